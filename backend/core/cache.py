@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache em memória (por processo) com expiração por TTL e limite de tamanho (LRU).
+    Thread-safe: pode ser usado tanto por rotas síncronas (threadpool) quanto pelo worker.
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0, maxsize: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return valor
+
+    def set(self, key: Hashable, valor: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, valor)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, loader: Callable[[], Any], ttl_seconds: Optional[float] = None) -> Any:
+        """Retorna o valor em cache ou chama `loader()` e guarda o resultado."""
+        valor = self.get(key, _MISSING)
+        if valor is not _MISSING:
+            return valor
+        valor = loader()
+        self.set(key, valor, ttl_seconds)
+        return valor
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove as chaves para as quais `predicate(chave)` é verdadeiro; retorna quantas."""
+        with self._lock:
+            chaves = [k for k in self._data if predicate(k)]
+            for k in chaves:
+                del self._data[k]
+            return len(chaves)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
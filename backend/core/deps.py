@@ -1,15 +1,41 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
 
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
 
 from database import SessionLocal
 from models.usuario import UsuarioModel
+from core.cache import TTLCache
 from core.security import SECRET_KEY, ALGORITHM
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Principal autenticado em cache por (sub, iat) do token: evita o SELECT em t_usuario a cada
+# requisição. Alterações feitas por este processo chamam invalidar_principal(); nas demais
+# instâncias a defasagem máxima é o TTL.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "1024"))
+
+_cache_principal = TTLCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Usuário autenticado (sem hash de senha); independe de sessão do banco."""
+    id: int
+    nome: str
+    email: str
+    funcao: Optional[str]
+    ativo: Optional[bool]
+    reset_senha_obrigatorio: Optional[bool]
+    email_verificado: Optional[bool]
+    email_daily_digest: Optional[bool]
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -17,33 +43,65 @@ def get_db():
     finally:
         db.close()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+
+def _carregar_principal(email: str) -> Optional[Principal]:
+    with SessionLocal() as db:
+        user = db.query(UsuarioModel).filter(UsuarioModel.email == email).first()
+        if user is None:
+            return None
+        return Principal(
+            id=user.id,
+            nome=user.nome,
+            email=user.email,
+            funcao=user.funcao,
+            ativo=user.ativo,
+            reset_senha_obrigatorio=user.reset_senha_obrigatorio,
+            email_verificado=user.email_verificado,
+            email_daily_digest=user.email_daily_digest,
+        )
+
+
+async def _principal_do_token(token: str) -> Optional[Principal]:
+    """Principal do token; None se o token for inválido ou o usuário não existir."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(UsuarioModel).filter(UsuarioModel.email == email).first()
-    if user is None:
-        raise credentials_exception
-    return user
-
-async def get_current_user_optional(token: str = Depends(OAuth2PasswordBearer(tokenUrl="token", auto_error=False)), db: Session = Depends(get_db)):
+        return None
+    email = payload.get("sub")
+    if email is None:
+        return None
+
+    chave = (email, payload.get("iat"))
+    principal = _cache_principal.get(chave)
+    if principal is None:
+        principal = await run_in_threadpool(_carregar_principal, email)
+        if principal is not None:
+            _cache_principal.set(chave, principal)
+    return principal
+
+
+def invalidar_principal(*emails: Optional[str]) -> None:
+    """Descarta o principal em cache desses e-mails (todos os tokens)."""
+    alvos = {e for e in emails if e}
+    if alvos:
+        _cache_principal.invalidate_where(lambda chave: chave[0] in alvos)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    principal = await _principal_do_token(token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
+async def get_current_user_optional(token: str = Depends(OAuth2PasswordBearer(tokenUrl="token", auto_error=False))) -> Optional[Principal]:
     if not token:
         return None
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            return db.query(UsuarioModel).filter(UsuarioModel.email == email).first()
+        return await _principal_do_token(token)
     except Exception:
-        pass
-    return None
+        return None
@@ -0,0 +1,151 @@
+# core/lideranca.py
+"""
+Eleição de líder entre processos/instâncias da API, usada pelo scheduler para que cada
+job rode em uma única instância.
+
+- Postgres: advisory lock de sessão (`pg_try_advisory_lock`) numa conexão dedicada que o
+  líder mantém aberta; se o processo morre ou a conexão cai, o Postgres libera o lock e
+  outra instância assume na próxima tentativa.
+- SQLite (dev): lock exclusivo não bloqueante num arquivo (fcntl no Linux/macOS,
+  msvcrt no Windows), liberado pelo sistema operacional quando o processo termina.
+
+`tentar()` é barato e idempotente: o líder apenas confirma que ainda segura o lock e os
+demais fazem uma nova tentativa, então basta chamá-lo a cada disparo de job.
+"""
+import logging
+import os
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("ordersync.lideranca")
+
+# Chave do advisory lock (bigint) — mesma em todas as instâncias do mesmo banco
+SCHEDULER_LOCK_ID = int(os.getenv("SCHEDULER_LOCK_ID", "7420240001"))
+# Arquivo de lock do fallback SQLite. Oculto (ponto inicial) para a limpeza de temporários ignorá-lo.
+SCHEDULER_LOCK_FILE = os.getenv(
+    "SCHEDULER_LOCK_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".ordersync-scheduler.lock"),
+)
+
+
+class LiderancaPostgres:
+    """Liderança via advisory lock de sessão numa conexão em autocommit mantida pelo líder."""
+
+    def __init__(self, engine: Engine, chave: int = SCHEDULER_LOCK_ID):
+        self.engine = engine
+        self.chave = chave
+        self._conn = None
+        self._trava = threading.Lock()
+
+    @property
+    def lider(self) -> bool:
+        return self._conn is not None
+
+    def tentar(self) -> bool:
+        with self._trava:
+            if self._conn is not None:
+                try:
+                    self._conn.execute(text("SELECT 1"))
+                    return True
+                except Exception as e:
+                    # Conexão caiu: o Postgres já liberou o lock, outra instância pode assumir
+                    logger.warning(f"[Liderança] Conexão do advisory lock perdida: {e}")
+                    self._fechar()
+            conn = None
+            try:
+                conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                obtido = conn.execute(text("SELECT pg_try_advisory_lock(:chave)"), {"chave": self.chave}).scalar()
+            except Exception as e:
+                logger.error(f"[Liderança] Falha ao tentar o advisory lock: {e}")
+                obtido = False
+            if obtido:
+                self._conn = conn
+                logger.info(f"[Liderança] Esta instância assumiu o scheduler (advisory lock {self.chave})")
+                return True
+            if conn is not None:
+                conn.close()
+            return False
+
+    def liberar(self) -> None:
+        with self._trava:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": self.chave})
+            except Exception:
+                pass
+            self._fechar()
+
+    def _fechar(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+class LiderancaArquivo:
+    """Liderança via lock exclusivo num arquivo local (fallback para SQLite em dev)."""
+
+    def __init__(self, caminho: str = SCHEDULER_LOCK_FILE):
+        self.caminho = caminho
+        self._arquivo = None
+        self._trava = threading.Lock()
+
+    @property
+    def lider(self) -> bool:
+        return self._arquivo is not None
+
+    def tentar(self) -> bool:
+        with self._trava:
+            if self._arquivo is not None:
+                return True
+            arquivo = open(self.caminho, "a+b")
+            try:
+                _travar_arquivo(arquivo)
+            except OSError:
+                arquivo.close()
+                return False
+            self._arquivo = arquivo
+            logger.info(f"[Liderança] Esta instância assumiu o scheduler (lock em {self.caminho})")
+            return True
+
+    def liberar(self) -> None:
+        with self._trava:
+            if self._arquivo is None:
+                return
+            try:
+                _destravar_arquivo(self._arquivo)
+            except OSError:
+                pass
+            self._arquivo.close()
+            self._arquivo = None
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _travar_arquivo(arquivo) -> None:
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _destravar_arquivo(arquivo) -> None:
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _travar_arquivo(arquivo) -> None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _destravar_arquivo(arquivo) -> None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
+def criar_lideranca(engine: Engine):
+    """Advisory lock no Postgres; lock de arquivo nos demais bancos (SQLite de dev)."""
+    if engine.dialect.name == "postgresql":
+        return LiderancaPostgres(engine)
+    return LiderancaArquivo()
@@ -1,19 +1,147 @@
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from apscheduler.triggers.interval import IntervalTrigger
-from database import SessionLocal
+from database import SessionLocal, engine
+from core.lideranca import criar_lideranca
 from services.cliente import verificar_inatividade_clientes
 from services.manutencao import limpar_arquivos_temporarios
 from services.prospeccao_service import enviar_relatorios_prospeccao
+from services.vendas_rollup import reconstruir_rollup
 from models.automation_config import AutomationConfigModel
+from models.scheduler_execucao import SchedulerExecucaoModel
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+from typing import Optional
 from zoneinfo import ZoneInfo
 import logging
+import os
+import socket
+import time
 
 logger = logging.getLogger("ordersync.scheduler")
 TZ = ZoneInfo("America/Sao_Paulo")
 
-scheduler = BackgroundScheduler(timezone=TZ)
+
+
+class _DisparoAgendado:
+    """Job do APScheduler com o horário agendado do disparo acrescentado aos args."""
+
+    def __init__(self, job, horario):
+        self._job = job
+        self.args = (*job.args, horario)
+
+    def __getattr__(self, nome):
+        return getattr(self._job, nome)
+
+    def __str__(self):
+        return str(self._job)
+
+
+class ExecutorComHorario(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor que passa ao job o horário em que o disparo estava agendado.
+    É a chave da reivindicação em tb_scheduler_execucoes: igual em todas as instâncias,
+    ao contrário do horário em que cada uma de fato começou a rodar.
+    """
+
+    def _do_submit_job(self, job, run_times):
+        for horario in run_times:
+            super()._do_submit_job(_DisparoAgendado(job, horario), [horario])
+
+
+scheduler = BackgroundScheduler(timezone=TZ, executors={"default": ExecutorComHorario()})
+
+# Todas as instâncias agendam os jobs, mas só a líder os executa (ver core/lideranca.py)
+lideranca = None
+INSTANCIA = f"{socket.gethostname()}:{os.getpid()}"[:120]
+
+# Chaves de métricas, por prioridade, usadas como "linhas afetadas" quando o job devolve um dict
+_CHAVES_LINHAS = ("linhas", "inativados", "removidos", "enviados")
+
+
+def _agora() -> datetime:
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+def _linhas_afetadas(retorno):
+    if isinstance(retorno, bool):
+        return None
+    if isinstance(retorno, int):
+        return retorno
+    if isinstance(retorno, dict):
+        for chave in _CHAVES_LINHAS:
+            if isinstance(retorno.get(chave), int):
+                return retorno[chave]
+    return None
+
+
+def _executar_job(job_id: str, func, agendado_para: Optional[datetime] = None):
+    """
+    Executa o job só na instância líder e registra a execução em tb_scheduler_execucoes.
+
+    O disparo é reivindicado antes (UNIQUE job_id + horário agendado, vindo do
+    ExecutorComHorario): se outra instância já registrou esta ocorrência, ela não roda de
+    novo. Chamado fora do scheduler, sem horário, usa o minuto atual. Falha ao gravar o
+    histórico não impede o job de rodar.
+    """
+    if lideranca is None or not lideranca.tentar():
+        logger.debug(f"[Scheduler] {job_id}: instância não é líder, ignorando disparo.")
+        return
+
+    inicio = _agora()
+    if agendado_para is None:
+        agendado_para = inicio.replace(second=0, microsecond=0)
+    elif agendado_para.tzinfo is not None:
+        agendado_para = agendado_para.astimezone(TZ).replace(tzinfo=None)
+    db = SessionLocal()
+    execucao = None
+    try:
+        execucao = SchedulerExecucaoModel(
+            job_id=job_id, agendado_para=agendado_para,
+            instancia=INSTANCIA, status="EXECUTANDO", inicio=inicio,
+        )
+        db.add(execucao)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        db.close()
+        logger.info(f"[Scheduler] {job_id}: disparo já executado por outra instância.")
+        return
+    except Exception as e:
+        db.rollback()
+        execucao = None
+        logger.warning(f"[Scheduler] {job_id}: histórico indisponível ({e}); executando sem registro.")
+
+    t0 = time.perf_counter()
+    retorno, erro = None, None
+    try:
+        retorno = func()
+    except Exception as e:
+        erro = e
+        logger.exception(f"[Scheduler] Erro no job {job_id}: {e}")
+    duracao = round(time.perf_counter() - t0, 3)
+
+    try:
+        if execucao is not None:
+            execucao.fim = _agora()
+            execucao.duracao_s = duracao
+            execucao.status = "ERRO" if erro else "CONCLUIDO"
+            execucao.linhas_afetadas = _linhas_afetadas(retorno)
+            execucao.resultado = retorno if isinstance(retorno, dict) else None
+            execucao.erro_msg = str(erro)[:2000] if erro else None
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"[Scheduler] {job_id}: falha ao gravar histórico: {e}")
+    finally:
+        db.close()
+    logger.info(f"[Scheduler] {job_id} {'com erro' if erro else 'concluído'} em {duracao}s "
+                f"(linhas: {_linhas_afetadas(retorno)})")
+
+
+def _agendar(func, trigger, id: str, name: str):
+    scheduler.add_job(_executar_job, trigger=trigger, args=[id, func], id=id, name=name, replace_existing=True)
+
 
 def check_dynamic_prospeccao():
     """
@@ -54,48 +182,60 @@ def check_dynamic_prospeccao():
         db.close()
 
 def start_scheduler():
+    global lideranca
     if not scheduler.running:
+        if lideranca is None:
+            lideranca = criar_lideranca(engine)
+            lideranca.tentar()
+
         # 1. Inativação de Clientes: Todo dia às 00:01
-        scheduler.add_job(
+        _agendar(
             verificar_inatividade_clientes,
             trigger=CronTrigger(hour=0, minute=1),
             id="inatividade_diaria",
             name="Inativação automática de clientes (00:01)",
-            replace_existing=True
         )
 
         # 2. Manutenção de Sistema: Todo dia às 03:00
-        scheduler.add_job(
+        _agendar(
             limpar_arquivos_temporarios,
             trigger=CronTrigger(hour=3, minute=0),
             id="manutencao_diaria",
             name="Limpeza de arquivos temporários (03:00)",
-            replace_existing=True
+        )
+
+        # 2.1 Rollup de Vendas (dashboards): reconstrução completa todo dia às 02:00
+        _agendar(
+            reconstruir_rollup,
+            trigger=CronTrigger(hour=2, minute=0),
+            id="rollup_vendas_diario",
+            name="Reconstrução do rollup diário de vendas (02:00)",
         )
 
         # 3. Prospecção Dinâmica: Checa a cada 5 minutos
-        scheduler.add_job(
+        _agendar(
             check_dynamic_prospeccao,
-            trigger=IntervalTrigger(minutes=5),
+            trigger=CronTrigger(minute="*/5"),  # alinhado ao relógio: mesmo disparo em todas as instâncias
             id="prospeccao_dinamica",
             name="Verificação de agendamento de prospecção (DB)",
-            replace_existing=True
         )
         
         # 4. Envio de E-mail de Resumo Matinal: Todo dia às 06:00
         from services.daily_digest import enviar_resumo_matinal
-        scheduler.add_job(
+        _agendar(
             enviar_resumo_matinal,
             trigger=CronTrigger(hour=6, minute=0),
             id="resumo_matinal_calendario",
             name="Envio do resumo matinal de calendário (06:00)",
-            replace_existing=True
         )
 
         scheduler.start()
-        logger.info("Scheduler iniciado com sucesso (Inativação 00:01 | Manutenção 03:00 | Prospecção Dinâmica)")
+        papel = "líder" if lideranca.lider else "em espera"
+        logger.info(f"Scheduler iniciado com sucesso ({papel}) (Inativação 00:01 | Rollup 02:00 | Manutenção 03:00 | Prospecção Dinâmica)")
 
 def stop_scheduler():
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler parado.")
+    if lideranca is not None:
+        lideranca.liberar()
@@ -2,19 +2,46 @@ import asyncio
 import logging
 import os
 import base64
-from sqlalchemy import text
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text, bindparam
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
 from zoneinfo import ZoneInfo
 
-from database import SessionLocal
+from database import SessionLocal, engine, DATABASE_URL
 from models.background_task import BackgroundTaskModel
-from services.pdf_service import gerar_pdf_pedido
+from services.pdf_cache import TAREFA_RENDER_PDF, obter_pdf_pedido
 from services.pedido_pdf_data import carregar_pedido_pdf
 from services.email_service import enviar_email_notificacao, get_email_cliente_responsavel_compras
 
 logger = logging.getLogger("ordersync.worker")
 TZ = ZoneInfo("America/Sao_Paulo")
 
+# Configuração (variáveis de ambiente)
+WORKER_CONCORRENCIA = int(os.getenv("WORKER_CONCORRENCIA", "4"))      # tarefas simultâneas por processo
+WORKER_LOTE = int(os.getenv("WORKER_LOTE", str(WORKER_CONCORRENCIA)))  # máx. de tarefas reivindicadas por consulta
+WORKER_MAX_TENTATIVAS = int(os.getenv("WORKER_MAX_TENTATIVAS", "5"))
+WORKER_BACKOFF_BASE = float(os.getenv("WORKER_BACKOFF_BASE", "10"))    # segundos: 10, 20, 40, 80...
+WORKER_BACKOFF_MAX = float(os.getenv("WORKER_BACKOFF_MAX", "900"))
+# Sem LISTEN/NOTIFY (SQLite ou falha no listener) a fila é consultada neste intervalo;
+# com LISTEN, a consulta periódica só cobre retentativas agendadas e notificações perdidas.
+WORKER_POLL_SEGUNDOS = float(os.getenv("WORKER_POLL_SEGUNDOS", "1"))
+WORKER_POLL_COM_LISTEN = float(os.getenv("WORKER_POLL_COM_LISTEN", "15"))
+# Tarefas presas em PROCESSANDO (processo morto no meio) voltam para a fila após este tempo
+WORKER_TIMEOUT_PROCESSANDO_MIN = int(os.getenv("WORKER_TIMEOUT_PROCESSANDO_MIN", "15"))
+
+CANAL_NOTIFY = "ordersync_tarefas"
+
+
+def _agora() -> datetime:
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+def calcular_backoff(tentativas: int, base: float = WORKER_BACKOFF_BASE, maximo: float = WORKER_BACKOFF_MAX) -> float:
+    """Espera (s) antes da próxima tentativa: base * 2^(tentativas-1), limitada a `maximo`."""
+    return min(base * (2 ** max(tentativas - 1, 0)), maximo)
+
+
 class PedidoEmailDummyBG:
     def __init__(self, id_pedido, codigo_cliente, cliente_nome, total_pedido, cliente_email):
         self.id = id_pedido
@@ -23,46 +50,47 @@ class PedidoEmailDummyBG:
         self.total_pedido = total_pedido
         self.cliente_email = cliente_email
 
-async def process_email_task(db, task: BackgroundTaskModel):
+def process_email_task(db, task: BackgroundTaskModel):
     """
-    Executa a pesada geração de PDF e o envio do SMTP fora do pipeline principal HTTP
+    Executa a pesada geração de PDF e o envio do SMTP fora do pipeline principal HTTP.
+    Roda no pool de threads do worker (bloqueante), nunca no event loop.
     """
     id_pedido = task.referencia_id
     logger.info(f"Worker processando tarefa {task.id} para Pedido {id_pedido}")
-    
+
     # 1. Carregar dados do pedido
     try:
         pedido_row = db.execute(text("""
-            SELECT codigo_cliente, cliente, total_pedido 
-            FROM tb_pedidos 
+            SELECT codigo_cliente, cliente, total_pedido
+            FROM tb_pedidos
             WHERE id_pedido = :id
         """), {"id": id_pedido}).mappings().first()
-        
+
         if not pedido_row:
             raise Exception(f"Pedido {id_pedido} não encontrado na base")
-            
+
         c_cod = pedido_row["codigo_cliente"]
         c_nom = pedido_row["cliente"]
         p_tot = pedido_row["total_pedido"]
-        
+
     except Exception as e:
         logger.error(f"Worker falhou ao buscar pedido {id_pedido}: {e}")
         raise e
 
-    # 2. Gerar PDFs pesados
+    # 2. Gerar PDFs pesados (ou reaproveitar do cache, ex.: reenvio de pedido inalterado)
     try:
         pedido_pdf_dados = carregar_pedido_pdf(db, id_pedido)
-        pdf_bytes_vendedor = gerar_pdf_pedido(pedido_pdf_dados, sem_validade=False)
-        pdf_bytes_cliente = gerar_pdf_pedido(pedido_pdf_dados, sem_validade=True)
+        pdf_bytes_vendedor, _ = obter_pdf_pedido(pedido_pdf_dados, sem_validade=False)
+        pdf_bytes_cliente, _ = obter_pdf_pedido(pedido_pdf_dados, sem_validade=True)
     except Exception as e:
         logger.error(f"Worker falhou ao gerar PDFs para pedido {id_pedido}: {e}")
         raise e
-        
+
     # 3. Enviar E-mail
     try:
         cliente_email_addr = get_email_cliente_responsavel_compras(db, c_cod)
         pedido_email_bg = PedidoEmailDummyBG(id_pedido, c_cod, c_nom, p_tot, cliente_email_addr)
-        
+
         enviar_email_notificacao(
             db=db,
             pedido=pedido_email_bg,
@@ -73,78 +101,304 @@ async def process_email_task(db, task: BackgroundTaskModel):
     except Exception as e:
         logger.error(f"Worker falhou ao enviar SMTP pedido {id_pedido}: {e}")
         raise e
-        
+
     # 4. Sucesso: Atualiza Status Link
     try:
         db.execute(text("""
-            UPDATE public.tb_pedidos 
-            SET link_enviado_em = NOW(), 
-                link_status = 'ENVIADO', 
-                atualizado_em = NOW() 
+            UPDATE public.tb_pedidos
+            SET link_enviado_em = NOW(),
+                link_status = 'ENVIADO',
+                atualizado_em = NOW()
             WHERE id_pedido = :id
         """), {"id": id_pedido})
-        
-        # Opcional salvar o base64 para uso imediato do front se quisesse, 
+
+        # Opcional salvar o base64 para uso imediato do front se quisesse,
         # mas como é worker, o front já pode ter o base64 inicial gerado syncronamente.
     except Exception as e:
          logger.error(f"Worker falhou ao marcar finalizado pedido {id_pedido}: {e}")
          raise e
-         
+
     return True
 
-async def worker_loop():
-    logger.info(f"Worker de Fila (E-mails) iniciado. Monitorando tb_background_tasks...")
-    
-    while True:
+
+def process_render_pdf_task(db, task: BackgroundTaskModel):
+    """
+    Renderiza o PDF do pedido (layout vendedor) para o cache em disco, fora da requisição
+    de edição; a chave do cache fica em `resultado` para a rota de download.
+    """
+    pedido_pdf = carregar_pedido_pdf(db, task.referencia_id)
+    _, chave = obter_pdf_pedido(pedido_pdf, sem_validade=False)
+    task.resultado = {"chave": chave}
+    return True
+
+
+# Tipos de tarefa tratados por este worker. Outros tipos (ex.: RECALCULO_MASSIVO, que roda
+# via BackgroundTasks do FastAPI) ficam na tabela apenas para acompanhamento de progresso.
+HANDLERS: Dict[str, Callable] = {
+    "ENVIO_EMAIL_CONFIRMACAO": process_email_task,
+    TAREFA_RENDER_PDF: process_render_pdf_task,
+}
+
+
+class TaskWorker:
+    """
+    Consome tb_background_tasks com concorrência configurável.
+
+    - Reivindica até `lote` tarefas por consulta (UPDATE ... FOR UPDATE SKIP LOCKED no Postgres),
+      então vários processos podem rodar o worker ao mesmo tempo sem pegar a mesma tarefa.
+    - O handler (bloqueante: PDF, SMTP) roda num ThreadPoolExecutor, fora do event loop do FastAPI.
+    - No Postgres, um LISTEN no canal `ordersync_tarefas` (NOTIFY disparado por trigger no INSERT)
+      acorda o worker na hora; sem ele, a fila é consultada a cada `poll_segundos`.
+    - Falhas voltam para PENDENTE com `proxima_tentativa_em` em backoff exponencial, até
+      `max_tentativas`; depois a tarefa fica em ERRO.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        handlers: Optional[Dict[str, Callable]] = None,
+        concorrencia: int = WORKER_CONCORRENCIA,
+        lote: int = WORKER_LOTE,
+        max_tentativas: int = WORKER_MAX_TENTATIVAS,
+        backoff_base: float = WORKER_BACKOFF_BASE,
+        backoff_max: float = WORKER_BACKOFF_MAX,
+        poll_segundos: float = WORKER_POLL_SEGUNDOS,
+        usar_listen: Optional[bool] = None,
+    ):
+        self.session_factory = session_factory
+        self.handlers = handlers if handlers is not None else HANDLERS
+        self.concorrencia = max(1, concorrencia)
+        self.lote = max(1, lote)
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_segundos = poll_segundos
+        self.usar_listen = DATABASE_URL.startswith("postgres") if usar_listen is None else usar_listen
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._acordar: Optional[asyncio.Event] = None
+        self._em_execucao: set = set()
+        self._listen_conn = None
+        self._parar = False
+
+    # ---------------- fila ----------------
+    def _reivindicar_lote(self, quantidade: int) -> List[int]:
+        with self.session_factory() as db:
+            return self.reivindicar(db, quantidade)
+
+    def _recuperar_presas(self) -> int:
+        with self.session_factory() as db:
+            return self.recuperar_presas(db)
+
+    def reivindicar(self, db, quantidade: int) -> List[int]:
+        """Marca até `quantidade` tarefas prontas como PROCESSANDO e retorna seus ids."""
+        agora = _agora()
+        params = {"tipos": list(self.handlers.keys()), "n": quantidade, "agora": agora}
+        filtro = """
+            status = 'PENDENTE'
+            AND tipo_tarefa IN :tipos
+            AND (proxima_tentativa_em IS NULL OR proxima_tentativa_em <= :agora)
+        """
+        if db.bind.dialect.name == "postgresql":
+            q = text(f"""
+                UPDATE tb_background_tasks SET
+                    status = 'PROCESSANDO',
+                    tentativas = tentativas + 1,
+                    atualizado_em = :agora
+                WHERE id IN (
+                    SELECT id FROM tb_background_tasks
+                    WHERE {filtro}
+                    ORDER BY criado_em ASC
+                    LIMIT :n
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
+            """).bindparams(bindparam("tipos", expanding=True))
+            ids = [r[0] for r in db.execute(q, params).fetchall()]
+        else:
+            # SQLite (dev/testes): um processo só, sem SKIP LOCKED
+            q_sel = text(f"""
+                SELECT id FROM tb_background_tasks
+                WHERE {filtro}
+                ORDER BY criado_em ASC
+                LIMIT :n
+            """).bindparams(bindparam("tipos", expanding=True))
+            ids = [r[0] for r in db.execute(q_sel, params).fetchall()]
+            if ids:
+                db.execute(text("""
+                    UPDATE tb_background_tasks SET
+                        status = 'PROCESSANDO',
+                        tentativas = tentativas + 1,
+                        atualizado_em = :agora
+                    WHERE id IN :ids AND status = 'PENDENTE'
+                """).bindparams(bindparam("ids", expanding=True)), {"ids": ids, "agora": agora})
+        db.commit()
+        return ids
+
+    def recuperar_presas(self, db) -> int:
+        """Devolve à fila tarefas que ficaram em PROCESSANDO por mais que o timeout (worker morto)."""
+        limite = _agora() - timedelta(minutes=WORKER_TIMEOUT_PROCESSANDO_MIN)
+        res = db.execute(text("""
+            UPDATE tb_background_tasks SET status = 'PENDENTE', atualizado_em = :agora
+            WHERE status = 'PROCESSANDO' AND tipo_tarefa IN :tipos AND atualizado_em < :limite
+        """).bindparams(bindparam("tipos", expanding=True)),
+            {"tipos": list(self.handlers.keys()), "agora": _agora(), "limite": limite})
+        db.commit()
+        return res.rowcount or 0
+
+    def executar_tarefa(self, task_id: int) -> None:
+        """Executa uma tarefa já reivindicada (roda numa thread do pool, com sessão própria)."""
+        with self.session_factory() as db:
+            task = db.query(BackgroundTaskModel).filter(BackgroundTaskModel.id == task_id).first()
+            if not task:
+                return
+            try:
+                self.handlers[task.tipo_tarefa](db, task)
+                task.status = "CONCLUIDO"
+                task.erro_msg = None
+                task.proxima_tentativa_em = None
+                task.concluido_em = _agora()
+            except Exception as e:
+                db.rollback()
+                task = db.query(BackgroundTaskModel).filter(BackgroundTaskModel.id == task_id).first()
+                task.erro_msg = str(e)
+                if task.tentativas >= self.max_tentativas:
+                    task.status = "ERRO"
+                    task.proxima_tentativa_em = None
+                    logger.error(f"Task {task.id} atingiu máximo de tentativas ({task.tentativas}). Abortando.")
+                else:
+                    espera = calcular_backoff(task.tentativas, self.backoff_base, self.backoff_max)
+                    task.status = "PENDENTE"
+                    task.proxima_tentativa_em = _agora() + timedelta(seconds=espera)
+                    logger.warning(f"Task {task.id} falhou (tentativa {task.tentativas}); nova tentativa em {espera:.0f}s: {e}")
+            task.atualizado_em = _agora()
+            db.commit()
+
+    # ---------------- LISTEN/NOTIFY ----------------
+    def _iniciar_listen(self, loop) -> bool:
         try:
-            with SessionLocal() as db:
-                # 1. Busca tarefa pendente (mais antiga primeiro)
-                task = db.query(BackgroundTaskModel)\
-                         .filter(BackgroundTaskModel.status == 'PENDENTE')\
-                         .order_by(BackgroundTaskModel.criado_em.asc())\
-                         .with_for_update(skip_locked=True)\
-                         .first()
-                         
-                if task:
-                    task.status = "PROCESSANDO"
-                    task.tentativas += 1
-                    db.commit() # Libera o lock e marca como processando
-                    
+            raw = engine.raw_connection()
+            raw.detach()  # conexão dedicada: não volta para o pool do SQLAlchemy
+            conn = raw.driver_connection
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL_NOTIFY}")
+
+            def _ao_notificar():
+                try:
+                    conn.poll()
+                    conn.notifies.clear()
+                except Exception as e:
+                    logger.error(f"Listener da fila perdeu a conexão: {e}")
+                    loop.remove_reader(conn.fileno())
+                    self._listen_conn = None
+                self._acordar.set()
+
+            loop.add_reader(conn.fileno(), _ao_notificar)
+            self._listen_conn = conn
+            return True
+        except Exception as e:
+            logger.warning(f"LISTEN indisponível, usando apenas polling da fila: {e}")
+            return False
+
+    def _parar_listen(self, loop) -> None:
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is None:
+            return
+        try:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+        except Exception:
+            pass
+
+    # ---------------- loop principal ----------------
+    async def _rodar_tarefa(self, loop, task_id: int) -> None:
+        try:
+            await loop.run_in_executor(self._executor, self.executar_tarefa, task_id)
+        except Exception as e:
+            logger.error(f"Erro inesperado executando task {task_id}: {e}")
+        finally:
+            self._acordar.set()  # vaga livre: pode haver mais tarefas esperando
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.concorrencia, thread_name_prefix="ordersync-worker")
+        self._acordar = asyncio.Event()
+        self._parar = False
+
+        com_listen = self.usar_listen and self._iniciar_listen(loop)
+        intervalo = WORKER_POLL_COM_LISTEN if com_listen else self.poll_segundos
+        logger.info(
+            f"Worker de Fila iniciado (concorrência={self.concorrencia}, lote={self.lote}, "
+            f"{'LISTEN/NOTIFY' if com_listen else 'polling'}). Monitorando tb_background_tasks..."
+        )
+
+        try:
+            presas = await loop.run_in_executor(self._executor, self._recuperar_presas)
+            if presas:
+                logger.warning(f"{presas} tarefa(s) presas em PROCESSANDO voltaram para a fila.")
+        except Exception as e:
+            logger.error(f"Falha ao recuperar tarefas presas: {e}")
+
+        try:
+            while not self._parar:
+                self._acordar.clear()
+                livres = self.concorrencia - len(self._em_execucao)
+                quantidade = min(livres, self.lote)
+                ids: List[int] = []
+                if quantidade > 0:
                     try:
-                        if task.tipo_tarefa == "ENVIO_EMAIL_CONFIRMACAO":
-                            await process_email_task(db, task)
-                            
-                        task.status = "CONCLUIDO"
-                        task.erro_msg = None
-                        
+                        ids = await loop.run_in_executor(self._executor, self._reivindicar_lote, quantidade)
                     except Exception as e:
-                        task.erro_msg = str(e)
-                        if task.tentativas >= 3:
-                            task.status = "ERRO"
-                            logger.error(f"Task {task.id} atingiu máximo de tentativas. Abortando.")
-                        else:
-                            # Volta para pendente para tentar novamente no próximo ciclo
-                            task.status = "PENDENTE" 
-                            
-                    task.atualizado_em = datetime.now(TZ)
-                    db.commit()
-                else:
-                    # Sem tarefas, dorme 5 segundos
-                    await asyncio.sleep(5)
-                    continue
+                        logger.error(f"Erro ao reivindicar tarefas: {e}")
+                        await asyncio.sleep(5)
+                        continue
+
+                for task_id in ids:
+                    t = asyncio.ensure_future(self._rodar_tarefa(loop, task_id))
+                    self._em_execucao.add(t)
+                    t.add_done_callback(self._em_execucao.discard)
 
-            # Se processou uma tarefa, aguarda apenas 0.5s para a próxima
-            await asyncio.sleep(0.5)
+                if ids and len(ids) == quantidade and len(self._em_execucao) < self.concorrencia:
+                    continue  # lote cheio: provavelmente há mais na fila
+
+                if self.usar_listen and com_listen and self._listen_conn is None:
+                    com_listen = self._iniciar_listen(loop)
+                    intervalo = WORKER_POLL_COM_LISTEN if com_listen else self.poll_segundos
+
+                try:
+                    await asyncio.wait_for(self._acordar.wait(), timeout=intervalo)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            logger.info("Worker Interrompido (shutdown)")
+        finally:
+            self._parar_listen(loop)
+            if self._em_execucao:
+                await asyncio.gather(*self._em_execucao, return_exceptions=True)
+            self._executor.shutdown(wait=False)
+
+    def parar(self) -> None:
+        self._parar = True
+        if self._acordar is not None:
+            self._acordar.set()
+
+
+_worker: Optional[TaskWorker] = None
+_worker_task: Optional[asyncio.Task] = None
 
-        except BaseException as e:
-            if isinstance(e, asyncio.CancelledError):
-                 logger.info("Worker Interrompido (shutdown)")
-                 break
-                 
-            logger.error(f"Erro catastrófico no Worker Loop: {e}")
-            await asyncio.sleep(5)
 
 def start_background_worker():
     """ Fire-and-forget setup do asyncio loop para fastapi"""
+    global _worker, _worker_task
     loop = asyncio.get_event_loop()
-    loop.create_task(worker_loop())
+    _worker = TaskWorker()
+    _worker_task = loop.create_task(_worker.run())
+
+
+def stop_background_worker():
+    if _worker is not None:
+        _worker.parar()
+    if _worker_task is not None and not _worker_task.done():
+        _worker_task.cancel()
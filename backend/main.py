@@ -104,6 +104,25 @@ app = FastAPI()
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# --- SHUTDOWN: para o scheduler (libera a liderança), o worker da fila e fecha conexões SMTP mantidas pelo pool ---
+@app.on_event("shutdown")
+def shutdown_event():
+    try:
+        from core.scheduler import stop_scheduler
+        stop_scheduler()
+    except Exception as e:
+        logger.error(f"[SHUTDOWN] Falha ao parar Scheduler: {e}")
+    try:
+        from core.worker import stop_background_worker
+        stop_background_worker()
+    except Exception as e:
+        logger.error(f"[SHUTDOWN] Falha ao parar Worker: {e}")
+    try:
+        from services.smtp_pool import fechar_pool
+        fechar_pool()
+    except Exception as e:
+        logger.error(f"[SHUTDOWN] Falha ao fechar pool SMTP: {e}")
+
 # --- STARTUP: Inicialização do Sistema ---
 @app.on_event("startup")
 def startup_event():
@@ -116,6 +135,7 @@ def startup_event():
         from models.background_task import BackgroundTaskModel
         from models.automation_config import AutomationConfigModel
         from models.error_log import ErrorLog
+        from models.scheduler_execucao import SchedulerExecucaoModel
         Base.metadata.create_all(bind=engine)
         
         from services.db_migrations import run_migrations
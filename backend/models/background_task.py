@@ -12,6 +12,7 @@ class BackgroundTaskModel(Base):
     referencia_id = Column(Integer, nullable=True)     # ex: id_pedido
     status = Column(String(20), nullable=False, default="PENDENTE")            # PENDENTE, PROCESSANDO, CONCLUIDO, ERRO
     tentativas = Column(Integer, nullable=False, default=0)
+    proxima_tentativa_em = Column(DateTime, nullable=True)  # backoff: tarefa só é reivindicada a partir daqui
     erro_msg = Column(Text, nullable=True)
     
     criado_em = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -1,5 +1,8 @@
+import re
+from datetime import datetime
+from typing import Optional
 
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, BigInteger, Sequence
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, BigInteger, Sequence, event
 from sqlalchemy.dialects.postgresql import JSONB
 from database import Base
 
@@ -20,6 +23,9 @@ class ClienteModelV2(Base):
     cadastro_cnpj = Column(String)
     cadastro_inscricao_estadual = Column(String)
     cadastro_cpf = Column(String)
+    # Só os dígitos de CNPJ/CPF, mantidos na escrita (ver _sincronizar_documentos) e indexados
+    cadastro_cnpj_digitos = Column(String, index=True)
+    cadastro_cpf_digitos = Column(String, index=True)
     cadastro_situacao = Column(String)
     cadastro_status_cadastro = Column(String)
     # JSONB: lista de strings com até 5 indicações. Ex: ["Fulano", "Ciclano"]
@@ -91,6 +97,8 @@ class ClienteModelV2(Base):
     # 9. DadosUltimasCompras
     ultimas_compras_numero_danfe = Column(String)
     ultimas_compras_emissao = Column(String)
+    # ultimas_compras_emissao já interpretada (ver parse_emissao_legada); None se ilegível
+    ultimas_compras_emissao_dt = Column(DateTime)
     ultimas_compras_valor_total = Column(Float)
     ultimas_compras_valor_frete = Column(Float)
     ultimas_compras_valor_frete_padrao = Column(Float)
@@ -161,3 +169,40 @@ class ClienteModelV2(Base):
 
     criado_por = Column(String, nullable=True)
     atualizado_por = Column(String, nullable=True)
+
+
+def so_digitos(valor) -> Optional[str]:
+    """'07.769.327/0001-71' -> '07769327000171'; None se não houver dígitos."""
+    digitos = re.sub(r"\D", "", str(valor or ""))
+    return digitos or None
+
+
+@event.listens_for(ClienteModelV2, "before_insert")
+@event.listens_for(ClienteModelV2, "before_update")
+def _sincronizar_documentos(mapper, connection, target):
+    target.cadastro_cnpj_digitos = so_digitos(target.cadastro_cnpj)
+    target.cadastro_cpf_digitos = so_digitos(target.cadastro_cpf)
+
+
+FORMATOS_EMISSAO_LEGADA = (
+    "%d/%m/%Y", "%d/%m/%y", "%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ",
+)
+
+
+def parse_emissao_legada(valor) -> Optional[datetime]:
+    """Data da última compra importada do ERP antigo (texto livre); horário local, sem tz."""
+    if not valor:
+        return None
+    texto = str(valor).strip()
+    for fmt in FORMATOS_EMISSAO_LEGADA:
+        try:
+            return datetime.strptime(texto, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+@event.listens_for(ClienteModelV2, "before_insert")
+@event.listens_for(ClienteModelV2, "before_update")
+def _sincronizar_emissao_legada(mapper, connection, target):
+    target.ultimas_compras_emissao_dt = parse_emissao_legada(target.ultimas_compras_emissao)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, JSON, UniqueConstraint
+from database import Base
+
+
+class SchedulerExecucaoModel(Base):
+    """Histórico de execuções dos jobs do scheduler (uma linha por disparo)."""
+    __tablename__ = "tb_scheduler_execucoes"
+    __table_args__ = (
+        # Reivindicação do disparo: a mesma ocorrência de um job só roda uma vez,
+        # mesmo se dois processos se considerarem líderes durante uma troca de liderança
+        UniqueConstraint("job_id", "agendado_para", name="uq_scheduler_execucoes_job_agendado"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(80), nullable=False)
+    agendado_para = Column(DateTime, nullable=False)    # horário agendado do disparo (São Paulo)
+    instancia = Column(String(120), nullable=True)      # host:pid que executou
+    status = Column(String(20), nullable=False, default="EXECUTANDO")  # EXECUTANDO, CONCLUIDO, ERRO
+
+    inicio = Column(DateTime, nullable=False)
+    fim = Column(DateTime, nullable=True)
+    duracao_s = Column(Float, nullable=True)
+    linhas_afetadas = Column(Integer, nullable=True)
+    resultado = Column(JSON, nullable=True)             # retorno do job quando é um dicionário de métricas
+    erro_msg = Column(Text, nullable=True)
@@ -7,7 +7,7 @@ from sqlalchemy.orm import Session
 from database import SessionLocal
 from models.usuario import UsuarioModel
 from core.security import verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from core.deps import get_current_user
+from core.deps import get_current_user, invalidar_principal
 from schemas.usuario import Token
 from core.rate_limit import limiter
 
@@ -59,7 +59,6 @@ def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestFor
 @router.post("/refresh", response_model=Token)
 def refresh_token(
     current_user: UsuarioModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
 ):
     """
     Renova o token de acesso para o usuário logado.
@@ -170,5 +169,6 @@ def verify_email(token: str, db: Session = Depends(get_db)):
     user.email_verificado = True
     user.token_verificacao = None # Opcional: limpar token ou guardar histórico
     db.commit()
+    invalidar_principal(user.email)
     
     return {"message": "E-mail verificado com sucesso!"}
@@ -76,3 +76,11 @@ def trigger_prospeccao_agora(db: Session = Depends(get_db), current_user: Usuari
     
     return {"message": "Rotina de prospecção disparada com sucesso."}
 
+
+@router.post("/inatividade-clientes")
+def executar_inatividade_clientes(dry_run: bool = True, current_user: UsuarioModel = Depends(get_current_user)):
+    """ Roda a inativação de clientes na hora; por padrão em dry-run (só contagens e tempo). """
+    if current_user.funcao != "admin":
+        raise HTTPException(status_code=403, detail="Apenas administradores.")
+    from services.cliente import verificar_inatividade_clientes
+    return verificar_inatividade_clientes(dry_run=dry_run)
@@ -5,6 +5,7 @@ from sqlalchemy.exc import IntegrityError
 from typing import List
 
 from database import SessionLocal
+from services.referencias_cache import invalidar_referencias, invalidar_st_clientes
 
 # Models
 from models.catalogo_referencias import (
@@ -65,6 +66,11 @@ def trigger_cascade(db: Session, model_class, db_item):
     elif model_class == CanalVendaModel:
         sync_canal_venda(db, db_item)
 
+def invalidar_caches_referencia():
+    # Cascatas (sync_service) e ramos de atividade alimentam o cadastro de clientes (flags de ST)
+    invalidar_referencias()
+    invalidar_st_clientes()
+
 def create_item(db: Session, model_class, item_data):
     db_item = model_class(**item_data.dict(exclude_unset=True))
     db.add(db_item)
@@ -72,6 +78,7 @@ def create_item(db: Session, model_class, item_data):
         db.commit()
         db.refresh(db_item)
         trigger_cascade(db, model_class, db_item)
+        invalidar_caches_referencia()
         return db_item
     except Exception as e:
         db.rollback()
@@ -92,6 +99,7 @@ def update_item(db: Session, model_class, pk_field: str, item_id: int, item_data
         db.commit()
         db.refresh(db_item)
         trigger_cascade(db, model_class, db_item)
+        invalidar_caches_referencia()
         return db_item
     except Exception as e:
         db.rollback()
@@ -105,6 +113,7 @@ def delete_item(db: Session, model_class, pk_field: str, item_id: int):
     try:
         db.delete(db_item)
         db.commit()
+        invalidar_caches_referencia()
         return {"detail": "Item deleted"}
     except Exception as e:
         db.rollback()
@@ -10,12 +10,14 @@ from services.cliente import (
     obter_cliente_por_codigo,
     criar_cliente,
     atualizar_cliente,
-    deletar_cliente
+    deletar_cliente,
+    buscar_duplicado
 )
 from core.deps import get_current_user
 from models.usuario import UsuarioModel
 from models.cliente_v2 import ClienteModelV2
 from database import SessionLocal
+from services.busca import buscar_clientes
 from sqlalchemy import text
 
 # Configuração de logger para o router
@@ -206,48 +208,22 @@ def verificar_duplicado(
     Verifica se já existe um cliente cadastrado com o código, CNPJ ou CPF informado.
     """
     try:
-        import re
-        from sqlalchemy import or_, func
-        condicoes = []
-        if codigo and codigo.strip():
-            condicoes.append(ClienteModelV2.cadastro_codigo_da_empresa == codigo.strip())
-        if cnpj and cnpj.strip():
-            cnpj_clean = re.sub(r"\D", "", cnpj)
-            condicoes.append(func.regexp_replace(ClienteModelV2.cadastro_cnpj, r"\D", "", "g") == cnpj_clean)
-        if cpf and cpf.strip():
-            cpf_clean = re.sub(r"\D", "", cpf)
-            condicoes.append(func.regexp_replace(ClienteModelV2.cadastro_cpf, r"\D", "", "g") == cpf_clean)
-
-        if not condicoes:
-            return {"duplicado": False}
-
         with SessionLocal() as db:
-            query = db.query(ClienteModelV2)
-            if exclude_id is not None:
-                query = query.filter(ClienteModelV2.id != exclude_id)
-            
-            existente = query.filter(or_(*condicoes)).first()
-            if existente:
-                if codigo and existente.cadastro_codigo_da_empresa == codigo.strip():
-                    return {
-                        "duplicado": True, 
-                        "campo": "codigo", 
-                        "mensagem": f"Código '{codigo}' já cadastrado para o cliente: {existente.cadastro_nome_cliente}"
-                    }
-                if cnpj and re.sub(r"\D", "", existente.cadastro_cnpj or "") == re.sub(r"\D", "", cnpj):
-                    return {
-                        "duplicado": True, 
-                        "campo": "cnpj", 
-                        "mensagem": f"CNPJ '{cnpj}' já cadastrado para o cliente: {existente.cadastro_nome_cliente}"
-                    }
-                if cpf and re.sub(r"\D", "", existente.cadastro_cpf or "") == re.sub(r"\D", "", cpf):
-                    return {
-                        "duplicado": True, 
-                        "campo": "cpf", 
-                        "mensagem": f"CPF '{cpf}' já cadastrado para o cliente: {existente.cadastro_nome_cliente}"
-                    }
-            
+            duplicado = buscar_duplicado(db, codigo, cnpj, cpf, excluir_id=exclude_id)
+        if not duplicado:
             return {"duplicado": False}
+
+        campo, existente = duplicado
+        valor, rotulo = {
+            "codigo": (codigo, "Código"),
+            "cnpj": (cnpj, "CNPJ"),
+            "cpf": (cpf, "CPF"),
+        }[campo]
+        return {
+            "duplicado": True,
+            "campo": campo,
+            "mensagem": f"{rotulo} '{valor}' já cadastrado para o cliente: {existente.cadastro_nome_cliente}"
+        }
     except Exception as e:
         logger.error(f"Erro ao verificar duplicidade de cliente: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao verificar duplicidade: {str(e)}")
@@ -258,16 +234,9 @@ def lookup_cliente(query: str):
     """Retorna clientes para o componente de Lookup."""
     try:
         with SessionLocal() as db:
-            # Busca clientes ativos e inativos
-            rows = db.execute(text("""
-                SELECT id, cadastro_codigo_da_empresa, cadastro_nome_cliente, cadastro_nome_fantasia
-                FROM public.t_cadastro_cliente_v2
-                WHERE cadastro_nome_cliente ILIKE :q
-                   OR cadastro_nome_fantasia ILIKE :q
-                   OR cadastro_codigo_da_empresa ILIKE :q
-                LIMIT 20
-            """), {"q": f"%{query}%"}).mappings().all()
-        return [{"codigo": r["cadastro_codigo_da_empresa"], "nome_empresarial": r["cadastro_nome_cliente"], "nome_fantasia": r["cadastro_nome_fantasia"]} for r in rows]
+            # Busca clientes ativos e inativos (índice trigram, mais relevantes primeiro)
+            rows = buscar_clientes(db, query, limite=20)
+        return [{"codigo": r["codigo"], "nome_empresarial": r["nome_cliente"], "nome_fantasia": r["nome_fantasia"]} for r in rows]
     except Exception as e:
         logger.error(f"Erro no lookup de cliente: {e}")
         raise HTTPException(status_code=500, detail="Erro ao buscar clientes")
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from core.deps import get_current_user
 from models.usuario import UsuarioModel
+from services.dashboard_agregacao import agregar_por_intervalos
 import datetime
 from dateutil.relativedelta import relativedelta
 
@@ -13,10 +14,15 @@ router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
 MONTH_NAMES = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
 
-def get_dashboard_filters(status: Optional[str] = None, periodo: str = "mes", filial: Optional[str] = None):
+# Rollup diário (services/vendas_rollup.py): leitura preferencial dos painéis de vendas
+ROLLUP_PEDIDOS = "public.tb_vendas_diario"
+ROLLUP_ITENS = "public.tb_vendas_produto_diario"
+
+def get_dashboard_filters(status: Optional[str] = None, periodo: str = "mes", filial: Optional[str] = None, coluna_data: str = "created_at"):
     """
     Retorna o fragmento SQL WHERE (sem o 'WHERE' ou 'AND' inicial)
     e os parâmetros para os filtros globais.
+    `coluna_data` = "dia" para consultas sobre o rollup diário.
     """
     hoje = datetime.date.today()
     params: Dict[str, Any] = {}
@@ -42,7 +48,7 @@ def get_dashboard_filters(status: Optional[str] = None, periodo: str = "mes", fi
     else: # "mes"
         start_date = datetime.date(hoje.year, hoje.month, 1)
     
-    where_parts.append("created_at >= :start_date")
+    where_parts.append(f"{coluna_data} >= :start_date")
     params["start_date"] = start_date
     
     # 3. Filtro de Filial/Fornecedor
@@ -132,15 +138,15 @@ def get_dashboard_geral(
     db: Session = Depends(get_db),
     current_user: UsuarioModel = Depends(get_current_user)
 ):
-    where_clause, params = get_dashboard_filters(status, periodo, filial)
+    where_clause, params = get_dashboard_filters(status, periodo, filial, coluna_data="dia")
 
     # KPIs
     q_kpi = text(f"""
         SELECT 
-            COUNT(id_pedido) as pedidos_mes,
+            COALESCE(SUM(qtd_pedidos), 0) as pedidos_mes,
             COALESCE(SUM(total_pedido), 0) as faturamento_mes,
-            COALESCE(AVG(total_pedido), 0) as ticket_medio
-        FROM public.tb_pedidos
+            COALESCE(SUM(total_pedido) / NULLIF(SUM(qtd_com_valor), 0), 0) as ticket_medio
+        FROM {ROLLUP_PEDIDOS}
         WHERE {where_clause}
     """)
     kpi_row = db.execute(q_kpi, params).mappings().first()
@@ -159,39 +165,33 @@ def get_dashboard_geral(
     """ + (" AND p.fornecedor = :filial" if filial and filial != 'Todos' else ""))
     cargas_row = db.execute(q_cargas, c_params).mappings().first()
 
-    # Gráfico
+    # Gráfico (todos os intervalos em uma única consulta agrupada)
     intervals = get_chart_intervals(periodo)
-    labels = []
-    faturamentos = []
-    qtds = []
-    
-    status_clause = "1=1"
+
+    chart_filtros = []
+    chart_params = {}
     if status and status != "Todos":
-        status_clause = "status = :status"
-        
-    filial_clause = ""
+        chart_filtros.append("status = :status")
+        chart_params["status"] = status
     if filial and filial != "Todos":
-        filial_clause = " AND fornecedor = :filial"
-        
-    for iv in intervals:
-        q_chart = text(f"""
-            SELECT 
-                COUNT(id_pedido) as qtd,
-                COALESCE(SUM(total_pedido), 0) as fat
-            FROM public.tb_pedidos
-            WHERE {status_clause} {filial_clause}
-              AND created_at >= :start AND created_at < :end
-        """)
-        c_params_chart = {"start": iv["start"], "end": iv["end"]}
-        if status and status != "Todos":
-            c_params_chart["status"] = status
-        if filial and filial != "Todos":
-            c_params_chart["filial"] = filial
-            
-        row = db.execute(q_chart, c_params_chart).mappings().first()
-        labels.append(iv["label"])
-        faturamentos.append(float(row["fat"]))
-        qtds.append(int(row["qtd"]))
+        chart_filtros.append("fornecedor = :filial")
+        chart_params["filial"] = filial
+
+    serie = agregar_por_intervalos(
+        db, intervals,
+        fonte=ROLLUP_PEDIDOS,
+        coluna_data="dia",
+        colunas="qtd_pedidos, total_pedido",
+        metricas={
+            "qtd": "COALESCE(SUM(src.qtd_pedidos), 0)",
+            "fat": "COALESCE(SUM(src.total_pedido), 0)",
+        },
+        filtros=" AND ".join(chart_filtros) or None,
+        params=chart_params,
+    )
+    labels = serie["labels"]
+    faturamentos = [float(v or 0) for v in serie["fat"]]
+    qtds = [int(v or 0) for v in serie["qtd"]]
 
     return {
         "kpis": {
@@ -216,10 +216,14 @@ def get_dashboard_vendas(
     db: Session = Depends(get_db),
     current_user: UsuarioModel = Depends(get_current_user)
 ):
-    where_clause, params = get_dashboard_filters(status, periodo, filial)
+    where_clause, params = get_dashboard_filters(status, periodo, filial, coluna_data="dia")
 
-    # Ticket médio especificado no período/status
-    q_ticket = text(f"SELECT COALESCE(AVG(total_pedido), 0) as tkt FROM public.tb_pedidos WHERE total_pedido > 0 AND {where_clause}")
+    # Ticket médio especificado no período/status (só pedidos com valor > 0)
+    q_ticket = text(f"""
+        SELECT COALESCE(SUM(total_valor_positivo) / NULLIF(SUM(qtd_valor_positivo), 0), 0) as tkt
+        FROM {ROLLUP_PEDIDOS}
+        WHERE {where_clause}
+    """)
     tkt_row = db.execute(q_ticket, params).mappings().first()
     
     # Vendedores ativos reajustado para tb_vendedores
@@ -227,19 +231,15 @@ def get_dashboard_vendas(
     vend_row = db.execute(q_vendedores).mappings().first()
 
     # Vendas por Região (Top 10 municípios: Peso vs Valor)
-    # A métrica é "Valor (Subtotal sem frete)"
-    # Valor sem frete em tb_pedidos não é direto se o valor for total.
-    # Pode-se usar SUM(p.total_pedido - p.frete_total) mas a melhor aproximação p/ "Valor (sem frete)"
-    # é fazer join com tbl_pedidos_itens e somar subtotal (que é qtd * preco).
-    # Como isso pode ser lerdo, p.total_pedido - COALESCE(p.frete_total, 0) é seguro.
+    # A métrica é "Valor (Subtotal sem frete)": total_pedido - frete_total por pedido,
+    # já somado no rollup junto com o município do cliente.
     q_regiao = text(f"""
         SELECT 
-            COALESCE(c.faturamento_municipio, c.entrega_municipio, 'Sem Município') as mun, 
-            SUM(GREATEST(CAST(p.total_pedido AS NUMERIC) - COALESCE(CAST(p.frete_total AS NUMERIC), 0), 0)) as total_valor,
-            SUM(COALESCE(p.peso_total_kg, 0)) as total_peso
-        FROM public.tb_pedidos p
-        LEFT JOIN public.t_cadastro_cliente_v2 c ON p.codigo_cliente = c.cadastro_codigo_da_empresa
-        WHERE {where_clause.replace('status =', 'p.status =').replace('created_at >=', 'p.created_at >=').replace('fornecedor =', 'p.fornecedor =')}
+            municipio as mun, 
+            SUM(valor_sem_frete) as total_valor,
+            SUM(peso_total_kg) as total_peso
+        FROM {ROLLUP_PEDIDOS}
+        WHERE {where_clause}
         GROUP BY 1
         ORDER BY 2 DESC
         LIMIT 10
@@ -250,34 +250,32 @@ def get_dashboard_vendas(
     reg_data_peso = [float(r["total_peso"] or 0) for r in regioes]
 
     # Vendas por Status
-    where_period, period_params = get_dashboard_filters(None, periodo, filial)
-    q_status = text(f"SELECT status, COUNT(id_pedido) as qtd FROM public.tb_pedidos WHERE {where_period} GROUP BY status")
+    where_period, period_params = get_dashboard_filters(None, periodo, filial, coluna_data="dia")
+    q_status = text(f"SELECT status, SUM(qtd_pedidos) as qtd FROM {ROLLUP_PEDIDOS} WHERE {where_period} GROUP BY status")
     status_rows = db.execute(q_status, period_params).mappings().all()
     st_labels = [s["status"] for s in status_rows]
     st_data = [int(s["qtd"]) for s in status_rows]
 
     # Evolução Ticket Médio
     intervals = get_chart_intervals(periodo)
-    evo_labels = []
-    evo_ticket = []
-    
-    filial_clause = ""
+
+    evo_filtros = "status != 'Cancelado'"
+    params_evo = {}
     if filial and filial != "Todos":
-        filial_clause = " AND fornecedor = :filial"
-        
-    for iv in intervals:
-        q_evo = text(f"""
-            SELECT COALESCE(AVG(total_pedido), 0) as tkt
-            FROM public.tb_pedidos
-            WHERE status != 'Cancelado' AND total_pedido > 0
-              AND created_at >= :start AND created_at < :end {filial_clause}
-        """)
-        params_evo = {"start": iv["start"], "end": iv["end"]}
-        if filial and filial != "Todos": params_evo["filial"] = filial
-        
-        row = db.execute(q_evo, params_evo).mappings().first()
-        evo_labels.append(iv["label"])
-        evo_ticket.append(float(row["tkt"]))
+        evo_filtros += " AND fornecedor = :filial"
+        params_evo["filial"] = filial
+
+    serie_evo = agregar_por_intervalos(
+        db, intervals,
+        fonte=ROLLUP_PEDIDOS,
+        coluna_data="dia",
+        colunas="qtd_valor_positivo, total_valor_positivo",
+        metricas={"tkt": "COALESCE(SUM(src.total_valor_positivo) / NULLIF(SUM(src.qtd_valor_positivo), 0), 0)"},
+        filtros=evo_filtros,
+        params=params_evo,
+    )
+    evo_labels = serie_evo["labels"]
+    evo_ticket = [float(v or 0) for v in serie_evo["tkt"]]
 
     return {
         "kpis": {
@@ -366,28 +364,26 @@ def get_dashboard_logistica(
     frota_rows = db.execute(q_frota).mappings().all()
 
     intervals = get_chart_intervals(periodo)
-    labels = []
-    pesos = []
-    
-    for iv in intervals:
-        status_cond = "1=1"
-        c_params_chart = {"start": iv["start"], "end": iv["end"]}
-        if status and status != "Todos":
-            status_cond = "p.status = :status"
-            c_params_chart["status"] = status
-            
-        q_chart = text(f"""
-            SELECT COALESCE(SUM(p.peso_total_kg), 0) as p
-            FROM public.tb_cargas_pedidos cp
+
+    hist_filtros = "c.is_historico = TRUE"
+    hist_params = {}
+    if status and status != "Todos":
+        hist_filtros += " AND p.status = :status"
+        hist_params["status"] = status
+
+    serie_hist = agregar_por_intervalos(
+        db, intervals,
+        fonte="""public.tb_cargas_pedidos cp
             JOIN public.tb_pedidos p ON cp.numero_pedido = CAST(p.id_pedido AS VARCHAR)
-            JOIN public.tb_cargas c ON cp.id_carga = c.id
-            WHERE {status_cond}
-              AND c.is_historico = TRUE
-              AND c.data_criacao >= :start AND c.data_criacao < :end
-        """)
-        row = db.execute(q_chart, c_params_chart).mappings().first()
-        labels.append(iv["label"])
-        pesos.append(float(row["p"]))
+            JOIN public.tb_cargas c ON cp.id_carga = c.id""",
+        coluna_data="c.data_criacao",
+        colunas="p.peso_total_kg",
+        metricas={"p": "COALESCE(SUM(src.peso_total_kg), 0)"},
+        filtros=hist_filtros,
+        params=hist_params,
+    )
+    labels = serie_hist["labels"]
+    pesos = [float(v or 0) for v in serie_hist["p"]]
 
     cargas_env_val = int(kpi_env["cargas_env"] if kpi_env else 0)
     cargas_tot_val = int(kpi_tot["cargas_tot"] if kpi_tot else 0)
@@ -450,33 +446,33 @@ def get_dashboard_kpis(
     params = {}
     
     if year:
-        where_clause += " AND EXTRACT(YEAR FROM created_at) = :year"
+        where_clause += " AND EXTRACT(YEAR FROM dia) = :year"
         params["year"] = year
     if month:
-        where_clause += " AND EXTRACT(MONTH FROM created_at) = :month"
+        where_clause += " AND EXTRACT(MONTH FROM dia) = :month"
         params["month"] = month
 
     # 1. Faturamento Total
     q_faturamento = text(f"""
         SELECT COALESCE(SUM(total_pedido), 0) as total
-        FROM public.tb_pedidos
+        FROM {ROLLUP_PEDIDOS}
         WHERE status != 'Cancelado' {where_clause}
     """)
     faturamento = db.execute(q_faturamento, params).scalar() or 0
 
     # 2. Pedidos Pendentes
     q_pendentes = text(f"""
-        SELECT COUNT(id_pedido)
-        FROM public.tb_pedidos
+        SELECT COALESCE(SUM(qtd_pedidos), 0)
+        FROM {ROLLUP_PEDIDOS}
         WHERE status = 'Pedido' {where_clause}
     """)
     pendentes = db.execute(q_pendentes, params).scalar() or 0
 
     # 3. Ticket Médio
     q_ticket = text(f"""
-        SELECT COALESCE(AVG(total_pedido), 0) as avg_val
-        FROM public.tb_pedidos
-        WHERE status != 'Cancelado' AND total_pedido > 0 {where_clause}
+        SELECT COALESCE(SUM(total_valor_positivo) / NULLIF(SUM(qtd_valor_positivo), 0), 0) as avg_val
+        FROM {ROLLUP_PEDIDOS}
+        WHERE status != 'Cancelado' {where_clause}
     """)
     ticket_medio = db.execute(q_ticket, params).scalar() or 0
 
@@ -524,20 +520,19 @@ def get_dashboard_produtos(
     db: Session = Depends(get_db),
     current_user: UsuarioModel = Depends(get_current_user)
 ):
-    where_clause, params = get_dashboard_filters(status, periodo, filial)
+    where_clause, params = get_dashboard_filters(status, periodo, filial, coluna_data="dia")
 
     # Top 10 Produtos (Valor/Peso) sem frete
-    # i.subtotal_sem_f é o valor sem frete
+    # subtotal_sem_f é o valor sem frete
     q_top_produtos = text(f"""
         SELECT 
-            i.nome, 
-            SUM(i.quantidade) as qtd, 
-            COALESCE(SUM(i.subtotal_sem_f), 0) as fat,
-            COALESCE(SUM(CAST(i.peso_kg AS NUMERIC) * CAST(i.quantidade AS NUMERIC)), 0) as peso
-        FROM public.tb_pedidos_itens i
-        JOIN public.tb_pedidos p ON i.id_pedido = p.id_pedido
-        WHERE {where_clause.replace('status =', 'p.status =').replace('created_at >=', 'p.created_at >=').replace('fornecedor =', 'p.fornecedor =')} 
-          AND i.nome IS NOT NULL AND i.nome != ''
+            nome, 
+            SUM(quantidade) as qtd, 
+            COALESCE(SUM(subtotal_sem_f), 0) as fat,
+            COALESCE(SUM(peso_kg), 0) as peso
+        FROM {ROLLUP_ITENS}
+        WHERE {where_clause} 
+          AND nome IS NOT NULL AND nome != ''
         GROUP BY 1
         ORDER BY 3 DESC
         LIMIT 10
@@ -546,12 +541,10 @@ def get_dashboard_produtos(
 
     # Distribuição por Família
     q_familias = text(f"""
-        SELECT COALESCE(pr.familia, 'Sem Família') as fam, COALESCE(SUM(i.subtotal_com_f), 0) as fat
-        FROM public.tb_pedidos_itens i
-        JOIN public.tb_pedidos p ON i.id_pedido = p.id_pedido
-        LEFT JOIN public.t_cadastro_produto_v2 pr ON i.codigo = pr.codigo_supra
-        WHERE {where_clause.replace('status =', 'p.status =').replace('created_at >=', 'p.created_at >=').replace('fornecedor =', 'p.fornecedor =')}
-          AND pr.familia IS NOT NULL AND pr.familia != ''
+        SELECT familia as fam, COALESCE(SUM(subtotal_com_f), 0) as fat
+        FROM {ROLLUP_ITENS}
+        WHERE {where_clause}
+          AND familia IS NOT NULL AND familia != ''
         GROUP BY 1
         ORDER BY 2 DESC
         LIMIT 10
@@ -597,44 +590,48 @@ def get_dashboard_clientes(
     top_cli_rows = db.execute(q_top_cli, params).mappings().all()
 
     # Funil
-    where_period, period_params = get_dashboard_filters(None, periodo, filial)
+    where_period, period_params = get_dashboard_filters(None, periodo, filial, coluna_data="dia")
     q_funil = text(f"""
         SELECT 
-            COUNT(CASE WHEN status = 'Orçamento' THEN 1 END) as orcamentos,
-            COUNT(CASE WHEN status != 'Orçamento' AND status != 'Cancelado' THEN 1 END) as convertidos
-        FROM public.tb_pedidos
+            COALESCE(SUM(CASE WHEN status = 'Orçamento' THEN qtd_pedidos END), 0) as orcamentos,
+            COALESCE(SUM(CASE WHEN status != 'Orçamento' AND status != 'Cancelado' THEN qtd_pedidos END), 0) as convertidos
+        FROM {ROLLUP_PEDIDOS}
         WHERE {where_period}
     """)
     funil_row = db.execute(q_funil, period_params).mappings().first()
 
-    q_ticket_geral = text(f"SELECT COALESCE(AVG(total_pedido), 0) as med FROM public.tb_pedidos WHERE total_pedido > 0 AND {where_clause}")
-    tkt_row = db.execute(q_ticket_geral, params).mappings().first()
+    where_rollup, rollup_params = get_dashboard_filters(status, periodo, filial, coluna_data="dia")
+    q_ticket_geral = text(f"""
+        SELECT COALESCE(SUM(total_valor_positivo) / NULLIF(SUM(qtd_valor_positivo), 0), 0) as med
+        FROM {ROLLUP_PEDIDOS}
+        WHERE {where_rollup}
+    """)
+    tkt_row = db.execute(q_ticket_geral, rollup_params).mappings().first()
 
     # Evolução do Funil
     intervals = get_chart_intervals(periodo)
-    evo_labels = []
-    evo_orcamentos = []
-    evo_confirmados = []
-    
-    filial_clause = ""
+
+    funil_params = {}
+    funil_filtros = None
     if filial and filial != "Todos":
-        filial_clause = " AND fornecedor = :filial"
-    
-    for iv in intervals:
-        q_evo = text(f"""
-            SELECT 
-                COUNT(CASE WHEN status = 'Orçamento' THEN 1 END) as orcs,
-                COUNT(CASE WHEN status != 'Orçamento' AND status != 'Cancelado' THEN 1 END) as confs
-            FROM public.tb_pedidos
-            WHERE created_at >= :start AND created_at < :end {filial_clause}
-        """)
-        params_evo = {"start": iv["start"], "end": iv["end"]}
-        if filial and filial != "Todos": params_evo["filial"] = filial
-        
-        row = db.execute(q_evo, params_evo).mappings().first()
-        evo_labels.append(iv["label"])
-        evo_orcamentos.append(int(row["orcs"] or 0))
-        evo_confirmados.append(int(row["confs"] or 0))
+        funil_filtros = "fornecedor = :filial"
+        funil_params["filial"] = filial
+
+    serie_funil = agregar_por_intervalos(
+        db, intervals,
+        fonte=ROLLUP_PEDIDOS,
+        coluna_data="dia",
+        colunas="status, qtd_pedidos",
+        metricas={
+            "orcs": "COALESCE(SUM(CASE WHEN src.status = 'Orçamento' THEN src.qtd_pedidos END), 0)",
+            "confs": "COALESCE(SUM(CASE WHEN src.status != 'Orçamento' AND src.status != 'Cancelado' THEN src.qtd_pedidos END), 0)",
+        },
+        filtros=funil_filtros,
+        params=funil_params,
+    )
+    evo_labels = serie_funil["labels"]
+    evo_orcamentos = [int(v or 0) for v in serie_funil["orcs"]]
+    evo_confirmados = [int(v or 0) for v in serie_funil["confs"]]
 
     return {
         "top_clientes": {
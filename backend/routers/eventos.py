@@ -4,6 +4,7 @@ from typing import List
 from datetime import datetime, date
 from uuid import UUID
 from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
 
 from core.deps import get_db, get_current_user
 from models.usuario import UsuarioModel
@@ -63,6 +64,48 @@ def _check_event_access(db: Session, event_id: UUID, user_id: int, required_perm
         
     return event, share.permission_level
 
+def _montar_respostas(db: Session, events: List[EventModel], permissao) -> List[EventWithCalendarResponse]:
+    """
+    Monta as respostas com agenda, cliente e compartilhamentos de vários eventos com uma
+    consulta por entidade (IN), em vez de consultas por evento. `permissao(ev, calendar)`
+    devolve o nível de acesso do usuário ao evento.
+    """
+    cliente_ids = {ev.cliente_id for ev in events if ev.cliente_id}
+    clientes = {}
+    if cliente_ids:
+        clientes = {c.id: c for c in db.query(
+            ClienteModelV2.id,
+            ClienteModelV2.cadastro_nome_cliente,
+            ClienteModelV2.cadastro_nome_fantasia,
+            ClienteModelV2.compras_celular_responsavel,
+            ClienteModelV2.legal_celular,
+        ).filter(ClienteModelV2.id.in_(cliente_ids)).all()}
+
+    user_ids = {s.shared_with_user_id for ev in events for s in ev.shares}
+    emails = {}
+    if user_ids:
+        emails = dict(db.query(UsuarioModel.id, UsuarioModel.email).filter(UsuarioModel.id.in_(user_ids)).all())
+
+    results = []
+    for ev in events:
+        res = EventWithCalendarResponse.model_validate(ev)
+        calendar = ev.calendar
+        res.calendar_color = calendar.color if calendar else "#3182ce"
+        res.calendar_name = calendar.name if calendar else "Compartilhado"
+        res.permission_level = permissao(ev, calendar)
+
+        cliente = clientes.get(ev.cliente_id) if ev.cliente_id else None
+        if cliente:
+            res.cliente_nome = cliente.cadastro_nome_cliente or cliente.cadastro_nome_fantasia
+            res.cliente_telefone = cliente.compras_celular_responsavel or cliente.legal_celular
+
+        res.shared_with = [
+            {"id": str(s.id), "email": emails[s.shared_with_user_id], "permission_level": s.permission_level}
+            for s in ev.shares if s.shared_with_user_id in emails
+        ]
+        results.append(res)
+    return results
+
 @router.get("", response_model=List[EventWithCalendarResponse])
 def get_events(
     start_date: date,
@@ -80,8 +123,11 @@ def get_events(
     shared_events = db.query(EventShareModel).filter(EventShareModel.shared_with_user_id == current_user.id).all()
     shared_events_ids = [s.event_id for s in shared_events]
     
-    # Busca otimizada por intervalo
-    events = db.query(EventModel).filter(
+    # Busca otimizada por intervalo; agenda e compartilhamentos vêm em lote (selectinload)
+    events = db.query(EventModel).options(
+        selectinload(EventModel.calendar),
+        selectinload(EventModel.shares),
+    ).filter(
         or_(
             EventModel.calendar_id.in_(all_calendar_ids),
             EventModel.id.in_(shared_events_ids)
@@ -89,43 +135,18 @@ def get_events(
         EventModel.start_time >= start_date,
         EventModel.start_time <= end_date
     ).all()
-    
-    # Formatar resposta
-    results = []
-    for ev in events:
-        res = EventWithCalendarResponse.model_validate(ev)
-        calendar = db.query(CalendarModel).filter(CalendarModel.id == ev.calendar_id).first()
-        res.calendar_color = calendar.color if calendar else "#3182ce"
-        res.calendar_name = calendar.name if calendar else "Compartilhado"
-        
+
+    perm_calendarios = {s.calendar_id: s.permission_level for s in shared_calendars}
+    perm_eventos = {s.event_id: s.permission_level for s in shared_events}
+
+    def permissao(ev, calendar):
         if calendar and calendar.user_id == current_user.id:
-            res.permission_level = "admin"
-        else:
-            share_cal = next((s for s in shared_calendars if s.calendar_id == ev.calendar_id), None)
-            if share_cal:
-                res.permission_level = share_cal.permission_level
-            else:
-                share_ev = next((s for s in shared_events if s.event_id == ev.id), None)
-                res.permission_level = share_ev.permission_level if share_ev else "read"
-                
-        if ev.cliente_id:
-            cliente = db.query(ClienteModelV2).filter(ClienteModelV2.id == ev.cliente_id).first()
-            if cliente:
-                res.cliente_nome = cliente.cadastro_nome_cliente or cliente.cadastro_nome_fantasia
-                res.cliente_telefone = cliente.compras_celular_responsavel or cliente.legal_celular
-                
-        # Populate shared_with
-        shares_for_ev = db.query(EventShareModel).filter(EventShareModel.event_id == ev.id).all()
-        shared_list = []
-        for s in shares_for_ev:
-            u = db.query(UsuarioModel).filter(UsuarioModel.id == s.shared_with_user_id).first()
-            if u:
-                shared_list.append({"id": str(s.id), "email": u.email, "permission_level": s.permission_level})
-        res.shared_with = shared_list
-        
-        results.append(res)
-        
-    return results
+            return "admin"
+        if ev.calendar_id in perm_calendarios:
+            return perm_calendarios[ev.calendar_id]
+        return perm_eventos.get(ev.id, "read")
+
+    return _montar_respostas(db, events, permissao)
 
 @router.post("", response_model=EventWithCalendarResponse)
 def create_event(
@@ -164,26 +185,7 @@ def create_event(
                 db.add(new_share)
         db.commit()
     
-    res = EventWithCalendarResponse.model_validate(db_event)
-    res.calendar_color = calendar.color
-    res.calendar_name = calendar.name
-    res.permission_level = perm
-    
-    if db_event.cliente_id:
-        cliente = db.query(ClienteModelV2).filter(ClienteModelV2.id == db_event.cliente_id).first()
-        if cliente:
-            res.cliente_nome = cliente.cadastro_nome_cliente or cliente.cadastro_nome_fantasia
-            res.cliente_telefone = cliente.compras_celular_responsavel or cliente.legal_celular
-            
-    shares_for_ev = db.query(EventShareModel).filter(EventShareModel.event_id == db_event.id).all()
-    shared_list = []
-    for s in shares_for_ev:
-        u = db.query(UsuarioModel).filter(UsuarioModel.id == s.shared_with_user_id).first()
-        if u:
-            shared_list.append({"id": str(s.id), "email": u.email, "permission_level": s.permission_level})
-    res.shared_with = shared_list
-
-    return res
+    return _montar_respostas(db, [db_event], lambda ev, cal: perm)[0]
 
 @router.put("/{event_id}", response_model=EventWithCalendarResponse)
 def update_event(
@@ -216,27 +218,7 @@ def update_event(
     db.commit()
     db.refresh(db_event)
     
-    res = EventWithCalendarResponse.model_validate(db_event)
-    calendar = db.query(CalendarModel).filter(CalendarModel.id == db_event.calendar_id).first()
-    res.calendar_color = calendar.color if calendar else "#3182ce"
-    res.calendar_name = calendar.name if calendar else "Compartilhado"
-    res.permission_level = perm
-    
-    if db_event.cliente_id:
-        cliente = db.query(ClienteModelV2).filter(ClienteModelV2.id == db_event.cliente_id).first()
-        if cliente:
-            res.cliente_nome = cliente.cadastro_nome_cliente or cliente.cadastro_nome_fantasia
-            res.cliente_telefone = cliente.compras_celular_responsavel or cliente.legal_celular
-            
-    shares_for_ev = db.query(EventShareModel).filter(EventShareModel.event_id == db_event.id).all()
-    shared_list = []
-    for s in shares_for_ev:
-        u = db.query(UsuarioModel).filter(UsuarioModel.id == s.shared_with_user_id).first()
-        if u:
-            shared_list.append({"id": str(s.id), "email": u.email, "permission_level": s.permission_level})
-    res.shared_with = shared_list
-
-    return res
+    return _montar_respostas(db, [db_event], lambda ev, cal: perm)[0]
 
 @router.delete("/{event_id}")
 def delete_event(
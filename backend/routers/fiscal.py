@@ -7,7 +7,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from database import SessionLocal
-from services.fiscal import decide_st, calcular_linha, D, money, _norm
+from services.fiscal import decide_st, calcular_linha, D, money, _norm, FiscalBatch, perfil_fiscal
 
 router = APIRouter(tags=["Fiscal"])
 
@@ -142,13 +142,8 @@ def preview_linha(payload: LinhaPreviewIn, db: Session = Depends(get_db)):
         tipo = produto.get("tipo") or getattr(payload, "tipo", None)
 
         peso = produto.get("peso_kg") or getattr(payload, "peso_kg", None)
-        peso = D(peso)
-        ipi_prod = D(produto.get("ipi", 0))
-        # nova regra:
-        ipi = ipi_prod if ((_norm(tipo) == "pet" or _norm(tipo) == "insumos") and peso is not None and peso <= D(10)) else D(0)
-
-        iva_st = D(produto.get("iva_st", 0))
-        icms = D(produto.get("icms", 0.18))
+        # nova regra: IPI só para pet/insumos de até 10 kg
+        perfil = perfil_fiscal(tipo, peso, produto.get("ipi", 0), produto.get("icms", 0.18), produto.get("iva_st", 0))
 
         aplica, motivos = decide_st(
             tipo=tipo,
@@ -162,7 +157,7 @@ def preview_linha(payload: LinhaPreviewIn, db: Session = Depends(get_db)):
             quantidade=payload.quantidade,
             desconto_linha=payload.desconto_linha,
             frete_linha=payload.frete_linha,
-            ipi=ipi, icms=icms, iva_st=iva_st,
+            ipi=perfil.ipi, icms=perfil.icms, iva_st=perfil.iva_st,
             aplica_st=aplica
         )
         
@@ -242,8 +237,9 @@ def preview_batch(payload: LinhaPreviewBatchIn, db: Session = Depends(get_db)):
         all_pids = [it.produto_id for it in payload.itens if it.produto_id]
         produtos_map = carregar_produtos_batch(db, all_pids)
 
-        results = []
-        
+        # 3. Monta as colunas do lote (um perfil fiscal por produto distinto)
+        perfis, decisoes = [], []
+        perfis_por_produto = {}
         for it in payload.itens:
             # Fallback local se vier no item
             produto = produtos_map.get(str(it.produto_id), {})
@@ -253,51 +249,50 @@ def preview_batch(payload: LinhaPreviewBatchIn, db: Session = Depends(get_db)):
             tipo_cliente = tipo_cliente_global or it.ramo_juridico
             
             tipo = produto.get("tipo") or it.tipo
-            
             peso = produto.get("peso_kg") or it.peso_kg
-            peso = D(peso)
-            
-            ipi_prod = D(produto.get("ipi", 0))
+
             # regra pet/insumos <= 10kg
-            ipi = ipi_prod if ((_norm(tipo) == "pet" or _norm(tipo) == "insumos") and peso is not None and peso <= D(10)) else D(0)
-
-            iva_st = D(produto.get("iva_st", 0))
-            icms = D(produto.get("icms", 0.18))
-
-            # forcar_iva_st pode vir do header ou do item?
-            # O header batch tem `forcar_iva_st`. O item NÃO tem no schema original `LinhaPreviewIn` (tem sim! linha 23).
-            # Vamos usar o do item se definido, ou herdar? 
-            # Na V1, `preview_linha` recebe `forcar_iva_st` no payload.
-            # Aqui vamos assumir que o front passa no ITEM o valor correto (já combinado header+linha).
-            # MAS o front atual monta o payload item a item. 
-            # O LinhaPreviewBatchIn tem `forcar_iva_st` global.
-            # Vamos priorizar o do item se o front mandar.
+            chave = (tipo, D(peso), str(it.produto_id))
+            if chave not in perfis_por_produto:
+                perfis_por_produto[chave] = perfil_fiscal(
+                    tipo, peso, produto.get("ipi", 0), produto.get("icms", 0.18), produto.get("iva_st", 0)
+                )
+            perfis.append(perfis_por_produto[chave])
+
+            # forcar_iva_st pode vir do header ou do item: o front já manda no item o valor
+            # combinado, mas o header batch também tem `forcar_iva_st`.
             forcado = it.forcar_iva_st or payload.forcar_iva_st
 
-            aplica, motivos = decide_st(
+            decisoes.append(decide_st(
                 tipo=tipo,
                 tipo_cliente=tipo_cliente,
                 forcar_iva_st=forcado
-            )
-            
-            comp = calcular_linha(
-                preco_unit=it.preco_unit,
-                quantidade=it.quantidade,
-                desconto_linha=it.desconto_linha,
-                frete_linha=it.frete_linha,
-                ipi=ipi, icms=icms, iva_st=iva_st,
-                aplica_st=aplica
-            )
-            
+            ))
+
+        # 4. Cálculo fiscal de todas as linhas de uma vez
+        itens = payload.itens
+        res = FiscalBatch(
+            preco_unit=[it.preco_unit for it in itens],
+            perfis=perfis,
+            aplica_st=[aplica for aplica, _ in decisoes],
+            frete_linha=[it.frete_linha for it in itens],
+            quantidade=[it.quantidade for it in itens],
+            desconto_linha=[it.desconto_linha for it in itens],
+        ).calcular()
+        comp = {chave: res.reais(chave) for chave in res.centavos}
+
+        results = []
+        for i, it in enumerate(itens):
+            aplica, motivos = decisoes[i]
             results.append(LinhaPreviewOut(
                 aplica_iva_st=aplica, motivos_iva_st=motivos,
-                subtotal_mercadoria=float(comp["subtotal"]),
-                base_ipi=float(comp["base_ipi"]), ipi=float(comp["ipi"]),
-                base_icms_proprio=float(comp["base_icms"]), icms_proprio=float(comp["icms_proprio"]),
-                base_st=float(comp["base_st"]), icms_st_cheio=float(comp["icms_st_cheio"]), icms_st_reter=float(comp["icms_st_reter"]),
+                subtotal_mercadoria=float(comp["subtotal"][i]),
+                base_ipi=float(comp["base_ipi"][i]), ipi=float(comp["ipi"][i]),
+                base_icms_proprio=float(comp["base_icms"][i]), icms_proprio=float(comp["icms_proprio"][i]),
+                base_st=float(comp["base_st"][i]), icms_st_cheio=float(comp["icms_st_cheio"][i]), icms_st_reter=float(comp["icms_st_reter"][i]),
                 desconto_linha=float(money(it.desconto_linha)), frete_linha=float(money(it.frete_linha)),
-                total_linha=float(comp["total_sem_st"]), total_linha_com_st=float(comp["total_com_st"]),
-                total_impostos_linha=float(comp["total_impostos"])
+                total_linha=float(comp["total_sem_st"][i]), total_linha_com_st=float(comp["total_com_st"][i]),
+                total_impostos_linha=float(comp["total_impostos"][i])
             ))
             
         return LinhaPreviewBatchOut(results=results)
@@ -189,7 +189,7 @@ def baixar_lista_preco(code: str, modo: str = "ambos"):
         })
 
 @router.get("/pdf_cliente/{code}")
-def baixar_pdf_cliente(code: str):
+def baixar_pdf_cliente(code: str, request: Request):
     """
     Endpoint dedicado para o cliente baixar o PDF do orçamento (Layout Cliente).
     Busca o pedido associado ao 'link_token' (que é o 'code').
@@ -217,15 +217,15 @@ def baixar_pdf_cliente(code: str):
 
         try:
             from services.pedido_pdf_data import carregar_pedido_pdf
-            from services.pdf_service import gerar_pdf_pedido
+            from services.pdf_cache import obter_pdf_pedido, resposta_pdf
             
             print(f"[baixar_pdf_cliente] Gerando PDF para pedido_id={pedido_id} (Token: {code})")
             
             # Carrega dados
             pedido_pdf = carregar_pedido_pdf(db, pedido_id)
             
-            # Gera PDF com flag sem_validade=True (LAYOUT CLIENTE / ORÇAMENTO)
-            pdf_bytes = gerar_pdf_pedido(pedido_pdf, sem_validade=True)
+            # PDF com flag sem_validade=True (LAYOUT CLIENTE / ORÇAMENTO), do cache se o pedido não mudou
+            pdf_bytes, etag = obter_pdf_pedido(pedido_pdf, sem_validade=True)
             
             # Nome do arquivo seguro
             import re
@@ -233,12 +233,7 @@ def baixar_pdf_cliente(code: str):
             safe_cliente = re.sub(r'\s+', ' ', safe_cliente)
             filename = f"Orcamento_{pedido_id}_{safe_cliente}.pdf"
             
-            return Response(content=pdf_bytes, media_type="application/pdf", headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-                "Pragma": "no-cache",
-                "Expires": "0"
-            })
+            return resposta_pdf(request, pdf_bytes, etag, f'attachment; filename="{filename}"')
             
         except Exception as e:
             # Logar erro real no server
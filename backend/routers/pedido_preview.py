@@ -16,7 +16,7 @@ import logging
 from schemas.pedido_confirmacao import ConfirmarPedidoRequest
 from services.pedido_confirmacao_service import criar_pedido_confirmado
 from services.tabela_preco import cliente_calcula_st
-from services.fiscal import calcular_linha
+from services.fiscal import FiscalBatch, perfil_fiscal
 
 router = APIRouter(prefix="/pedido", tags=["Pedido"])
 logger = logging.getLogger(__name__)
@@ -109,39 +109,45 @@ async def pedido_preview(
         if not rows:
             raise HTTPException(status_code=404, detail="Tabela sem itens ou não encontrada")
 
-        produtos: List[ProdutoPedidoPreview] = []
+        # Colunas do cálculo fiscal (um perfil por combinação de tipo/peso/alíquotas)
+        precos_fiscais, fretes, perfis = [], [], []
+        perfis_cache = {}
         for r in rows:
             valor_base = float(r.get("valor_produto") or 0.0)
             comissao = float(r.get("comissao_aplicada") or 0.0)
             ajuste = float(r.get("ajuste_pagamento") or 0.0)
-            frete_unit = float(r.get("valor_frete_unitario") or 0.0)
             
             # Preço fiscal unitário = (valor - comissao) + ajuste
-            preco_fiscal_unit = max(0.0, valor_base - comissao) + ajuste
-            
-            # Alíquotas
-            tipo_prod = str(r.get("tipo_produto") or "").strip().lower()
-            is_pet = (tipo_prod == "pet" or tipo_prod == "insumos")
-            peso_liq = float(r.get("peso") or 0.0)
-            
-            ipi_rate = float(r.get("tax_ipi") or 0.0) if (is_pet and peso_liq <= 10) else 0.0
-            icms_rate = float(r.get("tax_icms") or 0.18)
-            iva_st_rate = float(r.get("tax_iva_st") or 0.0)
+            precos_fiscais.append(max(0.0, valor_base - comissao) + ajuste)
+            fretes.append(float(r.get("valor_frete_unitario") or 0.0))
             
-            # Lógica fiscal em tempo de execução
-            res_fiscal = calcular_linha(
-                preco_unit=preco_fiscal_unit,
-                quantidade=1,
-                desconto_linha=0,
-                frete_linha=frete_unit,
-                ipi=ipi_rate,
-                icms=icms_rate,
-                iva_st=iva_st_rate,
-                aplica_st=aplica_st
+            # Alíquotas (IPI só para pet/insumos até 10 kg)
+            chave = (
+                str(r.get("tipo_produto") or ""),
+                float(r.get("peso") or 0.0),
+                float(r.get("tax_ipi") or 0.0),
+                float(r.get("tax_icms") or 0.18),
+                float(r.get("tax_iva_st") or 0.0),
             )
+            if chave not in perfis_cache:
+                perfis_cache[chave] = perfil_fiscal(*chave)
+            perfis.append(perfis_cache[chave])
+
+        # Lógica fiscal em tempo de execução, para todos os itens de uma vez
+        totais = FiscalBatch(
+            preco_unit=precos_fiscais,
+            perfis=perfis,
+            aplica_st=[aplica_st] * len(rows),
+            frete_linha=fretes,
+        ).calcular().reais("total_com_st")
+
+        produtos: List[ProdutoPedidoPreview] = []
+        for i, r in enumerate(rows):
+            frete_unit = fretes[i]
+            peso_liq = float(r.get("peso") or 0.0)
             
             # Totais recalculados
-            total_comercial = float(res_fiscal["total_com_st"])
+            total_comercial = float(totais[i])
             total_sem_frete = max(0.0, total_comercial - frete_unit)
             
             markup_pct = float(r.get("markup") or 0.0)
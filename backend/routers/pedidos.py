@@ -1,4 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime, timedelta,date
@@ -8,13 +10,25 @@ from sqlalchemy import text
 from database import SessionLocal  # usa seu database.py
 from services.pedidos import (
     LISTAGEM_SQL, COUNT_SQL, RESUMO_SQL, ITENS_JSON_SQL,
-    STATUS_SQL, STATUS_UPDATE_SQL, STATUS_EVENT_INSERT_SQL
+    STATUS_SQL, STATUS_UPDATE_SQL, STATUS_EVENT_INSERT_SQL,
+    encode_cursor, decode_cursor
 )
+from core.cache import TTLCache
+from services.vendas_rollup import atualizar_rollup_pedidos, atualizar_rollup_dias, dias_dos_pedidos
+from services.busca import filtro_pedidos_cliente
+from services.pedido_itens import frete_admin, frete_edicao, inserir_itens, preparar_itens, sincronizar_itens
+from services.pdf_cache import enfileirar_render_pdf, pdf_do_render, resposta_pdf, situacao_render
 
+import asyncio
 import re
+import time
 
 router = APIRouter(prefix="/api/pedidos", tags=["Pedidos"])
 
+# Total da listagem no modo cursor: contado uma vez por combinação de filtros e reaproveitado
+# enquanto o usuário navega pelas páginas (evita um COUNT(*) a cada página).
+_listagem_total_cache = TTLCache(ttl_seconds=60, maxsize=512)
+
 from utils.string_utils import clean_client_name
 
 
@@ -94,7 +108,8 @@ class ListagemResponse(BaseModel):
     data: List[PedidoListItem]
     page: int
     pageSize: int
-    total: int
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class PedidoItemResumo(BaseModel):
     codigo: str
@@ -233,9 +248,14 @@ def listar_pedidos(
     pageSize: int = 25,
     limit: Optional[int] = None,
     offset: Optional[int] = None,
+    paginacao: str = Query("offset", description="offset (padrão) | cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor devolvido pela página anterior (modo cursor)"),
+    com_total: bool = Query(True, description="No modo cursor, permite dispensar a contagem total"),
     db: Session = Depends(get_db)
 ):
     # 1. Paginação
+    # Modo cursor (keyset): ativado explicitamente ou quando o front devolve um cursor.
+    modo_cursor = paginacao == "cursor" or bool(cursor)
     limit = pageSize
     offset = (page - 1) * pageSize
     if offset < 0:
@@ -304,8 +324,11 @@ def listar_pedidos(
         params["tabela_nome"] = f"%{tabela_nome}%"
 
     if cliente:
-        filtros_sql.append("(a.cliente ILIKE :cliente_busca OR a.codigo_cliente ILIKE :cliente_busca)")
-        params["cliente_busca"] = f"%{cliente}%"
+        # nome ou código, sem acento, via índice trigram (busca_normalizada)
+        filtro_cliente = filtro_pedidos_cliente(db, cliente)
+        if filtro_cliente:
+            filtros_sql.append(filtro_cliente.where)
+            params.update(filtro_cliente.params)
 
     if fornecedor:
         filtros_sql.append("a.fornecedor ILIKE :fornecedor_busca")
@@ -340,7 +363,7 @@ def listar_pedidos(
         elif modalidade.upper() == "RETIRADA":
             filtros_sql.append("(a.usar_valor_com_frete = FALSE OR a.usar_valor_com_frete IS NULL)")
 
-    where_clause = " AND ".join(filtros_sql)
+    where_clause = " AND ".join(filtros_sql) or "1=1"
 
     # 6. montar SQL COUNT e LISTAGEM de forma segura
     count_sql = text(f"""
@@ -349,8 +372,43 @@ def listar_pedidos(
         WHERE {where_clause}
     """)
 
+    if modo_cursor:
+        return _listar_pedidos_cursor(db, where_clause, params, pageSize, cursor, com_total, count_sql)
+
     listagem_sql = text(f"""
         SELECT
+          {_LISTAGEM_COLUNAS}
+        {_LISTAGEM_FROM}
+        WHERE {where_clause}
+        ORDER BY a.id_pedido DESC
+        LIMIT :limit OFFSET :offset
+    """)
+
+    # adiciona paginação nos params da listagem
+    params_listagem = {
+        **params,
+        "limit": limit,
+        "offset": offset,
+    }
+
+    # 7. executa
+    total_row = db.execute(count_sql, params).mappings().first()
+    total = total_row["total"] if total_row and "total" in total_row else 0
+
+    rows_raw = db.execute(listagem_sql, params_listagem).mappings().all()
+
+    # 8. monta resposta
+    rows = [_row_to_list_item(r) for r in rows_raw]
+
+    return {
+        "data": rows,
+        "page": page,
+        "pageSize": pageSize,
+        "total": total,
+    }
+
+
+_LISTAGEM_COLUNAS = """
           a.id_pedido                               AS numero_pedido,
           a.created_at                              AS data_pedido,
           COALESCE(c.cadastro_nome_cliente, a.cliente) AS cliente_nome,
@@ -370,6 +428,9 @@ def listar_pedidos(
           a.nota_fiscal,
           a.data_faturamento,
           cg2.numero_carga AS numero_carga
+"""
+
+_LISTAGEM_FROM = """
         FROM public.tb_pedidos a
         LEFT JOIN public.t_cadastro_cliente_v2 c 
           ON c.cadastro_codigo_da_empresa::text = a.codigo_cliente 
@@ -379,57 +440,92 @@ def listar_pedidos(
           FROM public.tb_cargas_pedidos cp
           JOIN public.tb_cargas cr ON cr.id = cp.id_carga
         ) cg2 ON cg2.numero_pedido::text = a.id_pedido::text
-        WHERE {where_clause}
-        ORDER BY a.id_pedido DESC
-        LIMIT :limit OFFSET :offset
-    """)
+"""
+
+
+def _row_to_list_item(r) -> PedidoListItem:
+    return PedidoListItem(
+        numero_pedido      = r["numero_pedido"],
+        data_pedido        = r["data_pedido"],
+        cliente_nome       = clean_client_name(r["cliente_nome"]),
+        cliente_codigo     = r["cliente_codigo"],
+        modalidade         = r["modalidade"],
+        valor_total        = r["valor_total"],
+        status_codigo      = r["status_codigo"],
+        tabela_preco_nome  = r["tabela_preco_nome"],
+        fornecedor         = r["fornecedor"],
+        link_url           = r["link_url"],
+        link_status        = r["link_status"],
+        link_enviado       = r["link_enviado"],
+        peso_total         = float(r["peso_total"] or 0),
+        municipio          = r.get("municipio"),
+        rota_principal     = r.get("rota_principal"),
+        pedido_supra       = r.get("pedido_supra"),
+        nota_fiscal        = r.get("nota_fiscal"),
+        data_faturamento   = r.get("data_faturamento"),
+        numero_carga       = r.get("numero_carga")
+    )
 
-    # adiciona paginação nos params da listagem
-    params_listagem = {
-        **params,
-        "limit": limit,
-        "offset": offset,
-    }
 
-    # 7. executa
-    total_row = db.execute(count_sql, params).mappings().first()
-    total = total_row["total"] if total_row and "total" in total_row else 0
+def _listar_pedidos_cursor(db: Session, where_clause: str, params: dict, page_size: int,
+                           cursor: Optional[str], com_total: bool, count_sql):
+    """
+    Paginação keyset ordenada por (created_at, id_pedido) DESC.
+    Cada página custa o mesmo independente da profundidade (sem OFFSET), e o total
+    é opcional e reaproveitado do cache enquanto os filtros não mudam.
+    """
+    page_size = max(1, min(int(page_size or 25), 500))
+    filtros_keyset = [where_clause]
+    params_listagem = {**params, "limit": page_size + 1}
 
+    if cursor:
+        try:
+            cur_created_at, cur_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params_listagem["cur_id"] = cur_id
+        if cur_created_at is not None:
+            # Pedidos sem created_at vêm depois de todos os datados (NULLS LAST)
+            filtros_keyset.append(
+                "((a.created_at, a.id_pedido) < (:cur_created_at, :cur_id) OR a.created_at IS NULL)"
+            )
+            params_listagem["cur_created_at"] = cur_created_at
+        else:
+            filtros_keyset.append("(a.created_at IS NULL AND a.id_pedido < :cur_id)")
+
+    listagem_sql = text(f"""
+        SELECT
+          {_LISTAGEM_COLUNAS}
+        {_LISTAGEM_FROM}
+        WHERE {" AND ".join(filtros_keyset)}
+        ORDER BY a.created_at DESC NULLS LAST, a.id_pedido DESC
+        LIMIT :limit
+    """)
     rows_raw = db.execute(listagem_sql, params_listagem).mappings().all()
 
-    # 8. monta resposta
-    rows = [
-        PedidoListItem(
-            numero_pedido      = r["numero_pedido"],
-            data_pedido        = r["data_pedido"],
-            cliente_nome       = clean_client_name(r["cliente_nome"]),
-            cliente_codigo     = r["cliente_codigo"],
-            modalidade         = r["modalidade"],
-            valor_total        = r["valor_total"],
-            status_codigo      = r["status_codigo"],
-            tabela_preco_nome  = r["tabela_preco_nome"],
-            fornecedor         = r["fornecedor"],
-            link_url           = r["link_url"],
-            link_status        = r["link_status"],
-            link_enviado       = r["link_enviado"],
-            peso_total         = float(r["peso_total"] or 0),
-            municipio          = r.get("municipio"),
-            rota_principal     = r.get("rota_principal"),
-            pedido_supra       = r.get("pedido_supra"),
-            nota_fiscal        = r.get("nota_fiscal"),
-            data_faturamento   = r.get("data_faturamento"),
-            numero_carga       = r.get("numero_carga")
+    tem_proxima = len(rows_raw) > page_size
+    rows_raw = rows_raw[:page_size]
+    next_cursor = None
+    if tem_proxima and rows_raw:
+        ultima = rows_raw[-1]
+        next_cursor = encode_cursor(ultima["data_pedido"], ultima["numero_pedido"])
+
+    total = None
+    if com_total:
+        chave = (where_clause, tuple(sorted((k, str(v)) for k, v in params.items())))
+        total = _listagem_total_cache.get_or_set(
+            chave, lambda: int(db.execute(count_sql, params).scalar() or 0)
         )
-        for r in rows_raw
-    ]
 
     return {
-        "data": rows,
-        "page": page,
-        "pageSize": pageSize,
+        "data": [_row_to_list_item(r) for r in rows_raw],
+        "page": 1,
+        "pageSize": page_size,
         "total": total,
+        "next_cursor": next_cursor,
     }
 
+
 @router.get("/{id_pedido}/resumo", response_model=PedidoResumo)
 def resumo_pedido(id_pedido: int, db: Session = Depends(get_db)):
     head = db.execute(RESUMO_SQL, {"id_pedido": id_pedido}).mappings().first()
@@ -479,7 +575,8 @@ def atualizar_pedido(
     id_pedido: int,
     body: PedidoUpdateRequest,
     db: Session = Depends(get_db),
-    user_id: Optional[str] = Query(None)
+    user_id: Optional[str] = Query(None),
+    pdf_async: bool = Query(False, description="Gera o PDF em segundo plano e devolve um ticket em vez do base64"),
 ):
     from models.pedido import PedidoModel
     import json
@@ -494,18 +591,12 @@ def atualizar_pedido(
     if status_atual not in ["ORCAMENTO", "ORÇAMENTO"]:
         raise HTTPException(status_code=400, detail="Apenas pedidos com status 'Orçamento' podem ser editados.")
 
-    # 3. Recalcular os totais
-    peso_total_kg = 0.0
-    total_sem_frete = 0.0
-    total_com_frete = 0.0
-
-    for it in body.produtos:
-        qtd = float(it.quantidade or 0)
-        peso_total_kg += float(it.peso_kg or 0) * qtd
-        total_sem_frete += float(it.preco_unit or 0) * qtd
-        total_com_frete += float((it.preco_unit_com_frete if it.preco_unit_com_frete is not None else it.preco_unit) or 0) * qtd
-
-    frete_total = max(0.0, total_com_frete - total_sem_frete)
+    # 3. Validar itens e recalcular os totais (uma passada)
+    linhas_itens, totais = preparar_itens(body.produtos, frete_edicao)
+    peso_total_kg = totais["peso_total_kg"]
+    total_sem_frete = totais["total_sem_frete"]
+    total_com_frete = totais["total_com_frete"]
+    frete_total = totais["frete_total"]
     
     # Regra: Só marca frete se houver valor de frete no total
     final_usar_valor_com_frete = True if frete_total > 0.001 else False
@@ -535,62 +626,10 @@ def atualizar_pedido(
     db.add(pedido)
     print(f"[DEBUG] Atualizando pedido {id_pedido}: Peso={pedido.peso_total_kg}, Frete={pedido.frete_total}, Total={pedido.total_pedido}")
 
-    # 5. Deletar os itens antigos da tabela tb_pedidos_itens
-    db.execute(text("DELETE FROM public.tb_pedidos_itens WHERE id_pedido = :id_pedido"), {"id_pedido": id_pedido})
-
-    # 6. Inserir os novos itens
-    insert_item_sql = text("""
-        INSERT INTO tb_pedidos_itens (
-            id_pedido, codigo, nome, embalagem, peso_kg,
-            condicao_pagamento, tabela_comissao,
-            preco_unit, preco_unit_frt, valor_frete_unitario, frete_base_ton, quantidade,
-            subtotal_sem_f, subtotal_com_f, manual_freight,
-            markup, valor_final_markup, valor_s_frete_markup
-        ) VALUES (
-            :id_pedido, :codigo, :nome, :embalagem, :peso_kg,
-            :condicao_pagamento, :tabela_comissao,
-            :preco_unit, :preco_unit_frt, :valor_frete_unitario, :frete_base_ton, :quantidade,
-            :subtotal_sem_f, :subtotal_com_f, :manual_freight,
-            :markup, :valor_final_markup, :valor_s_frete_markup
-        )
-    """)
+    # 5. Aplicar nos itens só o que mudou (update/insert/delete)
+    sincronizar_itens(db, id_pedido, linhas_itens)
 
-    for it in body.produtos:
-        qtd = float(it.quantidade or 0)
-        p_sem = float(it.preco_unit or 0)
-        p_com = float((it.preco_unit_com_frete if it.preco_unit_com_frete is not None else it.preco_unit) or 0)
-        
-        # Se manual_freight for verdadeiro, usa frete_base_ton para calcular o frete unitário
-        if bool(getattr(it, "manual_freight", False)):
-            base_ton = float(it.frete_base_ton or 0)
-            v_frete = round((base_ton / 1000.0) * float(it.peso_kg or 0), 2)
-            v_frete_unitario_final = v_frete # No item, guardamos o resultado unitário
-        else:
-            v_frete = round(p_com - p_sem, 2)
-            v_frete_unitario_final = v_frete
-
-        db.execute(insert_item_sql, {
-            "id_pedido": id_pedido,
-            "codigo": (it.codigo or "")[:80],
-            "nome": (it.descricao or "")[:255] or None,
-            "embalagem": getattr(it, "embalagem", None),
-            "peso_kg": float(it.peso_kg or 0),
-            "condicao_pagamento": it.condicao_pagamento,
-            "tabela_comissao": it.tabela_comissao,
-            "preco_unit": round(p_sem, 2),
-            "preco_unit_frt": round(p_sem + v_frete, 2),
-            "valor_frete_unitario": v_frete_unitario_final,
-            "frete_base_ton": float(it.frete_base_ton or 0),
-            "quantidade": qtd,
-            "subtotal_sem_f": round(p_sem * qtd, 2),
-            "subtotal_com_f": round(p_com * qtd, 2),
-            "manual_freight": bool(getattr(it, "manual_freight", False)),
-            "markup": float(getattr(it, "markup", 0.0) or 0.0),
-            "valor_final_markup": float(getattr(it, "valor_final_markup", 0.0) or 0.0),
-            "valor_s_frete_markup": float(getattr(it, "valor_s_frete_markup", 0.0) or 0.0),
-        })
-
-    # 7. Logar evento de edição (usando a tabela de status_event como log geral)
+    # 6. Logar evento de edição (usando a tabela de status_event como log geral)
     try:
         with db.begin_nested():
             db.execute(STATUS_EVENT_INSERT_SQL, {
@@ -604,17 +643,28 @@ def atualizar_pedido(
     except Exception:
         pass
 
+    atualizar_rollup_pedidos(db, [id_pedido])
+    # Modo assíncrono: a renderização vai para a fila junto com a edição (mesmo commit)
+    pdf_ticket = enfileirar_render_pdf(db, id_pedido) if pdf_async else None
     db.commit()
 
+    if pdf_ticket:
+        return {
+            "ok": True,
+            "id": id_pedido,
+            "pdf_ticket": pdf_ticket,
+            "pdf_url": f"/api/pedidos/{id_pedido}/pdf/{pdf_ticket}",
+        }
+
     # Retorna o PDF base64 do cliente para download imediato, igual na criação
     from services.pedido_pdf_data import carregar_pedido_pdf
-    from services.pdf_service import gerar_pdf_pedido
+    from services.pdf_cache import obter_pdf_pedido
     import base64
     
     try:
         obj_pdf_cliente = carregar_pedido_pdf(db, id_pedido)
-        # Por padrão a criação envia "sem_validade=False"
-        pdf_bytes_cliente = gerar_pdf_pedido(obj_pdf_cliente, sem_validade=False)
+        # Por padrão a criação envia "sem_validade=False"; fica no cache para a visualização/worker
+        pdf_bytes_cliente, _ = obter_pdf_pedido(obj_pdf_cliente, sem_validade=False)
         pdf_b64 = base64.b64encode(pdf_bytes_cliente).decode('utf-8')
     except Exception as e:
         import logging
@@ -671,6 +721,54 @@ def verificar_e_historico_carga(db: Session, id_pedido: int, user_id: Optional[s
         logger = logging.getLogger("ordersync.errors")
         logger.error(f"Erro ao verificar histórico de carga {id_pedido}: {e}\n{traceback.format_exc()}")
 
+def _consultar_render(id_pedido: int, ticket: str):
+    with SessionLocal() as db:
+        task = situacao_render(db, id_pedido, ticket)
+        if task is None:
+            return None
+        return task.status, task.resultado or {}, task.erro_msg
+
+
+def _carregar_render(id_pedido: int, chave: Optional[str]):
+    with SessionLocal() as db:
+        return pdf_do_render(db, id_pedido, chave)
+
+
+@router.get("/{id_pedido:int}/pdf/{ticket}")
+async def baixar_pdf_renderizado(
+    id_pedido: int,
+    ticket: str,
+    request: Request,
+    aguardar: float = Query(0, ge=0, le=30, description="Segundos para esperar a renderização antes de responder 202"),
+):
+    """
+    PDF gerado em segundo plano pela edição (PUT com pdf_async=true), em binário.
+    Pronto: bytes do cache de PDFs, com ETag/304 como nas demais rotas de PDF.
+    Ainda na fila: espera até `aguardar` segundos; se não ficar pronto, 202 + Retry-After.
+    """
+    limite = time.monotonic() + aguardar
+    while True:
+        situacao = await run_in_threadpool(_consultar_render, id_pedido, ticket)
+        if situacao is None:
+            raise HTTPException(status_code=404, detail="Ticket de PDF não encontrado")
+        status_render, resultado, erro = situacao
+        if status_render in ("CONCLUIDO", "ERRO") or time.monotonic() >= limite:
+            break
+        await asyncio.sleep(0.25)
+
+    if status_render == "ERRO":
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar PDF: {erro}")
+    if status_render != "CONCLUIDO":
+        return JSONResponse(
+            status_code=202,
+            content={"status": status_render, "ticket": ticket},
+            headers={"Retry-After": "1"},
+        )
+
+    pdf_bytes, etag = await run_in_threadpool(_carregar_render, id_pedido, resultado.get("chave"))
+    return resposta_pdf(request, pdf_bytes, etag, f'inline; filename="Pedido_{id_pedido}.pdf"')
+
+
 @router.get("/status", response_model=StatusListResponse)
 
 def listar_status(db: Session = Depends(get_db)):
@@ -750,6 +848,7 @@ def mudar_status(id_pedido: int, body: StatusChangeBody, db: Session = Depends(g
     if body.para and body.para.lower() in ("faturado supra", "faturado dispet", "cancelado"):
         verificar_e_historico_carga(db, id_pedido, body.user_id)
 
+    atualizar_rollup_pedidos(db, [id_pedido])
     db.commit()
     return {"ok": True}
 
@@ -774,6 +873,8 @@ def atualizar_campos_faturamento(id_pedido: int, body: PedidoCamposFaturamento,
             pass
         
     db.add(pedido)
+    db.flush()
+    atualizar_rollup_pedidos(db, [id_pedido])
     db.commit()
     return {"ok": True, "pedido_supra": pedido.pedido_supra, "nota_fiscal": pedido.nota_fiscal, "valor_nota": pedido.valor_nota, "data_faturamento": str(pedido.data_faturamento) if pedido.data_faturamento else None}
 
@@ -814,6 +915,7 @@ def cancelar_pedido(id_pedido: int, db: Session = Depends(get_db), user_id: Opti
         pass
 
     verificar_e_historico_carga(db, id_pedido, user_id or "sistema")
+    atualizar_rollup_pedidos(db, [id_pedido])
     
     db.commit()
     return {"message": "Pedido cancelado com sucesso", "status": "CANCELADO"}
@@ -910,18 +1012,11 @@ def admin_criar_pedido(body: AdminCriarPedidoRequest, db: Session = Depends(get_
     if not body.produtos:
         raise HTTPException(status_code=400, detail="Nenhum item informado no pedido")
         
-    peso_total_kg = 0.0
-    total_sem_frete = 0.0
-    total_com_frete = 0.0
-
-    for it in body.produtos:
-        qtd = float(it.quantidade or 0)
-        peso_total_kg += float(it.peso_kg or 0) * qtd
-        total_sem_frete += float(it.preco_unit or 0) * qtd
-        p_com = float((it.preco_unit_com_frete if it.preco_unit_com_frete is not None else it.preco_unit) or 0)
-        total_com_frete += p_com * qtd
-
-    frete_total = max(0.0, total_com_frete - total_sem_frete)
+    linhas_itens, totais = preparar_itens(body.produtos, frete_admin)
+    peso_total_kg = totais["peso_total_kg"]
+    total_sem_frete = totais["total_sem_frete"]
+    total_com_frete = totais["total_com_frete"]
+    frete_total = totais["frete_total"]
     
     # Regra: Só marca frete se houver valor de frete no total
     final_usar_valor_com_frete = True if frete_total > 0.001 else False
@@ -1000,50 +1095,10 @@ def admin_criar_pedido(body: AdminCriarPedidoRequest, db: Session = Depends(get_
     
     new_id = db.execute(insert_sql, params).scalar()
     
-    # Insert itens
-    insert_item_sql = text("""
-        INSERT INTO tb_pedidos_itens (
-            id_pedido, codigo, nome, embalagem, peso_kg,
-            condicao_pagamento, tabela_comissao,
-            preco_unit, preco_unit_frt, valor_frete_unitario, quantidade,
-            subtotal_sem_f, subtotal_com_f,
-            markup, manual_freight, frete_base_ton, valor_final_markup, valor_s_frete_markup
-        ) VALUES (
-            :id_pedido, :codigo, :nome, :embalagem, :peso_kg,
-            :condicao_pagamento, :tabela_comissao,
-            :preco_unit, :preco_unit_frt, :valor_frete_unitario, :quantidade,
-            :subtotal_sem_f, :subtotal_com_f,
-            :markup, :manual_freight, :frete_base_ton, :valor_final_markup, :valor_s_frete_markup
-        )
-    """)
-    
-    for it in body.produtos:
-        qtd = float(it.quantidade or 0)
-        p_sem = float(it.preco_unit or 0)
-        p_com = float((it.preco_unit_com_frete if it.preco_unit_com_frete is not None else it.preco_unit) or 0)
-        v_frete = float(it.valor_frete_unitario or round(p_com - p_sem, 2))
-        
-        db.execute(insert_item_sql, {
-            "id_pedido": new_id,
-            "codigo": (it.codigo or "")[:80],
-            "nome": (it.descricao or "")[:255] or None,
-            "embalagem": getattr(it, "embalagem", None),
-            "peso_kg": float(it.peso_kg or 0),
-            "condicao_pagamento": it.condicao_pagamento,
-            "tabela_comissao": it.tabela_comissao,
-            "preco_unit": round(p_sem, 2),
-            "preco_unit_frt": round(p_com, 2),
-            "valor_frete_unitario": v_frete,
-            "quantidade": qtd,
-            "subtotal_sem_f": round(p_sem * qtd, 2),
-            "subtotal_com_f": round(p_com * qtd, 2),
-            "markup": float(it.markup or 0.0),
-            "manual_freight": bool(getattr(it, "manual_freight", False)),
-            "frete_base_ton": float(it.frete_base_ton or 0.0),
-            "valor_final_markup": float(it.valor_final_markup or 0.0),
-            "valor_s_frete_markup": float(it.valor_s_frete_markup or 0.0)
-        })
+    # Insert itens (um único INSERT multi-linha)
+    inserir_itens(db, new_id, linhas_itens)
         
+    atualizar_rollup_pedidos(db, [new_id])
     db.commit()
     
     # Agendar envio do E-mail
@@ -1073,6 +1128,8 @@ def deletar_pedido(pedido_id: int, db: Session = Depends(get_db)):
     if status_str != "CANCELADO":
         raise HTTPException(status_code=400, detail="Apenas pedidos com status CANCELADO podem ser deletados.")
 
+    dias_rollup = dias_dos_pedidos(db, [pedido_id])
+
     try:
         # 1.5 Deletar logs de status (pedido_status_event)
         try:
@@ -1097,6 +1154,7 @@ def deletar_pedido(pedido_id: int, db: Session = Depends(get_db)):
         
         # 4. Deletar o pedido
         db.execute(text("DELETE FROM tb_pedidos WHERE id_pedido = :id"), {"id": pedido_id})
+        atualizar_rollup_dias(db, dias_rollup)
         
         db.commit()
     except Exception as e:
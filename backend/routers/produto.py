@@ -2,7 +2,8 @@ from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Q
 from typing import Optional
 from datetime import date
 from pydantic import BaseModel
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 
 from database import SessionLocal
 from sqlalchemy.orm import Session
@@ -20,6 +21,7 @@ from services.produto_pdf import (
     update_produto,
     get_produto,
     list_produtos,
+    campos_listagem,
     get_anteriores,
     importar_pdf_para_produto,
     delete_produto,
@@ -29,8 +31,14 @@ from core.deps import get_current_user, get_db
 from models.usuario import UsuarioModel
 from models.background_task import BackgroundTaskModel
 from services.worker_recalculo import processar_recalculo_massivo
+from services.referencias_cache import invalidar_referencias
+from services.busca import invalidar_indices
+import logging
+import time
 import uuid
 
+logger = logging.getLogger("ordersync.produto")
+
 def trigger_recalculo(task_id: str, codigos_alterados: list):
     with SessionLocal() as db_bg:
         task = db_bg.query(BackgroundTaskModel).filter_by(task_id=task_id).first()
@@ -94,10 +102,13 @@ def listar_produtos(
     vigencia_em: Optional[date] = None,
     limit: int = 50,
     offset: int = 0,
+    include_imposto: bool = False,
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula (ex.: id,codigo_supra,preco)"),
 ):
+    campos = campos_listagem(fields)
     db = SessionLocal()
     try:
-        return list_produtos(
+        produtos = list_produtos(
             db,
             q=q,
             status=status,
@@ -106,9 +117,15 @@ def listar_produtos(
             vigencia_em=vigencia_em,
             limit=limit,
             offset=offset,
+            include_imposto=include_imposto,
+            campos=campos,
         )
     finally:
         db.close()
+    if campos:
+        # projeção parcial: não passa pelo response_model (campos obrigatórios podem faltar)
+        return JSONResponse(content=jsonable_encoder(produtos))
+    return produtos
 
 
 @router.post(
@@ -126,7 +143,10 @@ def criar_produto_endpoint(payload: ProdutoCreatePayload, current_user: UsuarioM
         # Modificar o payload antes de passar pro service
         payload.produto.criado_por = user_email
         payload.produto.atualizado_por = user_email
-        return create_produto(db, payload.produto, payload.imposto)
+        criado = create_produto(db, payload.produto, payload.imposto)
+        invalidar_referencias()
+        invalidar_indices()
+        return criado
     finally:
         db.close()
 
@@ -320,7 +340,10 @@ def atualizar_produto_endpoint(
     db = SessionLocal()
     try:
         produto.atualizado_por = current_user.email
-        return update_produto(db, produto_id, produto, imposto)
+        atualizado = update_produto(db, produto_id, produto, imposto)
+        invalidar_referencias()
+        invalidar_indices()
+        return atualizado
     finally:
         db.close()
 
@@ -349,6 +372,8 @@ def excluir_produto_endpoint(produto_id: int):
     db = SessionLocal()
     try:
         delete_produto(db, produto_id)
+        invalidar_referencias()
+        invalidar_indices()
         return Response(status_code=204)
     finally:
         db.close()
@@ -410,10 +435,12 @@ async def importar_lista(
                     detail=f"Data de validade inválida: {validade_tabela}. Use o formato AAAA-MM-DD."
                 )
 
+    inicio = time.perf_counter()
     try:
         df = parse_lista_precos(file.file, tipo_lista=tipo, filename=file.filename, fornecedor_selecionado=fornecedor)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao ler PDF: {e}")
+    tempos = {"parse": round(time.perf_counter() - inicio, 3)}
 
     if df.empty:
         raise HTTPException(
@@ -431,9 +458,14 @@ async def importar_lista(
         nome_arquivo=file.filename,
         usuario=current_user.email,
     )
+    # Validade, marcas e status dos produtos podem ter mudado
+    invalidar_referencias()
+    invalidar_indices()
 
     sync = resumo.get("sync", {})
+    tempos.update(resumo.get("tempos_segundos", {}))
 
+    inicio = time.perf_counter()
     codigos_alterados = []
     for g in sync.get("grupos", []):
         codigos_alterados.extend(g.get("codigos_alterados", []))
@@ -451,6 +483,8 @@ async def importar_lista(
         db.commit()
         
         background_tasks.add_task(trigger_recalculo, task_id, codigos_alterados)
+    tempos["recalculo_enfileirar"] = round(time.perf_counter() - inicio, 3)
+    logger.info(f"Importação de lista {file.filename}: {len(df)} linhas, tempos {tempos}")
 
     return {
         "arquivo": file.filename,
@@ -463,6 +497,8 @@ async def importar_lista(
         # detalhamento da sincronização
         "sync": sync,
         "task_id": task_id,
+        # tempo por etapa, em segundos (parse, insert, sync, recalculo_enfileirar)
+        "tempos_segundos": tempos,
     }
 
 @router.get("/task-status/{task_id}")
@@ -510,6 +546,8 @@ def renovar_validade_global(payload: RenovarValidadeReq, current_user: UsuarioMo
             res = db.execute(text(query), params)
             
             db.commit()
+            invalidar_referencias()
+            invalidar_indices()
             return {"ok": True, "linhas_afetadas": res.rowcount, "nova_validade": payload.nova_validade}
         except Exception as e:
             db.rollback()
@@ -539,11 +577,8 @@ async def importar_estoque(
     if df.empty:
         raise HTTPException(status_code=400, detail="A planilha está vazia.")
 
-    success_count = 0
-    not_found_codes = []
-    total_rows = 0
-
-    from models.produto import ProdutoV2, HistoricoEstoqueV2
+    from models.produto import HistoricoEstoqueV2
+    from services.estoque_import import importar_estoque_df
 
     # Desativa a flag de histórico ativo para todos os históricos de estoque anteriores
     try:
@@ -553,76 +588,9 @@ async def importar_estoque(
         db.rollback()
         raise HTTPException(500, detail=f"Erro ao resetar histórico de estoque ativo no banco: {e}")
 
-    for idx, row in df.iterrows():
-        # Skip completely empty rows
-        if row.isnull().all():
-            continue
-
-        # Look up product code: first column or by typical name candidates
-        def get_val_by_name_or_idx(names: list[str], pos: int):
-            for name in names:
-                if name in row:
-                    return row[name]
-            if len(row) > pos:
-                return row.iloc[pos]
-            return None
-
-        codigo_raw = get_val_by_name_or_idx(["Produto", "CODIGO", "CÓDIGO", "Codigo", "Código"], 0)
-        if pd.isna(codigo_raw) or not str(codigo_raw).strip():
-            continue
-
-        codigo_str = str(codigo_raw).strip()
-        total_rows += 1
-
-        def safe_int(val):
-            if pd.isna(val) or val is None:
-                return 0
-            try:
-                return int(float(val))
-            except:
-                return 0
-
-        # Columns F (5), G (6), H (7) positional and header fallback
-        qtd_estoque = safe_int(get_val_by_name_or_idx(["Qt. Estoque", "Qt Estoque", "Qtd Estoque", "Qtd. Estoque"], 5))
-        qtd_pedidos = safe_int(get_val_by_name_or_idx(["Qt. Pedidos Carteira", "Qt. Pedidos", "Qt Pedidos", "Qtd Pedidos"], 6))
-        af_pendentes = safe_int(get_val_by_name_or_idx(["AF Pendentes", "AF Pendente", "AF"], 7))
-
-        estoque_disponivel = qtd_estoque - qtd_pedidos
-        estoque_futuro = estoque_disponivel + af_pendentes
-
-        # Update in database using bulk query update
-        updated = db.query(ProdutoV2).filter(ProdutoV2.codigo_supra == codigo_str).update({
-            ProdutoV2.estoque_disponivel: estoque_disponivel,
-            ProdutoV2.estoque_futuro: estoque_futuro,
-            ProdutoV2.nome_arquivo_estoque: file.filename
-        }, synchronize_session=False)
-
-
-        if updated > 0:
-            success_count += updated
-        else:
-            not_found_codes.append(codigo_str)
-
-        # Salva registro no histórico de ingestão
-        nome_prod = get_val_by_name_or_idx(["Descrição", "DESCRIÇÃO", "Descriçao", "Descricao", "Descrio"], 1)
-        nome_prod_str = str(nome_prod).strip() if not pd.isna(nome_prod) else None
-
-        from models.produto import HistoricoEstoqueV2
-        hist_entry = HistoricoEstoqueV2(
-            codigo_supra=codigo_str,
-            nome_produto=nome_prod_str,
-            qtd_estoque=qtd_estoque,
-            qtd_pedido=qtd_pedidos,
-            af_pendentes=af_pendentes,
-            estoque_disponivel=estoque_disponivel,
-            estoque_futuro=estoque_futuro,
-            nome_arquivo=file.filename,
-            usuario=current_user.email,
-            ativo=True
-        )
-        db.add(hist_entry)
-
+    # Atualização em lote (UPDATE ... FROM VALUES) + histórico em insert único
     try:
+        resultado = importar_estoque_df(db, df, file.filename, current_user.email)
         db.commit()
     except Exception as e:
         db.rollback()
@@ -630,9 +598,9 @@ async def importar_estoque(
 
     return {
         "sucesso": True,
-        "total_linhas": total_rows,
-        "atualizados": success_count,
-        "nao_encontrados": not_found_codes
+        "total_linhas": resultado["total_linhas"],
+        "atualizados": resultado["atualizados"],
+        "nao_encontrados": resultado["nao_encontrados"]
     }
 
 
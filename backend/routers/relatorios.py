@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, text
 from typing import List, Optional
@@ -8,6 +9,8 @@ from models.cargas import CargaModel, CargaPedidoModel
 from models.pedido import PedidoModel
 from models.transporte import TransporteModel
 from schemas.cargas import CargaCreate, CargaUpdate, CargaResponse, CargaPedidoCreate, CargaPedidoDetailUpdate
+from services import relatorio_vendas_export
+from services.vendas_rollup import atualizar_rollup_pedidos
 
 router = APIRouter(
     prefix="/api/relatorios",
@@ -225,6 +228,7 @@ def add_pedido_to_carga(carga_id: int, pedido: CargaPedidoCreate, db: Session =
                     })
             except Exception:
                 pass
+            atualizar_rollup_pedidos(db, [db_pedido.id])
 
     db.commit()
     db.refresh(db_item)
@@ -266,6 +270,7 @@ def remove_pedido_from_carga(item_id: int, db: Session = Depends(get_db)):
                     })
             except Exception:
                 pass
+            atualizar_rollup_pedidos(db, [db_pedido.id])
 
     db.delete(db_item)
     db.commit()
@@ -563,6 +568,8 @@ def confirmar_entrega_carga(carga_id: int, db: Session = Depends(get_db)):
     # 5. Move a carga para o histórico
     db_carga.is_historico = True
     db_carga.data_faturamento = datetime.utcnow()
+
+    atualizar_rollup_pedidos(db, [id_pedido for id_pedido, _ in pedidos_db])
     
     db.commit()
     return {"status": "success", "message": "Entrega confirmada com sucesso!"}
@@ -609,32 +616,7 @@ def get_vendas_cliente_filtros(db: Session = Depends(get_db)):
     }
 
 
-@router.get("/vendas_cliente")
-def get_vendas_cliente(
-    data_inicio: Optional[str] = Query(None),
-    data_fim: Optional[str] = Query(None),
-    faturamento_inicio: Optional[str] = Query(None),
-    faturamento_fim: Optional[str] = Query(None),
-    filiais: Optional[List[str]] = Query(None),
-    categoria: Optional[str] = Query(None), # "INSUMOS" ou "PET"
-    status_list: Optional[List[str]] = Query(None),
-    municipios: Optional[List[str]] = Query(None),
-    db: Session = Depends(get_db)
-):
-    """
-    Retorna a listagem consolidada de vendas por cliente com base nos filtros informados.
-    """
-    # Normalização de parâmetros para chamadas diretas em Python/testes
-    if not isinstance(data_inicio, str): data_inicio = None
-    if not isinstance(data_fim, str): data_fim = None
-    if not isinstance(faturamento_inicio, str): faturamento_inicio = None
-    if not isinstance(faturamento_fim, str): faturamento_fim = None
-    if not isinstance(filiais, list): filiais = None
-    if not isinstance(categoria, str): categoria = None
-    if not isinstance(status_list, list): status_list = None
-    if not isinstance(municipios, list): municipios = None
-
-    query_str = """
+_SQL_VENDAS_CLIENTE = """
         SELECT
             p.id_pedido                             AS numero_pedido,
             MAX(p.pedido_supra)                     AS pedido_supra,
@@ -662,77 +644,9 @@ def get_vendas_cliente(
         LEFT JOIN public.t_cadastro_cliente_v2 c ON c.cadastro_codigo_da_empresa::text = p.codigo_cliente
         LEFT JOIN public.t_cadastro_produto_v2 pr ON pr.codigo_supra = i.codigo
         WHERE i.quantidade > 0 AND UPPER(p.status) NOT LIKE '%CANCEL%'
-    """
-    
-    params = {}
-    
-    if data_inicio:
-        query_str += " AND p.created_at::date >= CAST(:data_inicio AS DATE)"
-        params["data_inicio"] = data_inicio
-        
-    if data_fim:
-        query_str += " AND p.created_at::date <= CAST(:data_fim AS DATE)"
-        params["data_fim"] = data_fim
-        
-    if faturamento_inicio:
-        query_str += " AND p.data_faturamento::date >= CAST(:faturamento_inicio AS DATE)"
-        params["faturamento_inicio"] = faturamento_inicio
-        
-    if faturamento_fim:
-        query_str += " AND p.data_faturamento::date <= CAST(:faturamento_fim AS DATE)"
-        params["faturamento_fim"] = faturamento_fim
-        
-    if filiais:
-        query_str += " AND p.fornecedor = ANY(:filiais)"
-        params["filiais"] = filiais
-        
-    if categoria:
-        query_str += " AND UPPER(pr.tipo) = :categoria"
-        params["categoria"] = categoria.upper()
-        
-    if status_list:
-        query_str += " AND p.status = ANY(:status_list)"
-        params["status_list"] = status_list
-        
-    if municipios:
-        query_str += " AND c.entrega_municipio = ANY(:municipios)"
-        params["municipios"] = municipios
-        
-    query_str += " GROUP BY p.id_pedido ORDER BY p.id_pedido DESC"
-    
-    rows = db.execute(text(query_str), params).mappings().all()
-    
-    return [dict(r) for r in rows]
-
-
-@router.get("/vendas_produtos")
-def get_vendas_produtos(
-    data_inicio: Optional[str] = Query(None),
-    data_fim: Optional[str] = Query(None),
-    faturamento_inicio: Optional[str] = Query(None),
-    faturamento_fim: Optional[str] = Query(None),
-    filiais: Optional[List[str]] = Query(None),
-    categoria: Optional[str] = Query(None), # "INSUMOS" ou "PET"
-    status_list: Optional[List[str]] = Query(None),
-    municipios: Optional[List[str]] = Query(None),
-    grupos: Optional[List[str]] = Query(None), # marcas em t_cadastro_produto_v2
-    db: Session = Depends(get_db)
-):
-    """
-    Retorna a listagem consolidada de vendas agrupada por produto com base nos filtros informados.
-    """
-    # Normalização de parâmetros para chamadas diretas em Python/testes
-    if not isinstance(data_inicio, str): data_inicio = None
-    if not isinstance(data_fim, str): data_fim = None
-    if not isinstance(faturamento_inicio, str): faturamento_inicio = None
-    if not isinstance(faturamento_fim, str): faturamento_fim = None
-    if not isinstance(filiais, list): filiais = None
-    if not isinstance(categoria, str): categoria = None
-    if not isinstance(status_list, list): status_list = None
-    if not isinstance(municipios, list): municipios = None
-    if not isinstance(grupos, list): grupos = None
+"""
 
-    query_str = """
+_SQL_VENDAS_PRODUTOS = """
         SELECT
             i.codigo                                AS codigo_produto,
             MAX(i.nome)                            AS produto,
@@ -757,8 +671,40 @@ def get_vendas_produtos(
         LEFT JOIN public.t_cadastro_cliente_v2 c ON c.cadastro_codigo_da_empresa::text = p.codigo_cliente
         LEFT JOIN public.t_cadastro_produto_v2 pr ON pr.codigo_supra = i.codigo
         WHERE i.quantidade > 0 AND UPPER(p.status) NOT LIKE '%CANCEL%'
+"""
+
+_AGRUPAMENTO_CLIENTE = " GROUP BY p.id_pedido ORDER BY p.id_pedido DESC"
+_AGRUPAMENTO_PRODUTOS = " GROUP BY i.codigo ORDER BY peso_liquido_acumulado DESC"
+
+
+def _consulta_vendas(
+    query_str: str,
+    agrupamento: str,
+    data_inicio=None,
+    data_fim=None,
+    faturamento_inicio=None,
+    faturamento_fim=None,
+    filiais=None,
+    categoria=None,
+    status_list=None,
+    municipios=None,
+    grupos=None,
+):
     """
-    
+    Monta (sql, params) dos relatórios de vendas a partir dos filtros, compartilhado pela
+    listagem em JSON e pela exportação em streaming.
+    """
+    # Normalização de parâmetros para chamadas diretas em Python/testes
+    if not isinstance(data_inicio, str): data_inicio = None
+    if not isinstance(data_fim, str): data_fim = None
+    if not isinstance(faturamento_inicio, str): faturamento_inicio = None
+    if not isinstance(faturamento_fim, str): faturamento_fim = None
+    if not isinstance(filiais, list): filiais = None
+    if not isinstance(categoria, str): categoria = None
+    if not isinstance(status_list, list): status_list = None
+    if not isinstance(municipios, list): municipios = None
+    if not isinstance(grupos, list): grupos = None
+
     params = {}
     
     if data_inicio:
@@ -797,11 +743,116 @@ def get_vendas_produtos(
         query_str += " AND pr.marca = ANY(:grupos)"
         params["grupos"] = grupos
         
-    query_str += " GROUP BY i.codigo ORDER BY peso_liquido_acumulado DESC"
-    
+    return query_str + agrupamento, params
+
+
+def _resposta_exportacao(formato: str, sql: str, params: dict, colunas, nome: str) -> StreamingResponse:
+    headers = {
+        "Content-Disposition": f'attachment; filename="{nome}_{datetime.now().strftime("%Y-%m-%d")}.{formato}"',
+        "Access-Control-Expose-Headers": "Content-Disposition",
+    }
+    return StreamingResponse(
+        relatorio_vendas_export.exportar(formato, sql, params, colunas, nome),
+        media_type=relatorio_vendas_export.MEDIA_TYPES[formato],
+        headers=headers,
+    )
+
+
+@router.get("/vendas_cliente")
+def get_vendas_cliente(
+    data_inicio: Optional[str] = Query(None),
+    data_fim: Optional[str] = Query(None),
+    faturamento_inicio: Optional[str] = Query(None),
+    faturamento_fim: Optional[str] = Query(None),
+    filiais: Optional[List[str]] = Query(None),
+    categoria: Optional[str] = Query(None), # "INSUMOS" ou "PET"
+    status_list: Optional[List[str]] = Query(None),
+    municipios: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Retorna a listagem consolidada de vendas por cliente com base nos filtros informados.
+    """
+    query_str, params = _consulta_vendas(
+        _SQL_VENDAS_CLIENTE, _AGRUPAMENTO_CLIENTE, data_inicio, data_fim, faturamento_inicio,
+        faturamento_fim, filiais, categoria, status_list, municipios,
+    )
     rows = db.execute(text(query_str), params).mappings().all()
     
     return [dict(r) for r in rows]
 
 
+@router.get("/vendas_cliente/exportar")
+def exportar_vendas_cliente(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    data_inicio: Optional[str] = Query(None),
+    data_fim: Optional[str] = Query(None),
+    faturamento_inicio: Optional[str] = Query(None),
+    faturamento_fim: Optional[str] = Query(None),
+    filiais: Optional[List[str]] = Query(None),
+    categoria: Optional[str] = Query(None),
+    status_list: Optional[List[str]] = Query(None),
+    municipios: Optional[List[str]] = Query(None),
+):
+    """
+    Exporta o relatório de vendas por cliente (mesmos filtros da listagem) em CSV ou XLSX,
+    lendo o banco por cursor e enviando as linhas em streaming.
+    """
+    query_str, params = _consulta_vendas(
+        _SQL_VENDAS_CLIENTE, _AGRUPAMENTO_CLIENTE, data_inicio, data_fim, faturamento_inicio,
+        faturamento_fim, filiais, categoria, status_list, municipios,
+    )
+    return _resposta_exportacao(
+        formato, query_str, params, relatorio_vendas_export.COLUNAS_VENDAS_CLIENTE, "relatorio_vendas_por_cliente",
+    )
+
+
+@router.get("/vendas_produtos")
+def get_vendas_produtos(
+    data_inicio: Optional[str] = Query(None),
+    data_fim: Optional[str] = Query(None),
+    faturamento_inicio: Optional[str] = Query(None),
+    faturamento_fim: Optional[str] = Query(None),
+    filiais: Optional[List[str]] = Query(None),
+    categoria: Optional[str] = Query(None), # "INSUMOS" ou "PET"
+    status_list: Optional[List[str]] = Query(None),
+    municipios: Optional[List[str]] = Query(None),
+    grupos: Optional[List[str]] = Query(None), # marcas em t_cadastro_produto_v2
+    db: Session = Depends(get_db)
+):
+    """
+    Retorna a listagem consolidada de vendas agrupada por produto com base nos filtros informados.
+    """
+    query_str, params = _consulta_vendas(
+        _SQL_VENDAS_PRODUTOS, _AGRUPAMENTO_PRODUTOS, data_inicio, data_fim, faturamento_inicio,
+        faturamento_fim, filiais, categoria, status_list, municipios, grupos,
+    )
+    rows = db.execute(text(query_str), params).mappings().all()
+    
+    return [dict(r) for r in rows]
 
+
+@router.get("/vendas_produtos/exportar")
+def exportar_vendas_produtos(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    data_inicio: Optional[str] = Query(None),
+    data_fim: Optional[str] = Query(None),
+    faturamento_inicio: Optional[str] = Query(None),
+    faturamento_fim: Optional[str] = Query(None),
+    filiais: Optional[List[str]] = Query(None),
+    categoria: Optional[str] = Query(None),
+    status_list: Optional[List[str]] = Query(None),
+    municipios: Optional[List[str]] = Query(None),
+    grupos: Optional[List[str]] = Query(None),
+):
+    """
+    Exporta o relatório de vendas por produto (mesmos filtros da listagem) em CSV ou XLSX,
+    lendo o banco por cursor e enviando as linhas em streaming.
+    """
+    query_str, params = _consulta_vendas(
+        _SQL_VENDAS_PRODUTOS, _AGRUPAMENTO_PRODUTOS, data_inicio, data_fim, faturamento_inicio,
+        faturamento_fim, filiais, categoria, status_list, municipios, grupos,
+    )
+    return _resposta_exportacao(
+        formato, query_str, params, relatorio_vendas_export.COLUNAS_VENDAS_PRODUTOS, "relatorio_vendas_por_produto",
+    )
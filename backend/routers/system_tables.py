@@ -6,6 +6,7 @@ from datetime import datetime
 
 from database import SessionLocal
 import schemas.system_tables as s
+from services.referencias_cache import invalidar_referencias
 
 router = APIRouter(tags=["System Tables"])
 
@@ -53,6 +54,7 @@ def criar_condicao(payload: s.CondicaoPagamentoCreate, db: Session = Depends(get
         "ativo": True
     }).mappings().first()
     db.commit()
+    invalidar_referencias()
     
     d = dict(new_row)
     if d.get("custo") is not None:
@@ -85,6 +87,7 @@ def atualizar_condicao(id: int, payload: s.CondicaoPagamentoUpdate, db: Session
     if not row:
         raise HTTPException(status_code=404, detail="Condição não encontrada")
     db.commit()
+    invalidar_referencias()
 
     d = dict(row)
     if d.get("custo") is not None:
@@ -98,6 +101,7 @@ def deletar_condicao(id: int, db: Session = Depends(get_db)):
     if not row:
         raise HTTPException(status_code=404, detail="Condição não encontrada")
     db.commit()
+    invalidar_referencias()
     return {"message": "Inativado com sucesso"}
 
 
@@ -129,6 +133,7 @@ def criar_desconto(payload: s.DescontoCreate, db: Session = Depends(get_db)):
     """)
     new_row = db.execute(sql, {"id": payload.id_desconto, "f": fator, "ativo": True}).mappings().first()
     db.commit()
+    invalidar_referencias()
     
     d = dict(new_row)
     d["fator_comissao"] = float(d["fator_comissao"] or 0) * 100.0
@@ -153,6 +158,7 @@ def atualizar_desconto(id: int, payload: s.DescontoUpdate, db: Session = Depends
     if not row:
          raise HTTPException(status_code=404, detail="Desconto não encontrado")
     db.commit()
+    invalidar_referencias()
     
     d = dict(row)
     d["fator_comissao"] = float(d["fator_comissao"] or 0) * 100.0
@@ -164,6 +170,7 @@ def deletar_desconto(id: int, db: Session = Depends(get_db)):
     if not row:
         raise HTTPException(status_code=404, detail="Desconto não encontrado")
     db.commit()
+    invalidar_referencias()
     return {"message": "Inativado com sucesso"}
 
 
@@ -205,6 +212,7 @@ def criar_familia(payload: s.FamiliaProdutoBase, db: Session = Depends(get_db)):
         "ativo": True
     }).mappings().first()
     db.commit()
+    invalidar_referencias()
     return row
 
 @router.put("/system/familias/{id}", response_model=s.FamiliaProdutoOut)
@@ -260,6 +268,7 @@ def atualizar_familia(id: int, payload: s.FamiliaProdutoUpdate, db: Session = De
         })
 
     db.commit()
+    invalidar_referencias()
     return row
 
 @router.delete("/system/familias/{id}")
@@ -268,4 +277,5 @@ def deletar_familia(id: int, db: Session = Depends(get_db)):
     if not row:
         raise HTTPException(status_code=404, detail="Família não encontrada")
     db.commit()
+    invalidar_referencias()
     return {"message": "Inativado com sucesso"}
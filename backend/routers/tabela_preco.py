@@ -25,6 +25,9 @@ from core.deps import get_current_user, get_db
 from models.usuario import UsuarioModel
 from models.produto import ProdutoV2
 from models.background_task import BackgroundTaskModel
+from services import referencias_cache
+from services.busca import buscar_clientes, filtro_produtos
+from services.vendas_rollup import atualizar_rollup_pedidos
 from fastapi import BackgroundTasks
 import uuid
 
@@ -80,31 +83,30 @@ def filtrar_produtos_para_tabela_preco(
               AND (:grupo IS NULL OR p.marca = :grupo)
               AND (:tipo IS NULL OR UPPER(p.tipo) = UPPER(:tipo))
               AND (:fornecedor IS NULL OR UPPER(p.fornecedor) = UPPER(:fornecedor))
-              AND (
-                    :q IS NULL
-                 OR  p.codigo_supra::text ILIKE :like
-                 OR  p.nome_produto       ILIKE :like
-                 OR  COALESCE(p.unidade,'') ILIKE :like
-                 OR  COALESCE(p.tipo,'')  ILIKE :like
-              )
         """
 
         params = {
             "grupo": grupo or None,
             "tipo": tipo or None,
             "fornecedor": fornecedor or None,
-            "q": q or None,
-            "like": f"%{q}%" if q else None,
         }
 
         with SessionLocal() as db:
+            # código, descrição, unidade e tipo via índice trigram (mais relevantes primeiro)
+            ordem = "p.nome_produto ASC"
+            filtro = filtro_produtos(db, q, alias="p")
+            if filtro:
+                base_sql += f" AND {filtro.where}"
+                params.update(filtro.params)
+                ordem = f"{filtro.rank} DESC, {ordem}"
+
             count_sql = f"SELECT COUNT(*) AS total FROM ({base_sql}) sub"
             total = db.execute(text(count_sql), params).scalar() or 0
 
             offset = (page - 1) * page_size
             paginated_sql = f"""
                 {base_sql}
-                ORDER BY p.nome_produto ASC
+                ORDER BY {ordem}
                 LIMIT :limit OFFSET :offset
             """
             params_lim = {**params, "limit": int(page_size), "offset": int(offset)}
@@ -182,9 +184,8 @@ def obter_ids_filtro(
 def listar_descontos():
     try:
         db = SessionLocal()
-        query = text("SELECT id_desconto, fator_comissao FROM t_desconto WHERE ativo IS TRUE ORDER BY id_desconto")
-        resultado = db.execute(query).fetchall()
-        return [{"codigo": row.id_desconto, "percentual": row.fator_comissao} for row in resultado]
+        resultado = referencias_cache.descontos_ativos(db)
+        return [{"codigo": row["id_desconto"], "percentual": row["fator_comissao"]} for row in resultado]
     finally:
         db.close()
 
@@ -192,9 +193,8 @@ def listar_descontos():
 def condicoes_pagamento():
     try:
         db = SessionLocal()
-        query = text("select codigo_prazo, prazo, custo as taxa_condicao from t_condicoes_pagamento WHERE ativo IS TRUE order by codigo_prazo")
-        resultado = db.execute(query).fetchall()
-        return [{"codigo": row.codigo_prazo, "descricao": row.prazo, "taxa_condicao": row.taxa_condicao} for row in resultado]
+        resultado = referencias_cache.condicoes_pagamento_ativas(db)
+        return [{"codigo": row["codigo_prazo"], "descricao": row["prazo"], "taxa_condicao": row["taxa_condicao"]} for row in resultado]
     finally:
         db.close()
 
@@ -202,9 +202,7 @@ def condicoes_pagamento():
 def filtro_grupo_produto():
     try:
         db = SessionLocal()
-        query = text("select distinct trim(marca) as grupo from t_cadastro_produto_v2 WHERE marca IS NOT NULL AND trim(marca) != '' AND status_produto = 'ATIVO' order by trim(marca)")
-        resultado = db.execute(query).fetchall()
-        return [{"grupo": row.grupo} for row in resultado]
+        return [{"grupo": grupo} for grupo in referencias_cache.grupos_produto(db)]
     finally:
         db.close()
 
@@ -336,54 +334,17 @@ def busca_cliente(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
 ):
-    try:
-        db = SessionLocal()
-
-        # texto original digitado/colado
-        q_raw = (q or "").strip()
-        like = f"%{q_raw}%"
-
-        # só dígitos (para CNPJ/CPF), mesmo se vier "7769327000171 - DISPET ..."
-        cnpj_digits = re.sub(r"\D", "", q_raw)
-        cnpj_like = f"%{cnpj_digits}%" if cnpj_digits else None
-
-        base_sql = """
-            SELECT
-              cadastro_codigo_da_empresa AS codigo,
-              COALESCE(cadastro_cnpj, cadastro_cpf) AS cnpj_cpf,
-              cadastro_nome_cliente AS nome_cliente,
-              cadastro_tipo_cliente AS ramo_juridico,
-              cadastro_markup
-            FROM public.t_cadastro_cliente_v2
-            WHERE
-              (
-                :q = ''
-                OR cadastro_nome_cliente ILIKE :like
-                OR (
-                    :cnpj_like IS NOT NULL
-                    AND (cadastro_cnpj ILIKE :cnpj_like OR cadastro_cpf ILIKE :cnpj_like)
-                  )
-              )
-        """
-
-        params = {
-            "q": q_raw,
-            "like": like,
-            "cnpj_like": cnpj_like,
-            "offset": (page - 1) * page_size,
-            "limit": page_size,
-        }
-
-        if ramo:
-            base_sql += " AND cadastro_tipo_cliente = :ramo"
-            params["ramo"] = ramo
-
-        base_sql += " ORDER BY cadastro_nome_cliente OFFSET :offset LIMIT :limit"
-
-        rows = db.execute(text(base_sql), params).mappings().all()
-        return [dict(r) for r in rows]
-    finally:
-        db.close()
+    with SessionLocal() as db:
+        # nome/código via índice trigram; dígitos também procuram no CNPJ/CPF
+        # (ex.: "7769327000171 - DISPET ...")
+        rows = buscar_clientes(
+            db, q, limite=page_size, offset=(page - 1) * page_size,
+            ramo=ramo, incluir_documento=True,
+        )
+    return [
+        {k: r[k] for k in ("codigo", "cnpj_cpf", "nome_cliente", "ramo_juridico", "cadastro_markup")}
+        for r in rows
+    ]
 
 
 @router.get("/{id_tabela:int}")
@@ -476,11 +437,7 @@ def obter_tabela(id_tabela: int):
 def validade_global():
     try:
         with SessionLocal() as db:
-            v = db.execute(text("""
-                SELECT MAX(CAST(p.validade_tabela AS DATE)) AS max_validade
-                FROM t_cadastro_produto_v2 p
-                WHERE p.status_produto = 'ATIVO'
-            """)).scalar()
+            v = referencias_cache.validade_global(db)
 
         v_date = _as_date(v)
         if not v_date:
@@ -660,6 +617,8 @@ def confirmar_pedido(tabela_id: int, body: ConfirmarPedidoReq):
             fornecedor=head.get("fornecedor")
         )
         db.add(novo_pedido)
+        db.flush()
+        atualizar_rollup_pedidos(db, [novo_pedido.id])
         db.commit()
         db.refresh(novo_pedido)
         
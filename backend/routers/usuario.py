@@ -11,7 +11,7 @@ from models.usuario import UsuarioModel
 from schemas.usuario import UsuarioCreate, UsuarioPublic, UsuarioUpdateSenha, UsuarioResetSenha, UsuarioUpdate, UsuarioChangePassword, UsuarioAdminResetSenha
 from core.security import get_password_hash, SECRET_KEY, ALGORITHM, verify_password
 
-from core.deps import get_db, get_current_user, oauth2_scheme
+from core.deps import get_db, get_current_user, invalidar_principal, oauth2_scheme
 
 async def get_current_user_role(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
@@ -120,15 +120,21 @@ def alterar_minha_senha(
     db: Session = Depends(get_db),
     current_user: UsuarioModel = Depends(get_current_user)
 ):
+    # current_user é o principal em cache: a senha vem do registro
+    user = db.query(UsuarioModel).filter(UsuarioModel.id == current_user.id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+
     # Verify old password
-    if not verify_password(dados.senha_atual, current_user.senha_hash):
+    if not verify_password(dados.senha_atual, user.senha_hash):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
     
     # Update
-    current_user.senha_hash = get_password_hash(dados.nova_senha)
-    current_user.data_atualizacao = datetime.now()
-    current_user.reset_senha_obrigatorio = False
+    user.senha_hash = get_password_hash(dados.nova_senha)
+    user.data_atualizacao = datetime.now()
+    user.reset_senha_obrigatorio = False
     db.commit()
+    invalidar_principal(user.email)
     return {"message": "Senha alterada com sucesso"}
 
 @router.post("/{user_id}/reset-senha")
@@ -148,6 +154,7 @@ def resetar_senha_usuario(
         
     target_user.senha_hash = get_password_hash(dados.senha_nova)
     db.commit()
+    invalidar_principal(target_user.email)
     return {"message": f"Senha do usuário {target_user.email} resetada com sucesso"}
 
 @router.put("/{user_id}", response_model=UsuarioPublic)
@@ -165,12 +172,14 @@ def update_user(
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
+    email_anterior = user.email
     if dados.nome is not None: user.nome = dados.nome
     if dados.email is not None: user.email = dados.email
     if dados.funcao is not None: user.funcao = dados.funcao
     if dados.ativo is not None: user.ativo = dados.ativo
 
     db.commit()
+    invalidar_principal(email_anterior, user.email)
     db.refresh(user)
     return user
 
@@ -194,4 +203,5 @@ def delete_user(
 
     db.delete(user)
     db.commit()
+    invalidar_principal(user.email)
     return {"message": "Usuário excluído com sucesso"}
@@ -0,0 +1,272 @@
+# services/busca.py
+"""
+Busca textual (type-ahead) de clientes, produtos e pedidos.
+
+Postgres: cada tabela tem uma coluna gerada `busca_normalizada` (minúsculas, sem acento,
+via função ordersync_normaliza) com índice GIN pg_trgm, criadas na migração 30. Cada
+palavra digitada vira um `LIKE '%palavra%'` atendido pelo índice, e os resultados saem
+ordenados por similarity() com a busca inteira.
+
+SQLite (dev): não há pg_trgm; clientes e produtos são buscados num índice em memória
+(IndiceMemoria) montado com a mesma normalização e recarregado após TTL_INDICE segundos
+ou quando o cadastro muda.
+"""
+import logging
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from core.cache import TTLCache
+
+logger = logging.getLogger("ordersync.busca")
+
+TTL_INDICE = 60
+MAX_PALAVRAS = 6
+
+# Mesma tabela usada pela função SQL ordersync_normaliza (migração 30)
+ACENTOS = "ÁÀÂÃÄÅáàâãäåÉÈÊËéèêëÍÌÎÏíìîïÓÒÔÕÖóòôõöÚÙÛÜúùûüÇçÑñÝýÿ"
+SEM_ACENTO = "AAAAAAaaaaaaEEEEeeeeIIIIiiiiOOOOOoooooUUUUuuuuCcNnYyy"
+_TABELA_ACENTOS = str.maketrans(ACENTOS, SEM_ACENTO)
+
+
+# DDL da migração 30 (Postgres): função de normalização, colunas geradas e índices trigram
+BUSCA_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""
+    CREATE OR REPLACE FUNCTION ordersync_normaliza(t text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT lower(translate(COALESCE(t, ''), '{ACENTOS}', '{SEM_ACENTO}'))
+    $$
+    """,
+    """
+    ALTER TABLE public.t_cadastro_cliente_v2 ADD COLUMN IF NOT EXISTS busca_normalizada text
+    GENERATED ALWAYS AS (ordersync_normaliza(
+        COALESCE(cadastro_codigo_da_empresa::text, '') || ' ' ||
+        COALESCE(cadastro_nome_cliente, '') || ' ' || COALESCE(cadastro_nome_fantasia, '')
+    )) STORED
+    """,
+    """
+    ALTER TABLE public.t_cadastro_produto_v2 ADD COLUMN IF NOT EXISTS busca_normalizada text
+    GENERATED ALWAYS AS (ordersync_normaliza(
+        COALESCE(codigo_supra, '') || ' ' || COALESCE(nome_produto, '') || ' ' ||
+        COALESCE(unidade, '') || ' ' || COALESCE(tipo, '')
+    )) STORED
+    """,
+    """
+    ALTER TABLE public.tb_pedidos ADD COLUMN IF NOT EXISTS busca_normalizada text
+    GENERATED ALWAYS AS (ordersync_normaliza(
+        COALESCE(codigo_cliente::text, '') || ' ' || COALESCE(cliente, '')
+    )) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_cliente_v2_busca_trgm ON public.t_cadastro_cliente_v2 USING gin (busca_normalizada gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_produto_v2_busca_trgm ON public.t_cadastro_produto_v2 USING gin (busca_normalizada gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_tb_pedidos_busca_trgm ON public.tb_pedidos USING gin (busca_normalizada gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_tb_pedidos_supra_trgm ON public.tb_pedidos USING gin (pedido_supra gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_tb_pedidos_nf_trgm ON public.tb_pedidos USING gin (nota_fiscal gin_trgm_ops)",
+]
+
+
+def normalizar_busca(texto) -> str:
+    """Minúsculas e sem acento, igual a ordersync_normaliza() no banco."""
+    if texto is None:
+        return ""
+    return str(texto).translate(_TABELA_ACENTOS).lower()
+
+
+def palavras_busca(q: Optional[str]) -> List[str]:
+    return normalizar_busca(q).split()[:MAX_PALAVRAS]
+
+
+def usa_trgm(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _escapar_like(palavra: str) -> str:
+    return palavra.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class FiltroTexto(NamedTuple):
+    where: str
+    rank: str
+    params: Dict
+
+
+def filtro_trgm(coluna: str, q: Optional[str], prefixo: str = "busca") -> Optional[FiltroTexto]:
+    """
+    Condição SQL (Postgres) sobre uma coluna já normalizada: todas as palavras precisam
+    aparecer (em qualquer ordem); `rank` ordena pela similaridade trigram. None se q vazio.
+    """
+    palavras = palavras_busca(q)
+    if not palavras:
+        return None
+    params = {f"{prefixo}_q": " ".join(palavras)}
+    condicoes = []
+    for i, p in enumerate(palavras):
+        params[f"{prefixo}_{i}"] = f"%{_escapar_like(p)}%"
+        condicoes.append(f"{coluna} LIKE :{prefixo}_{i}")
+    return FiltroTexto(
+        where="(" + " AND ".join(condicoes) + ")",
+        rank=f"similarity({coluna}, :{prefixo}_q)",
+        params=params,
+    )
+
+
+class IndiceMemoria:
+    """Lista em memória (chave, texto normalizado) usada como fallback quando não há pg_trgm."""
+
+    def __init__(self, nome: str, carregar: Callable[[Session], List[Tuple]], ttl: float = TTL_INDICE):
+        self.nome = nome
+        self._carregar = carregar
+        self._cache = TTLCache(ttl_seconds=ttl, maxsize=1)
+
+    def _entradas(self, db: Session) -> List[Tuple]:
+        def montar():
+            entradas = [(chave, normalizar_busca(" ".join(str(c) for c in campos if c is not None)))
+                        for chave, *campos in self._carregar(db)]
+            logger.info(f"Índice de busca em memória '{self.nome}': {len(entradas)} registros.")
+            return entradas
+        return self._cache.get_or_set(self.nome, montar)
+
+    def invalidar(self) -> None:
+        self._cache.clear()
+
+    def buscar(self, db: Session, q: Optional[str], limite: Optional[int] = None) -> List:
+        """Chaves que contêm todas as palavras, das mais relevantes para as menos."""
+        palavras = palavras_busca(q)
+        if not palavras:
+            return []
+        frase = " ".join(palavras)
+        achados = []
+        for chave, texto in self._entradas(db):
+            if all(p in texto for p in palavras):
+                termos = texto.split()
+                inicio_palavra = sum(1 for p in palavras if any(t.startswith(p) for t in termos))
+                achados.append(((frase in texto, inicio_palavra, -len(texto)), chave))
+        achados.sort(key=lambda a: a[0], reverse=True)
+        chaves = [chave for _, chave in achados]
+        return chaves[:limite] if limite else chaves
+
+
+indice_clientes = IndiceMemoria("clientes", lambda db: db.execute(text("""
+    SELECT id, cadastro_codigo_da_empresa, cadastro_nome_cliente, cadastro_nome_fantasia
+    FROM t_cadastro_cliente_v2
+""")).fetchall())
+
+indice_produtos = IndiceMemoria("produtos", lambda db: db.execute(text("""
+    SELECT id, codigo_supra, nome_produto, unidade, tipo
+    FROM t_cadastro_produto_v2
+""")).fetchall())
+
+
+def invalidar_indices() -> None:
+    """Chamado após alterações de cadastro (só afeta o fallback em memória)."""
+    indice_clientes.invalidar()
+    indice_produtos.invalidar()
+
+
+# ---------------- clientes ----------------
+_COLUNAS_CLIENTE = """
+    c.id,
+    c.cadastro_codigo_da_empresa AS codigo,
+    c.cadastro_nome_cliente AS nome_cliente,
+    c.cadastro_nome_fantasia AS nome_fantasia,
+    COALESCE(c.cadastro_cnpj, c.cadastro_cpf) AS cnpj_cpf,
+    c.cadastro_tipo_cliente AS ramo_juridico,
+    c.cadastro_markup
+"""
+
+
+def buscar_clientes(db: Session, q: Optional[str], limite: int = 20, offset: int = 0,
+                    ramo: Optional[str] = None, incluir_documento: bool = False) -> List[Dict]:
+    """
+    Clientes por código/nome/fantasia, mais relevantes primeiro. Com `incluir_documento`,
+    dígitos digitados também procuram no CNPJ/CPF. Com q vazio, lista por nome.
+    """
+    q_raw = (q or "").strip()
+    cnpj_digits = re.sub(r"\D", "", q_raw) if incluir_documento else ""
+    params: Dict = {"limit": limite, "offset": offset}
+    filtros = []
+    if ramo:
+        filtros.append("c.cadastro_tipo_cliente = :ramo")
+        params["ramo"] = ramo
+
+    if not q_raw:
+        ordem = "c.cadastro_nome_cliente"
+    elif usa_trgm(db):
+        filtro = filtro_trgm("c.busca_normalizada", q_raw, "busca")
+        cond = filtro.where
+        if cnpj_digits:
+            cond = f"({cond} OR c.cadastro_cnpj_digitos LIKE :cnpj_like OR c.cadastro_cpf_digitos LIKE :cnpj_like)"
+            params["cnpj_like"] = f"%{cnpj_digits}%"
+        filtros.append(cond)
+        params.update(filtro.params)
+        ordem = f"{filtro.rank} DESC, c.cadastro_nome_cliente"
+    else:
+        return _buscar_clientes_memoria(db, q_raw, cnpj_digits, filtros, params, limite, offset)
+
+    where = " AND ".join(filtros) or "1=1"
+    rows = db.execute(text(f"""
+        SELECT {_COLUNAS_CLIENTE}
+        FROM t_cadastro_cliente_v2 c
+        WHERE {where}
+        ORDER BY {ordem}
+        LIMIT :limit OFFSET :offset
+    """), params).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _buscar_clientes_memoria(db, q_raw, cnpj_digits, filtros, params, limite, offset) -> List[Dict]:
+    ids = indice_clientes.buscar(db, q_raw)
+    cond = "c.id IN :ids"
+    if cnpj_digits:
+        cond = f"({cond} OR c.cadastro_cnpj_digitos LIKE :cnpj_like OR c.cadastro_cpf_digitos LIKE :cnpj_like)"
+        params["cnpj_like"] = f"%{cnpj_digits}%"
+    where = " AND ".join(filtros + [cond])
+    rows = db.execute(text(f"""
+        SELECT {_COLUNAS_CLIENTE}
+        FROM t_cadastro_cliente_v2 c
+        WHERE {where}
+    """).bindparams(bindparam("ids", expanding=True)), {**params, "ids": ids}).mappings().all()
+    posicao = {cid: i for i, cid in enumerate(ids)}
+    ordenados = sorted((dict(r) for r in rows), key=lambda r: (posicao.get(r["id"], len(posicao)), r["nome_cliente"] or ""))
+    return ordenados[offset:offset + limite]
+
+
+# ---------------- produtos ----------------
+def filtro_produtos(db: Session, q: Optional[str], alias: str = "p") -> Optional[FiltroTexto]:
+    """
+    Condição para consultas sobre v_produto_v2_preco/t_cadastro_produto_v2 (`alias`.id):
+    código, descrição, unidade e tipo. None se q vazio.
+    """
+    if not palavras_busca(q):
+        return None
+    if usa_trgm(db):
+        filtro = filtro_trgm("b.busca_normalizada", q, "busca")
+        return FiltroTexto(
+            where=f"{alias}.id IN (SELECT b.id FROM t_cadastro_produto_v2 b WHERE {filtro.where})",
+            rank=f"(SELECT {filtro.rank} FROM t_cadastro_produto_v2 b WHERE b.id = {alias}.id)",
+            params=filtro.params,
+        )
+    ids = indice_produtos.buscar(db, q)
+    if not ids:
+        return FiltroTexto(where="1=0", rank="0", params={})
+    # ids vêm do próprio banco (inteiros): seguros para ir direto no SQL
+    lista = ", ".join(str(int(i)) for i in ids)
+    casos = " ".join(f"WHEN {int(i)} THEN {len(ids) - n}" for n, i in enumerate(ids))
+    return FiltroTexto(where=f"{alias}.id IN ({lista})", rank=f"(CASE {alias}.id {casos} ELSE 0 END)", params={})
+
+
+# ---------------- pedidos ----------------
+def filtro_pedidos_cliente(db: Session, q: Optional[str], alias: str = "a") -> Optional[FiltroTexto]:
+    """Filtro de cliente (nome ou código) da listagem de pedidos."""
+    if not palavras_busca(q):
+        return None
+    if usa_trgm(db):
+        return filtro_trgm(f"{alias}.busca_normalizada", q, "cliente_busca")
+    return FiltroTexto(
+        where=f"(lower({alias}.cliente) LIKE :cliente_busca OR {alias}.codigo_cliente LIKE :cliente_busca)",
+        rank="0",
+        params={"cliente_busca": f"%{q.strip().lower()}%"},
+    )
@@ -0,0 +1,238 @@
+# services/captacao_snapshot.py
+"""
+Snapshot em memória (por processo) da tela de captação de pedidos.
+
+Antes, cada chamada de /captacao-pedidos, /previsao-semanal e do relatório semanal de
+prospecção lia todos os clientes com todas as colunas e fazia um GROUP BY em tb_pedidos.
+Aqui ficam só os campos usados de cada cliente e a data do último pedido por código;
+as escritas marcam o que mudou e a próxima leitura recarrega apenas isso:
+
+- clientes: `marcar_clientes(ids)` após criar/editar/excluir/inativar (services.cliente);
+- pedidos:  `marcar_pedidos(ids_pedido)`, chamado por `atualizar_rollup_pedidos`, que
+  todas as rotinas que gravam pedidos já usam.
+
+O snapshot inteiro é recarregado quando o TTL vence (cobre escritas fora do app, outras
+instâncias e leituras que pegaram uma marca antes do commit). O resultado calculado para
+o dia (cores, previsões, ordenação) fica guardado até o snapshot mudar.
+"""
+import logging
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("ordersync.captacao_snapshot")
+
+TTL_SNAPSHOT = 600
+
+_COLUNAS_CLIENTE = """
+    id, cadastro_codigo_da_empresa, cadastro_nome_cliente, cadastro_nome_fantasia,
+    entrega_rota_principal, entrega_rota_aproximacao, entrega_municipio, faturamento_municipio,
+    ultimas_compras_emissao_dt, cadastro_periodo_de_compra, elaboracao_vendedor, cadastro_ativo
+"""
+
+
+def extract_days(period_str: str) -> int:
+    if not period_str:
+        return 0
+    # Extrai o primeiro numero encontrado na string
+    numbers = re.findall(r'\d+', period_str)
+    if numbers:
+        return int(numbers[0])
+    return 0
+
+
+def _data(valor) -> Optional[date]:
+    """DATE de um timestamp do banco (o SQLite devolve texto)."""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def _registro_cliente(row) -> Dict:
+    return {
+        "id": row.id,
+        "codigo_cliente": row.cadastro_codigo_da_empresa or "",
+        "cliente": row.cadastro_nome_cliente or "",
+        "nome_fantasia": row.cadastro_nome_fantasia or "",
+        "rota_geral": row.entrega_rota_principal or "",
+        "rota_aproximacao": row.entrega_rota_aproximacao or "",
+        "municipio": row.entrega_municipio or row.faturamento_municipio or "",
+        "compra_legada": _data(row.ultimas_compras_emissao_dt),
+        "periodo_em_dias": extract_days(row.cadastro_periodo_de_compra or ""),
+        "vendedor": row.elaboracao_vendedor or "Sem Vendedor",
+        "ativo": bool(row.cadastro_ativo),
+    }
+
+
+def _ultimas_compras(db: Session, codigos: Optional[Iterable[str]] = None) -> Dict[str, date]:
+    """Data do último pedido não cancelado por código de cliente."""
+    filtro, params = "", {}
+    if codigos is not None:
+        filtro, params = "AND codigo_cliente IN :codigos", {"codigos": list(codigos)}
+    stmt = text(f"""
+        SELECT codigo_cliente, MAX(created_at) AS ultima_data
+        FROM tb_pedidos
+        WHERE status != 'CANCELADO' {filtro}
+        GROUP BY codigo_cliente
+    """)
+    if codigos is not None:
+        stmt = stmt.bindparams(bindparam("codigos", expanding=True))
+    return {r.codigo_cliente: _data(r.ultima_data) for r in db.execute(stmt, params)}
+
+
+def montar_linha(base: Dict, ultima_compra: Optional[date], hoje: date) -> Dict:
+    """Linha da captação para um cliente: dias sem comprar, cor e previsão da próxima compra."""
+    ultima_compra_data = ultima_compra or base["compra_legada"]
+    periodo_em_dias = base["periodo_em_dias"]
+
+    dias_sem_comprar = 0
+    previsao_data = None
+    status_cor = "cinza"  # Default se sem config ou sem compra
+    if ultima_compra_data:
+        delta = (hoje - ultima_compra_data).days
+        dias_sem_comprar = delta if delta > 0 else 0
+        if periodo_em_dias > 0:
+            if dias_sem_comprar <= 60:
+                status_cor = "verde"
+            elif dias_sem_comprar <= 90:
+                status_cor = "amarelo"
+            else:
+                status_cor = "vermelho"
+            previsao_data = ultima_compra_data + timedelta(days=periodo_em_dias)
+
+    grupo_ordem = 3
+    if base["ativo"]:
+        grupo_ordem = 1 if ultima_compra_data else 2
+
+    return {
+        "grupo_ordem": grupo_ordem,
+        "sort_date": previsao_data or date(9999, 12, 31),
+        "rota_geral": base["rota_geral"],
+        "rota_aproximacao": base["rota_aproximacao"],
+        "codigo_cliente": base["codigo_cliente"],
+        "cliente": base["cliente"],
+        "nome_fantasia": base["nome_fantasia"],
+        "municipio": base["municipio"],
+        "data_ultima_compra": ultima_compra_data.strftime('%d/%m/%Y') if ultima_compra_data else "",
+        "periodo_em_dias": periodo_em_dias,
+        "data_previsao_proxima": previsao_data.strftime('%d/%m/%Y') if previsao_data else "",
+        "dias_sem_comprar": dias_sem_comprar,
+        "status_cor": status_cor,
+        "ativo": base["ativo"],
+        "vendedor": base["vendedor"],
+        "previsao_data_raw": previsao_data,  # Mantido para filtro
+    }
+
+
+class CaptacaoSnapshot:
+    """Clientes (campos da captação) + último pedido por código, com recarga incremental."""
+
+    def __init__(self, ttl: float = TTL_SNAPSHOT):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._clientes: Dict[int, Dict] = {}
+        self._ultimas: Dict[str, date] = {}
+        self._carregado_em: Optional[float] = None
+        self._versao = 0
+        self._clientes_sujos: Set[int] = set()
+        self._pedidos_sujos: Set[int] = set()
+        self._codigos_sujos: Set[str] = set()
+        self._linhas: Optional[tuple] = None  # (versao, hoje, linhas)
+
+    def marcar_clientes(self, ids: Iterable[int] = (), codigos: Iterable[str] = ()) -> None:
+        """Clientes alterados (ids) e códigos cujos pedidos mudaram de dono."""
+        with self._lock:
+            self._clientes_sujos.update(ids)
+            self._codigos_sujos.update(c for c in codigos if c)
+
+    def marcar_pedidos(self, ids_pedido: Iterable[int]) -> None:
+        with self._lock:
+            self._pedidos_sujos.update(ids_pedido)
+
+    def invalidar(self) -> None:
+        """Descarta tudo; a próxima leitura recarrega o snapshot inteiro."""
+        with self._lock:
+            self._carregado_em = None
+
+    def _recarregar(self, db: Session) -> None:
+        inicio = time.perf_counter()
+        rows = db.execute(text(f"SELECT {_COLUNAS_CLIENTE} FROM t_cadastro_cliente_v2")).fetchall()
+        self._clientes = {r.id: _registro_cliente(r) for r in rows}
+        self._ultimas = _ultimas_compras(db)
+        self._clientes_sujos.clear()
+        self._pedidos_sujos.clear()
+        self._codigos_sujos.clear()
+        self._carregado_em = time.monotonic()
+        self._versao += 1
+        logger.info(f"Snapshot de captação recarregado: {len(self._clientes)} clientes em {time.perf_counter() - inicio:.2f}s")
+
+    def _aplicar_alteracoes(self, db: Session) -> None:
+        clientes, pedidos, codigos = self._clientes_sujos, self._pedidos_sujos, self._codigos_sujos
+        self._clientes_sujos, self._pedidos_sujos, self._codigos_sujos = set(), set(), set()
+
+        if clientes:
+            rows = db.execute(
+                text(f"SELECT {_COLUNAS_CLIENTE} FROM t_cadastro_cliente_v2 WHERE id IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(clientes)},
+            ).fetchall()
+            for cid in clientes:
+                self._clientes.pop(cid, None)
+            for r in rows:
+                self._clientes[r.id] = _registro_cliente(r)
+        if pedidos:
+            codigos |= set(db.execute(
+                text("SELECT DISTINCT codigo_cliente FROM tb_pedidos WHERE id_pedido IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(pedidos)},
+            ).scalars())
+        codigos.discard(None)
+        if codigos:
+            novas = _ultimas_compras(db, codigos)
+            for codigo in codigos:
+                if codigo in novas and novas[codigo]:
+                    self._ultimas[codigo] = novas[codigo]
+                else:
+                    self._ultimas.pop(codigo, None)
+        self._versao += 1
+
+    def linhas(self, db: Session, hoje: Optional[date] = None) -> List[Dict]:
+        """Linhas da captação ordenadas (grupo, previsão); cópias que o chamador pode alterar."""
+        hoje = hoje or datetime.now().date()
+        with self._lock:
+            if self._carregado_em is None or time.monotonic() - self._carregado_em > self.ttl:
+                self._recarregar(db)
+            elif self._clientes_sujos or self._pedidos_sujos or self._codigos_sujos:
+                self._aplicar_alteracoes(db)
+
+            if not self._linhas or self._linhas[:2] != (self._versao, hoje):
+                linhas = [
+                    montar_linha(base, self._ultimas.get(base["codigo_cliente"]), hoje)
+                    for base in self._clientes.values()
+                ]
+                linhas.sort(key=lambda x: (x["grupo_ordem"], x["sort_date"]))
+                self._linhas = (self._versao, hoje, linhas)
+            linhas = self._linhas[2]
+        return [dict(l) for l in linhas]
+
+
+snapshot_captacao = CaptacaoSnapshot()
+
+
+def dados_captacao(db: Session) -> List[Dict]:
+    return snapshot_captacao.linhas(db)
+
+
+def marcar_clientes(ids: Iterable[int] = (), codigos: Iterable[str] = ()) -> None:
+    snapshot_captacao.marcar_clientes(ids, codigos)
+
+
+def marcar_pedidos(ids_pedido: Iterable[int]) -> None:
+    snapshot_captacao.marcar_pedidos(ids_pedido)
@@ -1,11 +1,15 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from database import SessionLocal
-from models.cliente_v2 import ClienteModelV2
+from models.cliente_v2 import ClienteModelV2, so_digitos
+from services.referencias_cache import invalidar_st_clientes
+from services.busca import invalidar_indices
+from services.captacao_snapshot import marcar_clientes
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import logging
+import time
 
 TZ = ZoneInfo("America/Sao_Paulo")
 
@@ -369,6 +373,38 @@ def obter_cliente_por_codigo(codigo: str) -> dict:
     finally:
         db.close()
 
+def buscar_duplicado(db: Session, codigo=None, cnpj=None, cpf=None,
+                     excluir_id: Optional[int] = None) -> Optional[Tuple[str, ClienteModelV2]]:
+    """
+    Primeiro cliente com o mesmo código, CNPJ ou CPF (comparando só dígitos, pelas
+    colunas indexadas *_digitos). Retorna (campo, cliente) ou None.
+    """
+    from sqlalchemy import or_
+
+    codigo = str(codigo).strip() if codigo is not None else ""
+    cnpj_digitos, cpf_digitos = so_digitos(cnpj), so_digitos(cpf)
+    condicoes = []
+    if codigo:
+        condicoes.append(ClienteModelV2.cadastro_codigo_da_empresa == codigo)
+    if cnpj_digitos:
+        condicoes.append(ClienteModelV2.cadastro_cnpj_digitos == cnpj_digitos)
+    if cpf_digitos:
+        condicoes.append(ClienteModelV2.cadastro_cpf_digitos == cpf_digitos)
+    if not condicoes:
+        return None
+
+    query = db.query(ClienteModelV2).filter(or_(*condicoes))
+    if excluir_id is not None:
+        query = query.filter(ClienteModelV2.id != excluir_id)
+    existente = query.first()
+    if not existente:
+        return None
+    if codigo and existente.cadastro_codigo_da_empresa == codigo:
+        return "codigo", existente
+    if cnpj_digitos and existente.cadastro_cnpj_digitos == cnpj_digitos:
+        return "cnpj", existente
+    return "cpf", existente
+
 def criar_cliente(cliente_data: dict) -> dict:
     db = SessionLocal()
     try:
@@ -384,38 +420,27 @@ def criar_cliente(cliente_data: dict) -> dict:
             raise BusinessRuleException("Obrigatório preencher apenas um documento: ou o CPF ou o CNPJ (nunca ambos e nem nenhum).")
             
         novo_cliente = _nested_to_flat(cliente_data)
-        
-        import re
-        from sqlalchemy import or_, func
-        
-        condicoes = []
+
         _codigo = novo_cliente.cadastro_codigo_da_empresa
         _cnpj = novo_cliente.cadastro_cnpj
         _cpf = novo_cliente.cadastro_cpf
-        
-        if _codigo and str(_codigo).strip():
-            condicoes.append(ClienteModelV2.cadastro_codigo_da_empresa == _codigo)
-        if _cnpj and str(_cnpj).strip():
-            _cnpj_clean = re.sub(r"\D", "", _cnpj)
-            condicoes.append(func.regexp_replace(ClienteModelV2.cadastro_cnpj, r"\D", "", "g") == _cnpj_clean)
-        if _cpf and str(_cpf).strip():
-            _cpf_clean = re.sub(r"\D", "", _cpf)
-            condicoes.append(func.regexp_replace(ClienteModelV2.cadastro_cpf, r"\D", "", "g") == _cpf_clean)
-            
-        if condicoes:
-            existente = db.query(ClienteModelV2).filter(or_(*condicoes)).first()
-            if existente:
-                if _codigo and existente.cadastro_codigo_da_empresa == _codigo:
-                    raise BusinessRuleException(f"Já existe um cliente cadastrado com o código {_codigo}")
-                if _cnpj and re.sub(r"\D", "", existente.cadastro_cnpj or "") == re.sub(r"\D", "", _cnpj):
-                    raise BusinessRuleException(f"Já existe um cliente cadastrado com o CNPJ {_cnpj}")
-                if _cpf and re.sub(r"\D", "", existente.cadastro_cpf or "") == re.sub(r"\D", "", _cpf):
-                    raise BusinessRuleException(f"Já existe um cliente cadastrado com o CPF {_cpf}")
-                    
+
+        duplicado = buscar_duplicado(db, _codigo, _cnpj, _cpf)
+        if duplicado:
+            campo, _ = duplicado
+            if campo == "codigo":
+                raise BusinessRuleException(f"Já existe um cliente cadastrado com o código {_codigo}")
+            if campo == "cnpj":
+                raise BusinessRuleException(f"Já existe um cliente cadastrado com o CNPJ {_cnpj}")
+            raise BusinessRuleException(f"Já existe um cliente cadastrado com o CPF {_cpf}")
+
         novo_cliente.data_criacao = datetime.now()
         db.add(novo_cliente)
         db.commit()
+        invalidar_st_clientes()
+        invalidar_indices()
         db.refresh(novo_cliente)
+        marcar_clientes([novo_cliente.id])
         return _flat_to_nested(novo_cliente)
     except Exception as e:
         db.rollback()
@@ -442,37 +467,19 @@ def atualizar_cliente(cliente_id: int, cliente_data: dict) -> dict:
             return None
         
         novos_dados = _nested_to_flat(cliente_data)
-        
-        import re
-        from sqlalchemy import or_, func
-        
-        condicoes = []
+
         _codigo = novos_dados.cadastro_codigo_da_empresa
         _cnpj = novos_dados.cadastro_cnpj
         _cpf = novos_dados.cadastro_cpf
-        
-        if _codigo and str(_codigo).strip():
-            condicoes.append(ClienteModelV2.cadastro_codigo_da_empresa == _codigo)
-        if _cnpj and str(_cnpj).strip():
-            _cnpj_clean = re.sub(r"\D", "", _cnpj)
-            condicoes.append(func.regexp_replace(ClienteModelV2.cadastro_cnpj, r"\D", "", "g") == _cnpj_clean)
-        if _cpf and str(_cpf).strip():
-            _cpf_clean = re.sub(r"\D", "", _cpf)
-            condicoes.append(func.regexp_replace(ClienteModelV2.cadastro_cpf, r"\D", "", "g") == _cpf_clean)
-            
-        if condicoes:
-            existente = db.query(ClienteModelV2).filter(
-                ClienteModelV2.id != cliente_id,
-                or_(*condicoes)
-            ).first()
-            
-            if existente:
-                if _codigo and existente.cadastro_codigo_da_empresa == _codigo:
-                    raise BusinessRuleException(f"Já existe outro cliente usando o código {_codigo}")
-                if _cnpj and re.sub(r"\D", "", existente.cadastro_cnpj or "") == re.sub(r"\D", "", _cnpj):
-                    raise BusinessRuleException(f"Já existe outro cliente usando o CNPJ {_cnpj}")
-                if _cpf and re.sub(r"\D", "", existente.cadastro_cpf or "") == re.sub(r"\D", "", _cpf):
-                    raise BusinessRuleException(f"Já existe outro cliente usando o CPF {_cpf}")
+
+        duplicado = buscar_duplicado(db, _codigo, _cnpj, _cpf, excluir_id=cliente_id)
+        if duplicado:
+            campo, _ = duplicado
+            if campo == "codigo":
+                raise BusinessRuleException(f"Já existe outro cliente usando o código {_codigo}")
+            if campo == "cnpj":
+                raise BusinessRuleException(f"Já existe outro cliente usando o CNPJ {_cnpj}")
+            raise BusinessRuleException(f"Já existe outro cliente usando o CPF {_cpf}")
         
         # Guardar valores antigos antes da alteração
         nome_antigo = cliente.cadastro_nome_cliente
@@ -517,6 +524,10 @@ def atualizar_cliente(cliente_id: int, cliente_data: dict) -> dict:
         
         cliente.data_atualizacao = datetime.now()
         db.commit()
+        invalidar_st_clientes()
+        invalidar_indices()
+        # Pedidos órfãos podem ter passado para o código do cliente
+        marcar_clientes([cliente_id], codigos=[str(novo_codigo).strip()] if novo_codigo else [])
         db.refresh(cliente)
         return _flat_to_nested(cliente)
     except Exception as e:
@@ -532,6 +543,9 @@ def deletar_cliente(cliente_id: int) -> bool:
         if cliente:
             db.delete(cliente)
             db.commit()
+            invalidar_st_clientes()
+            invalidar_indices()
+            marcar_clientes([cliente_id])
             return True
         return False
     except Exception as e:
@@ -541,96 +555,97 @@ def deletar_cliente(cliente_id: int) -> bool:
         db.close()
 
 
-def verificar_inatividade_clientes():
+DIAS_INATIVIDADE = 180
+
+
+def _para_sp(valor: Optional[datetime]) -> Optional[datetime]:
+    """Timestamp do banco (naive = UTC) no fuso de São Paulo."""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    if not valor.tzinfo:
+        valor = valor.replace(tzinfo=ZoneInfo("UTC"))
+    return valor.astimezone(TZ)
+
+
+def verificar_inatividade_clientes(dry_run: bool = False) -> dict:
     """
     Regra automática: Se o intervalo desde a última compra for > 180 dias,
     setar cadastro_ativo = FALSE.
-    Consulta a tabela tb_pedidos baseada no codigo_cliente.
-    Trabalhando no fuso horário de São Paulo (America/Sao_Paulo).
+    Referência, nesta ordem: último pedido não cancelado em tb_pedidos, data legada
+    do ERP (ultimas_compras_emissao_dt) e data de cadastro; fuso America/Sao_Paulo.
+
+    Uma consulta agrupada traz a referência de todos os clientes ativos e um UPDATE
+    em lote inativa os vencidos. Com dry_run nada é gravado, só as contagens.
     """
-    logger.info("Iniciando verificação de inatividade de clientes (> 180 dias)...")
+    logger.info(f"Iniciando verificação de inatividade de clientes (> {DIAS_INATIVIDADE} dias)...")
+    inicio = time.perf_counter()
+    resumo = {"dry_run": dry_run, "avaliados": 0, "inativados": 0, "sem_referencia": 0, "por_origem": {}}
     db = SessionLocal()
     try:
-        clientes_ativos = db.query(ClienteModelV2).filter(
-            ClienteModelV2.cadastro_ativo == True,
-            ClienteModelV2.cadastro_codigo_da_empresa != None,
-            ClienteModelV2.cadastro_codigo_da_empresa != ""
-        ).all()
-
-        if not clientes_ativos:
-            logger.info("Nenhum cliente ativo com código encontrado.")
-            return 0
+        rows = db.execute(text("""
+            WITH ultima AS (
+                SELECT codigo_cliente, MAX(created_at) AS ultima_compra
+                FROM tb_pedidos
+                WHERE LOWER(status) != 'cancelado'
+                GROUP BY codigo_cliente
+            )
+            SELECT c.id, c.cadastro_codigo_da_empresa, u.ultima_compra,
+                   c.ultimas_compras_emissao_dt, c.data_criacao
+            FROM t_cadastro_cliente_v2 c
+            LEFT JOIN ultima u ON u.codigo_cliente = c.cadastro_codigo_da_empresa
+            WHERE c.cadastro_ativo = TRUE
+              AND c.cadastro_codigo_da_empresa IS NOT NULL
+              AND TRIM(c.cadastro_codigo_da_empresa) != ''
+        """)).fetchall()
 
-        inativos_count = 0
         agora_sp = datetime.now(TZ)
-        limite = agora_sp - timedelta(days=180)
-
-        for cliente in clientes_ativos:
-            codigo = cliente.cadastro_codigo_da_empresa
-            if not codigo or not str(codigo).strip():
+        limite = agora_sp - timedelta(days=DIAS_INATIVIDADE)
+        inativar = []
+        for cliente_id, codigo, ultima_compra, emissao_legada, data_criacao in rows:
+            if ultima_compra:
+                data_referencia, origem_data = _para_sp(ultima_compra), "Pedido ERP Novo"
+            elif emissao_legada:
+                if isinstance(emissao_legada, str):
+                    emissao_legada = datetime.fromisoformat(emissao_legada)
+                data_referencia, origem_data = emissao_legada.replace(tzinfo=TZ), "Histórico ERP (Legado)"
+            elif data_criacao:
+                # Cliente nunca comprou
+                data_referencia, origem_data = _para_sp(data_criacao), "Data de Cadastro"
+            else:
+                resumo["sem_referencia"] += 1
+                logger.warning(f"Cliente {codigo} ignorado na inativação: Impossível determinar data de referência.")
                 continue
 
-            result = db.execute(text("""
-                SELECT MAX(created_at) as ultima_compra
-                FROM tb_pedidos
-                WHERE codigo_cliente = :codigo
-                  AND LOWER(status) != 'cancelado'
-            """), {"codigo": codigo}).fetchone()
+            if data_referencia < limite:
+                inativar.append(cliente_id)
+                resumo["por_origem"][origem_data] = resumo["por_origem"].get(origem_data, 0) + 1
+                logger.info(f"Cliente {codigo} {'seria inativado' if dry_run else 'inativado'}. Motivo: >{DIAS_INATIVIDADE} dias. Ref: {origem_data} ({data_referencia.strftime('%d/%m/%Y')})")
 
-            data_referencia = None
-            origem_data = "Nenhuma"
+        resumo["avaliados"] = len(rows)
+        resumo["inativados"] = len(inativar)
 
-            if result and result[0]:
-                ultima_compra = result[0]
-                
-                if not ultima_compra.tzinfo:
-                    ultima_compra = ultima_compra.replace(tzinfo=ZoneInfo("UTC"))
-                
-                data_referencia = ultima_compra.astimezone(TZ)
-                origem_data = "Pedido ERP Novo"
-
-            if not data_referencia and cliente.ultimas_compras_emissao:
-                dt_str = str(cliente.ultimas_compras_emissao).strip()
-                parsed_dt = None
-                for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%dT%H:%M:%S.%fZ"):
-                    try:
-                        parsed_dt = datetime.strptime(dt_str, fmt)
-                        break
-                    except ValueError:
-                        pass
-                
-                if parsed_dt:
-                    data_referencia = parsed_dt.replace(tzinfo=TZ)
-                    origem_data = "Histórico ERP (Legado)"
-                else:
-                    logger.debug(f"Falha ao interpretar data legada '{dt_str}' para o cliente {codigo}")
-
-            # Fallback 2: Data de criação do cadastro (Cliente nunca comprou)
-            if not data_referencia and cliente.data_criacao:
-                dc = cliente.data_criacao
-                if not dc.tzinfo:
-                    dc = dc.replace(tzinfo=ZoneInfo("UTC"))
-                data_referencia = dc.astimezone(TZ)
-                origem_data = "Data de Cadastro"
-
-            if data_referencia:
-                if data_referencia < limite:
-                    cliente.cadastro_ativo = False
-                    cliente.data_atualizacao = agora_sp
-                    cliente.data_inativacao = agora_sp  # [NEW] Registra data de inativação
-                    inativos_count += 1
-                    logger.info(f"Cliente {codigo} inativado. Motivo: >180 dias. Ref: {origem_data} ({data_referencia.strftime('%d/%m/%Y')})")
-            else:
-                logger.warning(f"Cliente {codigo} ignorado na inativação: Impossível determinar data de referência.")
-
-        if inativos_count > 0:
+        if inativar and not dry_run:
+            db.execute(text("""
+                UPDATE t_cadastro_cliente_v2
+                SET cadastro_ativo = FALSE, data_atualizacao = :agora, data_inativacao = :agora
+                WHERE id IN :ids AND cadastro_ativo = TRUE
+            """).bindparams(bindparam("ids", expanding=True)), {"agora": agora_sp, "ids": inativar})
             db.commit()
-
-        logger.info(f"Verificação concluída. {inativos_count} cliente(s) marcado(s) como inativo(s).")
-        return inativos_count
+            marcar_clientes(inativar)
+
+        resumo["segundos"] = round(time.perf_counter() - inicio, 3)
+        logger.info(
+            f"Verificação concluída{' (dry-run)' if dry_run else ''}: {resumo['avaliados']} avaliado(s), "
+            f"{resumo['inativados']} cliente(s) {'a inativar' if dry_run else 'marcado(s) como inativo(s)'} "
+            f"em {resumo['segundos']}s."
+        )
+        return resumo
     except Exception as e:
         db.rollback()
         logger.error(f"Erro na verificação de inatividade: {e}")
-        return 0
+        resumo["erro"] = str(e)
+        return resumo
     finally:
         db.close()
@@ -1,17 +1,32 @@
 import logging
+import os
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Callable, Dict, List, Optional
 from sqlalchemy.orm import Session
 from jinja2 import Template
 
 from database import SessionLocal
 from models.usuario import UsuarioModel
 from models.calendario import EventModel, CalendarModel, CalendarShareModel
-from services.email_service import _abrir_conexao, _get_cfg_smtp
+from services.email_service import _get_cfg_smtp
+from services import smtp_pool
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 logger = logging.getLogger("ordersync.worker")
 
+# Envios simultâneos (não passar do max_conexoes do pool SMTP) e tentativas por e-mail
+DIGEST_CONCORRENCIA = int(os.getenv("DIGEST_CONCORRENCIA", "4"))
+DIGEST_TENTATIVAS = int(os.getenv("DIGEST_TENTATIVAS", "3"))
+DIGEST_BACKOFF_BASE = float(os.getenv("DIGEST_BACKOFF_BASE", "2"))
+
+# Link do Frontend (Fallback dev/prod)
+# O ideal é estar em variáveis de ambiente, usando placeholder temporário
+LINK_APP = "https://ordersync-y7kg.onrender.com/public/index.html"
+
 # Template HTML simples usando Jinja2 para loop de eventos
 TEMPLATE_HTML = """
 <!DOCTYPE html>
@@ -66,6 +81,153 @@ TEMPLATE_HTML = """
 </html>
 """
 
+
+# Compilado uma vez por processo, não a cada usuário
+_TEMPLATE = Template(TEMPLATE_HTML)
+
+
+def carregar_resumos(db: Session, inicio_dia: datetime, fim_dia: datetime) -> List[Dict]:
+    """
+    Usuários com resumo ativo e seus eventos do dia, em 4 consultas fixas (usuários, agendas
+    próprias, agendas compartilhadas, eventos) em vez de 3 por usuário.
+    Retorna [{nome, email, eventos: [dict do template]}] só de quem tem eventos.
+    """
+    usuario_ativo = (UsuarioModel.ativo == True, UsuarioModel.email_daily_digest == True)
+    usuarios = db.query(UsuarioModel.id, UsuarioModel.nome, UsuarioModel.email).filter(*usuario_ativo).all()
+    if not usuarios:
+        return []
+
+    agendas: Dict = {}
+    agendas_por_usuario: Dict[int, set] = {u.id: set() for u in usuarios}
+    proprias = db.query(CalendarModel).join(UsuarioModel, UsuarioModel.id == CalendarModel.user_id).filter(*usuario_ativo).all()
+    for cal in proprias:
+        agendas[cal.id] = cal
+        agendas_por_usuario[cal.user_id].add(cal.id)
+    compartilhadas = db.query(CalendarShareModel.shared_with_user_id, CalendarModel).join(
+        CalendarModel, CalendarModel.id == CalendarShareModel.calendar_id
+    ).join(
+        UsuarioModel, UsuarioModel.id == CalendarShareModel.shared_with_user_id
+    ).filter(*usuario_ativo).all()
+    for user_id, cal in compartilhadas:
+        agendas[cal.id] = cal
+        agendas_por_usuario[user_id].add(cal.id)
+    if not agendas:
+        return []
+
+    eventos = db.query(EventModel).filter(
+        EventModel.calendar_id.in_(list(agendas.keys())),
+        EventModel.start_time >= inicio_dia,
+        EventModel.start_time <= fim_dia
+    ).order_by(EventModel.start_time).all()
+    eventos_por_agenda: Dict = {}
+    for ev in eventos:
+        cal = agendas[ev.calendar_id]
+        eventos_por_agenda.setdefault(ev.calendar_id, []).append({
+            "inicio": ev.start_time,
+            "titulo": ev.title,
+            "hora_inicio": ev.start_time.strftime("%H:%M"),
+            "hora_fim": ev.end_time.strftime("%H:%M"),
+            "dia_inteiro": ev.is_all_day,
+            "agenda_nome": cal.name,
+            "cor": cal.color,
+            "local": ev.location
+        })
+
+    resumos = []
+    for user in usuarios:
+        eventos_user = [ev for cal_id in agendas_por_usuario[user.id] for ev in eventos_por_agenda.get(cal_id, [])]
+        if not eventos_user:
+            continue  # Não envia e-mail se não houver eventos
+        # Desempate por agenda e título: eventos no mesmo horário saem sempre na mesma ordem
+        eventos_user.sort(key=lambda ev: (ev["inicio"], ev["agenda_nome"] or "", ev["titulo"] or ""))
+        resumos.append({"nome": user.nome, "email": user.email, "eventos": eventos_user})
+    return resumos
+
+
+def montar_mensagem(resumo: Dict, remetente: str, data_str: str) -> str:
+    html_body = _TEMPLATE.render(
+        user_nome=resumo["nome"],
+        data_hoje=data_str,
+        eventos=resumo["eventos"],
+        link_app=LINK_APP
+    )
+    msg = MIMEMultipart("alternative")
+    msg["From"] = remetente
+    msg["To"] = resumo["email"]
+    msg["Subject"] = f"Seus Compromissos de Hoje - {data_str}"
+    msg.attach(MIMEText(html_body, "html", "utf-8"))
+    return msg.as_string()
+
+
+def _erro_permanente(e: Exception) -> bool:
+    """Destinatário recusado ou resposta 5xx: tentar de novo não adianta."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500
+
+
+def _enviar_com_retentativa(enviar: Callable[[str, str], None], email: str, mensagem: str,
+                            tentativas: int, backoff_base: float) -> int:
+    """Envia um e-mail; devolve o número de tentativas usadas ou levanta o último erro."""
+    for tentativa in range(1, tentativas + 1):
+        try:
+            enviar(email, mensagem)
+            return tentativa
+        except Exception as e:
+            if tentativa == tentativas or _erro_permanente(e):
+                raise
+            espera = backoff_base * (2 ** (tentativa - 1))
+            logger.warning(f"[DailyDigest] Falha ao enviar para {email} (tentativa {tentativa}): {e}; nova tentativa em {espera:.0f}s")
+            time.sleep(espera)
+
+
+def executar_resumo(db: Session, remetente: str, enviar: Callable[[str, str], None],
+                    agora: Optional[datetime] = None, concorrencia: int = DIGEST_CONCORRENCIA,
+                    tentativas: int = DIGEST_TENTATIVAS, backoff_base: float = DIGEST_BACKOFF_BASE) -> Dict:
+    """
+    Carrega os resumos em lote, renderiza e envia em paralelo (`concorrencia` threads).
+    `enviar(email, mensagem)` faz o envio de um e-mail. Retorna as métricas da execução.
+    """
+    agora = agora or datetime.now()
+    inicio_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    fim_dia = agora.replace(hour=23, minute=59, second=59, microsecond=999999)
+    data_str = agora.strftime("%d/%m/%Y")
+    metricas = {"destinatarios": 0, "enviados": 0, "falhas": 0, "retentativas": 0}
+
+    t0 = time.perf_counter()
+    resumos = carregar_resumos(db, inicio_dia, fim_dia)
+    t_carga = time.perf_counter()
+    mensagens = [(r["email"], montar_mensagem(r, remetente, data_str), len(r["eventos"])) for r in resumos]
+    t_render = time.perf_counter()
+    metricas["destinatarios"] = len(mensagens)
+
+    def _enviar(item):
+        email, mensagem, qtd_eventos = item
+        try:
+            usadas = _enviar_com_retentativa(enviar, email, mensagem, tentativas, backoff_base)
+            logger.info(f"[DailyDigest] Enviado para {email} com {qtd_eventos} compromissos.")
+            return True, usadas - 1
+        except Exception as e_send:
+            logger.error(f"[DailyDigest] Falha ao enviar para {email}: {e_send}")
+            return False, 0
+
+    if mensagens:
+        with ThreadPoolExecutor(max_workers=max(1, min(concorrencia, len(mensagens))),
+                                thread_name_prefix="ordersync-digest") as executor:
+            for ok, extras in executor.map(_enviar, mensagens):
+                metricas["enviados" if ok else "falhas"] += 1
+                metricas["retentativas"] += extras
+    t_envio = time.perf_counter()
+
+    metricas.update({
+        "segundos_carga": round(t_carga - t0, 3),
+        "segundos_render": round(t_render - t_carga, 3),
+        "segundos_envio": round(t_envio - t_render, 3),
+        "segundos_total": round(t_envio - t0, 3),
+    })
+    return metricas
+
+
 def enviar_resumo_matinal():
     """
     Função chamada pelo Scheduler todo dia às 06:00.
@@ -76,83 +238,18 @@ def enviar_resumo_matinal():
     try:
         cfg_smtp = _get_cfg_smtp(db)
         remetente = (getattr(cfg_smtp, "remetente_email", "") or getattr(cfg_smtp, "smtp_user", "")).strip()
-        
-        # 1. Usuários ativos que desejam e-mail
-        usuarios = db.query(UsuarioModel).filter(
-            UsuarioModel.ativo == True,
-            UsuarioModel.email_daily_digest == True
-        ).all()
-        
-        agora = datetime.now()
-        inicio_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
-        fim_dia = agora.replace(hour=23, 59, 59, 999999)
-        data_str = agora.strftime("%d/%m/%Y")
-        
-        # Link do Frontend (Fallback dev/prod)
-        # O ideal é estar em variáveis de ambiente, usando placeholder temporário
-        link_app = "https://ordersync-y7kg.onrender.com/public/index.html" 
-        
-        jinja_template = Template(TEMPLATE_HTML)
-        
-        with _abrir_conexao(cfg_smtp) as server:
-            for user in usuarios:
-                # 2. Encontrar agendas do usuário
-                own_cals = db.query(CalendarModel).filter(CalendarModel.user_id == user.id).all()
-                shared_cals = db.query(CalendarModel).join(CalendarShareModel).filter(
-                    CalendarShareModel.shared_with_user_id == user.id
-                ).all()
-                
-                cal_map = {c.id: c for c in own_cals + shared_cals}
-                if not cal_map:
-                    continue
-                    
-                # 3. Buscar eventos de hoje
-                eventos = db.query(EventModel).filter(
-                    EventModel.calendar_id.in_(cal_map.keys()),
-                    EventModel.start_time >= inicio_dia,
-                    EventModel.start_time <= fim_dia
-                ).order_by(EventModel.start_time).all()
-                
-                if not eventos:
-                    continue # Não envia e-mail se não houver eventos
-                    
-                # 4. Preparar dados para o template
-                eventos_data = []
-                for ev in eventos:
-                    cal = cal_map[ev.calendar_id]
-                    eventos_data.append({
-                        "titulo": ev.title,
-                        "hora_inicio": ev.start_time.strftime("%H:%M"),
-                        "hora_fim": ev.end_time.strftime("%H:%M"),
-                        "dia_inteiro": ev.is_all_day,
-                        "agenda_nome": cal.name,
-                        "cor": cal.color,
-                        "local": ev.location
-                    })
-                    
-                # 5. Renderizar HTML
-                html_body = jinja_template.render(
-                    user_nome=user.nome,
-                    data_hoje=data_str,
-                    eventos=eventos_data,
-                    link_app=link_app
-                )
-                
-                # 6. Construir Mensagem
-                msg = MIMEMultipart("alternative")
-                msg["From"] = remetente
-                msg["To"] = user.email
-                msg["Subject"] = f"Seus Compromissos de Hoje - {data_str}"
-                
-                msg.attach(MIMEText(html_body, "html", "utf-8"))
-                
-                # 7. Enviar
-                try:
-                    server.sendmail(remetente, [user.email], msg.as_string())
-                    logger.info(f"[DailyDigest] Enviado para {user.email} com {len(eventos)} compromissos.")
-                except Exception as e_send:
-                    logger.error(f"[DailyDigest] Falha ao enviar para {user.email}: {e_send}")
-                    
+
+        def enviar(email: str, mensagem: str) -> None:
+            smtp_pool.enviar_email(cfg_smtp, remetente, [email], mensagem)
+
+        metricas = executar_resumo(db, remetente, enviar)
+        logger.info(
+            f"[DailyDigest] {metricas['enviados']}/{metricas['destinatarios']} enviados, "
+            f"{metricas['falhas']} falha(s), {metricas['retentativas']} retentativa(s) | "
+            f"carga {metricas['segundos_carga']}s, render {metricas['segundos_render']}s, "
+            f"envio {metricas['segundos_envio']}s, total {metricas['segundos_total']}s"
+        )
+        return metricas
     except Exception as e:
         logger.error(f"[DailyDigest] Erro geral: {e}")
     finally:
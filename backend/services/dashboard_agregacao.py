@@ -0,0 +1,75 @@
+# services/dashboard_agregacao.py
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+
+
+def agregar_por_intervalos(
+    db: Session,
+    intervals: List[Dict[str, Any]],
+    fonte: str,
+    coluna_data: str,
+    colunas: str,
+    metricas: Dict[str, str],
+    filtros: Optional[str] = None,
+    params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, List[Any]]:
+    """
+    Calcula as métricas de todos os intervalos do gráfico em UMA consulta agrupada.
+
+    Os intervalos (saída de get_chart_intervals) viram uma lista VALUES (idx, ini, fim)
+    que é cruzada por LEFT JOIN com a fonte; intervalos sem pedidos continuam aparecendo
+    (COUNT = 0, SUM/AVG = NULL -> tratar com COALESCE na métrica), exatamente como o
+    antigo laço de uma consulta por intervalo.
+
+    - fonte:       tabelas/joins do FROM (ex.: "public.tb_pedidos")
+    - coluna_data: coluna de data usada para encaixar a linha no intervalo
+    - colunas:     colunas expostas pela fonte para as métricas (acessadas como src.<col>)
+    - metricas:    {nome: expressão agregada sobre src}, ex.: {"qtd": "COUNT(src.id_pedido)"}
+    - filtros:     condição extra (sem WHERE/AND inicial) aplicada à fonte
+
+    Retorna {"labels": [...], <nome_metrica>: [...]} na ordem dos intervalos.
+    """
+    resultado: Dict[str, List[Any]] = {"labels": [iv["label"] for iv in intervals]}
+    for nome in metricas:
+        resultado[nome] = []
+    if not intervals:
+        return resultado
+
+    sql_params: Dict[str, Any] = dict(params or {})
+    valores = []
+    for i, iv in enumerate(intervals):
+        valores.append(f"({i}, :_iv_ini_{i}, :_iv_fim_{i})")
+        sql_params[f"_iv_ini_{i}"] = iv["start"]
+        sql_params[f"_iv_fim_{i}"] = iv["end"]
+    sql_params["_iv_min"] = min(iv["start"] for iv in intervals)
+    sql_params["_iv_max"] = max(iv["end"] for iv in intervals)
+
+    condicoes = f"{coluna_data} >= :_iv_min AND {coluna_data} < :_iv_max"
+    if filtros:
+        condicoes = f"({filtros}) AND {condicoes}"
+
+    select_metricas = ",\n            ".join(f"{expr} AS {nome}" for nome, expr in metricas.items())
+    q = text(f"""
+        WITH intervalos (idx, ini, fim) AS (
+            VALUES {", ".join(valores)}
+        )
+        SELECT
+            iv.idx AS idx,
+            {select_metricas}
+        FROM intervalos iv
+        LEFT JOIN (
+            SELECT {coluna_data} AS _dt, {colunas}
+            FROM {fonte}
+            WHERE {condicoes}
+        ) src ON src._dt >= iv.ini AND src._dt < iv.fim
+        GROUP BY iv.idx
+        ORDER BY iv.idx
+    """)
+
+    rows = {int(r["idx"]): r for r in db.execute(q, sql_params).mappings().all()}
+    for i in range(len(intervals)):
+        row = rows.get(i)
+        for nome in metricas:
+            resultado[nome].append(row[nome] if row is not None else None)
+    return resultado
@@ -517,6 +517,173 @@ def run_migrations():
                 db.rollback()
                 logger.error(f"Falha ao adicionar ativo em t_historico_estoque_v2: {e}")
 
+        # 27. tb_pedidos: índice da paginação por cursor (created_at, id_pedido)
+        try:
+            db.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_tb_pedidos_created_at_id
+                ON public.tb_pedidos (created_at DESC NULLS LAST, id_pedido DESC)
+            """))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Falha ao criar idx_tb_pedidos_created_at_id: {e}")
+
+        # 28. Rollup diário de vendas (dashboards)
+        try:
+            from services.vendas_rollup import ROLLUP_DDL, reconstruir_rollup
+            for ddl in ROLLUP_DDL:
+                db.execute(text(ddl))
+            db.commit()
+            vazio = db.execute(text("SELECT NOT EXISTS (SELECT 1 FROM public.tb_vendas_diario)")).scalar()
+            if vazio:
+                logger.info("Populando rollup de vendas (tb_vendas_diario / tb_vendas_produto_diario)...")
+                reconstruir_rollup(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Falha ao criar rollup de vendas: {e}")
+
+        # 29. tb_background_tasks: backoff exponencial + NOTIFY na inserção (worker da fila)
+        try:
+            db.execute(text("SELECT proxima_tentativa_em FROM tb_background_tasks LIMIT 1"))
+        except Exception:
+            db.rollback()
+            logger.info("Adicionando coluna proxima_tentativa_em em tb_background_tasks...")
+            try:
+                db.execute(text("ALTER TABLE tb_background_tasks ADD COLUMN proxima_tentativa_em TIMESTAMP"))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Falha ao adicionar proxima_tentativa_em: {e}")
+        try:
+            db.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_tb_background_tasks_fila
+                ON tb_background_tasks (status, criado_em)
+                WHERE status = 'PENDENTE'
+            """))
+            db.execute(text("""
+                CREATE OR REPLACE FUNCTION fn_notificar_tarefa() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('ordersync_tarefas', NEW.tipo_tarefa);
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """))
+            db.execute(text("DROP TRIGGER IF EXISTS trg_notificar_tarefa ON tb_background_tasks"))
+            db.execute(text("""
+                CREATE TRIGGER trg_notificar_tarefa
+                AFTER INSERT OR UPDATE OF status ON tb_background_tasks
+                FOR EACH ROW WHEN (NEW.status = 'PENDENTE')
+                EXECUTE FUNCTION fn_notificar_tarefa()
+            """))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Falha ao criar trigger de NOTIFY da fila: {e}")
+
+        # 30. Busca textual: pg_trgm + colunas busca_normalizada (clientes, produtos, pedidos)
+        if db.get_bind().dialect.name == "postgresql":
+            try:
+                from services.busca import BUSCA_DDL
+                for ddl in BUSCA_DDL:
+                    db.execute(text(ddl))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Falha ao criar índices de busca (pg_trgm): {e}")
+        else:
+            logger.info("Busca textual: sem pg_trgm neste banco, usando índice em memória.")
+
+        # 31. t_cadastro_cliente_v2: CNPJ/CPF só dígitos (checagem de duplicidade por índice)
+        for coluna in ("cadastro_cnpj_digitos", "cadastro_cpf_digitos"):
+            try:
+                db.execute(text(f"SELECT {coluna} FROM t_cadastro_cliente_v2 LIMIT 1"))
+            except Exception:
+                db.rollback()
+                logger.info(f"Adicionando coluna {coluna} em t_cadastro_cliente_v2...")
+                try:
+                    db.execute(text(f"ALTER TABLE t_cadastro_cliente_v2 ADD COLUMN {coluna} VARCHAR"))
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Falha ao adicionar {coluna}: {e}")
+        try:
+            # Backfill idempotente: só linhas ainda sem os dígitos (ou alteradas por fora do ORM)
+            if db.get_bind().dialect.name == "postgresql":
+                res = db.execute(text(r"""
+                    UPDATE t_cadastro_cliente_v2 SET
+                        cadastro_cnpj_digitos = NULLIF(regexp_replace(cadastro_cnpj, '\D', '', 'g'), ''),
+                        cadastro_cpf_digitos = NULLIF(regexp_replace(cadastro_cpf, '\D', '', 'g'), '')
+                    WHERE cadastro_cnpj_digitos IS DISTINCT FROM NULLIF(regexp_replace(cadastro_cnpj, '\D', '', 'g'), '')
+                       OR cadastro_cpf_digitos IS DISTINCT FROM NULLIF(regexp_replace(cadastro_cpf, '\D', '', 'g'), '')
+                """))
+                alterados = res.rowcount
+            else:
+                from models.cliente_v2 import so_digitos
+                rows = db.execute(text("""
+                    SELECT id, cadastro_cnpj, cadastro_cpf, cadastro_cnpj_digitos, cadastro_cpf_digitos
+                    FROM t_cadastro_cliente_v2
+                """)).fetchall()
+                pendentes = [
+                    {"id": r[0], "cnpj": so_digitos(r[1]), "cpf": so_digitos(r[2])}
+                    for r in rows if (r[3], r[4]) != (so_digitos(r[1]), so_digitos(r[2]))
+                ]
+                if pendentes:
+                    db.execute(text("""
+                        UPDATE t_cadastro_cliente_v2
+                        SET cadastro_cnpj_digitos = :cnpj, cadastro_cpf_digitos = :cpf
+                        WHERE id = :id
+                    """), pendentes)
+                alterados = len(pendentes)
+            db.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_t_cadastro_cliente_v2_cadastro_cnpj_digitos
+                ON t_cadastro_cliente_v2 (cadastro_cnpj_digitos)
+            """))
+            db.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_t_cadastro_cliente_v2_cadastro_cpf_digitos
+                ON t_cadastro_cliente_v2 (cadastro_cpf_digitos)
+            """))
+            db.commit()
+            if alterados:
+                logger.info(f"CNPJ/CPF só dígitos preenchido em {alterados} clientes.")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Falha no backfill de CNPJ/CPF só dígitos: {e}")
+
+        # 32. t_cadastro_cliente_v2: data legada de última compra já interpretada (inatividade)
+        try:
+            db.execute(text("SELECT ultimas_compras_emissao_dt FROM t_cadastro_cliente_v2 LIMIT 1"))
+        except Exception:
+            db.rollback()
+            logger.info("Adicionando coluna ultimas_compras_emissao_dt em t_cadastro_cliente_v2...")
+            try:
+                db.execute(text("ALTER TABLE t_cadastro_cliente_v2 ADD COLUMN ultimas_compras_emissao_dt TIMESTAMP"))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Falha ao adicionar ultimas_compras_emissao_dt: {e}")
+        try:
+            # Só linhas ainda não interpretadas; textos ilegíveis seguem NULL e são reavaliados
+            # a cada startup, então um formato novo em FORMATOS_EMISSAO_LEGADA preenche o que faltava
+            from models.cliente_v2 import parse_emissao_legada
+            rows = db.execute(text("""
+                SELECT id, ultimas_compras_emissao FROM t_cadastro_cliente_v2
+                WHERE ultimas_compras_emissao_dt IS NULL
+                  AND ultimas_compras_emissao IS NOT NULL AND ultimas_compras_emissao != ''
+            """)).fetchall()
+            pendentes = [
+                {"id": r[0], "dt": dt} for r in rows
+                if (dt := parse_emissao_legada(r[1])) is not None
+            ]
+            if pendentes:
+                db.execute(text(
+                    "UPDATE t_cadastro_cliente_v2 SET ultimas_compras_emissao_dt = :dt WHERE id = :id"
+                ), pendentes)
+                db.commit()
+                logger.info(f"Data legada de última compra interpretada para {len(pendentes)} clientes.")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Falha no backfill de ultimas_compras_emissao_dt: {e}")
+
     logger.info("Todas as migrações concluídas.")
 
 
@@ -8,6 +8,7 @@ from email import encoders
 from typing import Optional
 import ssl, smtplib
 from sqlalchemy.orm import Session
+from services import smtp_pool
 
 # ===== IMPORTS CORRETOS =====
 try:
@@ -114,7 +115,7 @@ def _get_cfg_msg(db: Session) -> ConfigEmailMensagemModel:
 
 
 # ------------------------
-# Conexão SMTP
+# Conexão SMTP (aberta pelo services/smtp_pool, que reaproveita as conexões)
 # ------------------------
 def _abrir_conexao(cfg_smtp):
     host = cfg_smtp.smtp_host.strip()
@@ -216,9 +217,8 @@ def enviar_email_notificacao(
                 part2.add_header("Content-Disposition", "attachment", filename=filename2)
                 msg.attach(part2)
 
-            with _abrir_conexao(cfg_smtp) as server:
-                server.sendmail(remetente, destinatarios_internos, msg.as_string())
-                print(f"Email Interno enviado para: {destinatarios_internos}")
+            smtp_pool.enviar_email(cfg_smtp, remetente, destinatarios_internos, msg.as_string())
+            print(f"Email Interno enviado para: {destinatarios_internos}")
         
         except Exception as e:
             print(f"Erro ao enviar email interno: {e}")
@@ -255,9 +255,8 @@ def enviar_email_notificacao(
                 part.add_header("Content-Disposition", "attachment", filename=filename)
                 msg.attach(part)
 
-            with _abrir_conexao(cfg_smtp) as server:
-                server.sendmail(remetente, [email_cliente], msg.as_string())
-                print(f"Email Cliente enviado para: {email_cliente}")
+            smtp_pool.enviar_email(cfg_smtp, remetente, [email_cliente], msg.as_string())
+            print(f"Email Cliente enviado para: {email_cliente}")
 
         except Exception as e:
             print(f"Erro ao enviar email cliente: {e}")
@@ -301,9 +300,8 @@ def enviar_email_recuperacao_senha(db: Session, email_destino: str, link_reset:
     msg.attach(MIMEText(corpo_html, "html", "utf-8"))
     
     try:
-        with _abrir_conexao(cfg_smtp) as server:
-            server.sendmail(remetente, [email_destino], msg.as_string())
-            print(f"Email de recuperação enviado para: {email_destino}")
+        smtp_pool.enviar_email(cfg_smtp, remetente, [email_destino], msg.as_string())
+        print(f"Email de recuperação enviado para: {email_destino}")
     except Exception as e:
         print(f"Erro ao enviar email de recuperação: {e}")
         # Não lançar exceção para não expor erro ao usuário (security by obscurity, ou melhor, UX)
@@ -343,9 +341,8 @@ def enviar_email_verificacao(db: Session, email_destino: str, link_verificacao:
     msg.attach(MIMEText(corpo_html, "html", "utf-8"))
     
     try:
-        with _abrir_conexao(cfg_smtp) as server:
-            server.sendmail(remetente, [email_destino], msg.as_string())
-            print(f"Email de verificação enviado para: {email_destino}")
+        smtp_pool.enviar_email(cfg_smtp, remetente, [email_destino], msg.as_string())
+        print(f"Email de verificação enviado para: {email_destino}")
     except Exception as e:
         print(f"Erro ao enviar email de verificação: {e}")
         raise e # Aqui lançamos pois é crítico na criação
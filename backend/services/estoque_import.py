@@ -0,0 +1,129 @@
+# services/estoque_import.py
+"""
+Ingestão da planilha de estoque (t_cadastro_produto_v2 + t_historico_estoque_v2).
+
+As colunas são convertidas de uma vez com pandas, os produtos são atualizados com um
+UPDATE ... FROM (VALUES ...) por bloco de LOTE_ESTOQUE códigos (RETURNING diz quais
+códigos existiam) e o histórico entra num insert em lote (executemany / multi-VALUES).
+"""
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from models.produto import HistoricoEstoqueV2
+
+logger = logging.getLogger("ordersync.estoque_import")
+
+LOTE_ESTOQUE = 1000
+
+# Nomes de cabeçalho aceitos e posição de fallback (colunas A, B, F, G, H)
+COLUNAS_CODIGO = (["Produto", "CODIGO", "CÓDIGO", "Codigo", "Código"], 0)
+COLUNAS_DESCRICAO = (["Descrição", "DESCRIÇÃO", "Descriçao", "Descricao", "Descrio"], 1)
+COLUNAS_QTD_ESTOQUE = (["Qt. Estoque", "Qt Estoque", "Qtd Estoque", "Qtd. Estoque"], 5)
+COLUNAS_QTD_PEDIDOS = (["Qt. Pedidos Carteira", "Qt. Pedidos", "Qt Pedidos", "Qtd Pedidos"], 6)
+COLUNAS_AF_PENDENTES = (["AF Pendentes", "AF Pendente", "AF"], 7)
+
+
+def _coluna(df: pd.DataFrame, nomes_pos) -> pd.Series:
+    """Coluna pelo primeiro nome de cabeçalho encontrado, senão pela posição."""
+    nomes, pos = nomes_pos
+    for nome in nomes:
+        if nome in df.columns:
+            return df[nome]
+    if len(df.columns) > pos:
+        return df.iloc[:, pos]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _inteiros(serie: pd.Series) -> pd.Series:
+    """int(float(v)) vetorizado: vazio, texto inválido ou infinito viram 0."""
+    num = pd.to_numeric(serie, errors="coerce").replace([np.inf, -np.inf], np.nan).fillna(0)
+    return np.trunc(num.astype(float)).astype(np.int64)
+
+
+def preparar_linhas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    DataFrame [codigo_supra, nome_produto, qtd_estoque, qtd_pedido, af_pendentes,
+    estoque_disponivel, estoque_futuro] na ordem da planilha, só com linhas que têm código.
+    """
+    df = df[~df.isnull().all(axis=1)]
+    codigo_raw = _coluna(df, COLUNAS_CODIGO)
+    codigo = codigo_raw.astype(str).str.strip()
+    validas = codigo_raw.notna() & (codigo != "")
+
+    nome_raw = _coluna(df, COLUNAS_DESCRICAO)
+    linhas = pd.DataFrame({
+        "codigo_supra": codigo,
+        "nome_produto": nome_raw.astype(str).str.strip().where(nome_raw.notna(), None),
+        "qtd_estoque": _inteiros(_coluna(df, COLUNAS_QTD_ESTOQUE)),
+        "qtd_pedido": _inteiros(_coluna(df, COLUNAS_QTD_PEDIDOS)),
+        "af_pendentes": _inteiros(_coluna(df, COLUNAS_AF_PENDENTES)),
+    })[validas.values]
+    linhas["estoque_disponivel"] = linhas["qtd_estoque"] - linhas["qtd_pedido"]
+    linhas["estoque_futuro"] = linhas["estoque_disponivel"] + linhas["af_pendentes"]
+    return linhas.reset_index(drop=True)
+
+
+def _atualizar_produtos(db: Session, linhas: pd.DataFrame, nome_arquivo: str, lote: int) -> Dict[str, int]:
+    """UPDATE ... FROM VALUES; retorna código -> nº de produtos atualizados."""
+    # Código repetido na planilha: vale a última linha (como no laço antigo)
+    ultimos = linhas.drop_duplicates("codigo_supra", keep="last")
+    registros = list(zip(
+        ultimos["codigo_supra"].tolist(),
+        ultimos["estoque_disponivel"].tolist(),
+        ultimos["estoque_futuro"].tolist(),
+    ))
+    atualizados: Dict[str, int] = {}
+    for ini in range(0, len(registros), lote):
+        bloco = registros[ini:ini + lote]
+        params = {"arquivo": nome_arquivo}
+        valores = []
+        for i, (codigo, disp, fut) in enumerate(bloco):
+            params[f"c_{i}"], params[f"d_{i}"], params[f"f_{i}"] = codigo, int(disp), int(fut)
+            valores.append(f"(CAST(:c_{i} AS TEXT), CAST(:d_{i} AS INTEGER), CAST(:f_{i} AS INTEGER))")
+        rows = db.execute(text(f"""
+            WITH v (codigo_supra, estoque_disponivel, estoque_futuro) AS (
+                VALUES {", ".join(valores)}
+            )
+            UPDATE t_cadastro_produto_v2 SET
+                estoque_disponivel = v.estoque_disponivel,
+                estoque_futuro = v.estoque_futuro,
+                nome_arquivo_estoque = :arquivo,
+                updated_at = CURRENT_TIMESTAMP
+            FROM v
+            WHERE t_cadastro_produto_v2.codigo_supra = v.codigo_supra
+            RETURNING t_cadastro_produto_v2.codigo_supra
+        """), params).fetchall()
+        for (codigo,) in rows:
+            atualizados[codigo] = atualizados.get(codigo, 0) + 1
+    return atualizados
+
+
+def importar_estoque_df(db: Session, df: pd.DataFrame, nome_arquivo: str, usuario: Optional[str],
+                        lote: int = LOTE_ESTOQUE) -> Dict:
+    """
+    Aplica a planilha de estoque e grava o histórico (ativo=True), sem commit.
+    O histórico ativo anterior deve ser desativado antes pelo chamador.
+    """
+    linhas = preparar_linhas(df)
+    if linhas.empty:
+        return {"total_linhas": 0, "atualizados": 0, "nao_encontrados": []}
+
+    atualizados = _atualizar_produtos(db, linhas, nome_arquivo, lote)
+
+    historico = linhas.assign(nome_arquivo=nome_arquivo, usuario=usuario, ativo=True)
+    historico = historico.astype(object).where(historico.notna(), None)
+    db.execute(insert(HistoricoEstoqueV2), historico.to_dict("records"))
+
+    # Mesma contagem do laço antigo: cada linha soma os produtos do seu código
+    codigos = linhas["codigo_supra"].tolist()
+    nao_encontrados: List[str] = [c for c in codigos if c not in atualizados]
+    return {
+        "total_linhas": len(codigos),
+        "atualizados": sum(atualizados.get(c, 0) for c in codigos),
+        "nao_encontrados": nao_encontrados,
+    }
@@ -1,6 +1,9 @@
 from __future__ import annotations
+from dataclasses import dataclass
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Sequence, Tuple, List
+
+import numpy as np
 
 TWO = Decimal("0.01")
 
@@ -103,3 +106,261 @@ def calcular_linha(
         "total_com_st": total_com_st,
         "total_impostos": money(valor_ipi + icms_st_reter),
     }
+
+
+# ---------------------------------------------------------------------------
+# Cálculo em lote
+# ---------------------------------------------------------------------------
+
+def ipi_aplicavel(tipo: Optional[str], peso) -> bool:
+    """IPI só vale para pet/insumos de até 10 kg (peso ausente conta como 0)."""
+    return _norm(tipo) in ("pet", "insumos") and D(peso) <= D(10)
+
+
+@dataclass(frozen=True)
+class PerfilFiscal:
+    """Alíquotas efetivas de um produto (o IPI já passou pela regra de aplicação)."""
+    ipi: Decimal = Decimal("0")
+    icms: Decimal = Decimal("0")
+    iva_st: Decimal = Decimal("0")
+
+
+def perfil_fiscal(tipo: Optional[str], peso, ipi, icms, iva_st) -> PerfilFiscal:
+    return PerfilFiscal(
+        ipi=D(ipi) if ipi_aplicavel(tipo, peso) else D(0),
+        icms=D(icms),
+        iva_st=D(iva_st),
+    )
+
+
+CHAVES_FISCAIS = (
+    "subtotal", "base_ipi", "ipi", "base_icms", "icms_proprio", "base_st",
+    "icms_st_cheio", "icms_st_reter", "total_sem_st", "total_com_st", "total_impostos",
+)
+
+# Acima disso (em módulo) a linha vai para calcular_linha: o espaçamento entre floats se
+# aproxima de 1 centavo e o Decimal de 28 dígitos poderia arredondar produtos intermediários.
+_LIMITE_LOTE = 10 ** 11
+
+
+def _razao(valor) -> Optional[Tuple[int, int]]:
+    """Fração exata (numerador, denominador) de D(valor); None se não finito ou grande demais."""
+    d = D(valor)
+    if not d.is_finite() or abs(d) >= _LIMITE_LOTE:
+        return None
+    return d.as_integer_ratio()
+
+
+def _razoes(valores: Sequence, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(numeradores, denominadores, válidos) de cada valor; valores repetidos convertem uma vez."""
+    nums = np.empty(n, dtype=object)
+    dens = np.empty(n, dtype=object)
+    validos = np.ones(n, dtype=bool)
+    cache: Dict = {}
+    for i, v in enumerate(valores):
+        try:
+            r = cache[v]
+        except KeyError:
+            r = cache[v] = _razao(v)
+        if r is None:
+            nums[i], dens[i], validos[i] = 0, 1, False
+        else:
+            nums[i], dens[i] = r
+    return nums, dens, validos
+
+
+def _floats(valores: Sequence) -> Optional[np.ndarray]:
+    """Coluna como array float quando todos os valores já são float/int (sem Decimal)."""
+    if isinstance(valores, np.ndarray):
+        return valores.astype(float) if valores.dtype.kind in "fiu" else None
+    if all(type(v) is float or type(v) is int for v in valores):
+        return np.asarray(valores, dtype=float)
+    return None
+
+
+def _centavos_half_up(x: np.ndarray) -> np.ndarray:
+    """
+    Equivalente vetorizado de money(D(x)) em centavos (int64), para floats finitos.
+
+    D(x) usa a menor representação decimal do float. Ela só difere do valor binário no
+    arredondamento quando cai exatamente num ponto de empate t = (2n+1)/200, e isso
+    acontece sse float(t) == x. Como float(t) é o float mais próximo de t, comparar x com
+    float(t) dá o mesmo sinal que comparar com t; na igualdade o empate sobe (HALF_UP).
+    """
+    a = np.abs(x)
+    n = np.rint(a * 100.0)
+    baixo = (2.0 * n - 1.0) / 200.0
+    alto = (2.0 * n + 1.0) / 200.0
+    n = n - (a < baixo) + (a >= alto)
+    return (np.sign(x) * n).astype(np.int64)
+
+
+def _meio_acima(num: np.ndarray, den) -> np.ndarray:
+    """num/den arredondado HALF_UP (empate se afasta do zero) em inteiros exatos; den > 0."""
+    q = (2 * np.abs(num) + den) // (2 * den)
+    return np.where(num < 0, -q, q)
+
+
+class ResultadoFiscal:
+    """Resultado em colunas: centavos (int exato) por chave de calcular_linha."""
+
+    def __init__(self, centavos: Dict[str, np.ndarray]):
+        self.centavos = centavos
+
+    def __len__(self) -> int:
+        return len(self.centavos["subtotal"])
+
+    def __getitem__(self, chave: str) -> np.ndarray:
+        return self.centavos[chave]
+
+    def reais(self, chave: str) -> np.ndarray:
+        """Coluna em float (o mesmo que float() do Decimal de calcular_linha)."""
+        return np.array([c / 100 for c in self.centavos[chave]], dtype=float)
+
+    def linha(self, i: int) -> dict:
+        """Linha i no formato de calcular_linha (Decimal com 2 casas)."""
+        return {chave: Decimal(int(self.centavos[chave][i])).scaleb(-2) for chave in CHAVES_FISCAIS}
+
+
+class FiscalBatch:
+    """
+    calcular_linha para várias linhas de uma vez: entradas em colunas, um PerfilFiscal por
+    linha (normalmente o mesmo objeto para as linhas do mesmo produto) e saída em colunas
+    de centavos, iguais às de calcular_linha centavo a centavo.
+
+    - preço/frete em float, sem quantidade/desconto: subtotal e frete vão a centavos com
+      NumPy (_centavos_half_up) e o resto é aritmética inteira;
+    - demais linhas (Decimal, quantidade, desconto, negativos): frações exatas de D(x);
+    - não finitos ou grandes demais: o próprio calcular_linha.
+    """
+
+    def __init__(
+        self,
+        preco_unit: Sequence,
+        perfis: Sequence[PerfilFiscal],
+        aplica_st: Sequence[bool],
+        frete_linha: Optional[Sequence] = None,
+        quantidade: Optional[Sequence] = None,
+        desconto_linha: Optional[Sequence] = None,
+    ):
+        n = len(preco_unit)
+        self.n = n
+        self.preco_unit = preco_unit
+        self.perfis = perfis
+        self.aplica_st = np.asarray(aplica_st, dtype=bool).reshape(n)
+        self.frete_linha = frete_linha if frete_linha is not None else [0.0] * n
+        self.quantidade = quantidade
+        self.desconto_linha = desconto_linha
+
+    def _aliquotas(self) -> Tuple[np.ndarray, ...]:
+        """Frações das alíquotas por linha, convertidas uma vez por perfil."""
+        n = self.n
+        cols = [np.empty(n, dtype=object) for _ in range(6)]
+        validos = np.ones(n, dtype=bool)
+        cache: Dict[int, Optional[tuple]] = {}
+        for i, perfil in enumerate(self.perfis):
+            chave = id(perfil)
+            if chave not in cache:
+                razoes = [_razao(perfil.ipi), _razao(perfil.icms), _razao(perfil.iva_st)]
+                cache[chave] = None if None in razoes else tuple(x for r in razoes for x in r)
+            r = cache[chave]
+            if r is None:
+                validos[i] = False
+                r = (0, 1, 0, 1, 0, 1)
+            for col, v in zip(cols, r):
+                col[i] = v
+        return (*cols, validos)
+
+    def calcular(self) -> ResultadoFiscal:
+        n = self.n
+        ipi_n, ipi_d, icms_n, icms_d, iva_n, iva_d, validos = self._aliquotas()
+        centavos = {chave: np.zeros(n, dtype=np.int64).astype(object) for chave in CHAVES_FISCAIS}
+        if n == 0:
+            return ResultadoFiscal(centavos)
+
+        rapido = np.zeros(n, dtype=bool)
+        preco_f = frete_f = None
+        if self.quantidade is None and self.desconto_linha is None:
+            preco_f, frete_f = _floats(self.preco_unit), _floats(self.frete_linha)
+            if preco_f is not None and frete_f is not None:
+                rapido = (
+                    validos & np.isfinite(preco_f) & np.isfinite(frete_f)
+                    & (preco_f >= 0) & (frete_f >= 0) & (preco_f < _LIMITE_LOTE) & (frete_f < _LIMITE_LOTE)
+                    & (ipi_n >= 0) & (icms_n >= 0) & (iva_n >= 0)
+                )
+
+        # subtotal, frete (numerador/denominador) e alíquotas das linhas de cada caminho
+        subtotal = np.zeros(n, dtype=np.int64).astype(object)
+        fn = np.zeros(n, dtype=np.int64).astype(object)
+        fd = np.ones(n, dtype=np.int64).astype(object)
+        base_ipi = np.zeros(n, dtype=np.int64).astype(object)
+
+        idx = np.flatnonzero(rapido)
+        if len(idx):
+            subtotal[idx] = _centavos_half_up(preco_f[idx]).astype(object)
+            # subtotal é centavo exato e tudo é >= 0: money(subtotal + frete) = subtotal + money(frete)
+            base_ipi[idx] = subtotal[idx] + _centavos_half_up(frete_f[idx]).astype(object)
+
+        idx = np.flatnonzero(~rapido)
+        if len(idx):
+            m = len(idx)
+            sub = lambda col, padrao: [col[i] for i in idx] if col is not None else [padrao] * m
+            pn, pd_, ok_p = _razoes(sub(self.preco_unit, 0), m)
+            qn, qd, ok_q = _razoes(sub(self.quantidade, 1), m)
+            dn, dd, ok_d = _razoes(sub(self.desconto_linha, 0), m)
+            fn[idx], fd[idx], ok_f = _razoes(sub(self.frete_linha, 0), m)
+            validos[idx] &= ok_p & ok_q & ok_d & ok_f
+            # subtotal = money(preco * qtd - desconto)
+            subtotal[idx] = _meio_acima((pn * qn * dd - dn * pd_ * qd) * 100, pd_ * qd * dd)
+            base_ipi[idx] = _meio_acima(subtotal[idx] * fd[idx] + fn[idx] * 100, fd[idx])
+
+        valor_ipi = _meio_acima(base_ipi * ipi_n, ipi_d)
+        icms_proprio = _meio_acima(base_ipi * icms_n, icms_d)
+
+        # (subtotal + frete + ipi) com o frete exato; nas linhas rápidas só é preciso com ST
+        com_st = self.aplica_st & (iva_n > 0) & validos
+        total_sem_st = subtotal + (base_ipi - subtotal) + valor_ipi
+        exatos = np.flatnonzero(~rapido | com_st)
+        if len(exatos):
+            ja = ~rapido[exatos]
+            for j, i in enumerate(exatos):
+                if not ja[j]:
+                    fn[i], fd[i] = _razao(self.frete_linha[i])
+            num = (subtotal[exatos] + valor_ipi[exatos]) * fd[exatos] + fn[exatos] * 100
+            total_sem_st[exatos] = np.where(ja, _meio_acima(num, fd[exatos]), total_sem_st[exatos])
+            st = np.flatnonzero(com_st[exatos])
+            if len(st):
+                i_st = exatos[st]
+                base_st = _meio_acima(num[st] * (iva_d[i_st] + iva_n[i_st]), fd[i_st] * iva_d[i_st])
+                cheio = _meio_acima(base_st * icms_n[i_st], icms_d[i_st])
+                reter = cheio - icms_proprio[i_st]
+                centavos["base_st"][i_st] = base_st
+                centavos["icms_st_cheio"][i_st] = cheio
+                centavos["icms_st_reter"][i_st] = np.where(reter < 0, 0, reter)
+
+        reter = centavos["icms_st_reter"]
+        centavos.update({
+            "subtotal": subtotal,
+            "base_ipi": base_ipi,
+            "ipi": valor_ipi,
+            "base_icms": base_ipi.copy(),
+            "icms_proprio": icms_proprio,
+            "total_sem_st": total_sem_st,
+            "total_com_st": total_sem_st + reter,
+            "total_impostos": valor_ipi + reter,
+        })
+
+        # Fora das premissas: cálculo escalar original
+        for i in np.flatnonzero(~validos):
+            perfil = self.perfis[i]
+            res = calcular_linha(
+                preco_unit=self.preco_unit[i],
+                quantidade=self.quantidade[i] if self.quantidade is not None else 1,
+                desconto_linha=self.desconto_linha[i] if self.desconto_linha is not None else 0,
+                frete_linha=self.frete_linha[i],
+                ipi=perfil.ipi, icms=perfil.icms, iva_st=perfil.iva_st, aplica_st=bool(self.aplica_st[i]),
+            )
+            for chave in CHAVES_FISCAIS:
+                centavos[chave][i] = int(res[chave].scaleb(2))
+
+        return ResultadoFiscal(centavos)
@@ -0,0 +1,584 @@
+# services/importacao_pedidos.py
+"""
+Conciliação da planilha de pedidos do ERP (abas Banco_Dados e Danfes) com tb_pedidos.
+
+A planilha é lida em streaming (openpyxl read-only) e processada em blocos de
+LOTE_IMPORTACAO linhas: uma consulta resolve todos os pedido_supra do bloco, outra soma
+os pesos dos itens, e as alterações vão num UPDATE ... FROM (VALUES ...) mais um INSERT
+multi-linha no histórico (tb_pedidos_importados). Cada bloco é commitado junto com o
+progresso da tarefa em tb_background_tasks, consultado pela tela de importação.
+"""
+import logging
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from models.background_task import BackgroundTaskModel
+from services.vendas_rollup import atualizar_rollup_pedidos
+
+logger = logging.getLogger("ordersync.importacao")
+
+LOTE_IMPORTACAO = 500
+
+ABA_BANCO_DADOS = "Banco_Dados"
+ABA_DANFES = "Danfes"
+
+
+# ---------------- normalização de valores da planilha ----------------
+def normalize_text(text_val):
+    """Remove acentos, converte para minúsculas e remove espaços das extremidades."""
+    if pd.isna(text_val) or text_val is None:
+        return ""
+    val_str = str(text_val)
+    normalized = unicodedata.normalize('NFKD', val_str).encode('ascii', 'ignore').decode('utf-8')
+    return normalized.lower().strip()
+
+def clean_numeric_code(val):
+    """Garante que códigos numéricos fiquem sem ponto decimal (ex: 237.001 ou 237001.0 -> 237001)."""
+    if pd.isna(val) or val is None:
+        return ""
+    val_str = str(val).strip()
+    if not val_str:
+        return ""
+    # Se terminar com .0 (padrão de leitura de floats no Pandas), remove
+    if val_str.endswith(".0"):
+        val_str = val_str[:-2]
+    # Remove qualquer ponto restante (ex: 237.001)
+    val_str = val_str.replace(".", "")
+    return val_str
+
+def normalizar_pedido_supra(pedido_supra_str: str, data_referencia=None) -> str:
+    """
+    Garante que o pedido_supra seja gravado no banco sempre com 10 dígitos (YYYY + 6 dígitos com zero padding).
+    Ex: '2111' -> '2026002111' (usando o ano da data_referencia ou o ano atual do sistema).
+    Ex: '2026002111' -> '2026002111' (mantém intacto).
+    """
+    if not pedido_supra_str:
+        return ""
+
+    # Remove qualquer caractere não numérico
+    digits = "".join(filter(str.isdigit, str(pedido_supra_str)))
+    if not digits:
+        return ""
+
+    # Se já tem 10 dígitos, retorna direto
+    if len(digits) == 10:
+        return digits
+
+    # Se tiver menos que 10 dígitos (ex: 2111), completa com o ano
+    # Determina o ano a partir da data de referência ou do ano atual do sistema local (2026)
+    ano = "2026"
+    if data_referencia:
+        try:
+            if hasattr(data_referencia, 'year'):
+                ano = str(data_referencia.year)
+            else:
+                match = str(data_referencia).strip()[:4]
+                if match.isdigit() and len(match) == 4:
+                    ano = match
+        except:
+            pass
+
+    # Limpa zeros à esquerda do sufixo para fazer o lpad correto de 6 dígitos
+    sufixo = digits.lstrip('0')
+    if not sufixo:
+        sufixo = "0"
+
+    # Trunca se passar de 6 dígitos
+    if len(sufixo) > 6:
+        sufixo = sufixo[-6:]
+
+    return f"{ano}{sufixo.zfill(6)}"
+
+def clean_currency(val):
+    """
+    Processa valores monetários suportando vírgula como separador decimal.
+    Ex: 'R$ 1.500,50' ou '1500,50' ou 1500.5
+    """
+    if pd.isna(val) or val is None:
+        return 0.0
+    if isinstance(val, (int, float)):
+        return float(val)
+
+    val_str = str(val).replace("R$", "").strip()
+    if not val_str:
+        return 0.0
+
+    # Se houver vírgula, trata-se do padrão brasileiro onde a vírgula separa centavos.
+    if "," in val_str:
+        # 1.500,50 -> 1500,50 -> 1500.50
+        val_str = val_str.replace(".", "").replace(",", ".")
+
+    try:
+        return float(val_str)
+    except ValueError:
+        return 0.0
+
+def find_column(colunas, keywords) -> Optional[int]:
+    """Índice da primeira coluna do cabeçalho cujo nome normalizado contém todas as keywords."""
+    for i, col in enumerate(colunas):
+        norm_col = normalize_text(col)
+        # Todas as palavras-chaves devem estar presentes na string normalizada
+        if all(kw in norm_col for kw in keywords):
+            return i
+    return None
+
+def _to_datetime(val):
+    return pd.to_datetime(val, errors='coerce', dayfirst=True) if pd.notna(val) else None
+
+def _texto(val) -> str:
+    return str(val).strip() if val is not None and pd.notna(val) else ""
+
+
+# ---------------- leitura da planilha ----------------
+def mapear_colunas(cabecalho) -> Dict[str, Optional[int]]:
+    """Identificação dinâmica das colunas da aba Banco_Dados (resiliente a trocas de posição)."""
+    cols = {
+        "pedido": find_column(cabecalho, ["pedido"]),
+        "emissao": find_column(cabecalho, ["emissao"]),
+        "retira": find_column(cabecalho, ["retira"]),
+        "peso": find_column(cabecalho, ["peso"]),
+        "valor": find_column(cabecalho, ["valor", "pedido"]),
+        "danfe": find_column(cabecalho, ["danfe"]),
+        "codigo": find_column(cabecalho, ["codigo"]),
+        "data_pedido": find_column(cabecalho, ["data", "pedido"]),
+        "data_danfe": None,
+    }
+    # Busca flexível e resiliente de data de faturamento/danfe
+    for i, col in enumerate(cabecalho):
+        norm_col = normalize_text(col)
+        if "data" in norm_col or "dt" in norm_col or "date" in norm_col:
+            if "danfe" in norm_col or "fatur" in norm_col:
+                cols["data_danfe"] = i
+                break
+    if cols["data_danfe"] is None:
+        for kws in (["data", "faturamento"], ["data", "danfe"], ["dt", "faturamento"],
+                    ["dt", "danfe"], ["faturamento"], ["danfe"]):
+            idx = find_column(cabecalho, kws)
+            if idx is not None:
+                cols["data_danfe"] = idx
+                break
+    return cols
+
+
+def validar_planilha(caminho: str) -> Dict:
+    """
+    Lê só os cabeçalhos das duas abas e valida o layout. Levanta ValueError com a mensagem
+    para o usuário; retorna {"colunas", "total_linhas"} (total estimado pela dimensão da aba).
+    """
+    try:
+        wb = load_workbook(caminho, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"Erro ao abrir a planilha: {e}")
+    try:
+        if ABA_BANCO_DADOS not in wb.sheetnames:
+            raise ValueError(f"Erro ao ler a aba {ABA_BANCO_DADOS}: aba não encontrada")
+        if ABA_DANFES not in wb.sheetnames:
+            raise ValueError(f"Erro ao ler a aba {ABA_DANFES}: aba não encontrada")
+
+        ws_bd = wb[ABA_BANCO_DADOS]
+        linhas = ws_bd.iter_rows(min_row=2, max_row=2, values_only=True)
+        cabecalho = next(linhas, ()) or ()
+        colunas = mapear_colunas(cabecalho)
+        if colunas["pedido"] is None:
+            raise ValueError("Coluna de identificação do Pedido não encontrada na aba Banco_Dados.")
+
+        ws_danfes = wb[ABA_DANFES]
+        cab_danfes = next(ws_danfes.iter_rows(min_row=1, max_row=1, values_only=True), ()) or ()
+        if max(len(cab_danfes), ws_danfes.max_column or 0) < 11:
+            raise ValueError("Aba Danfes estruturalmente incorreta (não possui colunas I e K).")
+
+        total_linhas = max((ws_bd.max_row or 0) - 2, 0) or None
+        return {"colunas": colunas, "total_linhas": total_linhas}
+    finally:
+        wb.close()
+
+
+def carregar_status_danfes(wb) -> Dict[str, str]:
+    """pedido_supra (coluna I) -> status (coluna K) da aba Danfes; vale a primeira ocorrência."""
+    status = {}
+    for valores in wb[ABA_DANFES].iter_rows(min_row=2, values_only=True):
+        if len(valores) < 11:
+            continue
+        pedido_supra = normalizar_pedido_supra(clean_numeric_code(valores[8]))
+        if pedido_supra and pedido_supra not in status:
+            status[pedido_supra] = _texto(valores[10])
+    return status
+
+
+def ler_linhas(wb, colunas: Dict[str, Optional[int]]) -> Iterator[Dict]:
+    """Linhas da aba Banco_Dados (a partir da 3ª: 1ª é título, 2ª é cabeçalho) já normalizadas."""
+    for valores in wb[ABA_BANCO_DADOS].iter_rows(min_row=3, values_only=True):
+        def v(nome):
+            i = colunas.get(nome)
+            return valores[i] if i is not None and i < len(valores) else None
+
+        pedido_supra_raw = clean_numeric_code(v("pedido"))
+        if not pedido_supra_raw or str(pedido_supra_raw).lower() == 'nan':
+            continue
+
+        danfe = _texto(v("danfe"))
+        if danfe.endswith(".0"): danfe = danfe[:-2]
+        if danfe.lower() == 'nan': danfe = ""
+
+        emissao_dt = _to_datetime(v("emissao"))
+        data_pedido_dt = _to_datetime(v("data_pedido"))
+        data_danfe_dt = _to_datetime(v("data_danfe"))
+        dt_ref = emissao_dt or data_pedido_dt or data_danfe_dt or datetime.now()
+
+        yield {
+            "pedido_supra": normalizar_pedido_supra(pedido_supra_raw, dt_ref),
+            "codigo_cliente": clean_numeric_code(v("codigo")) if colunas.get("codigo") is not None else "",
+            "peso": clean_currency(v("peso")) if colunas.get("peso") is not None else 0.0,
+            "valor_pedido": clean_currency(v("valor")) if colunas.get("valor") is not None else 0.0,
+            "danfe": danfe,
+            "emissao_dt": emissao_dt,
+            "data_pedido_dt": data_pedido_dt,
+            "data_danfe_dt": data_danfe_dt,
+            "cliente_retira": _texto(v("retira")),
+        }
+
+
+def _blocos(linhas: Iterator[Dict], tamanho: int) -> Iterator[List[Dict]]:
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+# ---------------- consultas por bloco ----------------
+def _buscar_pedidos(db: Session, chaves: List[str]) -> Dict[str, Dict]:
+    """
+    pedido_supra normalizado (10 dígitos) -> pedido. Cobre pedidos gravados com o código
+    curto do ERP (ex.: '2111'), completados com o ano de criação, como na conciliação antiga.
+    """
+    rows = db.execute(text("""
+        SELECT * FROM (
+            SELECT
+                CASE
+                    WHEN length(pedido_supra) = 10 THEN pedido_supra
+                    ELSE to_char(COALESCE(created_at, confirmado_em, now()), 'YYYY') || lpad(ltrim(pedido_supra, '0'), 6, '0')
+                END AS chave,
+                id_pedido, nota_fiscal, total_pedido, peso_total_kg, codigo_cliente, status,
+                data_faturamento, pedido_supra
+            FROM public.tb_pedidos
+            WHERE pedido_supra IS NOT NULL AND pedido_supra != ''
+        ) p
+        WHERE p.chave IN :chaves
+        ORDER BY p.id_pedido
+    """).bindparams(bindparam("chaves", expanding=True)), {"chaves": chaves}).mappings().all()
+    pedidos = {}
+    for r in rows:
+        pedidos.setdefault(r["chave"], dict(r))
+    return pedidos
+
+
+def _pesos_itens(db: Session, ids: List[int]) -> Dict[int, Dict]:
+    """id_pedido -> {peso_bruto, peso_liquido} somados dos itens (peso do cadastro de produtos)."""
+    rows = db.execute(text("""
+        SELECT c.id_pedido,
+               SUM(c.quantidade * COALESCE(NULLIF(c.peso_kg, 0), prod.peso, 0)) AS peso_bruto,
+               SUM(c.quantidade * COALESCE(prod.peso, 0)) AS peso_liquido
+        FROM public.tb_pedidos_itens c
+        LEFT JOIN (
+          SELECT codigo_supra, MAX(peso) as peso
+          FROM public.t_cadastro_produto_v2
+          GROUP BY codigo_supra
+        ) prod ON prod.codigo_supra = c.codigo
+        WHERE c.id_pedido IN :ids AND c.quantidade > 0
+        GROUP BY c.id_pedido
+    """).bindparams(bindparam("ids", expanding=True)), {"ids": ids}).mappings().all()
+    return {r["id_pedido"]: dict(r) for r in rows}
+
+
+def _gravar_pesos(db: Session, pesos: Dict[int, float]) -> None:
+    if not pesos:
+        return
+    params, valores = {}, []
+    for i, (id_pedido, peso) in enumerate(pesos.items()):
+        params[f"id_{i}"] = id_pedido
+        params[f"peso_{i}"] = peso
+        valores.append(f"(CAST(:id_{i} AS INTEGER), CAST(:peso_{i} AS NUMERIC))")
+    db.execute(text(f"""
+        UPDATE public.tb_pedidos AS p SET peso_total_kg = v.peso
+        FROM (VALUES {", ".join(valores)}) AS v (id_pedido, peso)
+        WHERE p.id_pedido = v.id_pedido
+    """), params)
+
+
+def _gravar_atualizacoes(db: Session, atualizacoes: Dict[int, Dict]) -> None:
+    """UPDATE ... FROM VALUES; danfe/data/status nulos mantêm o valor atual."""
+    if not atualizacoes:
+        return
+    params, valores = {}, []
+    for i, a in enumerate(atualizacoes.values()):
+        params.update({
+            f"id_{i}": a["id_pedido"], f"ajuste_{i}": a["ajuste"], f"total_{i}": a["total"],
+            f"ped_{i}": a["ped_completo"], f"danfe_{i}": a["danfe"], f"data_fat_{i}": a["data_fat"],
+            f"novo_status_{i}": a["novo_status"],
+        })
+        valores.append(
+            f"(CAST(:id_{i} AS INTEGER), CAST(:ajuste_{i} AS NUMERIC), CAST(:total_{i} AS NUMERIC), "
+            f"CAST(:ped_{i} AS TEXT), CAST(:danfe_{i} AS TEXT), CAST(:data_fat_{i} AS TIMESTAMP), "
+            f"CAST(:novo_status_{i} AS TEXT))"
+        )
+    db.execute(text(f"""
+        UPDATE public.tb_pedidos AS p SET
+            valor_ajuste = v.ajuste,
+            total_pedido = v.total,
+            pedido_supra = v.ped_completo,
+            nota_fiscal = COALESCE(v.danfe, p.nota_fiscal),
+            data_faturamento = COALESCE(v.data_fat, p.data_faturamento),
+            status = COALESCE(v.novo_status, p.status),
+            atualizado_em = now()
+        FROM (VALUES {", ".join(valores)})
+            AS v (id_pedido, ajuste, total, ped_completo, danfe, data_fat, novo_status)
+        WHERE p.id_pedido = v.id_pedido
+    """), params)
+
+
+COLUNAS_HISTORICO = ("ped", "em", "ret", "peso", "val", "danfe", "cod", "dt", "st_ex", "st_proc", "ajuste", "detalhes")
+
+
+def _gravar_historico(db: Session, registros: List[Dict]) -> None:
+    """Log Histórico Permanente: um INSERT multi-linha por bloco."""
+    if not registros:
+        return
+    params, valores = {}, []
+    for i, reg in enumerate(registros):
+        marcadores = []
+        for c in COLUNAS_HISTORICO:
+            params[f"{c}_{i}"] = reg[c]
+            marcadores.append(f":{c}_{i}")
+        valores.append(f"({', '.join(marcadores)})")
+    db.execute(text(f"""
+        INSERT INTO public.tb_pedidos_importados (
+            pedido_supra, emissao, cliente_retira, peso, valor_pedido, danfe,
+            codigo_cliente, data_pedido, status_pedido_excel, status_processamento,
+            ajuste_gerado, detalhes_processamento
+        ) VALUES {", ".join(valores)}
+    """), params)
+
+
+def _is_same_date(dt1, dt2):
+    """Compara datas de faturamento de forma resiliente."""
+    t1 = pd.to_datetime(dt1) if pd.notna(dt1) else None
+    t2 = pd.to_datetime(dt2) if pd.notna(dt2) else None
+    if t1 is None and t2 is None:
+        return True
+    if t1 is None or t2 is None:
+        return False
+    return t1.date() == t2.date()
+
+
+# ---------------- conciliação ----------------
+def conciliar_bloco(db: Session, bloco: List[Dict], status_danfes: Dict[str, str], resumo: Dict) -> tuple:
+    """
+    Concilia um bloco de linhas e grava as alterações (sem commit).
+    Retorna (itens_resposta, ids_alterados).
+    """
+    pedidos = _buscar_pedidos(db, sorted({l["pedido_supra"] for l in bloco}))
+    ids = sorted({p["id_pedido"] for p in pedidos.values()})
+    pesos = _pesos_itens(db, ids) if ids else {}
+
+    # Auto-cura: se o peso no cabeçalho do banco for 0, mas os itens/cadastro de produtos tiverem peso, recalculamos
+    pesos_curados = {}
+    for p in pedidos.values():
+        peso_db = float(p["peso_total_kg"]) if p["peso_total_kg"] is not None else 0.0
+        peso_calculado = (pesos.get(p["id_pedido"]) or {}).get("peso_bruto")
+        if peso_db <= 0.001 and peso_calculado and peso_calculado > 0:
+            pesos_curados[p["id_pedido"]] = float(peso_calculado)
+            p["peso_total_kg"] = float(peso_calculado)
+    _gravar_pesos(db, pesos_curados)
+
+    itens_resposta, historico = [], []
+    atualizacoes: Dict[int, Dict] = {}  # id_pedido -> última alteração do bloco
+
+    for linha in bloco:
+        resumo["lidos"] += 1
+        pedido_supra = linha["pedido_supra"]
+        codigo_cliente = linha["codigo_cliente"]
+        peso = linha["peso"]
+        valor_pedido = linha["valor_pedido"]
+        danfe = linha["danfe"]
+        emissao_dt = linha["emissao_dt"]
+        data_pedido_dt = linha["data_pedido_dt"]
+        data_danfe_dt = linha["data_danfe_dt"]
+        status_excel = status_danfes.get(pedido_supra, "")
+
+        detalhes = []
+        status_proc = "SUCESSO"
+        ajuste_gerado = 0.0
+        status_novo_pedido = None
+
+        pedido = pedidos.get(pedido_supra)
+        id_pedido = None
+        nf_db = ""
+        peso_liquido_db = 0.0
+        if not pedido:
+            status_proc = "ERRO_NAO_ENCONTRADO"
+            detalhes.append("Pedido não encontrado no OrderSync.")
+            resumo["erros"] += 1
+            total_db = 0.0
+        else:
+            id_pedido = pedido["id_pedido"]
+            nf_db = pedido["nota_fiscal"]
+            cod_cli_db = pedido["codigo_cliente"]
+            status_db = pedido["status"]
+            total_db = float(pedido["total_pedido"]) if pedido["total_pedido"] is not None else 0.0
+            peso_liquido_calculado = (pesos.get(id_pedido) or {}).get("peso_liquido")
+            peso_liquido_db = float(peso_liquido_calculado) if peso_liquido_calculado is not None else 0.0
+
+            # Regras de Status Dinâmicas (Calculadas primeiro para verificar se houve alteração)
+            if normalize_text(status_excel) == "pedido nao completo":
+                status_novo_pedido = 'PEDIDO_NAO_COMPLETO'
+            elif danfe:
+                status_novo_pedido = 'FATURADO_SUPRA'
+
+            # Verificar se o pedido já está 100% atualizado com os mesmos dados (SEM_ALTERACAO)
+            is_nf_same = (nf_db or "") == danfe
+            is_val_same = abs(valor_pedido - total_db) <= 0.01
+            is_peso_same = abs(peso - peso_liquido_db) <= 0.01
+            is_cli_same = clean_numeric_code(cod_cli_db) == codigo_cliente
+            is_status_same = (status_novo_pedido is None) or (status_db == status_novo_pedido)
+            is_date_same = _is_same_date(data_danfe_dt, pedido["data_faturamento"])
+            is_supra_same = (pedido["pedido_supra"] or "") == pedido_supra
+
+            if is_nf_same and is_val_same and is_peso_same and is_cli_same and is_status_same and is_date_same and is_supra_same:
+                status_proc = "SEM_ALTERACAO"
+                detalhes.append("Pedido já importado anteriormente (Sem alterações).")
+                resumo["sem_alteracao"] += 1
+            else:
+                # Validações Físicas e Comerciais se houver alguma divergência ou alteração
+                if cod_cli_db and clean_numeric_code(cod_cli_db) != codigo_cliente:
+                    detalhes.append(f"Divergência de Cliente (Planilha: {codigo_cliente}, Banco: {cod_cli_db}).")
+
+                if abs(peso - peso_liquido_db) > 0.01:
+                    detalhes.append(f"Divergência de Peso Líquido (Planilha: {peso:.2f}kg, Banco (Líquido): {peso_liquido_db:.2f}kg).")
+
+                diff_valor = valor_pedido - total_db
+                if abs(diff_valor) > 0.01:
+                    ajuste_gerado = diff_valor
+                    status_proc = "AJUSTADO"
+                    detalhes.append(f"Ajuste financeiro aplicado. (Planilha: {valor_pedido:.2f}, Banco: {total_db:.2f}).")
+                    resumo["ajustados"] += 1
+                    resumo["valor_total_ajustes"] += abs(ajuste_gerado)
+                else:
+                    resumo["sucesso"] += 1
+
+                # Aplicando os ajustes e curando/salvando o pedido_supra no formato completo de 10 dígitos
+                data_fat = data_danfe_dt if pd.notna(data_danfe_dt) else None
+                atualizacoes[id_pedido] = {
+                    "id_pedido": id_pedido, "ajuste": ajuste_gerado, "total": valor_pedido,
+                    "ped_completo": pedido_supra, "danfe": danfe or None, "data_fat": data_fat,
+                    "novo_status": status_novo_pedido,
+                }
+                # Linhas seguintes do mesmo pedido enxergam o pedido já atualizado
+                pedido["total_pedido"] = valor_pedido
+                pedido["pedido_supra"] = pedido_supra
+                if danfe:
+                    pedido["nota_fiscal"] = danfe
+                if data_fat is not None:
+                    pedido["data_faturamento"] = data_fat
+                if status_novo_pedido:
+                    pedido["status"] = status_novo_pedido
+
+        historico.append({
+            "ped": pedido_supra,
+            "em": emissao_dt if pd.notna(emissao_dt) else None,
+            "ret": linha["cliente_retira"],
+            "peso": peso,
+            "val": valor_pedido,
+            "danfe": danfe,
+            "cod": codigo_cliente,
+            "dt": data_pedido_dt if pd.notna(data_pedido_dt) else None,
+            "st_ex": status_excel,
+            "st_proc": status_proc,
+            "ajuste": ajuste_gerado,
+            "detalhes": " | ".join(detalhes) if detalhes else "Validado com sucesso.",
+        })
+
+        itens_resposta.append({
+            "id_pedido": id_pedido,
+            "danfe": danfe if danfe else (nf_db if nf_db else ""),
+            "pedido_supra": pedido_supra,
+            "cliente_codigo": codigo_cliente,
+            "data_pedido": data_pedido_dt.strftime('%d/%m/%Y') if pd.notna(data_pedido_dt) else (emissao_dt.strftime('%d/%m/%Y') if pd.notna(emissao_dt) else "-"),
+            "data_faturamento": data_danfe_dt.strftime('%d/%m/%Y') if pd.notna(data_danfe_dt) else "-",
+            "valor_planilha": valor_pedido,
+            "valor_sistema": total_db,
+            "peso_planilha": peso,
+            "peso_sistema": peso_liquido_db,
+            "ajuste_gerado": ajuste_gerado,
+            "status": status_proc,
+            "novo_status_pedido": status_novo_pedido or "N/A",
+            "detalhes": detalhes,
+        })
+
+    _gravar_atualizacoes(db, atualizacoes)
+    _gravar_historico(db, historico)
+    return itens_resposta, set(atualizacoes)
+
+
+def processar_importacao_pedidos(db: Session, task: BackgroundTaskModel, caminho: str,
+                                 lote: int = LOTE_IMPORTACAO) -> None:
+    """Executa a conciliação inteira, atualizando progresso/resultado em `task`."""
+    try:
+        layout = validar_planilha(caminho)
+        total_linhas = layout["total_linhas"]
+        task.status = "PROCESSANDO"
+        task.total_passos = total_linhas or 0
+        task.mensagem_status = "Lendo aba Danfes..."
+        db.commit()
+
+        resumo = {
+            "lidos": 0,
+            "sucesso": 0,
+            "ajustados": 0,
+            "erros": 0,
+            "sem_alteracao": 0,
+            "valor_total_ajustes": 0.0
+        }
+        itens_resposta = []
+
+        wb = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            status_danfes = carregar_status_danfes(wb)
+            for bloco in _blocos(ler_linhas(wb, layout["colunas"]), lote):
+                itens, alterados = conciliar_bloco(db, bloco, status_danfes, resumo)
+                itens_resposta.extend(itens)
+                atualizar_rollup_pedidos(db, alterados)
+
+                if total_linhas:
+                    task.progresso = min(99, int(resumo["lidos"] * 100 / total_linhas))
+                task.mensagem_status = f"{resumo['lidos']} pedidos conciliados..."
+                db.commit()
+        finally:
+            wb.close()
+
+        # Verificar se todas as linhas lidas não tiveram alterações (Duplicidade do Arquivo)
+        if resumo["sem_alteracao"] == resumo["lidos"] and resumo["lidos"] > 0:
+            resumo["aviso"] = "Atenção: Todos os pedidos deste arquivo já foram processados anteriormente e não houve novas alterações."
+
+        task.resultado = {"resumo": resumo, "itens": itens_resposta}
+        task.status = "CONCLUIDO"
+        task.progresso = 100
+        task.mensagem_status = f"Importação concluída: {resumo['lidos']} pedidos."
+        task.concluido_em = datetime.now()
+        db.commit()
+    except Exception as e:
+        logger.exception("Erro processando planilha de pedidos")
+        db.rollback()
+        task.status = "ERRO"
+        task.erro = str(e)
+        task.mensagem_status = f"Falha: {str(e)[:100]}"
+        db.commit()
@@ -2,6 +2,7 @@ import secrets
 from datetime import datetime, time
 from sqlalchemy import text
 from models.pedido_link import PedidoLink
+from services.referencias_cache import validade_global
 from zoneinfo import ZoneInfo
 
 TZ = ZoneInfo("America/Sao_Paulo")
@@ -10,11 +11,7 @@ def _fim_do_dia(d):  # date → datetime no fim do dia
     return datetime.combine(d, time(23, 59, 59, 999999, tzinfo=TZ))
 
 def calcular_expires_at_global(db):
-    v = db.execute(text("""
-        SELECT MAX(CAST(p.validade_tabela AS DATE)) AS max_validade
-        FROM t_cadastro_produto_v2 p
-        WHERE p.status_produto = 'ATIVO'
-    """)).scalar()
+    v = validade_global(db)
     return _fim_do_dia(v) if v else None
 
 def _parse_iso_date(s):
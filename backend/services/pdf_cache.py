@@ -0,0 +1,221 @@
+# services/pdf_cache.py
+"""
+Cache em disco dos PDFs de pedido, endereçado pelo conteúdo.
+
+A chave é o SHA-256 do layout + payload `PedidoPdf` serializado: qualquer mudança no
+pedido (itens, totais, cliente, validade...) gera outra chave, então não há invalidação
+manual. O mesmo hash serve de ETag nas rotas de visualização/download.
+
+Os arquivos ficam em PDF_CACHE_DIR (padrão: <tmp>/ordersync_pdf_cache) e o diretório é
+limitado a PDF_CACHE_MAX_MB; ao passar do limite, os arquivos menos usados recentemente
+(mtime, atualizado a cada leitura) são removidos.
+
+Renderização assíncrona: `enfileirar_render_pdf` grava uma tarefa RENDER_PDF_PEDIDO em
+tb_background_tasks (o task_id é o ticket devolvido ao front); o worker renderiza para este
+cache e guarda a chave em `resultado`, e `pdf_do_render` entrega os bytes.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from models.background_task import BackgroundTaskModel
+from models.pedido_pdf import PedidoPdf
+
+logger = logging.getLogger("ordersync.pdf_cache")
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ordersync_pdf_cache"))
+PDF_CACHE_MAX_MB = float(os.getenv("PDF_CACHE_MAX_MB", "200"))
+
+# Mudou o desenho do PDF (pdf_service / pdf_cliente_layout)? Incremente para descartar o cache.
+VERSAO_LAYOUT = "1"
+
+LAYOUT_VENDEDOR = "vendedor"
+LAYOUT_CLIENTE = "cliente"
+
+TAREFA_RENDER_PDF = "RENDER_PDF_PEDIDO"
+
+
+def chave_pdf(pedido: PedidoPdf, sem_validade: bool) -> str:
+    layout = LAYOUT_CLIENTE if sem_validade else LAYOUT_VENDEDOR
+    payload = pedido.model_dump_json().encode("utf-8")
+    h = hashlib.sha256()
+    h.update(f"{VERSAO_LAYOUT}|{layout}|".encode("utf-8"))
+    h.update(payload)
+    return f"{pedido.id_pedido}-{layout}-{h.hexdigest()[:32]}"
+
+
+class PdfDiskCache:
+    def __init__(self, diretorio: str = PDF_CACHE_DIR, max_bytes: int = int(PDF_CACHE_MAX_MB * 1024 * 1024)):
+        self.diretorio = Path(diretorio)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None  # bytes em disco (calculado no primeiro set)
+
+    def _caminho(self, chave: str) -> Path:
+        return self.diretorio / f"{chave}.pdf"
+
+    def get(self, chave: str) -> Optional[bytes]:
+        caminho = self._caminho(chave)
+        try:
+            dados = caminho.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Falha lendo PDF em cache {caminho.name}: {e}")
+            return None
+        try:
+            os.utime(caminho)  # marca como usado recentemente (LRU)
+        except OSError:
+            pass
+        return dados
+
+    def set(self, chave: str, dados: bytes) -> None:
+        try:
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            caminho = self._caminho(chave)
+            # escrita atômica: outro processo nunca lê PDF pela metade
+            fd, tmp = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(dados)
+            os.replace(tmp, caminho)
+        except OSError as e:
+            logger.warning(f"Falha gravando PDF em cache: {e}")
+            return
+        with self._lock:
+            if self._total is None:
+                self._total = self._tamanho_total()
+            else:
+                self._total += len(dados)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _arquivos(self):
+        try:
+            return [p for p in self.diretorio.iterdir() if p.suffix == ".pdf"]
+        except OSError:
+            return []
+
+    def _tamanho_total(self) -> int:
+        total = 0
+        for p in self._arquivos():
+            try:
+                total += p.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _evict(self) -> None:
+        """Remove os menos usados até ficar em 90% do limite (folga para não varrer a cada set)."""
+        entradas = []
+        for p in self._arquivos():
+            try:
+                st = p.stat()
+                entradas.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                pass
+        entradas.sort()
+        total = sum(e[1] for e in entradas)
+        alvo = int(self.max_bytes * 0.9)
+        removidos = 0
+        for _, tamanho, p in entradas:
+            if total <= alvo:
+                break
+            try:
+                p.unlink()
+                total -= tamanho
+                removidos += 1
+            except OSError:
+                pass
+        self._total = total
+        if removidos:
+            logger.info(f"Cache de PDF: {removidos} arquivo(s) removidos (LRU), {total // 1024} KB em disco.")
+
+    def clear(self) -> None:
+        with self._lock:
+            for p in self._arquivos():
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+            self._total = 0
+
+
+cache = PdfDiskCache()
+
+
+def obter_pdf_pedido(pedido: PedidoPdf, sem_validade: bool = False) -> Tuple[bytes, str]:
+    """
+    PDF do pedido (bytes, etag): lê do cache ou renderiza com gerar_pdf_pedido e grava.
+    """
+    from services.pdf_service import gerar_pdf_pedido
+
+    chave = chave_pdf(pedido, sem_validade)
+    dados = cache.get(chave)
+    if dados is None:
+        dados = gerar_pdf_pedido(pedido, sem_validade=sem_validade)
+        cache.set(chave, dados)
+    return dados, chave
+
+
+def enfileirar_render_pdf(db: Session, id_pedido: int) -> str:
+    """
+    Agenda a renderização do PDF do pedido (layout vendedor) e devolve o ticket.
+    A tarefa entra na transação do chamador: só é vista pelo worker após o commit.
+    """
+    ticket = uuid.uuid4().hex
+    db.add(BackgroundTaskModel(
+        task_id=ticket,
+        tipo_tarefa=TAREFA_RENDER_PDF,
+        referencia_id=id_pedido,
+        status="PENDENTE",
+        tentativas=0,
+    ))
+    return ticket
+
+
+def situacao_render(db: Session, id_pedido: int, ticket: str) -> Optional[BackgroundTaskModel]:
+    return db.query(BackgroundTaskModel).filter(
+        BackgroundTaskModel.task_id == ticket,
+        BackgroundTaskModel.tipo_tarefa == TAREFA_RENDER_PDF,
+        BackgroundTaskModel.referencia_id == id_pedido,
+    ).first()
+
+
+def pdf_do_render(db: Session, id_pedido: int, chave: Optional[str]) -> Tuple[bytes, str]:
+    """
+    Bytes do PDF renderizado pelo worker. Se o arquivo não estiver no cache desta instância
+    (outro servidor renderizou, ou foi removido pelo LRU), renderiza o pedido atual aqui.
+    """
+    dados = cache.get(chave) if chave else None
+    if dados is not None:
+        return dados, chave
+    from services.pedido_pdf_data import carregar_pedido_pdf
+
+    return obter_pdf_pedido(carregar_pedido_pdf(db, id_pedido), sem_validade=False)
+
+
+def resposta_pdf(request: Optional[Request], dados: bytes, etag: str, content_disposition: str) -> Response:
+    """
+    Response do PDF com ETag; 304 quando o navegador já tem esta versão (If-None-Match).
+    `no-cache` obriga a revalidação, então um pedido editado nunca aparece desatualizado.
+    """
+    etag_header = f'"{etag}"'
+    headers = {
+        "ETag": etag_header,
+        "Cache-Control": "private, no-cache",
+    }
+    if request is not None:
+        if_none_match = request.headers.get("if-none-match") or ""
+        enviados = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if etag_header in enviados or "*" in enviados:
+            return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = content_disposition
+    return Response(content=dados, media_type="application/pdf", headers=headers)
@@ -10,6 +10,8 @@ import logging
 from services.pdf_service import gerar_pdf_pedido
 from services.email_service import enviar_email_notificacao
 from services.pedido_pdf_data import carregar_pedido_pdf
+from services.vendas_rollup import atualizar_rollup_pedidos
+from services.pedido_itens import frete_link, inserir_itens, preparar_itens
 from schemas.pedido_confirmacao import ConfirmarPedidoRequest
 from fastapi import BackgroundTasks
 from core.exceptions import BusinessRuleException, ValidationException
@@ -86,19 +88,12 @@ def criar_pedido_confirmado(db: Session, tabela_id: int, body: ConfirmarPedidoRe
         pedido_created_at = None
         link_url = None
 
-    # 3) Somar totais no servidor
-    peso_total_kg = 0.0
-    total_sem_frete = 0.0
-    total_com_frete = 0.0
-    for it in body.produtos:
-        qtd = float(it.quantidade or 0)
-        peso_total_kg += float(it.peso_kg or 0) * qtd
-        total_sem_frete += float(it.preco_unit or 0) * qtd
-        total_com_frete += float(
-            (it.preco_unit_com_frete if it.preco_unit_com_frete is not None else it.preco_unit) or 0
-        ) * qtd
-
-    frete_total = max(0.0, total_com_frete - total_sem_frete)
+    # 3) Validar itens e somar totais no servidor (uma passada)
+    linhas_itens, totais = preparar_itens(body.produtos, frete_link)
+    peso_total_kg = totais["peso_total_kg"]
+    total_sem_frete = totais["total_sem_frete"]
+    total_com_frete = totais["total_com_frete"]
+    frete_total = totais["frete_total"]
     total_pedido = total_com_frete if body.usar_valor_com_frete else total_sem_frete
 
     # 4) Datas e campos
@@ -196,56 +191,10 @@ def criar_pedido_confirmado(db: Session, tabela_id: int, body: ConfirmarPedidoRe
 
     new_id = db.execute(insert_sql, params).scalar()
 
-    # 6) Insert itens
-    insert_item_sql = text("""
-        INSERT INTO tb_pedidos_itens (
-            id_pedido, codigo, nome, embalagem, peso_kg,
-            condicao_pagamento, tabela_comissao,
-            preco_unit, preco_unit_frt, valor_frete_unitario, quantidade,
-            subtotal_sem_f, subtotal_com_f, manual_freight,
-            markup, valor_final_markup, valor_s_frete_markup
-        ) VALUES (
-            :id_pedido, :codigo, :nome, :embalagem, :peso_kg,
-            :condicao_pagamento, :tabela_comissao,
-            :preco_unit, :preco_unit_frt, :valor_frete_unitario, :quantidade,
-            :subtotal_sem_f, :subtotal_com_f, :manual_freight,
-            :markup, :valor_final_markup, :valor_s_frete_markup
-        )
-    """)
-
-    for it in body.produtos:
-        qtd   = float(it.quantidade or 0)
-        p_sem = float(it.preco_unit or 0)
-        p_com = float((it.preco_unit_com_frete 
-                        if it.preco_unit_com_frete is not None 
-                        else it.preco_unit) or 0)
-        
-        # Prioriza o valor_frete_unitario vindo do payload (vindo da tabela de preço)
-        if it.valor_frete_unitario is not None:
-            v_frete = float(it.valor_frete_unitario)
-        else:
-            v_frete = round(p_com - p_sem, 2)
-
-        db.execute(insert_item_sql, {
-            "id_pedido": new_id,
-            "codigo": (it.codigo or "")[:80],
-            "nome": (it.descricao or "")[:255] or None,
-            "embalagem": getattr(it, "embalagem", None),
-            "peso_kg": float(it.peso_kg or 0),
-            "condicao_pagamento": it.condicao_pagamento,
-            "tabela_comissao": it.tabela_comissao,
-            "preco_unit": round(p_sem, 2),
-            "preco_unit_frt": round(p_com, 2),
-            "valor_frete_unitario": v_frete,
-            "quantidade": qtd,
-            "subtotal_sem_f": round(p_sem * qtd, 2),
-            "subtotal_com_f": round(p_com * qtd, 2),
-            "manual_freight": bool(it.manual_freight or False),
-            "markup": float(it.markup or 0.0),
-            "valor_final_markup": float(it.valor_final_markup or 0.0),
-            "valor_s_frete_markup": float(it.valor_s_frete_markup or 0.0)
-        })
+    # 6) Insert itens (um único INSERT multi-linha)
+    inserir_itens(db, new_id, linhas_itens)
 
+    atualizar_rollup_pedidos(db, [new_id])
     db.commit()
 
     # 7) Monta um "pedido" mínimo só para o serviço de e-mail
@@ -0,0 +1,173 @@
+# services/pedido_itens.py
+"""
+Gravação dos itens de pedido (tb_pedidos_itens), compartilhada pela edição de orçamento,
+criação pelo admin e confirmação via link.
+
+`preparar_itens` valida os itens e calcula linhas e totais numa única passada;
+`inserir_itens` grava todas as linhas num executemany (insertmanyvalues: um INSERT
+multi-linha por lote) e `sincronizar_itens` aplica só a diferença na edição.
+"""
+import math
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import case, column, delete, insert, select, table, update
+from sqlalchemy.orm import Session
+
+from core.exceptions import ValidationException
+
+COLUNAS_ITEM = (
+    "codigo", "nome", "embalagem", "peso_kg",
+    "condicao_pagamento", "tabela_comissao",
+    "preco_unit", "preco_unit_frt", "valor_frete_unitario", "frete_base_ton", "quantidade",
+    "subtotal_sem_f", "subtotal_com_f", "manual_freight",
+    "markup", "valor_final_markup", "valor_s_frete_markup",
+)
+
+_ITENS = table(
+    "tb_pedidos_itens", column("id_item"), column("id_pedido"),
+    *(column(c) for c in COLUNAS_ITEM), schema="public",
+)
+
+# Linhas por comando do INSERT multi-linha
+LOTE_ITENS = 500
+
+
+# --- Regras de frete unitário de cada origem: (valor_frete_unitario, preco_unit_frt) ---
+
+def frete_edicao(it, p_sem: float, p_com: float) -> Tuple[float, float]:
+    """Edição de orçamento: frete manual vem de frete_base_ton (R$/ton) x peso do item."""
+    if bool(getattr(it, "manual_freight", False)):
+        v_frete = round((float(it.frete_base_ton or 0) / 1000.0) * float(it.peso_kg or 0), 2)
+    else:
+        v_frete = round(p_com - p_sem, 2)
+    return v_frete, round(p_sem + v_frete, 2)
+
+
+def frete_admin(it, p_sem: float, p_com: float) -> Tuple[float, float]:
+    """Criação pelo admin: frete informado (zero conta como ausente) ou a diferença de preços."""
+    return float(it.valor_frete_unitario or round(p_com - p_sem, 2)), round(p_com, 2)
+
+
+def frete_link(it, p_sem: float, p_com: float) -> Tuple[float, float]:
+    """Confirmação via link: prioriza o frete unitário vindo da tabela de preço."""
+    if it.valor_frete_unitario is not None:
+        return float(it.valor_frete_unitario), round(p_com, 2)
+    return round(p_com - p_sem, 2), round(p_com, 2)
+
+
+def preparar_itens(
+    produtos: Sequence[Any],
+    regra_frete: Callable[[Any, float, float], Tuple[float, float]],
+) -> Tuple[List[Dict], Dict[str, float]]:
+    """
+    Valida os itens e devolve (linhas para tb_pedidos_itens, totais) numa única passada.
+    Totais sem arredondamento: peso_total_kg, total_sem_frete, total_com_frete, frete_total.
+    """
+    linhas: List[Dict] = []
+    erros: List[str] = []
+    peso_total_kg = total_sem_frete = total_com_frete = 0.0
+
+    for n, it in enumerate(produtos, start=1):
+        qtd = float(it.quantidade or 0)
+        p_sem = float(it.preco_unit or 0)
+        p_com = float((it.preco_unit_com_frete if it.preco_unit_com_frete is not None else it.preco_unit) or 0)
+        peso = float(it.peso_kg or 0)
+        if not all(math.isfinite(v) for v in (qtd, p_sem, p_com, peso)):
+            erros.append(f"Item {n} ({it.codigo}): valor numérico inválido")
+            continue
+        if qtd < 0 or p_sem < 0 or p_com < 0 or peso < 0:
+            erros.append(f"Item {n} ({it.codigo}): quantidade, preço e peso não podem ser negativos")
+            continue
+
+        peso_total_kg += peso * qtd
+        total_sem_frete += p_sem * qtd
+        total_com_frete += p_com * qtd
+
+        v_frete, preco_unit_frt = regra_frete(it, p_sem, p_com)
+        linhas.append({
+            "codigo": (it.codigo or "")[:80],
+            "nome": (it.descricao or "")[:255] or None,
+            "embalagem": getattr(it, "embalagem", None),
+            "peso_kg": peso,
+            "condicao_pagamento": it.condicao_pagamento,
+            "tabela_comissao": it.tabela_comissao,
+            "preco_unit": round(p_sem, 2),
+            "preco_unit_frt": preco_unit_frt,
+            "valor_frete_unitario": v_frete,
+            "frete_base_ton": float(getattr(it, "frete_base_ton", 0) or 0),
+            "quantidade": qtd,
+            "subtotal_sem_f": round(p_sem * qtd, 2),
+            "subtotal_com_f": round(p_com * qtd, 2),
+            "manual_freight": bool(getattr(it, "manual_freight", False) or False),
+            "markup": float(getattr(it, "markup", 0.0) or 0.0),
+            "valor_final_markup": float(getattr(it, "valor_final_markup", 0.0) or 0.0),
+            "valor_s_frete_markup": float(getattr(it, "valor_s_frete_markup", 0.0) or 0.0),
+        })
+
+    if erros:
+        raise ValidationException("Itens do pedido inválidos", code="PED_ITEM_001", details=erros)
+
+    totais = {
+        "peso_total_kg": peso_total_kg,
+        "total_sem_frete": total_sem_frete,
+        "total_com_frete": total_com_frete,
+        "frete_total": max(0.0, total_com_frete - total_sem_frete),
+    }
+    return linhas, totais
+
+
+def inserir_itens(db: Session, id_pedido: int, linhas: List[Dict]) -> None:
+    """Todas as linhas num único executemany (INSERT multi-linha de até LOTE_ITENS linhas)."""
+    if not linhas:
+        return
+    db.execute(
+        insert(_ITENS).execution_options(insertmanyvalues_page_size=LOTE_ITENS),
+        [{"id_pedido": id_pedido, **linha} for linha in linhas],
+    )
+
+
+def _mesmo_valor(atual, novo) -> bool:
+    if isinstance(novo, float) and atual is not None and not isinstance(atual, (str, bool)):
+        return math.isclose(float(atual), novo, rel_tol=0, abs_tol=1e-9)
+    return atual == novo
+
+
+def sincronizar_itens(db: Session, id_pedido: int, linhas: List[Dict]) -> Dict[str, int]:
+    """
+    Deixa os itens do pedido iguais a `linhas` sem apagar e regravar tudo.
+
+    Os itens são lidos na ordem de id_item (a ordem de exibição) e pareados por posição
+    com as linhas novas: a posição i que mudou recebe UPDATE no mesmo id_item, linhas a
+    mais são inseridas no fim e as que sobraram são apagadas, então a ordem final é a
+    da lista recebida. No máximo quatro comandos, qualquer que seja o tamanho do pedido.
+    """
+    atuais = db.execute(
+        select(_ITENS.c.id_item, *(_ITENS.c[c] for c in COLUNAS_ITEM))
+        .where(_ITENS.c.id_pedido == id_pedido)
+        .order_by(_ITENS.c.id_item)
+    ).mappings().all()
+
+    alterados = {}
+    for atual, nova in zip(atuais, linhas):
+        if not all(_mesmo_valor(atual[c], nova[c]) for c in COLUNAS_ITEM):
+            alterados[atual["id_item"]] = nova
+    removidos = [r["id_item"] for r in atuais[len(linhas):]]
+    novos = linhas[len(atuais):]
+
+    if alterados:
+        # Um UPDATE para todas as linhas alteradas: CASE id_item WHEN ... por coluna
+        # (o ELSE com a própria coluna também dá o tipo ao NULL no Postgres)
+        db.execute(
+            update(_ITENS)
+            .where(_ITENS.c.id_item.in_(list(alterados)))
+            .values({
+                c: case({id_item: linha[c] for id_item, linha in alterados.items()},
+                        value=_ITENS.c.id_item, else_=_ITENS.c[c])
+                for c in COLUNAS_ITEM
+            })
+        )
+    if removidos:
+        db.execute(delete(_ITENS).where(_ITENS.c.id_item.in_(removidos)))
+    inserir_itens(db, id_pedido, novos)
+
+    return {"atualizados": len(alterados), "inseridos": len(novos), "removidos": len(removidos)}
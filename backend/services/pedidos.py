@@ -1,6 +1,9 @@
 # services/pedidos.py
+import base64
+import json
+from datetime import datetime
 from sqlalchemy import text
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 LISTAGEM_SQL = text("""
 SELECT
@@ -160,3 +163,27 @@ STATUS_EVENT_INSERT_SQL = text("""
 INSERT INTO public.pedido_status_event (id, pedido_id, de_status, para_status, user_id, motivo, metadata, created_at)
 VALUES (gen_random_uuid(), :pedido_id, :de_status, :para_status, :user_id, :motivo, CAST(:metadata AS jsonb), now())
 """)
+
+
+# ---------- Paginação por cursor (keyset) ----------
+# O cursor é opaco para o front: base64url de {"c": created_at ISO, "i": id_pedido}
+# apontando para a última linha entregue na página anterior.
+
+def encode_cursor(created_at: Optional[datetime], id_pedido: int) -> str:
+    payload = {
+        "c": created_at.isoformat() if created_at else None,
+        "i": int(id_pedido),
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Decodifica o cursor. Levanta ValueError se estiver malformado."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        created_at = datetime.fromisoformat(payload["c"]) if payload.get("c") else None
+        return created_at, int(payload["i"])
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
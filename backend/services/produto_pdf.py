@@ -1,11 +1,15 @@
 # services/produtos_v2_service.py
 
+import csv
+import io
+import time
 from typing import Any, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import Date, bindparam, column, insert, table, text, update
 from fastapi import HTTPException
 from datetime import date
 from services.produto_regras import sincronizar_produtos_com_listas_ativas
+from services.busca import filtro_produtos
 from models.produto import ProdutoV2, ImpostoV2
 from schemas.produto import (
     ProdutoV2Create,
@@ -290,6 +294,59 @@ def get_produto(db: Session, produto_id: int) -> ProdutoV2Out:
 
 
 
+# ----------------------------
+# Listagem
+# ----------------------------
+# Colunas da view devolvidas pela listagem (campos de ProdutoV2Out que vêm do banco)
+COLUNAS_LISTAGEM = (
+    "id", "codigo_supra", "status_produto", "nome_produto", "tipo_giro", "tipo",
+    "estoque_disponivel", "estoque_futuro", "unidade", "peso", "peso_bruto", "estoque_ideal",
+    "embalagem_venda", "unidade_embalagem", "codigo_ean", "codigo_embalagem", "ncm",
+    "fornecedor", "filhos", "familia", "marca", "id_familia", "preco", "preco_tonelada",
+    "validade_tabela", "desconto_valor_tonelada", "data_desconto_inicio", "data_desconto_fim",
+    "unidade_anterior", "preco_anterior", "preco_tonelada_anterior", "validade_tabela_anterior",
+)
+
+# Mesmas regras de _row_to_out, calculadas no banco com :hoje
+_DESCONTO_VIGENTE = (
+    "p.data_desconto_inicio IS NOT NULL AND p.data_desconto_fim IS NOT NULL"
+    " AND p.data_desconto_inicio <= :hoje AND :hoje <= p.data_desconto_fim"
+)
+_DESCONTO_UNITARIO = "COALESCE(p.desconto_valor_tonelada, 0) / 1000.0 * COALESCE(p.peso, 0)"
+COLUNAS_CALCULADAS = {
+    "vigencia_ativa": f"CASE WHEN {_DESCONTO_VIGENTE} THEN 1 ELSE 0 END",
+    # % de desconto efetivo hoje; o preço final não fica negativo (desconto máximo de 100%)
+    "reajuste_percentual": f"""CASE
+        WHEN COALESCE(p.desconto_valor_tonelada, 0) > 0 AND COALESCE(p.peso, 0) > 0
+             AND COALESCE(p.preco, 0) > 0 AND {_DESCONTO_VIGENTE}
+        THEN CASE WHEN {_DESCONTO_UNITARIO} >= p.preco THEN 100.0
+                  ELSE {_DESCONTO_UNITARIO} * 100.0 / p.preco END
+        ELSE 0.0 END""",
+}
+
+
+def campos_listagem(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Lista de campos pedida em `fields=` (separados por vírgula), sempre com `id`.
+    None quando não informado (listagem completa).
+    """
+    if not fields:
+        return None
+    campos = [c.strip() for c in fields.split(",") if c.strip()]
+    desconhecidos = [c for c in campos if c not in ProdutoV2Out.model_fields]
+    if desconhecidos:
+        raise HTTPException(400, detail=f"Campos inválidos em fields: {', '.join(desconhecidos)}")
+    return ["id"] + [c for c in dict.fromkeys(campos) if c != "id"]
+
+
+def _impostos_por_produto(db: Session, ids: List[int]) -> Dict[int, ImpostoV2Out]:
+    """Impostos de vários produtos com uma única consulta."""
+    if not ids:
+        return {}
+    rows = db.query(ImpostoV2).filter(ImpostoV2.produto_id.in_(ids)).all()
+    return {imp.produto_id: ImpostoV2Out.from_orm(imp) for imp in rows}
+
+
 def list_produtos(
     db: Session,
     q: Optional[str],
@@ -299,49 +356,68 @@ def list_produtos(
     vigencia_em: Optional[date],
     limit: int,
     offset: int,
-) -> List[ProdutoV2Out]:
-    base = "SELECT * FROM v_produto_v2_preco WHERE 1=1"
-    params: Dict[str, Any] = {}
-
-    if q:
-        base += " AND (nome_produto ILIKE :q OR codigo_supra ILIKE :q)"
-        params["q"] = f"%{q}%"
+    include_imposto: bool = False,
+    campos: Optional[List[str]] = None,
+) -> List[Any]:
+    """
+    Produtos da view com colunas projetadas; vigencia_ativa e reajuste_percentual vêm
+    calculados do banco e os impostos (se pedidos) numa consulta só.
+    Com `campos`, devolve dicts apenas com esses campos em vez de ProdutoV2Out.
+    """
+    selecionados = campos or list(COLUNAS_LISTAGEM) + list(COLUNAS_CALCULADAS)
+    colunas = [
+        f"{COLUNAS_CALCULADAS[c]} AS {c}" if c in COLUNAS_CALCULADAS else f"p.{c}"
+        for c in selecionados if c in COLUNAS_LISTAGEM or c in COLUNAS_CALCULADAS
+    ]
+    base = f"SELECT {', '.join(colunas)} FROM v_produto_v2_preco p WHERE 1=1"
+    params: Dict[str, Any] = {"hoje": date.today()}
+    ordem = "p.id DESC"
+
+    filtro = filtro_produtos(db, q, alias="p")
+    if filtro:
+        base += f" AND {filtro.where}"
+        params.update(filtro.params)
+        ordem = f"{filtro.rank} DESC, p.id DESC"
     if status:
-        base += " AND status_produto = :status"
+        base += " AND p.status_produto = :status"
         params["status"] = status
     if familia is not None:
-        base += " AND familia = :familia"
+        base += " AND p.familia = :familia"
         params["familia"] = familia
     if fornecedor:
-        base += " AND UPPER(fornecedor) = UPPER(:fornecedor)"
+        base += " AND UPPER(p.fornecedor) = UPPER(:fornecedor)"
         params["fornecedor"] = fornecedor
     if vigencia_em:
-        base += " AND validade_tabela <= :vig"
+        base += " AND p.validade_tabela <= :vig"
         params["vig"] = vigencia_em
 
-    base += " ORDER BY id DESC LIMIT :limit OFFSET :offset"
+    base += f" ORDER BY {ordem} LIMIT :limit OFFSET :offset"
     params["limit"] = limit
     params["offset"] = offset
 
-    try:
-        rows = db.execute(text(base), params).mappings().all()
-        
-        valid_products = []
+    stmt = text(base).bindparams(bindparam("hoje", type_=Date()))
+    rows = [dict(r) for r in db.execute(stmt, params).mappings().all()]
+    for r in rows:
+        if "vigencia_ativa" in r:
+            r["vigencia_ativa"] = bool(r["vigencia_ativa"])
+
+    if include_imposto or (campos and "imposto" in campos):
+        impostos = _impostos_por_produto(db, [r["id"] for r in rows])
         for r in rows:
-            try:
-                out = _row_to_out(db, r, include_imposto=False)
-                valid_products.append(out)
-            except Exception as e:
-                print(f"[list_produtos] ERRO ao mapear produto ID {r.get('id')}: {e}")
-                # Log error but don't crash
-        
-        return valid_products
+            r["imposto"] = impostos.get(r["id"])
 
-    except Exception as e:
-        import traceback
-        with open("search_error.log", "w") as f:
-            f.write(traceback.format_exc())
-        raise e
+    if campos:
+        # campos sem coluna (ex.: preco_final) saem como null, igual ao ProdutoV2Out
+        return [{c: r.get(c) for c in campos} for r in rows]
+
+    valid_products = []
+    for r in rows:
+        try:
+            valid_products.append(ProdutoV2Out(**r))
+        except Exception as e:
+            print(f"[list_produtos] ERRO ao mapear produto ID {r.get('id')}: {e}")
+            # Log error but don't crash
+    return valid_products
 
 
 def get_anteriores(db: Session, produto_id: int) -> Dict[str, Any]:
@@ -366,48 +442,54 @@ def importar_lista_df(db: Session, df: pd.DataFrame) -> Dict[str, Any]:
     - chave de busca: codigo_supra (vem do campo 'codigo' do DF)
     - se não existir: cria produto novo com status 'ATIVO'
     - se existir: atualiza preço / fornecedor
+    Os produtos existentes são lidos numa consulta só (pelos códigos do DF) e as
+    gravações vão em lote.
     """
+    linhas = [
+        r for r in df.astype(object).where(df.notna(), None).to_dict(orient="records")
+        if r.get("codigo") and r.get("descricao")
+    ]
+    if not linhas:
+        db.commit()
+        return {"inseridos": 0, "atualizados": 0}
+
+    ids_por_codigo: Dict[str, List[int]] = {}
+    for pid, codigo in db.execute(
+        text("SELECT id, codigo_supra FROM t_cadastro_produto_v2 WHERE codigo_supra IN :codigos")
+        .bindparams(bindparam("codigos", expanding=True)),
+        {"codigos": list({r["codigo"] for r in linhas})},
+    ):
+        ids_por_codigo.setdefault(codigo, []).append(pid)
+
     inseridos = 0
     atualizados = 0
-
-    for row in df.to_dict(orient="records"):
-        codigo = row.get("codigo")
-        descricao = row.get("descricao")
-        fornecedor = row.get("fornecedor")
-        preco_ton = row.get("preco_ton")
-        preco_sc = row.get("preco_sc")
-
-        if not codigo or not descricao:
-            continue
-
-        # procura produto pela chave única codigo_supra
-        obj = (
-            db.query(ProdutoV2)
-            .filter(ProdutoV2.codigo_supra == codigo)
-            .one_or_none()
-        )
-        if obj:
-            # Atualiza
+    precos: Dict[int, Dict[str, Any]] = {}
+    novos: Dict[str, Dict[str, Any]] = {}
+    for row in linhas:
+        codigo = row["codigo"]
+        preco = {"preco_tonelada": row.get("preco_ton"), "preco": row.get("preco_sc")}
+        if codigo in ids_por_codigo:
             atualizados += 1
-            # Se quiser atualizar descrição/preço sempre que aparecer, descomente:
-            # obj.nome_produto = descricao
-            # obj.fornecedor = fornecedor
-            obj.preco_tonelada = preco_ton
-            obj.preco = preco_sc
-            # Trigger DB atualiza updated_at
+            for pid in ids_por_codigo[codigo]:
+                precos[pid] = {"id": pid, **preco}
+        elif codigo in novos:
+            # código repetido no DF: a linha seguinte atualiza o produto recém-criado
+            atualizados += 1
+            novos[codigo].update(preco)
         else:
-            # Cria novo
             inseridos += 1
-            novo = ProdutoV2(
-                codigo_supra=codigo,
-                status_produto="ATIVO",
-                nome_produto=descricao,
-                fornecedor=fornecedor,
-                preco_tonelada=preco_ton,
-                preco=preco_sc,
-            )
-            db.add(novo)
-
+            novos[codigo] = {
+                "codigo_supra": codigo,
+                "status_produto": "ATIVO",
+                "nome_produto": row["descricao"],
+                "fornecedor": row.get("fornecedor"),
+                **preco,
+            }
+
+    if precos:
+        db.execute(update(ProdutoV2), list(precos.values()))
+    if novos:
+        db.execute(insert(ProdutoV2.__table__), list(novos.values()))
     db.commit()
     return {"inseridos": inseridos, "atualizados": atualizados}
 
@@ -494,71 +576,88 @@ def limpar_preco_pdf_por_tipo(
     db.commit()
 
 
+COLUNAS_PRECO_PDF = (
+    "fornecedor", "lista", "familia", "codigo", "descricao", "preco_ton", "preco_sc", "page",
+    "validade_tabela", "data_ingestao", "nome_arquivo", "ativo", "usuario", "filhos",
+)
+LOTE_PRECO_PDF = 1000  # linhas por INSERT multi-VALUES (fora do Postgres)
+
+
+def _registros_preco_pdf(df: pd.DataFrame, nome_arquivo: Optional[str], usuario: Optional[str]) -> List[tuple]:
+    """Tuplas na ordem de COLUNAS_PRECO_PDF, com os defaults da ingestão e NaN -> NULL."""
+    df = df.copy()
+    defaults = {
+        "validade_tabela": None,
+        "data_ingestao": date.today(),
+        "nome_arquivo": nome_arquivo,
+        "usuario": usuario,
+    }
+    for col, valor in defaults.items():
+        if col not in df.columns:
+            df[col] = valor
+    df["ativo"] = True  # Força sempre True na nova ingestão
+    dados = df[list(COLUNAS_PRECO_PDF)].astype(object)
+    dados = dados.where(dados.notna(), None)
+    return list(dados.itertuples(index=False, name=None))
+
+
+def _copiar_preco_pdf(db: Session, registros: List[tuple]) -> None:
+    """COPY ... FROM STDIN (CSV) na mesma transação da sessão."""
+    buf = io.StringIO()
+    escritor = csv.writer(buf)
+    for reg in registros:
+        escritor.writerow(["\\N" if v is None else v for v in reg])
+    buf.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY public.t_preco_produto_pdf_v2 ({', '.join(COLUNAS_PRECO_PDF)}) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buf,
+        )
+    finally:
+        cursor.close()
+
+
+_TABELA_PRECO_PDF = table(
+    "t_preco_produto_pdf_v2", *(column(c) for c in COLUNAS_PRECO_PDF), schema="public"
+)
+
+
+def _inserir_preco_pdf(db: Session, registros: List[tuple], page_size: int) -> None:
+    """executemany do INSERT; drivers com insertmanyvalues mandam `page_size` linhas por comando."""
+    db.execute(
+        insert(_TABELA_PRECO_PDF).execution_options(insertmanyvalues_page_size=page_size),
+        [dict(zip(COLUNAS_PRECO_PDF, reg)) for reg in registros],
+    )
+
+
 def salvar_t_preco_produto_pdf(
     db: Session,
     df: pd.DataFrame,
     nome_arquivo: Optional[str] = None,
     usuario: Optional[str] = None,
-) -> None:
+    page_size: int = LOTE_PRECO_PDF,
+) -> int:
     """
     Insere o DataFrame na tabela t_preco_produto_pdf_v2.
     - Mantém histórico por data_ingestao.
     - Usa flag 'ativo' para marcar a carga atual.
     - Guarda nome do arquivo e usuário.
+    No Postgres a carga vai por COPY; nos demais bancos, num executemany em lotes.
+    Retorna o número de linhas gravadas.
     """
     if df.empty:
-        return
+        return 0
 
-    sql = text(
-        """
-        INSERT INTO public.t_preco_produto_pdf_v2 (
-            fornecedor,
-            lista,
-            familia,
-            codigo,
-            descricao,
-            preco_ton,
-            preco_sc,
-            page,
-            validade_tabela,
-            data_ingestao,
-            nome_arquivo,
-            ativo,
-            usuario,
-            filhos
-        )
-        VALUES (
-            :fornecedor,
-            :lista,
-            :familia,
-            :codigo,
-            :descricao,
-            :preco_ton,
-            :preco_sc,
-            :page,
-            :validade_tabela,
-            :data_ingestao,
-            :nome_arquivo,
-            :ativo,
-            :usuario,
-            :filhos
-        )
-        """
-    )
-
-    registros = df.to_dict(orient="records")
-
-    for row in registros:
-        # defaults
-        row.setdefault("validade_tabela", None)
-        row.setdefault("data_ingestao", date.today())
-        row.setdefault("nome_arquivo", nome_arquivo)
-        row["ativo"] = True # Força sempre True na nova ingestão
-        row.setdefault("usuario", usuario)
-
-        db.execute(sql, row)
+    registros = _registros_preco_pdf(df, nome_arquivo, usuario)
+    if db.get_bind().dialect.name == "postgresql":
+        _copiar_preco_pdf(db, registros)
+    else:
+        _inserir_preco_pdf(db, registros, page_size)
 
     db.commit()
+    return len(registros)
 
 def importar_pdf_para_produto(
     db: Session,
@@ -572,6 +671,7 @@ def importar_pdf_para_produto(
          para o mesmo (fornecedor, lista)
       2) salvar a nova ingestão (ativo = TRUE)
       3) sincronizar com t_cadastro_produto_v2 (atualizar, inativar, inserir)
+    O tempo de cada etapa (insert, sync) vem em "tempos_segundos".
     """
     if df.empty:
         return {"total_linhas": 0, "lista": None, "fornecedor": None, "sync": {}}
@@ -600,6 +700,9 @@ def importar_pdf_para_produto(
     if "fornecedor" in df.columns and not pd.isna(df["fornecedor"].iloc[0]):
         fornecedor = str(df["fornecedor"].iloc[0]).strip() or None
 
+    tempos: Dict[str, float] = {}
+    inicio = time.perf_counter()
+
     # 1) desativar cargas antigas daquele (fornecedor, lista)
     limpar_preco_pdf_por_tipo(db, lista=lista, fornecedor=fornecedor)
 
@@ -610,18 +713,22 @@ def importar_pdf_para_produto(
         nome_arquivo=nome_arquivo,
         usuario=usuario,
     )
+    tempos["insert"] = round(time.perf_counter() - inicio, 3)
 
     # 3) sincronizar produtos com a lista ativa
+    inicio = time.perf_counter()
     resumo_sync = sincronizar_produtos_com_listas_ativas(
         db,
         fornecedor=fornecedor,
         lista=lista,
     )
+    tempos["sync"] = round(time.perf_counter() - inicio, 3)
 
     return {
         "lista": lista,
         "fornecedor": fornecedor,
         "total_linhas": int(len(df)),
         "sync": resumo_sync,
+        "tempos_segundos": tempos,
     }
 
@@ -2,13 +2,25 @@
 
 from __future__ import annotations
 
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import date
-from typing import BinaryIO, Optional
+from typing import BinaryIO, List, Optional
 
 import pdfplumber
 import pandas as pd
 
+from core.cache import TTLCache
+
+logger = logging.getLogger("ordersync.produto_pdf_data")
+
 
 def normalize_num(s):
     """
@@ -52,23 +64,226 @@ def clean_markers(s: Optional[str]) -> Optional[str]:
     return s.strip()
 
 
+def _cpus_disponiveis() -> int:
+    """CPUs que o processo pode usar (afinidade); os.cpu_count() é o do host, não o do container."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:  # Windows/macOS
+        return os.cpu_count() or 1
+
+
+# Processos do parser: cada worker abre o PDF uma vez e extrai um bloco contíguo de páginas.
+# Padrão pequeno e fixo (a cota de CPU do container pode ser menor que a afinidade).
+PDF_PARSE_PROCESSOS = int(os.getenv("PDF_PARSE_PROCESSOS", "0")) or min(2, _cpus_disponiveis())
+PDF_PARSE_MIN_PAGINAS = 4  # abaixo disso, o custo de subir os processos não compensa
+
+# Resultado do parser por hash do arquivo: reenviar o mesmo PDF não relê as páginas
+_cache_parser = TTLCache(ttl_seconds=3600, maxsize=16)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _linhas_da_pagina(page, page_idx: int, lista: str, fornecedor: Optional[str]) -> List[dict]:
+    """
+    Linhas de produto das tabelas de uma página, já com a família corrente.
+    A sequência 'filhos' (que atravessa páginas) é numerada depois, em `_numerar_filhos`.
+    """
+    linhas: List[dict] = []
+    for table in page.extract_tables() or []:
+        if not table or len(table[0]) < 2:
+            continue
+
+        familia_atual: Optional[str] = None
+
+        for row in table:
+            # Normaliza row
+            row_safe = list(row) + [None] * (max(0, 6 - len(row)))
+            c0 = (row_safe[0] or "").strip()
+            c1 = (row_safe[1] or "").strip()
+            c2 = (row_safe[2] or "").strip()
+            c3 = (row_safe[3] or "").strip()
+
+            # Linha vazia?
+            if not any([c0, c1, c2, c3]):
+                continue
+
+            joined_upper = " ".join(x for x in [c0, c1, c2, c3] if x).upper()
+
+            # --- FILTRO DE RODAPÉ (IGNORE TERMS) ---
+            IGNORE_TERMS = [
+                "ATENDIMENTO AO CONSUMIDOR",
+                "GERÊNCIA DE VENDAS", 
+                "CONTATO:", "EMAIL:", "FONE:",
+                "VOTORANTIM@ALISUL", "PÁG:", "PAGINA",
+                "OBSERVAÇÕES", " PEDIDO MÍNIMO"
+            ]
+            if any(term in joined_upper for term in IGNORE_TERMS):
+                continue
+
+            # Familia Header
+            # Logica melhorada: Se c0 tem texto, c1/c2/c3 vazios, e contem "FAMILIA" ou parece titulo
+            if c0 and not c1 and not c2 and not c3:
+                # Se contiver "FAMILIA", é batata
+                if "FAMÍLIA" in c0.upper() or "FAMILIA" in c0.upper():
+                    familia_atual = clean_markers(c0)
+                    continue
+
+                # Se for um texto longo sem numeros, pode ser familia (ex: FROST GATOS)
+                # Mas evitar confundir com "ATENDIMENTO..." (já filtrado acima)
+                if len(c0) > 3 and not re.search(r"\d", c0):
+                     familia_atual = clean_markers(c0)
+                     continue
+
+            # Table Header Skip
+            if ("COD" in joined_upper or "CÓD" in joined_upper) and ("PROD" in joined_upper):
+                continue
+
+            # === Lógica Diferenciada por TIPO ===
+            codigo = clean_markers(c0)
+            descricao = clean_markers(c1)
+            preco_ton = None
+            preco_sc = None
+
+            if not codigo or not re.match(r"^[0-9A-Z]", codigo):
+                continue
+
+            # FILTRO DE LIXO / TABELAS DE PRAZO
+            code_upper = codigo.upper()
+            if (
+                "PRAZO" in code_upper 
+                or "COEF" in code_upper 
+                or re.search(r"\d+\s*DD", code_upper)
+                or re.search(r"\d+/\d+", code_upper)
+            ):
+                continue
+
+            if lista == "PET":
+                # Layout PET: COL2=Embalagem, COL3=Preço(7DD)
+                emb = c2
+                if emb and emb not in descricao:
+                    descricao = f"{descricao} - {emb}"
+
+                preco_sc = normalize_num(c3)
+                preco_ton = None
+            else:
+                # Layout INSUMOS (Default)
+                preco_ton = normalize_num(c2)
+                preco_sc = normalize_num(c3)
+
+            linhas.append(
+                {
+                    "fornecedor": fornecedor,
+                    "lista": lista,
+                    "familia": familia_atual,
+                    "codigo": codigo,
+                    "descricao": descricao,
+                    "preco_ton": preco_ton,
+                    "preco_sc": preco_sc,
+                    "page": page_idx,
+                }
+            )
+    return linhas
+
+
+def _extrair_paginas(conteudo: bytes, paginas: List[int], lista: str, fornecedor: Optional[str]) -> List[List[dict]]:
+    """Worker: abre o PDF em memória e extrai as páginas pedidas (índices a partir de 1)."""
+    with pdfplumber.open(io.BytesIO(conteudo)) as pdf:
+        return [_linhas_da_pagina(pdf.pages[i - 1], i, lista, fornecedor) for i in paginas]
+
+
+def _numerar_filhos(paginas: List[List[dict]]) -> List[dict]:
+    """Junta as páginas em ordem e numera 'filhos' dentro de cada sequência de família."""
+    linhas: List[dict] = []
+    last_familia = None
+    filhos_seq = 0
+    for linhas_pagina in paginas:
+        for linha in linhas_pagina:
+            if linha["familia"] != last_familia:
+                last_familia = linha["familia"]
+                filhos_seq = 1
+            else:
+                filhos_seq += 1
+            linha["filhos"] = filhos_seq
+            linhas.append(linha)
+    return linhas
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Sem fork: o uvicorn já tem threads (scheduler, worker, pool SMTP) e um filho
+            # criado por fork pode herdar travas presas por elas (logging, pool do banco)
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PDF_PARSE_PROCESSOS,
+                                        mp_context=multiprocessing.get_context(metodo))
+        return _pool
+
+
+def _extrair_em_paralelo(conteudo: bytes, total: int, lista: str, fornecedor: Optional[str],
+                         processos: int) -> List[List[dict]]:
+    """Distribui blocos contíguos de páginas entre os processos e devolve na ordem das páginas."""
+    global _pool
+    tamanho = -(-total // processos)
+    blocos = [list(range(ini, min(ini + tamanho, total + 1))) for ini in range(1, total + 1, tamanho)]
+    try:
+        pool = _get_pool()
+        futuros = [pool.submit(_extrair_paginas, conteudo, bloco, lista, fornecedor) for bloco in blocos]
+        return [pagina for futuro in futuros for pagina in futuro.result()]
+    except BrokenProcessPool:
+        logger.warning("Pool de processos do parser quebrou; lendo o PDF no processo atual")
+        with _pool_lock:
+            _pool = None
+        return _extrair_paginas(conteudo, list(range(1, total + 1)), lista, fornecedor)
+
+
 def parse_lista_precos(
     file_obj: BinaryIO,
     tipo_lista: Optional[str] = None,  # "INSUMOS" ou "PET"
     filename: Optional[str] = None,
     fornecedor_selecionado: Optional[str] = None,
+    processos: Optional[int] = None,
 ) -> pd.DataFrame:
     """
     Lê o PDF da lista de preços (INS/PET VOTORANTIM 15) a partir de um file-like.
     Usa o Fornecedor Selecionado pelo usuário.
+    As páginas são extraídas em paralelo (`processos`, padrão PDF_PARSE_PROCESSOS) e o
+    resultado fica em cache pelo hash do arquivo.
     """
-    linhas = []
+    conteudo = file_obj.read()
+    chave = (
+        hashlib.sha256(conteudo).hexdigest(),
+        (tipo_lista or "").upper(),
+        fornecedor_selecionado,
+        None if tipo_lista else filename,  # o nome do arquivo só decide o tipo quando não informado
+    )
+    linhas = _cache_parser.get(chave)
+    if linhas is None:
+        linhas = _ler_pdf(conteudo, tipo_lista, filename, fornecedor_selecionado,
+                          processos or PDF_PARSE_PROCESSOS)
+        _cache_parser.set(chave, linhas)
+    else:
+        logger.info(f"Lista de preços {filename}: resultado do parser em cache")
+
+    df = pd.DataFrame([dict(l) for l in linhas])
+
+    if not df.empty:
+        df["lista"] = df["lista"].fillna(value="DESCONHECIDO")
+        df["fornecedor"] = df["fornecedor"].fillna(value="DESCONHECIDO")
+        df["data_ingestao"] = date.today()
+
+    return df
 
-    # Sequence tracking
-    last_familia = None
-    filhos_seq = 0
 
-    with pdfplumber.open(file_obj) as pdf:
+def _ler_pdf(
+    conteudo: bytes,
+    tipo_lista: Optional[str],
+    filename: Optional[str],
+    fornecedor_selecionado: Optional[str],
+    processos: int,
+) -> List[dict]:
+    """Tipo e fornecedor pelo cabeçalho, depois as linhas de todas as páginas com 'filhos' numerado."""
+    with pdfplumber.open(io.BytesIO(conteudo)) as pdf:
         # === Leitura Inicial (Header) ===
         header_text = pdf.pages[0].extract_text() or ""
         m = re.search(
@@ -119,120 +334,12 @@ def parse_lista_precos(
              elif up_lista and "LISTA" not in up_lista:
                 fornecedor = up_lista
 
-        # === 3. Extração de Dados ===
-        for page_idx, page in enumerate(pdf.pages, start=1):
-            tables = page.extract_tables()
-            if not tables:
-                continue
-
-            for table in tables:
-                if not table or len(table[0]) < 2:
-                    continue
-
-                familia_atual: Optional[str] = None
-
-                for row in table:
-                    # Normaliza row
-                    row_safe = list(row) + [None] * (max(0, 6 - len(row)))
-                    c0 = (row_safe[0] or "").strip()
-                    c1 = (row_safe[1] or "").strip()
-                    c2 = (row_safe[2] or "").strip()
-                    c3 = (row_safe[3] or "").strip()
-
-                    # Linha vazia?
-                    if not any([c0, c1, c2, c3]):
-                        continue
-
-                    joined_upper = " ".join(x for x in [c0, c1, c2, c3] if x).upper()
-
-                    # --- FILTRO DE RODAPÉ (IGNORE TERMS) ---
-                    IGNORE_TERMS = [
-                        "ATENDIMENTO AO CONSUMIDOR",
-                        "GERÊNCIA DE VENDAS", 
-                        "CONTATO:", "EMAIL:", "FONE:",
-                        "VOTORANTIM@ALISUL", "PÁG:", "PAGINA",
-                        "OBSERVAÇÕES", " PEDIDO MÍNIMO"
-                    ]
-                    if any(term in joined_upper for term in IGNORE_TERMS):
-                        continue
-
-                    # Familia Header
-                    # Logica melhorada: Se c0 tem texto, c1/c2/c3 vazios, e contem "FAMILIA" ou parece titulo
-                    if c0 and not c1 and not c2 and not c3:
-                        # Se contiver "FAMILIA", é batata
-                        if "FAMÍLIA" in c0.upper() or "FAMILIA" in c0.upper():
-                            familia_atual = clean_markers(c0)
-                            continue
-                        
-                        # Se for um texto longo sem numeros, pode ser familia (ex: FROST GATOS)
-                        # Mas evitar confundir com "ATENDIMENTO..." (já filtrado acima)
-                        if len(c0) > 3 and not re.search(r"\d", c0):
-                             familia_atual = clean_markers(c0)
-                             continue
-
-                    # Table Header Skip
-                    if ("COD" in joined_upper or "CÓD" in joined_upper) and ("PROD" in joined_upper):
-                        continue
-
-                    # === Lógica Diferenciada por TIPO ===
-                    codigo = clean_markers(c0)
-                    descricao = clean_markers(c1)
-                    preco_ton = None
-                    preco_sc = None
-                    
-                    if not codigo or not re.match(r"^[0-9A-Z]", codigo):
-                        continue
-
-                    # FILTRO DE LIXO / TABELAS DE PRAZO
-                    code_upper = codigo.upper()
-                    if (
-                        "PRAZO" in code_upper 
-                        or "COEF" in code_upper 
-                        or re.search(r"\d+\s*DD", code_upper)
-                        or re.search(r"\d+/\d+", code_upper)
-                    ):
-                        continue
-
-                    if lista == "PET":
-                        # Layout PET: COL2=Embalagem, COL3=Preço(7DD)
-                        emb = c2
-                        if emb and emb not in descricao:
-                            descricao = f"{descricao} - {emb}"
-                        
-                        preco_sc = normalize_num(c3)
-                        preco_ton = None
-                    else:
-                        # Layout INSUMOS (Default)
-                        preco_ton = normalize_num(c2)
-                        preco_sc = normalize_num(c3)
-
-                    # Sequence Logic
-                    if familia_atual != last_familia:
-                        last_familia = familia_atual
-                        filhos_seq = 1
-                    else:
-                        filhos_seq += 1
-
-                    linhas.append(
-                        {
-                            "fornecedor": fornecedor,
-                            "lista": lista,
-                            "familia": familia_atual,
-                            "codigo": codigo,
-                            "descricao": descricao,
-                            "preco_ton": preco_ton,
-                            "preco_sc": preco_sc,
-                            "page": page_idx,
-                            "filhos": filhos_seq,
-                        }
-                    )
-
-    df = pd.DataFrame(linhas)
-
-    if not df.empty:
-        df["lista"] = df["lista"].fillna(value=lista or "DESCONHECIDO")
-        df["fornecedor"] = df["fornecedor"].fillna(value=fornecedor or "DESCONHECIDO")
-        df["data_ingestao"] = date.today()
-
-    return df
+        total = len(pdf.pages)
+        if processos <= 1 or total < PDF_PARSE_MIN_PAGINAS:
+            # === 3. Extração de Dados (sequencial) ===
+            return _numerar_filhos([
+                _linhas_da_pagina(page, i, lista, fornecedor) for i, page in enumerate(pdf.pages, start=1)
+            ])
 
+    # === 3. Extração de Dados (páginas em paralelo, junção na ordem) ===
+    return _numerar_filhos(_extrair_em_paralelo(conteudo, total, lista, fornecedor, processos))
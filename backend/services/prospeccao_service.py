@@ -1,10 +1,11 @@
 import logging
 from sqlalchemy.orm import Session
 from datetime import datetime, date
-from routers.captacao_pedidos import _get_captacao_data
+from services.captacao_snapshot import dados_captacao as carregar_dados_captacao
 from models.vendedor import VendedorModel
 from services.captacao_pdf_service import gerar_pdf_prospeccao
-from services.email_service import _get_cfg_msg, _get_cfg_smtp, _abrir_conexao
+from services.email_service import _get_cfg_msg, _get_cfg_smtp
+from services import smtp_pool
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
@@ -19,7 +20,7 @@ def enviar_relatorios_prospeccao(db: Session):
     
     # 1. Pega os dados brutos de captação (todos os clientes)
     try:
-        dados_captacao = _get_captacao_data(db)
+        dados_captacao = carregar_dados_captacao(db)
     except Exception as e:
         logger.error(f"Erro ao obter dados de captação: {e}")
         return False
@@ -68,9 +69,10 @@ def enviar_relatorios_prospeccao(db: Session):
          logger.error("Configuração SMTP não encontrada/falhou. Abortando.")
          return False
 
-    server = None
+    # Valida a conexão antes de gerar PDFs (ela fica aquecida no pool para os envios)
     try:
-        server = _abrir_conexao(cfg_smtp)
+        with smtp_pool.pool.conexao(cfg_smtp):
+            pass
     except Exception as e:
         logger.error(f"Falha ao conectar no SMTP: {e}")
         return False
@@ -124,16 +126,12 @@ def enviar_relatorios_prospeccao(db: Session):
         
         # Envia
         try:
-            server.sendmail(remetente, [email_vendedor], msg.as_string())
+            smtp_pool.enviar_email(cfg_smtp, remetente, [email_vendedor], msg.as_string())
             logger.info(f"E-mail de prospecção enviado com sucesso para {nome_vendedor} ({email_vendedor}).")
             success_count += 1
         except Exception as e:
             logger.error(f"Falha no envio de e-mail para {nome_vendedor} ({email_vendedor}): {e}")
-            
-    try:
-        server.quit()
-    except:
-        pass
+
 
     logger.info(f"Rotina de prospecção finalizada. E-mails enviados: {success_count}.")
     return True
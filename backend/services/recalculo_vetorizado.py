@@ -0,0 +1,232 @@
+# services/recalculo_vetorizado.py
+"""
+Motor em lote do RECALCULO_MASSIVO.
+
+Carrega todas as linhas de tb_tabela_preco afetadas (com produto e impostos) em UMA consulta,
+calcula comissão, ajuste de pagamento, frete, IPI, ST e markup por coluna (pandas/NumPy) e grava
+o resultado com UPDATE ... FROM (VALUES ...).
+
+A parte fiscal usa services.fiscal.FiscalBatch, que reproduz calcular_linha centavo a
+centavo (frações exatas e HALF_UP em inteiros).
+"""
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.fiscal import CHAVES_FISCAIS, D, FiscalBatch, PerfilFiscal
+
+logger = logging.getLogger("worker_recalculo")
+
+# Linhas por comando UPDATE ... FROM (VALUES ...)
+LOTE_UPDATE = 1000
+
+# ---------------------------------------------------------------------------
+# Arredondamentos vetorizados
+# ---------------------------------------------------------------------------
+
+def _round_py(x: np.ndarray, casas: int) -> np.ndarray:
+    """
+    Equivalente vetorizado do round(x, casas) do Python (empate para par sobre o valor binário).
+    Quando x coincide com o float de um ponto de empate, o valor exato é ambíguo e a linha
+    usa o round() embutido.
+    """
+    escala = 10.0 ** casas
+    n = np.rint(x * escala)
+    baixo = (2.0 * n - 1.0) / (2.0 * escala)
+    alto = (2.0 * n + 1.0) / (2.0 * escala)
+    n = n - (x < baixo) + (x > alto)
+    out = n / escala
+    ambiguos = (x == baixo) | (x == alto)
+    if ambiguos.any():
+        out[ambiguos] = [round(float(v), casas) for v in x[ambiguos]]
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Parte fiscal (espelho de calcular_linha com quantidade=1 e desconto=0)
+# ---------------------------------------------------------------------------
+
+def calcular_linhas_fiscal(
+    preco_unit: Sequence[float],
+    frete_linha: Sequence[float],
+    ipi: Sequence,
+    icms: Sequence,
+    iva_st: Sequence,
+    aplica_st: Sequence[bool],
+) -> Dict[str, np.ndarray]:
+    """
+    Versão em colunas de calcular_linha(preco_unit, 1, 0, frete_linha, ipi, icms, iva_st, aplica_st).
+    Retorna {chave: centavos (int)} com as mesmas chaves de calcular_linha.
+    As alíquotas gravadas no cadastro entram como estão (sem a regra de IPI do preview).
+    """
+    perfis: Dict[tuple, PerfilFiscal] = {}
+    por_linha = []
+    for chave in zip(ipi, icms, iva_st):
+        if chave not in perfis:
+            perfis[chave] = PerfilFiscal(ipi=D(chave[0]), icms=D(chave[1]), iva_st=D(chave[2]))
+        por_linha.append(perfis[chave])
+    return FiscalBatch(preco_unit, por_linha, aplica_st, frete_linha=frete_linha).calcular().centavos
+
+
+# ---------------------------------------------------------------------------
+# Carga, cálculo comercial e gravação
+# ---------------------------------------------------------------------------
+
+def _resolver_chave(valor: Optional[str], mapa: Dict[str, float]) -> Optional[float]:
+    """Trata chaves compostas "CODIGO - DESC" ou apenas "CODIGO" (mesma regra do worker)."""
+    s = str(valor or "").strip()
+    if not s:
+        return None
+    cod = s.split(" - ")[0].strip().upper()
+    if cod in mapa:
+        return mapa[cod]
+    if s.upper() in mapa:
+        return mapa[s.upper()]
+    return None
+
+
+def carregar_linhas(db: Session, codigos: List[str]) -> pd.DataFrame:
+    """Todas as linhas ativas de tb_tabela_preco dos códigos informados, já com produto e impostos."""
+    rows = db.execute(text("""
+        SELECT t.id_linha, t.id_tabela, t.codigo_produto_supra, t.codigo_plano_pagamento,
+               t.descricao_fator_comissao, t.valor_produto, t.comissao_aplicada,
+               t.peso_liquido, t.frete_kg, t.markup, t.calcula_st,
+               p.preco, p.peso, p.peso_bruto,
+               i.ipi, i.icms, i.iva_st
+        FROM tb_tabela_preco t
+        JOIN t_cadastro_produto_v2 p ON p.codigo_supra = t.codigo_produto_supra
+        LEFT JOIN t_imposto_v2 i ON i.produto_id = p.id
+        WHERE t.ativo IS TRUE
+          AND t.codigo_produto_supra = ANY(:codigos)
+        ORDER BY t.id_linha, p.id, i.id
+    """), {"codigos": list(codigos)}).mappings().all()
+    df = pd.DataFrame([dict(r) for r in rows], columns=[
+        "id_linha", "id_tabela", "codigo_produto_supra", "codigo_plano_pagamento",
+        "descricao_fator_comissao", "valor_produto", "comissao_aplicada",
+        "peso_liquido", "frete_kg", "markup", "calcula_st",
+        "preco", "peso", "peso_bruto", "ipi", "icms", "iva_st",
+    ])
+    # Produto/imposto duplicado: vale o último, como nos dicionários do worker antigo
+    return df.drop_duplicates("id_linha", keep="last").reset_index(drop=True)
+
+
+def _float(serie: pd.Series) -> np.ndarray:
+    return np.array([float(v) if v is not None and not pd.isna(v) else 0.0 for v in serie], dtype=float)
+
+
+def calcular_lote(
+    df: pd.DataFrame,
+    mapa_condicoes: Dict[str, float],
+    mapa_descontos: Dict[str, float],
+) -> pd.DataFrame:
+    """
+    Recalcula as linhas carregadas por carregar_linhas. Linhas cuja condição de pagamento
+    não existe (ou está inativa) saem com `ignorada=True` e não devem ser gravadas.
+    """
+    out = pd.DataFrame({
+        "id_linha": df["id_linha"].to_numpy(),
+        "id_tabela": df["id_tabela"].to_numpy(),
+        "codigo_produto_supra": df["codigo_produto_supra"].to_numpy(),
+        "codigo_plano_pagamento": df["codigo_plano_pagamento"].to_numpy(),
+    })
+    if df.empty:
+        out["ignorada"] = pd.Series(dtype=bool)
+        return out
+
+    valor_antigo = _float(df["valor_produto"])
+    comissao_antiga = _float(df["comissao_aplicada"])
+    peso_antigo = _float(df["peso_liquido"])
+
+    # --- DESCONTO / FATOR --- (fallback: fator implícito na própria linha)
+    descs = df["descricao_fator_comissao"]
+    fatores = descs.map({v: _resolver_chave(v, mapa_descontos) for v in descs.unique()})
+    fallback = np.divide(comissao_antiga, valor_antigo, out=np.zeros_like(valor_antigo), where=valor_antigo > 0)
+    fator_comissao = np.where(fatores.isna(), fallback, fatores.astype(float).fillna(0.0))
+
+    # --- CONDIÇÃO DE PAGAMENTO ---
+    planos = df["codigo_plano_pagamento"]
+    taxas = planos.map({v: _resolver_chave(v, mapa_condicoes) for v in planos.unique()})
+    ignorada = taxas.isna().to_numpy()
+    taxa_condicao = taxas.astype(float).fillna(0.0).to_numpy()
+
+    # Dados novos
+    novo_valor = _float(df["preco"])
+    peso_bruto = _float(df["peso_bruto"])
+    peso_liquido_prod = _float(df["peso"])
+    peso_para_frete = np.where(peso_bruto > 0, peso_bruto, peso_liquido_prod)
+    peso_para_frete = np.where(peso_para_frete <= 0, peso_antigo, peso_para_frete)
+
+    # Lógica comercial
+    nova_comissao = novo_valor * fator_comissao
+    novo_liquido = np.maximum(0.0, novo_valor - nova_comissao)
+    novo_ajuste = novo_liquido * taxa_condicao
+    preco_fiscal_unit = novo_liquido + novo_ajuste
+
+    # Frete da linha é sempre R$/tonelada: recalcula o R$ com o peso atual
+    frete_kg = _float(df["frete_kg"])
+    frete_total = (frete_kg / 1000.0) * peso_para_frete
+
+    # Lógica fiscal
+    ipi = [v if v is not None and not pd.isna(v) else 0.0 for v in df["ipi"]]
+    icms = [v if v is not None and not pd.isna(v) else 0.0 for v in df["icms"]]
+    iva = [v if v is not None and not pd.isna(v) else 0.0 for v in df["iva_st"]]
+    fiscal = calcular_linhas_fiscal(
+        preco_fiscal_unit, frete_total, ipi, icms, iva, df["calcula_st"].fillna(False).astype(bool).to_numpy()
+    )
+
+    # Lógica de markup
+    factor = 1.0 + (_float(df["markup"]) / 100.0)
+    total_comercial = fiscal["total_com_st"].astype(float) / 100.0
+    total_sem_frete = np.maximum(0.0, total_comercial - frete_total)
+
+    out["valor_produto"] = novo_valor
+    out["peso_liquido"] = np.where(peso_liquido_prod > 0, peso_liquido_prod, peso_antigo)
+    out["comissao_aplicada"] = nova_comissao
+    out["ajuste_pagamento"] = novo_ajuste
+    out["valor_frete_aplicado"] = _round_py(frete_total, 4)
+    out["valor_frete"] = _round_py(total_comercial, 2)
+    out["valor_s_frete"] = _round_py(total_sem_frete, 2)
+    out["ipi"] = fiscal["ipi"].astype(float) / 100.0
+    out["icms_st"] = fiscal["icms_proprio"].astype(float) / 100.0
+    out["iva_st"] = fiscal["base_st"].astype(float) / 100.0
+    out["valor_final_markup"] = _round_py(total_comercial * factor, 2)
+    out["valor_s_frete_markup"] = _round_py(total_sem_frete * factor, 2)
+    out["ignorada"] = ignorada
+    return out
+
+
+COLUNAS_GRAVADAS = (
+    "valor_produto", "peso_liquido", "comissao_aplicada", "ajuste_pagamento",
+    "valor_frete_aplicado", "valor_frete", "valor_s_frete", "ipi", "icms_st", "iva_st",
+    "valor_final_markup", "valor_s_frete_markup",
+)
+
+
+def gravar_lote(db: Session, resultado: pd.DataFrame, lote: int = LOTE_UPDATE) -> int:
+    """Grava as linhas não ignoradas com UPDATE ... FROM (VALUES ...). Não faz commit."""
+    linhas = resultado[~resultado["ignorada"]]
+    registros = linhas[["id_linha", *COLUNAS_GRAVADAS]].to_dict("records")
+    set_sql = ",\n            ".join(f"{c} = CAST(v.{c} AS NUMERIC)" for c in COLUNAS_GRAVADAS)
+    colunas_v = ", ".join(("id_linha", *COLUNAS_GRAVADAS))
+
+    for ini in range(0, len(registros), lote):
+        bloco = registros[ini:ini + lote]
+        params = {}
+        valores = []
+        for i, reg in enumerate(bloco):
+            marcadores = []
+            for c in ("id_linha", *COLUNAS_GRAVADAS):
+                params[f"{c}_{i}"] = int(reg[c]) if c == "id_linha" else float(reg[c])
+                marcadores.append(f":{c}_{i}")
+            valores.append(f"({', '.join(marcadores)})")
+        db.execute(text(f"""
+            UPDATE tb_tabela_preco AS t SET
+            {set_sql}
+            FROM (VALUES {", ".join(valores)}) AS v ({colunas_v})
+            WHERE t.id_linha = v.id_linha
+        """), params)
+    return len(registros)
@@ -0,0 +1,116 @@
+# services/referencias_cache.py
+"""
+Cache por processo dos dados de referência usados na precificação.
+
+Condições de pagamento, descontos, grupos de produto, validade global e flags de ST dos
+clientes mudam poucas vezes por mês, mas eram consultados a cada requisição. Os valores
+ficam em memória com TTL; as rotas de cadastro (system_tables, catalogo_referencias,
+clientes, produtos) chamam `invalidar_referencias()` / `invalidar_st_clientes()` após o commit.
+
+Como o cache é por processo, outras instâncias só enxergam a mudança quando o TTL vence.
+"""
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from core.cache import TTLCache
+
+logger = logging.getLogger("ordersync.referencias_cache")
+
+TTL_REFERENCIAS = 300
+TTL_ST_CLIENTE = 300
+
+_cache = TTLCache(ttl_seconds=TTL_REFERENCIAS, maxsize=32)
+_cache_st = TTLCache(ttl_seconds=TTL_ST_CLIENTE, maxsize=4096)
+
+FLAGS_SIM = ("SIM", "YES", "TRUE", "S", "1")
+FLAGS_NAO = ("NAO", "NO", "FALSE", "N", "0")
+
+
+def invalidar_referencias() -> None:
+    """Descarta condições, descontos, grupos e validade global em cache."""
+    _cache.clear()
+
+
+def invalidar_st_clientes() -> None:
+    """Descarta as flags de ST dos clientes em cache."""
+    _cache_st.clear()
+
+
+def condicoes_pagamento_ativas(db: Session) -> List[Dict]:
+    """[{codigo_prazo, prazo, taxa_condicao}] das condições ativas, ordenadas por código."""
+    def carregar():
+        rows = db.execute(text("""
+            SELECT codigo_prazo, prazo, custo as taxa_condicao
+            FROM t_condicoes_pagamento
+            WHERE ativo IS TRUE
+            ORDER BY codigo_prazo
+        """)).mappings().all()
+        return [dict(r) for r in rows]
+    return _cache.get_or_set("condicoes_pagamento", carregar)
+
+
+def descontos_ativos(db: Session) -> List[Dict]:
+    """[{id_desconto, fator_comissao}] dos descontos ativos, ordenados por código."""
+    def carregar():
+        rows = db.execute(text("""
+            SELECT id_desconto, fator_comissao
+            FROM t_desconto
+            WHERE ativo IS TRUE
+            ORDER BY id_desconto
+        """)).mappings().all()
+        return [dict(r) for r in rows]
+    return _cache.get_or_set("descontos", carregar)
+
+
+def grupos_produto(db: Session) -> List[str]:
+    """Marcas (grupos) distintas dos produtos ativos."""
+    def carregar():
+        rows = db.execute(text("""
+            SELECT DISTINCT trim(marca) AS grupo
+            FROM t_cadastro_produto_v2
+            WHERE marca IS NOT NULL AND trim(marca) != '' AND status_produto = 'ATIVO'
+            ORDER BY trim(marca)
+        """)).fetchall()
+        return [r.grupo for r in rows]
+    return _cache.get_or_set("grupos_produto", carregar)
+
+
+def validade_global(db: Session) -> Optional[date]:
+    """Maior validade_tabela entre os produtos ativos (None se não houver)."""
+    def carregar():
+        return db.execute(text("""
+            SELECT MAX(CAST(p.validade_tabela AS DATE)) AS max_validade
+            FROM t_cadastro_produto_v2 p
+            WHERE p.status_produto = 'ATIVO'
+        """)).scalar()
+    return _cache.get_or_set("validade_global", carregar)
+
+
+def cliente_calcula_st_flag(db: Session, codigo_cliente: str) -> bool:
+    """
+    Flag de ST do cliente: ultimas_compras_cliente_calcula_st explícito (SIM/NAO),
+    senão ramo Revenda/Distribuidora. Cliente inexistente -> False.
+    """
+    cod = str(codigo_cliente).strip()
+
+    def carregar():
+        row = db.execute(text("""
+            SELECT ultimas_compras_cliente_calcula_st as calcula_st_flag, cadastro_tipo_cliente as ramo
+            FROM t_cadastro_cliente_v2
+            WHERE cadastro_codigo_da_empresa = :cod
+            LIMIT 1
+        """), {"cod": cod}).mappings().first()
+        if not row:
+            return False
+        flag = str(row.get("calcula_st_flag") or "").strip().upper()
+        if flag in FLAGS_SIM:
+            return True
+        if flag in FLAGS_NAO:
+            return False
+        ramo = str(row.get("ramo") or "").strip().upper()
+        return "REVENDA" in ramo or "DISTRIBUIDORA" in ramo
+    return _cache_st.get_or_set(cod, carregar)
@@ -0,0 +1,179 @@
+# services/relatorio_vendas_export.py
+"""
+Exportação em streaming dos relatórios de vendas (por cliente e por produto) em CSV e XLSX.
+
+As linhas vêm do banco por cursor do lado do servidor (`yield_per`: no Postgres, cursor
+nomeado lido de LOTE_EXPORTACAO em LOTE_EXPORTACAO) e são emitidas conforme chegam, então a
+memória fica constante qualquer que seja o período. O CSV sai com o mesmo layout da
+exportação feita no navegador (separador ";", BOM UTF-8, decimais com vírgula e linha de
+TOTAL ACUMULADO) e o primeiro bloco — cabeçalho — é enviado antes mesmo da consulta rodar.
+
+O XLSX usa o modo write-only do openpyxl (as linhas vão para um arquivo temporário, não
+ficam em memória); como o formato é um zip com índice no fim, o arquivo só é enviado
+depois de montado, em blocos de BLOCO_ARQUIVO bytes.
+"""
+import logging
+import math
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from openpyxl import Workbook
+from sqlalchemy import text
+
+from database import SessionLocal
+
+logger = logging.getLogger("ordersync.relatorios")
+
+LOTE_EXPORTACAO = 2000
+BLOCO_ARQUIVO = 64 * 1024
+
+# (campo da consulta, cabeçalho, tipo) — tipos: texto, data, peso, qtd, valor
+Coluna = Tuple[str, str, str]
+
+COLUNAS_VENDAS_CLIENTE: List[Coluna] = [
+    ("numero_pedido", "Nº Pedido Sistema", "texto"),
+    ("pedido_supra", "Pedido Supra", "texto"),
+    ("danfe", "Danfe", "texto"),
+    ("data_faturamento", "Data Faturamento", "data"),
+    ("codigo_cliente", "Código Cliente", "texto"),
+    ("cliente", "Cliente", "texto"),
+    ("nome_fantasia", "Nome Fantasia", "texto"),
+    ("municipio", "Município", "texto"),
+    ("peso_liquido", "Peso Líquido (kg)", "peso"),
+    ("valor_sem_frete", "Valor Sem Frete", "valor"),
+    ("valor_com_frete", "Valor Com Frete", "valor"),
+]
+
+COLUNAS_VENDAS_PRODUTOS: List[Coluna] = [
+    ("codigo_produto", "Código Produto", "texto"),
+    ("produto", "Produto", "texto"),
+    ("embalagem", "Embalagem", "texto"),
+    ("peso_liquido_unitario", "Peso Líq. Unit. (kg)", "peso"),
+    ("quantidade", "Quantidade", "qtd"),
+    ("peso_liquido_acumulado", "Peso Líq. Acumulado (kg)", "peso"),
+    ("valor_sem_frete", "Valor Sem Frete", "valor"),
+    ("valor_com_frete", "Valor Com Frete", "valor"),
+]
+
+# Colunas somadas na linha de TOTAL ACUMULADO (as mesmas da tela)
+COLUNAS_TOTAL = ("peso_liquido", "peso_liquido_acumulado", "valor_sem_frete", "valor_com_frete")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def linhas_relatorio(sql: str, params: Dict, lote: int = LOTE_EXPORTACAO) -> Iterator[Dict]:
+    """
+    Executa a consulta com cursor do lado do servidor e devolve as linhas uma a uma.
+    Abre a própria sessão: o gerador roda durante o envio da resposta, depois que a
+    sessão da requisição (get_db) já foi fechada.
+    """
+    db = SessionLocal()
+    try:
+        resultado = db.execute(text(sql), params, execution_options={"yield_per": lote})
+        for linha in resultado.mappings():
+            yield linha
+    finally:
+        db.close()
+
+
+# ---------------- CSV ----------------
+
+def _texto_csv(valor) -> str:
+    if valor is None or valor == "":
+        return "-"
+    return str(valor).replace(";", ",").replace('"', '""').strip()
+
+
+def _data_csv(valor) -> str:
+    if not valor:
+        return "-"
+    partes = str(valor)[:10].split("-")
+    return "/".join(reversed(partes)) if len(partes) == 3 else str(valor)
+
+
+def _numero_csv(valor, tipo: str) -> str:
+    n = float(valor or 0)
+    if tipo == "peso":
+        return str(math.floor(n + 0.5))  # como o Math.round da exportação do navegador
+    if tipo == "valor":
+        return f"{n:.2f}".replace(".", ",")
+    return str(int(n)) if n.is_integer() else repr(n).replace(".", ",")
+
+
+def _celula_csv(valor, tipo: str) -> str:
+    if tipo == "texto":
+        return _texto_csv(valor)
+    if tipo == "data":
+        return _data_csv(valor)
+    return _numero_csv(valor, tipo)
+
+
+def _linha_csv(celulas: Iterable[str]) -> str:
+    return ";".join(f'"{c}"' for c in celulas) + "\n"
+
+
+def gerar_csv(linhas: Iterable[Dict], colunas: List[Coluna], lote: int = LOTE_EXPORTACAO) -> Iterator[bytes]:
+    """CSV no layout da exportação do navegador, emitido em blocos de `lote` linhas."""
+    yield ("\ufeff" + "#;" + ";".join(cab for _, cab, _ in colunas) + "\n").encode("utf-8")
+
+    totais = {campo: 0.0 for campo, _, _ in colunas if campo in COLUNAS_TOTAL}
+    bloco: List[str] = []
+    n = 0
+    for n, linha in enumerate(linhas, start=1):
+        for campo in totais:
+            totais[campo] += float(linha[campo] or 0)
+        bloco.append(_linha_csv([str(n), *(_celula_csv(linha[campo], tipo) for campo, _, tipo in colunas)]))
+        if len(bloco) >= lote:
+            yield "".join(bloco).encode("utf-8")
+            bloco = []
+
+    total = ["TOTAL ACUMULADO"] + [
+        _numero_csv(totais[campo], tipo) if campo in totais else "" for campo, _, tipo in colunas
+    ]
+    bloco.append(_linha_csv(total))
+    yield "".join(bloco).encode("utf-8")
+    logger.info(f"Exportação CSV concluída: {n} linhas")
+
+
+# ---------------- XLSX ----------------
+
+def _celula_xlsx(valor, tipo: str):
+    if tipo in ("texto", "data"):
+        return valor
+    return float(valor or 0)
+
+
+def gerar_xlsx(linhas: Iterable[Dict], colunas: List[Coluna], titulo: str) -> Iterator[bytes]:
+    """Planilha em modo write-only (linhas em disco) enviada em blocos depois de montada."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titulo[:31])
+    ws.append(["#", *(cab for _, cab, _ in colunas)])
+
+    totais = {campo: 0.0 for campo, _, _ in colunas if campo in COLUNAS_TOTAL}
+    n = 0
+    for n, linha in enumerate(linhas, start=1):
+        for campo in totais:
+            totais[campo] += float(linha[campo] or 0)
+        ws.append([n, *(_celula_xlsx(linha[campo], tipo) for campo, _, tipo in colunas)])
+    ws.append(["TOTAL ACUMULADO", *(totais.get(campo) for campo, _, _ in colunas)])
+
+    with tempfile.TemporaryFile() as arquivo:
+        wb.save(arquivo)
+        arquivo.seek(0)
+        while True:
+            bloco = arquivo.read(BLOCO_ARQUIVO)
+            if not bloco:
+                break
+            yield bloco
+    logger.info(f"Exportação XLSX concluída: {n} linhas")
+
+
+def exportar(formato: str, sql: str, params: Dict, colunas: List[Coluna], titulo: str) -> Iterator[bytes]:
+    """Gerador do corpo da resposta no formato pedido ('csv' ou 'xlsx')."""
+    linhas = linhas_relatorio(sql, params)
+    if formato == "xlsx":
+        return gerar_xlsx(linhas, colunas, titulo)
+    return gerar_csv(linhas, colunas)
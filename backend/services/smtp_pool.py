@@ -0,0 +1,186 @@
+# services/smtp_pool.py
+"""
+Pool de conexões SMTP reaproveitáveis (por processo).
+
+Abrir conexão custa TCP + TLS + AUTH; antes isso acontecia a cada e-mail (2 por pedido).
+O pool mantém conexões autenticadas ociosas por até `ociosidade_max` segundos, testa com
+NOOP as que ficaram paradas mais de `intervalo_noop` e reabre a conexão quando o servidor
+derrubou a sessão. Usado por email_service (e portanto pelo worker), prospeccao_service
+e daily_digest.
+"""
+import logging
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Iterable, Optional, Tuple
+
+logger = logging.getLogger("ordersync.smtp_pool")
+
+# Erros que indicam conexão morta (vale descartar e tentar com uma nova). Não inclui OSError:
+# smtplib.SMTPException herda de OSError, e erros de protocolo (destinatário recusado,
+# autenticação, dados) não melhoram com outra conexão.
+ERROS_CONEXAO = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+
+def _chave_cfg(cfg_smtp) -> Tuple:
+    """Identifica a configuração: mudou host/porta/usuário/senha/TLS, não reaproveita conexão antiga."""
+    return (
+        (cfg_smtp.smtp_host or "").strip(),
+        int(cfg_smtp.smtp_port),
+        (cfg_smtp.smtp_user or "").strip(),
+        cfg_smtp.smtp_senha or "",
+        bool(getattr(cfg_smtp, "usar_tls", True)),
+    )
+
+
+class _Conexao:
+    __slots__ = ("server", "chave", "criada_em", "usada_em")
+
+    def __init__(self, server, chave):
+        self.server = server
+        self.chave = chave
+        self.criada_em = self.usada_em = time.monotonic()
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        abrir: Optional[Callable] = None,
+        max_conexoes: int = 4,
+        ociosidade_max: float = 60.0,
+        intervalo_noop: float = 10.0,
+        idade_max: float = 900.0,
+    ):
+        self._abrir = abrir
+        self.max_conexoes = max_conexoes
+        self.ociosidade_max = ociosidade_max
+        self.intervalo_noop = intervalo_noop
+        self.idade_max = idade_max
+        self._livres: Deque[_Conexao] = deque()
+        self._lock = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(max_conexoes)
+        self.conexoes_abertas = 0  # total de handshakes feitos (diagnóstico/testes)
+
+    # ---------------- internos ----------------
+    def _nova(self, cfg_smtp, chave) -> _Conexao:
+        abrir = self._abrir
+        if abrir is None:
+            from services.email_service import _abrir_conexao as abrir
+        server = abrir(cfg_smtp)
+        with self._lock:
+            self.conexoes_abertas += 1
+        return _Conexao(server, chave)
+
+    @staticmethod
+    def _fechar(conn: _Conexao) -> None:
+        try:
+            conn.server.quit()
+        except Exception:
+            try:
+                conn.server.close()
+            except Exception:
+                pass
+
+    def _saudavel(self, conn: _Conexao, agora: float) -> bool:
+        if agora - conn.criada_em > self.idade_max or agora - conn.usada_em > self.ociosidade_max:
+            return False
+        if agora - conn.usada_em > self.intervalo_noop:
+            try:
+                codigo, _ = conn.server.noop()
+                return codigo == 250
+            except Exception:
+                return False
+        return True
+
+    def _pegar(self, cfg_smtp) -> _Conexao:
+        chave = _chave_cfg(cfg_smtp)
+        descartar = []
+        escolhida = None
+        with self._lock:
+            # LIFO: a conexão usada por último é a com menor chance de ter caído
+            while self._livres:
+                conn = self._livres.pop()
+                if conn.chave == chave:
+                    escolhida = conn
+                    break
+                descartar.append(conn)
+        for conn in descartar:
+            self._fechar(conn)
+        if escolhida is not None and self._saudavel(escolhida, time.monotonic()):
+            return escolhida
+        if escolhida is not None:
+            self._fechar(escolhida)
+        return self._nova(cfg_smtp, chave)
+
+    def _devolver(self, conn: _Conexao) -> None:
+        conn.usada_em = time.monotonic()
+        with self._lock:
+            self._livres.append(conn)
+
+    # ---------------- API ----------------
+    @contextmanager
+    def conexao(self, cfg_smtp, timeout: float = 60.0):
+        """
+        Empresta uma conexão autenticada. Se o bloco levantar erro de conexão, ela é
+        descartada; caso contrário volta para o pool.
+        """
+        if not self._vagas.acquire(timeout=timeout):
+            raise TimeoutError("Pool SMTP sem conexões disponíveis")
+        try:
+            conn = self._pegar(cfg_smtp)
+            try:
+                yield conn.server
+            except ERROS_CONEXAO:
+                self._fechar(conn)
+                raise
+            except smtplib.SMTPException:
+                # Erro de protocolo (destinatário recusado etc.): a sessão segue válida após RSET
+                try:
+                    conn.server.rset()
+                    self._devolver(conn)
+                except Exception:
+                    self._fechar(conn)
+                raise
+            except BaseException:
+                self._fechar(conn)
+                raise
+            else:
+                self._devolver(conn)
+        finally:
+            self._vagas.release()
+
+    def enviar(self, cfg_smtp, remetente: str, destinatarios: Iterable[str], mensagem: str) -> None:
+        """sendmail com uma nova tentativa (em conexão nova) se a conexão reaproveitada caiu."""
+        destinatarios = list(destinatarios)
+        try:
+            with self.conexao(cfg_smtp) as server:
+                server.sendmail(remetente, destinatarios, mensagem)
+        except ERROS_CONEXAO as e:
+            logger.warning(f"Conexão SMTP perdida ({e}); reenviando em nova conexão.")
+            with self.conexao(cfg_smtp) as server:
+                server.sendmail(remetente, destinatarios, mensagem)
+
+    def fechar_todas(self) -> None:
+        with self._lock:
+            livres = list(self._livres)
+            self._livres.clear()
+        for conn in livres:
+            self._fechar(conn)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._livres)
+
+
+pool = SMTPPool()
+
+
+def enviar_email(cfg_smtp, remetente: str, destinatarios: Iterable[str], mensagem: str) -> None:
+    pool.enviar(cfg_smtp, remetente, destinatarios, mensagem)
+
+
+def fechar_pool() -> None:
+    pool.fechar_todas()
@@ -5,6 +5,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from models.tabela_preco import TabelaPreco as TabelaPrecoModel
+from services.referencias_cache import cliente_calcula_st_flag
 import logging
 import re
 
@@ -12,24 +13,8 @@ def cliente_calcula_st(db: Session, codigo_cliente: str | None) -> bool:
     if not codigo_cliente:
         return False
     try:
-        # Busca ativamente no cadastro de clientes
-        row = db.execute(text("""
-            SELECT ultimas_compras_cliente_calcula_st as calcula_st_flag, cadastro_tipo_cliente as ramo
-            FROM t_cadastro_cliente_v2
-            WHERE cadastro_codigo_da_empresa = :cod
-            LIMIT 1
-        """), {"cod": str(codigo_cliente).strip()}).mappings().first()
-        if not row:
-            return False
-        flag = str(row.get("calcula_st_flag") or "").strip().upper()
-        if flag in ["SIM", "YES", "TRUE", "S", "1"]:
-            return True
-        elif flag in ["NAO", "NO", "FALSE", "N", "0"]:
-            return False
-        # Fallback to Ramo
-        ramo = str(row.get("ramo") or "").strip().upper()
-        if "REVENDA" in ramo or "DISTRIBUIDORA" in ramo:
-            return True
+        # Cadastro do cliente (flag explícita ou fallback pelo ramo), com cache por TTL
+        return cliente_calcula_st_flag(db, codigo_cliente)
     except Exception as e:
         logger.error("Erro ao verificar calcula_st do cliente: %s", e)
     return False
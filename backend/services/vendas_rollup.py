@@ -0,0 +1,195 @@
+# services/vendas_rollup.py
+"""
+Rollup diário de vendas lido pelos dashboards.
+
+Duas granularidades, ambas por dia de criação do pedido (created_at::date):
+- tb_vendas_diario:         (dia, fornecedor, status, municipio) -> métricas de cabeçalho do pedido
+- tb_vendas_produto_diario: (dia, fornecedor, status, municipio, codigo, nome, familia) -> métricas dos itens
+
+As rotinas que alteram pedidos chamam `atualizar_rollup_pedidos` antes do commit, e só os
+dias afetados são recalculados (DELETE + INSERT ... SELECT do dia). `reconstruir_rollup`
+refaz tudo; é usado na criação das tabelas e no job noturno, que também absorve mudanças
+indiretas (ex.: município alterado no cadastro do cliente).
+"""
+import logging
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.captacao_snapshot import marcar_pedidos
+
+logger = logging.getLogger("ordersync.vendas_rollup")
+
+ROLLUP_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.tb_vendas_diario (
+        dia DATE NOT NULL,
+        fornecedor VARCHAR,
+        status VARCHAR,
+        municipio VARCHAR,
+        qtd_pedidos INTEGER NOT NULL DEFAULT 0,
+        qtd_com_valor INTEGER NOT NULL DEFAULT 0,
+        qtd_valor_positivo INTEGER NOT NULL DEFAULT 0,
+        total_pedido NUMERIC NOT NULL DEFAULT 0,
+        total_valor_positivo NUMERIC NOT NULL DEFAULT 0,
+        valor_sem_frete NUMERIC NOT NULL DEFAULT 0,
+        frete_total NUMERIC NOT NULL DEFAULT 0,
+        peso_total_kg NUMERIC NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tb_vendas_diario_dia ON public.tb_vendas_diario (dia)",
+    """
+    CREATE TABLE IF NOT EXISTS public.tb_vendas_produto_diario (
+        dia DATE NOT NULL,
+        fornecedor VARCHAR,
+        status VARCHAR,
+        municipio VARCHAR,
+        codigo VARCHAR,
+        nome VARCHAR,
+        familia VARCHAR,
+        quantidade NUMERIC NOT NULL DEFAULT 0,
+        subtotal_sem_f NUMERIC NOT NULL DEFAULT 0,
+        subtotal_com_f NUMERIC NOT NULL DEFAULT 0,
+        peso_kg NUMERIC NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tb_vendas_produto_diario_dia ON public.tb_vendas_produto_diario (dia)",
+]
+
+# Cliente deduplicado por código para não multiplicar pedidos quando há cadastros repetidos
+_CLIENTE_MUNICIPIO_JOIN = """
+    LEFT JOIN (
+        SELECT DISTINCT ON (cadastro_codigo_da_empresa)
+               cadastro_codigo_da_empresa,
+               COALESCE(faturamento_municipio, entrega_municipio) AS municipio
+        FROM public.t_cadastro_cliente_v2
+        WHERE cadastro_codigo_da_empresa IS NOT NULL AND cadastro_codigo_da_empresa != ''
+        ORDER BY cadastro_codigo_da_empresa, id DESC
+    ) c ON c.cadastro_codigo_da_empresa::text = p.codigo_cliente
+"""
+
+_INSERT_PEDIDOS_SQL = f"""
+    INSERT INTO public.tb_vendas_diario (
+        dia, fornecedor, status, municipio,
+        qtd_pedidos, qtd_com_valor, qtd_valor_positivo,
+        total_pedido, total_valor_positivo, valor_sem_frete, frete_total, peso_total_kg
+    )
+    SELECT
+        p.created_at::date,
+        p.fornecedor,
+        p.status,
+        COALESCE(c.municipio, 'Sem Município'),
+        COUNT(p.id_pedido),
+        COUNT(p.total_pedido),
+        COUNT(CASE WHEN p.total_pedido > 0 THEN 1 END),
+        COALESCE(SUM(p.total_pedido), 0),
+        COALESCE(SUM(CASE WHEN p.total_pedido > 0 THEN p.total_pedido END), 0),
+        COALESCE(SUM(GREATEST(CAST(p.total_pedido AS NUMERIC) - COALESCE(CAST(p.frete_total AS NUMERIC), 0), 0)), 0),
+        COALESCE(SUM(p.frete_total), 0),
+        COALESCE(SUM(p.peso_total_kg), 0)
+    FROM public.tb_pedidos p
+    {_CLIENTE_MUNICIPIO_JOIN}
+    WHERE p.created_at IS NOT NULL {{filtro_dias}}
+    GROUP BY 1, 2, 3, 4
+"""
+
+_INSERT_ITENS_SQL = f"""
+    INSERT INTO public.tb_vendas_produto_diario (
+        dia, fornecedor, status, municipio, codigo, nome, familia,
+        quantidade, subtotal_sem_f, subtotal_com_f, peso_kg
+    )
+    SELECT
+        p.created_at::date,
+        p.fornecedor,
+        p.status,
+        COALESCE(c.municipio, 'Sem Município'),
+        i.codigo,
+        i.nome,
+        pr.familia,
+        COALESCE(SUM(i.quantidade), 0),
+        COALESCE(SUM(i.subtotal_sem_f), 0),
+        COALESCE(SUM(i.subtotal_com_f), 0),
+        COALESCE(SUM(CAST(i.peso_kg AS NUMERIC) * CAST(i.quantidade AS NUMERIC)), 0)
+    FROM public.tb_pedidos_itens i
+    JOIN public.tb_pedidos p ON i.id_pedido = p.id_pedido
+    LEFT JOIN public.t_cadastro_produto_v2 pr ON i.codigo = pr.codigo_supra
+    {_CLIENTE_MUNICIPIO_JOIN}
+    WHERE p.created_at IS NOT NULL {{filtro_dias}}
+    GROUP BY 1, 2, 3, 4, 5, 6, 7
+"""
+
+
+def dias_dos_pedidos(db: Session, ids_pedido: Iterable[int]) -> Set[date]:
+    """Dias (created_at::date) dos pedidos informados. Chamar ANTES de apagar pedidos."""
+    ids = [int(i) for i in ids_pedido if i is not None]
+    if not ids:
+        return set()
+    rows = db.execute(text("""
+        SELECT DISTINCT created_at::date
+        FROM public.tb_pedidos
+        WHERE id_pedido = ANY(:ids) AND created_at IS NOT NULL
+    """), {"ids": ids}).scalars().all()
+    return {d.date() if isinstance(d, datetime) else d for d in rows}
+
+
+def atualizar_rollup_dias(db: Session, dias: Iterable[date]) -> None:
+    """
+    Recalcula o rollup apenas dos dias informados, na transação corrente (sem commit).
+    Roda em SAVEPOINT: uma falha aqui é logada e não derruba a operação de negócio.
+    """
+    dias_lista: List[date] = sorted({d for d in dias if d is not None})
+    if not dias_lista:
+        return
+    try:
+        with db.begin_nested():
+            params = {"dias": dias_lista}
+            db.execute(text("DELETE FROM public.tb_vendas_diario WHERE dia = ANY(:dias)"), params)
+            db.execute(text("DELETE FROM public.tb_vendas_produto_diario WHERE dia = ANY(:dias)"), params)
+            filtro = "AND p.created_at::date = ANY(:dias)"
+            db.execute(text(_INSERT_PEDIDOS_SQL.format(filtro_dias=filtro)), params)
+            db.execute(text(_INSERT_ITENS_SQL.format(filtro_dias=filtro)), params)
+    except Exception as e:
+        logger.error(f"Falha ao atualizar rollup de vendas dos dias {dias_lista}: {e}")
+
+
+def atualizar_rollup_pedidos(db: Session, ids_pedido: Iterable[int], dias_extras: Optional[Iterable[date]] = None) -> None:
+    """Atalho: recalcula os dias dos pedidos informados (mais `dias_extras`, se houver)."""
+    ids_pedido = list(ids_pedido)
+    # Toda rotina que grava pedidos passa por aqui: avisa também o snapshot da captação
+    marcar_pedidos(ids_pedido)
+    try:
+        dias = dias_dos_pedidos(db, ids_pedido)
+    except Exception as e:
+        logger.error(f"Falha ao identificar dias do rollup de vendas: {e}")
+        return
+    if dias_extras:
+        dias |= set(dias_extras)
+    atualizar_rollup_dias(db, dias)
+
+
+def reconstruir_rollup(db: Optional[Session] = None) -> Optional[int]:
+    """
+    Reconstrói o rollup inteiro. Sem sessão informada, abre e commita a própria (uso no scheduler).
+    Devolve o número de linhas gravadas nas duas tabelas (None em caso de falha).
+    """
+    propria = db is None
+    if propria:
+        from database import SessionLocal
+        db = SessionLocal()
+    try:
+        inicio = datetime.now()
+        db.execute(text("DELETE FROM public.tb_vendas_diario"))
+        db.execute(text("DELETE FROM public.tb_vendas_produto_diario"))
+        linhas = db.execute(text(_INSERT_PEDIDOS_SQL.format(filtro_dias=""))).rowcount
+        linhas += db.execute(text(_INSERT_ITENS_SQL.format(filtro_dias=""))).rowcount
+        db.commit()
+        logger.info(f"Rollup de vendas reconstruído em {(datetime.now() - inicio).total_seconds():.1f}s ({linhas} linhas)")
+        return linhas
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Falha ao reconstruir rollup de vendas: {e}")
+    finally:
+        if propria:
+            db.close()
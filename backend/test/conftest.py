@@ -0,0 +1,26 @@
+"""
+Configuração comum dos testes.
+
+Os testes usam SQLite no lugar do Postgres. Para as tabelas saírem direto dos models
+(`Model.__table__.create(engine)` ou `Base.metadata.create_all(engine, tables=[...])`):
+- JSONB (colunas de listas do cadastro de clientes) é criado como JSON;
+- BIGINT vira INTEGER, para a chave primária BigInteger ser autoincremento (rowid) no SQLite.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import BigInteger
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_no_sqlite(tipo, compilador, **kw):
+    return "JSON"
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_no_sqlite(tipo, compilador, **kw):
+    return "INTEGER"
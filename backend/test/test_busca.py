@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from services import busca
+
+
+def _sessao():
+    engine = create_engine("sqlite://")
+    db = sessionmaker(bind=engine)()
+    db.execute(text("""
+        CREATE TABLE t_cadastro_cliente_v2 (
+            id INTEGER PRIMARY KEY, cadastro_codigo_da_empresa TEXT, cadastro_nome_cliente TEXT,
+            cadastro_nome_fantasia TEXT, cadastro_cnpj TEXT, cadastro_cpf TEXT,
+            cadastro_tipo_cliente TEXT, cadastro_markup REAL,
+            cadastro_cnpj_digitos TEXT, cadastro_cpf_digitos TEXT
+        )
+    """))
+    db.execute(text("CREATE TABLE t_cadastro_produto_v2 (id INTEGER PRIMARY KEY, codigo_supra TEXT, nome_produto TEXT, unidade TEXT, tipo TEXT)"))
+    db.execute(text("INSERT INTO t_cadastro_cliente_v2 VALUES (:id, :cod, :nome, :fant, :cnpj, NULL, :ramo, 0, :cnpj, NULL)"), [
+        {"id": 1, "cod": "100", "nome": "AGROPECUÁRIA SÃO JOÃO LTDA", "fant": "Casa do Agro", "cnpj": "07769327000171", "ramo": "Revenda"},
+        {"id": 2, "cod": "101", "nome": "JOÃO DA SILVA", "fant": None, "cnpj": "11222333000144", "ramo": "Consumidor"},
+        {"id": 3, "cod": "102", "nome": "PET SHOP SÃO JOSÉ", "fant": "Pet José", "cnpj": None, "ramo": "Revenda"},
+    ])
+    db.execute(text("INSERT INTO t_cadastro_produto_v2 VALUES (:id, :cod, :nome, 'SC', 'INSUMOS')"), [
+        {"id": 10, "cod": "5001", "nome": "RAÇÃO BOVINOS 40KG"},
+        {"id": 11, "cod": "5002", "nome": "SAL MINERAL BOVINOS"},
+        {"id": 12, "cod": "5003", "nome": "RAÇÃO CÃES ADULTO"},
+    ])
+    db.commit()
+    busca.invalidar_indices()
+    return db
+
+
+def test_normalizacao_igual_a_funcao_sql():
+    assert busca.normalizar_busca("AGROPECUÁRIA São João Ñ") == "agropecuaria sao joao n"
+    assert busca.ACENTOS in busca.BUSCA_DDL[1] and busca.SEM_ACENTO in busca.BUSCA_DDL[1]
+
+
+def test_filtro_trgm_exige_todas_as_palavras():
+    f = busca.filtro_trgm("c.busca_normalizada", "  João 10% ", "b")
+    assert f.where == "(c.busca_normalizada LIKE :b_0 AND c.busca_normalizada LIKE :b_1)"
+    assert f.params == {"b_q": "joao 10%", "b_0": "%joao%", "b_1": "%10\\%%"}
+    assert busca.filtro_trgm("x", "   ", "b") is None
+
+
+def test_fallback_em_memoria_clientes_sem_acento_e_ranqueado():
+    db = _sessao()
+    nomes = [r["nome_cliente"] for r in busca.buscar_clientes(db, "joao")]
+    assert nomes == ["JOÃO DA SILVA", "AGROPECUÁRIA SÃO JOÃO LTDA"]
+
+    assert [r["codigo"] for r in busca.buscar_clientes(db, "sao revenda")] == []
+    assert [r["codigo"] for r in busca.buscar_clientes(db, "são", ramo="Revenda")] == ["102", "100"]
+    assert [r["codigo"] for r in busca.buscar_clientes(db, "são", ramo="Revenda", limite=1, offset=1)] == ["100"]
+    # dígitos procuram no CNPJ apenas quando pedido
+    assert busca.buscar_clientes(db, "07769327") == []
+    assert [r["codigo"] for r in busca.buscar_clientes(db, "07769327", incluir_documento=True)] == ["100"]
+    assert len(busca.buscar_clientes(db, "")) == 3
+
+
+def test_fallback_em_memoria_produtos_compoe_com_sql():
+    db = _sessao()
+    f = busca.filtro_produtos(db, "racao", alias="p")
+    rows = db.execute(text(
+        f"SELECT p.codigo_supra FROM t_cadastro_produto_v2 p WHERE {f.where} ORDER BY {f.rank} DESC, p.id"
+    )).fetchall()
+    assert [r[0] for r in rows] == ["5003", "5001"]  # texto menor primeiro
+    assert busca.filtro_produtos(db, "inexistente").where == "1=0"
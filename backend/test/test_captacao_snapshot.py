@@ -0,0 +1,83 @@
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from models.cliente_v2 import ClienteModelV2
+from services.captacao_snapshot import CaptacaoSnapshot
+
+
+def _banco():
+    engine = create_engine("sqlite://")
+    ClienteModelV2.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    db.execute(text("CREATE TABLE tb_pedidos (id_pedido INTEGER PRIMARY KEY, codigo_cliente TEXT, status TEXT, created_at TIMESTAMP)"))
+    return engine, db
+
+
+def test_snapshot_calcula_linhas_e_recarrega_so_o_alterado():
+    engine, db = _banco()
+    hoje = date(2025, 6, 30)
+    db.add_all([
+        ClienteModelV2(id=1, cadastro_codigo_da_empresa="A", cadastro_nome_cliente="Alfa", cadastro_ativo=True,
+                       cadastro_periodo_de_compra="30 dias", entrega_municipio=None, faturamento_municipio="Jundiaí"),
+        ClienteModelV2(id=2, cadastro_codigo_da_empresa="B", cadastro_nome_cliente="Beta", cadastro_ativo=True,
+                       cadastro_periodo_de_compra="A cada 15", ultimas_compras_emissao="22/03/2025",
+                       elaboracao_vendedor="Ana"),
+        ClienteModelV2(id=3, cadastro_codigo_da_empresa="C", cadastro_nome_cliente="Gama", cadastro_ativo=False),
+    ])
+    db.execute(text("INSERT INTO tb_pedidos (id_pedido, codigo_cliente, status, created_at) VALUES (:i, :c, :s, :d)"), [
+        {"i": 1, "c": "A", "s": "CONFIRMADO", "d": datetime(2025, 6, 20, 15, 0)},
+        {"i": 2, "c": "A", "s": "CANCELADO", "d": datetime(2025, 6, 29, 9, 0)},
+    ])
+    db.commit()
+
+    snap = CaptacaoSnapshot()
+    linhas = snap.linhas(db, hoje)
+    assert [(l["codigo_cliente"], l["grupo_ordem"], l["status_cor"]) for l in linhas] == [
+        ("B", 1, "vermelho"), ("A", 1, "verde"), ("C", 3, "cinza"),
+    ]
+    alfa, beta = linhas[1], linhas[0]
+    assert alfa["data_ultima_compra"] == "20/06/2025" and alfa["dias_sem_comprar"] == 10
+    assert alfa["data_previsao_proxima"] == "20/07/2025" and alfa["municipio"] == "Jundiaí"
+    assert alfa["vendedor"] == "Sem Vendedor"
+    assert beta["data_ultima_compra"] == "22/03/2025" and beta["previsao_data_raw"] == date(2025, 4, 6)
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: queries.append(a[2]))
+    linhas[0].pop("previsao_data_raw")  # o chamador recebe cópias
+    assert snap.linhas(db, hoje)[0]["previsao_data_raw"] == date(2025, 4, 6)
+    assert queries == []
+
+    # novo pedido de B e cliente C reativado: só eles são relidos
+    db.execute(text("INSERT INTO tb_pedidos VALUES (3, 'B', 'CONFIRMADO', :d)"), {"d": datetime(2025, 6, 28)})
+    db.execute(text("UPDATE t_cadastro_cliente_v2 SET cadastro_ativo = 1 WHERE id = 3"))
+    db.commit()
+    snap.marcar_pedidos([3])
+    snap.marcar_clientes([3])
+    queries.clear()
+    linhas = {l["codigo_cliente"]: l for l in snap.linhas(db, hoje)}
+    assert len(queries) == 3 and all("IN (" in q for q in queries)
+    assert linhas["B"]["status_cor"] == "verde" and linhas["B"]["dias_sem_comprar"] == 2
+    assert linhas["C"]["grupo_ordem"] == 2
+
+    # virada do dia recalcula sem ir ao banco
+    queries.clear()
+    assert snap.linhas(db, hoje + timedelta(days=1))[0]["dias_sem_comprar"] == 3
+    assert queries == []
+
+
+def test_data_legada_com_ano_de_dois_digitos():
+    _, db = _banco()
+    db.add(ClienteModelV2(id=1, cadastro_codigo_da_empresa="D", cadastro_nome_cliente="Delta", cadastro_ativo=True,
+                          cadastro_periodo_de_compra="30 dias", ultimas_compras_emissao="15/06/25"))
+    db.commit()
+    assert db.execute(text("SELECT ultimas_compras_emissao_dt FROM t_cadastro_cliente_v2")).scalar() is not None
+
+    (linha,) = CaptacaoSnapshot().linhas(db, date(2025, 6, 30))
+    assert linha["data_ultima_compra"] == "15/06/2025" and linha["dias_sem_comprar"] == 15
+    assert linha["status_cor"] == "verde"
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models.cliente_v2 import ClienteModelV2, so_digitos
+from services.cliente import buscar_duplicado
+
+
+def _sessao():
+    engine = create_engine("sqlite://")
+    ClienteModelV2.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_digitos_mantidos_na_escrita():
+    assert so_digitos("07.769.327/0001-71") == "07769327000171"
+    assert so_digitos(" - ") is None and so_digitos(None) is None
+
+    db = _sessao()
+    cliente = ClienteModelV2(id=1, cadastro_nome_cliente="A", cadastro_cnpj="07.769.327/0001-71")
+    db.add(cliente)
+    db.commit()
+    assert db.execute(text("SELECT cadastro_cnpj_digitos FROM t_cadastro_cliente_v2")).scalar() == "07769327000171"
+
+    cliente.cadastro_cnpj = None
+    cliente.cadastro_cpf = "123.456.789-09"
+    db.commit()
+    assert db.execute(text(
+        "SELECT cadastro_cnpj_digitos, cadastro_cpf_digitos FROM t_cadastro_cliente_v2"
+    )).one() == (None, "12345678909")
+
+
+def test_buscar_duplicado_por_documento_formatado():
+    db = _sessao()
+    db.add_all([
+        ClienteModelV2(id=1, cadastro_codigo_da_empresa="100", cadastro_nome_cliente="A", cadastro_cnpj="07.769.327/0001-71"),
+        ClienteModelV2(id=2, cadastro_codigo_da_empresa="200", cadastro_nome_cliente="B", cadastro_cpf="12345678909"),
+    ])
+    db.commit()
+
+    campo, existente = buscar_duplicado(db, cnpj="07769327000171")
+    assert (campo, existente.id) == ("cnpj", 1)
+    campo, existente = buscar_duplicado(db, codigo=" 200 ", cpf="123.456.789-09")
+    assert (campo, existente.id) == ("codigo", 2)
+    assert buscar_duplicado(db, cpf="123.456.789-09", excluir_id=2) is None
+    assert buscar_duplicado(db, cnpj="../-") is None
+
+    plano = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM t_cadastro_cliente_v2 WHERE cadastro_cnpj_digitos = '07769327000171'"
+    )).fetchall()
+    assert any("ix_t_cadastro_cliente_v2_cadastro_cnpj_digitos" in str(linha) for linha in plano)
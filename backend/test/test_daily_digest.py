@@ -0,0 +1,86 @@
+import email
+import os
+import smtplib
+import sys
+import threading
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from models.usuario import UsuarioModel
+from models.calendario import CalendarModel, CalendarShareModel, EventModel, EventShareModel
+from services.daily_digest import executar_resumo
+
+HOJE = datetime(2025, 5, 12, 6, 0)
+
+
+def _sessao(n_usuarios):
+    engine = create_engine("sqlite://")
+    for model in (UsuarioModel, CalendarModel, CalendarShareModel, EventModel, EventShareModel):
+        model.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    for i in range(1, n_usuarios + 1):
+        db.add(UsuarioModel(id=i, nome=f"U{i}", email=f"u{i}@x.com", senha_hash="x", ativo=True,
+                            email_daily_digest=(i != 2)))
+    db.flush()
+    agendas = []
+    for i in range(1, n_usuarios + 1):
+        cal = CalendarModel(user_id=i, name=f"Agenda {i}", color="#123456")
+        db.add(cal)
+        agendas.append(cal)
+    db.flush()
+    # u1 vê a agenda do u2 (que não recebe resumo)
+    db.add(CalendarShareModel(calendar_id=agendas[1].id, shared_with_user_id=1, permission_level="read"))
+    for i, cal in enumerate(agendas):
+        if i == 3:
+            continue  # u4 sem eventos hoje
+        for h in (14, 9):
+            db.add(EventModel(calendar_id=cal.id, created_by_user_id=cal.user_id, title=f"Ev {i}-{h}",
+                              start_time=HOJE.replace(hour=h), end_time=HOJE.replace(hour=h + 1)))
+        db.add(EventModel(calendar_id=cal.id, created_by_user_id=cal.user_id, title="Amanhã",
+                          start_time=HOJE + timedelta(days=1), end_time=HOJE + timedelta(days=1, hours=1)))
+    db.commit()
+    return engine, db
+
+
+def _rodar(n_usuarios, enviar):
+    engine, db = _sessao(n_usuarios)
+    contador = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contador["n"] += 1
+
+    metricas = executar_resumo(db, "agenda@x.com", enviar, agora=HOJE, concorrencia=4, backoff_base=0)
+    return metricas, contador["n"]
+
+
+def test_resumo_em_lote_com_retentativa_por_mensagem():
+    enviados, tentativas = {}, {}
+    lock = threading.Lock()
+
+    def enviar(destino, mensagem):
+        with lock:
+            tentativas[destino] = tentativas.get(destino, 0) + 1
+            if destino == "u3@x.com" and tentativas[destino] == 1:
+                raise smtplib.SMTPServerDisconnected("caiu")
+            if destino == "u5@x.com":
+                raise smtplib.SMTPRecipientsRefused({destino: (550, b"nao existe")})
+            enviados[destino] = mensagem
+
+    metricas, queries = _rodar(6, enviar)
+    assert set(enviados) == {"u1@x.com", "u3@x.com", "u6@x.com"}
+    assert (metricas["destinatarios"], metricas["enviados"], metricas["falhas"], metricas["retentativas"]) == (4, 3, 1, 1)
+    assert tentativas["u5@x.com"] == 1  # erro permanente não é retentado
+    assert metricas["segundos_total"] >= metricas["segundos_envio"]
+
+    html = email.message_from_string(enviados["u1@x.com"]).get_payload()[0].get_payload(decode=True).decode()
+    assert "Bom dia, U1!" in html and "Amanh" not in html
+    # ordem por horário e, no mesmo horário, pelo nome da agenda
+    assert html.index("Ev 0-9") < html.index("Ev 1-9") < html.index("Ev 0-14") < html.index("Ev 1-14")
+
+    _, queries_muitos = _rodar(60, lambda destino, mensagem: None)
+    assert queries == queries_muitos == 4
@@ -0,0 +1,132 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import time
+import datetime
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from routers.dashboard import get_chart_intervals
+from services.dashboard_agregacao import agregar_por_intervalos
+
+
+def _criar_sessao_com_pedidos(n_pedidos=5000):
+    """SQLite em memória com o schema 'public' anexado, para reaproveitar o SQL do dashboard."""
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _attach_public(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS public")
+
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.execute(text("""
+        CREATE TABLE public.tb_pedidos (
+            id_pedido INTEGER PRIMARY KEY,
+            created_at TIMESTAMP,
+            status VARCHAR,
+            fornecedor VARCHAR,
+            total_pedido FLOAT
+        )
+    """))
+    rnd = random.Random(42)
+    hoje = datetime.date.today()
+    inicio = datetime.datetime(hoje.year - 1, 1, 1)
+    dias = (datetime.datetime(hoje.year + 1, 1, 1) - inicio).days
+    linhas = [
+        {
+            "id": i,
+            "dt": inicio + datetime.timedelta(days=rnd.randrange(dias), minutes=rnd.randrange(1440)),
+            "st": rnd.choice(["Orçamento", "Pedido", "Cancelado", "Faturado Supra"]),
+            "forn": rnd.choice(["SUPRA", "DISPET"]),
+            "tot": round(rnd.uniform(50, 5000), 2),
+        }
+        for i in range(1, n_pedidos + 1)
+    ]
+    db.execute(
+        text("INSERT INTO public.tb_pedidos VALUES (:id, :dt, :st, :forn, :tot)"),
+        linhas,
+    )
+    db.commit()
+    return engine, db
+
+
+def _contar_queries(engine):
+    contador = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contador["n"] += 1
+
+    return contador
+
+
+def _serie_por_intervalo(db, intervals, status):
+    """Implementação anterior: uma consulta por intervalo."""
+    labels, fat, qtd = [], [], []
+    for iv in intervals:
+        row = db.execute(text("""
+            SELECT COUNT(id_pedido) as qtd, COALESCE(SUM(total_pedido), 0) as fat
+            FROM public.tb_pedidos
+            WHERE status = :status AND created_at >= :start AND created_at < :end
+        """), {"start": iv["start"], "end": iv["end"], "status": status}).mappings().first()
+        labels.append(iv["label"])
+        fat.append(float(row["fat"]))
+        qtd.append(int(row["qtd"]))
+    return labels, fat, qtd
+
+
+def _serie_agrupada(db, intervals, status):
+    serie = agregar_por_intervalos(
+        db, intervals,
+        fonte="public.tb_pedidos",
+        coluna_data="created_at",
+        colunas="id_pedido, total_pedido",
+        metricas={"qtd": "COUNT(src.id_pedido)", "fat": "COALESCE(SUM(src.total_pedido), 0)"},
+        filtros="status = :status",
+        params={"status": status},
+    )
+    return serie["labels"], [float(v or 0) for v in serie["fat"]], [int(v or 0) for v in serie["qtd"]]
+
+
+def test_agregacao_agrupada_equivale_ao_laco_por_intervalo():
+    engine, db = _criar_sessao_com_pedidos()
+    try:
+        for periodo in ["mes", "12_meses", "trimestre", "semestre", "ytd"]:
+            intervals = get_chart_intervals(periodo)
+            lbl_a, fat_a, qtd_a = _serie_por_intervalo(db, intervals, "Pedido")
+            lbl_b, fat_b, qtd_b = _serie_agrupada(db, intervals, "Pedido")
+            assert lbl_a == lbl_b
+            assert qtd_a == qtd_b
+            assert [round(v, 2) for v in fat_a] == [round(v, 2) for v in fat_b]
+    finally:
+        db.close()
+
+
+def test_benchmark_query_count_e_latencia():
+    engine, db = _criar_sessao_com_pedidos()
+    contador = _contar_queries(engine)
+    intervals = get_chart_intervals("mes")
+    try:
+        contador["n"] = 0
+        t0 = time.perf_counter()
+        _serie_por_intervalo(db, intervals, "Pedido")
+        t_laco = time.perf_counter() - t0
+        queries_laco = contador["n"]
+
+        contador["n"] = 0
+        t0 = time.perf_counter()
+        _serie_agrupada(db, intervals, "Pedido")
+        t_agrupado = time.perf_counter() - t0
+        queries_agrupado = contador["n"]
+
+        print(
+            f"\n[benchmark] intervalos={len(intervals)} | laço: {queries_laco} queries, {t_laco * 1000:.1f} ms"
+            f" | agrupado: {queries_agrupado} query, {t_agrupado * 1000:.1f} ms"
+        )
+        assert queries_laco == len(intervals)
+        assert queries_agrupado == 1
+    finally:
+        db.close()
@@ -0,0 +1,150 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from models.produto import ProdutoV2, HistoricoEstoqueV2
+from services.estoque_import import importar_estoque_df
+
+
+def _sessao(n_produtos):
+    engine = create_engine("sqlite://")
+    db = sessionmaker(bind=engine)()
+    db.execute(text("""
+        CREATE TABLE t_cadastro_produto_v2 (
+            id INTEGER PRIMARY KEY, codigo_supra TEXT, estoque_disponivel INTEGER,
+            estoque_futuro INTEGER, nome_arquivo_estoque TEXT, updated_at TIMESTAMP
+        )
+    """))
+    db.execute(text("CREATE INDEX ix_produto_codigo ON t_cadastro_produto_v2 (codigo_supra)"))
+    db.execute(text("""
+        CREATE TABLE t_historico_estoque_v2 (
+            id INTEGER PRIMARY KEY, codigo_supra TEXT NOT NULL, nome_produto TEXT,
+            qtd_estoque INTEGER, qtd_pedido INTEGER, af_pendentes INTEGER,
+            estoque_disponivel INTEGER, estoque_futuro INTEGER,
+            data_ingestao TIMESTAMP DEFAULT CURRENT_TIMESTAMP, nome_arquivo TEXT, usuario TEXT, ativo BOOLEAN
+        )
+    """))
+    # código 1000 existe duas vezes (mesmo código em dois produtos)
+    codigos = [str(1000 + i) for i in range(n_produtos)] + ["1000"]
+    db.execute(text("INSERT INTO t_cadastro_produto_v2 (codigo_supra) VALUES (:c)"), [{"c": c} for c in codigos])
+    db.commit()
+    return engine, db
+
+
+def _planilha(n_linhas, n_produtos):
+    rnd = random.Random(7)
+    linhas = []
+    for i in range(n_linhas):
+        codigo = 1000 + rnd.randrange(int(n_produtos * 1.1))  # ~10% de códigos inexistentes
+        linhas.append([
+            codigo, f"Produto {codigo}", None, None, None,
+            rnd.choice([rnd.randrange(500), f"{rnd.randrange(500)}.0", None, "x"]),
+            rnd.randrange(100), rnd.choice([rnd.randrange(50), None]),
+        ])
+    linhas.append([None] * 8)       # linha vazia
+    linhas.append([None, "sem código", None, None, None, 1, 1, 1])
+    return pd.DataFrame(linhas, columns=["Produto", "Descrição", "C", "D", "E", "Qt. Estoque", "Qt. Pedidos", "AF Pendentes"])
+
+
+def _importar_legado(db, df, nome_arquivo, usuario):
+    """Implementação anterior: um UPDATE e um objeto de histórico por linha."""
+    success_count, not_found_codes, total_rows = 0, [], 0
+    for _, row in df.iterrows():
+        if row.isnull().all():
+            continue
+
+        def get_val(names, pos):
+            for name in names:
+                if name in row:
+                    return row[name]
+            return row.iloc[pos] if len(row) > pos else None
+
+        def safe_int(val):
+            if pd.isna(val) or val is None:
+                return 0
+            try:
+                return int(float(val))
+            except Exception:
+                return 0
+
+        codigo_raw = get_val(["Produto"], 0)
+        if pd.isna(codigo_raw) or not str(codigo_raw).strip():
+            continue
+        codigo_str = str(codigo_raw).strip()
+        total_rows += 1
+        qtd_estoque = safe_int(get_val(["Qt. Estoque"], 5))
+        qtd_pedidos = safe_int(get_val(["Qt. Pedidos"], 6))
+        af = safe_int(get_val(["AF Pendentes"], 7))
+        disp = qtd_estoque - qtd_pedidos
+        fut = disp + af
+        updated = db.query(ProdutoV2).filter(ProdutoV2.codigo_supra == codigo_str).update({
+            ProdutoV2.estoque_disponivel: disp, ProdutoV2.estoque_futuro: fut,
+            ProdutoV2.nome_arquivo_estoque: nome_arquivo,
+        }, synchronize_session=False)
+        if updated > 0:
+            success_count += updated
+        else:
+            not_found_codes.append(codigo_str)
+        nome = get_val(["Descrição"], 1)
+        db.add(HistoricoEstoqueV2(
+            codigo_supra=codigo_str, nome_produto=str(nome).strip() if not pd.isna(nome) else None,
+            qtd_estoque=qtd_estoque, qtd_pedido=qtd_pedidos, af_pendentes=af,
+            estoque_disponivel=disp, estoque_futuro=fut, nome_arquivo=nome_arquivo, usuario=usuario, ativo=True,
+        ))
+    db.flush()
+    return {"total_linhas": total_rows, "atualizados": success_count, "nao_encontrados": not_found_codes}
+
+
+def _estado(db):
+    produtos = db.execute(text(
+        "SELECT id, estoque_disponivel, estoque_futuro, nome_arquivo_estoque FROM t_cadastro_produto_v2 ORDER BY id"
+    )).fetchall()
+    historico = db.execute(text("""
+        SELECT codigo_supra, nome_produto, qtd_estoque, qtd_pedido, af_pendentes,
+               estoque_disponivel, estoque_futuro, nome_arquivo, usuario, ativo
+        FROM t_historico_estoque_v2 ORDER BY id
+    """)).fetchall()
+    return produtos, historico
+
+
+def test_importacao_em_lote_equivale_ao_laco_e_benchmark_10k():
+    n_produtos, n_linhas = 9000, 10000
+    df = _planilha(n_linhas, n_produtos)
+
+    engine_a, db_a = _sessao(n_produtos)
+    engine_b, db_b = _sessao(n_produtos)
+    contador = {"n": 0}
+
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contador["n"] += 1
+
+    event.listen(engine_a, "before_cursor_execute", _conta)
+    event.listen(engine_b, "before_cursor_execute", _conta)
+    try:
+        t0 = time.perf_counter()
+        esperado = _importar_legado(db_a, df, "estoque.xlsx", "u@x.com")
+        t_laco, queries_laco = time.perf_counter() - t0, contador["n"]
+
+        contador["n"] = 0
+        t0 = time.perf_counter()
+        obtido = importar_estoque_df(db_b, df, "estoque.xlsx", "u@x.com")
+        t_lote, queries_lote = time.perf_counter() - t0, contador["n"]
+
+        print(
+            f"\n[benchmark] linhas={n_linhas} | laço: {queries_laco} queries, {t_laco * 1000:.0f} ms"
+            f" | lote: {queries_lote} queries, {t_lote * 1000:.0f} ms"
+        )
+        assert obtido == esperado
+        assert _estado(db_a) == _estado(db_b)
+        assert esperado["nao_encontrados"] and esperado["total_linhas"] == n_linhas
+        assert queries_lote <= 20 < queries_laco
+    finally:
+        db_a.close()
+        db_b.close()
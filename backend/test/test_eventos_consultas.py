@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datetime
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from models.usuario import UsuarioModel
+from models.calendario import CalendarModel, CalendarShareModel, EventModel, EventShareModel
+from models.cliente_v2 import ClienteModelV2
+from routers.eventos import get_events
+
+
+def _sessao(n_eventos):
+    engine = create_engine("sqlite://")
+    for model in (UsuarioModel, CalendarModel, CalendarShareModel, EventModel, EventShareModel, ClienteModelV2):
+        model.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    db.execute(text("INSERT INTO t_cadastro_cliente_v2 (id, cadastro_nome_cliente, legal_celular) VALUES (1, 'Cliente A', '1199')"))
+
+    usuarios = [UsuarioModel(id=i, nome=f"U{i}", email=f"u{i}@x.com", senha_hash="x") for i in (1, 2, 3)]
+    propria = CalendarModel(user_id=1, name="Minha", color="#111111")
+    alheia = CalendarModel(user_id=2, name="Do U2", color="#222222")
+    db.add_all(usuarios + [propria, alheia])
+    db.flush()
+    db.add(CalendarShareModel(calendar_id=alheia.id, shared_with_user_id=1, permission_level="write"))
+
+    inicio = datetime.datetime(2025, 5, 1, 9)
+    for i in range(n_eventos):
+        ev = EventModel(calendar_id=propria.id if i % 2 else alheia.id, created_by_user_id=1,
+                        title=f"Visita {i}", start_time=inicio + datetime.timedelta(hours=i),
+                        end_time=inicio + datetime.timedelta(hours=i + 1), cliente_id=1 if i % 3 == 0 else None)
+        db.add(ev)
+        db.flush()
+        db.add(EventShareModel(event_id=ev.id, shared_with_user_id=2 + i % 2, permission_level="read"))
+    db.commit()
+    return engine, db, usuarios[0]
+
+
+def _consultar(n_eventos):
+    engine, db, usuario = _sessao(n_eventos)
+    db.expire_all()
+    usuario.id  # recarrega o usuário logado fora da contagem
+    contador = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contador["n"] += 1
+
+    eventos = get_events(datetime.date(2025, 5, 1), datetime.date(2025, 6, 1), db=db, current_user=usuario)
+    return eventos, contador["n"]
+
+
+def test_get_events_usa_numero_constante_de_queries():
+    poucos, queries_poucos = _consultar(3)
+    muitos, queries_muitos = _consultar(200)
+
+    assert len(poucos) == 3 and len(muitos) == 200
+    assert queries_muitos == queries_poucos <= 8
+
+    por_titulo = {e.title: e for e in muitos}
+    ev0, ev1 = por_titulo["Visita 0"], por_titulo["Visita 1"]
+    assert (ev0.calendar_name, ev0.permission_level) == ("Do U2", "write")
+    assert (ev1.calendar_name, ev1.permission_level) == ("Minha", "admin")
+    assert ev0.cliente_nome == "Cliente A" and ev0.cliente_telefone == "1199" and ev1.cliente_nome is None
+    assert [s["email"] for s in ev0.shared_with] == ["u2@x.com"]
+    assert [s["email"] for s in ev1.shared_with] == ["u3@x.com"]
@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+from decimal import Decimal
+
+from services.fiscal import CHAVES_FISCAIS, FiscalBatch, PerfilFiscal, calcular_linha, perfil_fiscal
+
+
+def _linha(res, i):
+    return {chave: res.linha(i)[chave] for chave in CHAVES_FISCAIS}
+
+
+def test_lote_igual_a_calcular_linha_com_float_e_decimal():
+    rnd = random.Random(20)
+    perfis = [
+        perfil_fiscal("PET", 10, 0.065, 0.18, 0.5834),
+        perfil_fiscal("insumos", 25, 0.065, 0.12, 0.3),    # acima de 10 kg: sem IPI
+        PerfilFiscal(Decimal("0.0325"), Decimal("0.07"), Decimal("0")),
+    ]
+    n = 3000
+    precos, fretes, linhas_perfil, aplica = [], [], [], []
+    for i in range(n):
+        precos.append(round(rnd.uniform(0, 500), rnd.choice([2, 3, 4])))
+        fretes.append(rnd.choice([0.0, round(rnd.uniform(0, 30), 3), 1.005]))
+        linhas_perfil.append(perfis[i % 3])
+        aplica.append(i % 5 != 0)
+    precos[:3] = [2.675, 0.005, 1e12]  # empates e linha fora do lote (calcular_linha)
+
+    res = FiscalBatch(precos, linhas_perfil, aplica, frete_linha=fretes).calcular()
+    decimais = FiscalBatch(
+        [Decimal(str(p)) for p in precos], linhas_perfil, aplica,
+        frete_linha=[Decimal(str(f)) for f in fretes],
+    ).calcular()
+
+    for i in range(n):
+        p = linhas_perfil[i]
+        esperado = calcular_linha(precos[i], 1, 0, fretes[i], p.ipi, p.icms, p.iva_st, aplica[i])
+        assert _linha(res, i) == esperado, i
+        assert _linha(decimais, i) == esperado, i
+    assert res.linha(2)["subtotal"] == Decimal("1000000000000.00")
+    assert perfis[1].ipi == 0 and perfis[0].ipi == Decimal("0.065")
+
+
+def test_lote_com_quantidade_desconto_e_negativos():
+    perfil = perfil_fiscal("pet", 3, "0.1", "0.18", "0.4")
+    casos = [
+        # (preco, qtd, desconto, frete, aplica_st)
+        (Decimal("19.99"), 3, Decimal("1.005"), Decimal("2.5"), True),
+        (Decimal("7.333"), Decimal("1.5"), 0, 0, True),
+        (10, 2, 25, 0, True),                 # subtotal negativo
+        (Decimal("-3.335"), 1, 0, Decimal("-0.005"), False),
+        (Decimal("0.10"), 7, Decimal("0.01"), Decimal("0.333"), True),
+    ]
+    res = FiscalBatch(
+        [c[0] for c in casos], [perfil] * len(casos), [c[4] for c in casos],
+        frete_linha=[c[3] for c in casos],
+        quantidade=[c[1] for c in casos],
+        desconto_linha=[c[2] for c in casos],
+    ).calcular()
+
+    assert len(res) == len(casos)
+    for i, (preco, qtd, desc, frete, aplica) in enumerate(casos):
+        esperado = calcular_linha(preco, qtd, desc, frete, perfil.ipi, perfil.icms, perfil.iva_st, aplica)
+        assert _linha(res, i) == esperado, i
+        assert res.reais("total_com_st")[i] == float(esperado["total_com_st"])
@@ -0,0 +1,61 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook, load_workbook
+
+from services.importacao_pedidos import (
+    _blocos, carregar_status_danfes, ler_linhas, validar_planilha,
+)
+
+
+def _planilha(caminho, linhas, com_danfes=True):
+    wb = Workbook()
+    bd = wb.active
+    bd.title = "Banco_Dados"
+    bd.append(["Relatório de pedidos"])
+    bd.append(["Código", "Nº Pedido", "Emissão", "Peso", "Valor Pedido", "Danfe", "Data Faturamento", "Retira"])
+    for l in linhas:
+        bd.append(l)
+    if com_danfes:
+        dn = wb.create_sheet("Danfes")
+        dn.append([f"c{i}" for i in range(11)])
+        dn.append([None] * 8 + [2111.0, None, "Pedido não completo"])
+    wb.save(caminho)
+    return str(caminho)
+
+
+def test_le_linhas_em_streaming_com_colunas_por_cabecalho(tmp_path):
+    caminho = _planilha(tmp_path / "p.xlsx", [
+        [237001.0, 2111, datetime(2025, 3, 10), "1.500,50", "2.000,00", 4567.0, datetime(2025, 3, 12), "Sim"],
+        [None, None, None, None, None, None, None, None],  # linha sem pedido é ignorada
+        ["99", "2025000042", None, 10, 99.9, None, None, None],
+    ])
+    layout = validar_planilha(caminho)
+    assert layout["colunas"]["pedido"] == 1
+    assert layout["colunas"]["data_danfe"] == 6
+    assert layout["total_linhas"] == 3
+
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    linhas = list(ler_linhas(wb, layout["colunas"]))
+    assert carregar_status_danfes(wb) == {"2026002111": "Pedido não completo"}
+    wb.close()
+
+    assert [l["pedido_supra"] for l in linhas] == ["2025002111", "2025000042"]
+    assert linhas[0]["codigo_cliente"] == "237001"
+    assert linhas[0]["peso"] == 1500.5 and linhas[0]["valor_pedido"] == 2000.0
+    assert linhas[0]["danfe"] == "4567"
+    assert linhas[0]["data_danfe_dt"].date() == datetime(2025, 3, 12).date()
+    assert linhas[1]["danfe"] == "" and linhas[1]["data_danfe_dt"] is None
+
+    assert [len(b) for b in _blocos(iter(range(7)), 3)] == [3, 3, 1]
+
+
+def test_planilha_sem_aba_danfes_e_rejeitada(tmp_path):
+    caminho = _planilha(tmp_path / "p.xlsx", [], com_danfes=False)
+    with pytest.raises(ValueError, match="Danfes"):
+        validar_planilha(caminho)
@@ -0,0 +1,66 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+import services.cliente as cliente_service
+from models.cliente_v2 import ClienteModelV2, parse_emissao_legada
+
+
+def _banco(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'clientes.db'}")
+    ClienteModelV2.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.execute(text("CREATE TABLE tb_pedidos (id_pedido INTEGER PRIMARY KEY, codigo_cliente TEXT, status TEXT, created_at TIMESTAMP)"))
+        db.commit()
+    monkeypatch.setattr(cliente_service, "SessionLocal", Session)
+    return engine, Session
+
+
+def test_varredura_em_lote_com_dry_run(tmp_path, monkeypatch):
+    engine, Session = _banco(tmp_path, monkeypatch)
+    agora = datetime.utcnow()
+    antigo, recente = agora - timedelta(days=400), agora - timedelta(days=10)
+    clientes = [
+        # id, código, emissão legada, data de cadastro, pedidos (status, data)
+        (1, "A1", None, antigo, [("Faturado", recente)]),              # comprou há pouco
+        (2, "A2", None, recente, [("Faturado", antigo)]),              # pedido velho decide
+        (3, "A3", None, recente, [("CANCELADO", antigo)]),             # cancelado não conta -> cadastro recente
+        (4, "A4", antigo.strftime("%d/%m/%Y"), recente, []),           # data legada velha
+        (5, "A5", "data ruim", antigo, []),                            # legado ilegível -> cadastro
+        (6, "", None, antigo, []),                                     # sem código: ignorado
+    ]
+    with Session() as db:
+        for cid, codigo, emissao, criacao, pedidos in clientes:
+            db.add(ClienteModelV2(id=cid, cadastro_codigo_da_empresa=codigo, cadastro_ativo=True,
+                                  ultimas_compras_emissao=emissao, data_criacao=criacao))
+            for status, data in pedidos:
+                db.execute(text("INSERT INTO tb_pedidos (codigo_cliente, status, created_at) VALUES (:c, :s, :d)"),
+                           {"c": codigo, "s": status, "d": data})
+        db.commit()
+    assert parse_emissao_legada("2024-03-05T10:00:00") == datetime(2024, 3, 5, 10)
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: queries.append(a[2]))
+
+    resumo = cliente_service.verificar_inatividade_clientes(dry_run=True)
+    assert (resumo["avaliados"], resumo["inativados"], resumo["sem_referencia"]) == (5, 3, 0)
+    assert resumo["por_origem"] == {"Pedido ERP Novo": 1, "Histórico ERP (Legado)": 1, "Data de Cadastro": 1}
+    assert resumo["segundos"] >= 0
+    with Session() as db:
+        assert db.execute(text("SELECT COUNT(*) FROM t_cadastro_cliente_v2 WHERE cadastro_ativo")).scalar() == 6
+
+    queries.clear()
+    resumo = cliente_service.verificar_inatividade_clientes()
+    assert resumo["inativados"] == 3 and not resumo["dry_run"]
+    assert sum(q.lstrip().upper().startswith(("WITH", "SELECT", "UPDATE")) for q in queries) == 2
+    with Session() as db:
+        inativos = db.execute(text(
+            "SELECT id FROM t_cadastro_cliente_v2 WHERE NOT cadastro_ativo AND data_inativacao IS NOT NULL ORDER BY id"
+        )).scalars().all()
+    assert inativos == [2, 4, 5]
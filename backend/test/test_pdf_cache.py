@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.requests import Request
+
+from models.pedido_pdf import PedidoPdf
+from services import pdf_cache, pdf_service
+
+
+def _pedido(total=100.0):
+    return PedidoPdf(
+        id_pedido=1, codigo_cliente="100", cliente="Cliente", data_pedido=None,
+        data_entrega_ou_retirada=None, frete_total=0, total_peso_bruto=0,
+        total_peso_liquido=0, total_valor=total, itens=[],
+    )
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_renderiza_uma_vez_por_versao_do_pedido(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_cache, "cache", pdf_cache.PdfDiskCache(str(tmp_path)))
+    chamadas = []
+
+    def fake_render(pedido, sem_validade=False):
+        chamadas.append((pedido.total_valor, sem_validade))
+        return f"%PDF {pedido.total_valor} {sem_validade}".encode()
+
+    monkeypatch.setattr(pdf_service, "gerar_pdf_pedido", fake_render)
+
+    a, etag_a = pdf_cache.obter_pdf_pedido(_pedido(), sem_validade=False)
+    b, etag_b = pdf_cache.obter_pdf_pedido(_pedido(), sem_validade=False)
+    assert a == b and etag_a == etag_b
+    assert len(chamadas) == 1
+
+    _, etag_cli = pdf_cache.obter_pdf_pedido(_pedido(), sem_validade=True)
+    _, etag_editado = pdf_cache.obter_pdf_pedido(_pedido(total=150.0))
+    assert len({etag_a, etag_cli, etag_editado}) == 3
+    assert len(chamadas) == 3
+
+
+def test_lru_remove_os_menos_usados(tmp_path):
+    c = pdf_cache.PdfDiskCache(str(tmp_path), max_bytes=3000)
+    for chave in ("a", "b", "c"):
+        c.set(chave, b"x" * 900)
+        time.sleep(0.01)
+    c.get("a")  # "a" passa a ser o mais recente
+    c.set("d", b"x" * 900)
+    assert c.get("b") is None
+    assert c.get("a") is not None and c.get("d") is not None
+
+
+def test_if_none_match_retorna_304():
+    resp = pdf_cache.resposta_pdf(_request('"abc"'), b"%PDF", "abc", "inline")
+    assert resp.status_code == 304 and resp.body == b""
+    resp = pdf_cache.resposta_pdf(_request('"outro"'), b"%PDF", "abc", "inline")
+    assert resp.status_code == 200 and resp.headers["etag"] == '"abc"'
@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Table, TableStyle
+
+from services import produto_pdf_data
+from services.produto_pdf_data import parse_lista_precos
+
+
+def _gerar_pdf(paginas, linhas_por_pagina):
+    """Lista no layout INSUMOS; a família só aparece nas páginas pares."""
+    buf = io.BytesIO()
+    elementos = [Paragraph("LISTA: INS VOTORANTIM 15   VALIDADE 01/10", getSampleStyleSheet()["Normal"])]
+    n = 0
+    for p in range(paginas):
+        dados = [[f"FAMILIA {p // 2}", "", "", ""]] if p % 2 == 0 else []
+        dados.append(["COD", "PRODUTO", "R$/TON", "R$/SC"])
+        for _ in range(linhas_por_pagina):
+            n += 1
+            dados.append([f"{1000 + n}", f"RACAO {n} (*)", f"{3 + n % 5}.{457 + n},00", f"{40 + n % 7},{n % 100:02d}"])
+        dados.append(["PRAZO 30DD", "", "", ""])
+        tabela = Table(dados)
+        tabela.setStyle(TableStyle([("GRID", (0, 0), (-1, -1), 0.5, "black")]))
+        elementos += [tabela, PageBreak()]
+    SimpleDocTemplate(buf, pagesize=A4).build(elementos)
+    return buf.getvalue()
+
+
+def test_paralelo_igual_ao_sequencial_e_cache_por_hash(monkeypatch):
+    pdf = _gerar_pdf(paginas=8, linhas_por_pagina=6)
+    produto_pdf_data._cache_parser.clear()
+
+    sequencial = parse_lista_precos(io.BytesIO(pdf), tipo_lista="INSUMOS", processos=1)
+    produto_pdf_data._cache_parser.clear()
+    paralelo = parse_lista_precos(io.BytesIO(pdf), tipo_lista="INSUMOS", processos=3)
+
+    assert len(sequencial) == 48
+    assert paralelo.equals(sequencial)
+    assert produto_pdf_data._pool._mp_context.get_start_method() != "fork"  # processo da API tem threads
+    assert sequencial["fornecedor"].unique().tolist() == ["VOTORANTIM"]
+    # 'filhos' segue a sequência da família entre páginas (página sem cabeçalho recomeça)
+    assert sequencial["filhos"].tolist()[:14] == [1, 2, 3, 4, 5, 6, 1, 2, 3, 4, 5, 6, 1, 2]
+    assert sequencial["page"].tolist()[5:7] == [1, 2]
+
+    # mesmo arquivo de novo: não relê o PDF, e o DataFrame devolvido é uma cópia
+    def _nao_deve_ler(*args, **kwargs):
+        raise AssertionError("PDF relido apesar do cache")
+
+    monkeypatch.setattr(produto_pdf_data, "_ler_pdf", _nao_deve_ler)
+    paralelo.drop(paralelo.index, inplace=True)
+    repetido = parse_lista_precos(io.BytesIO(pdf), tipo_lista="INSUMOS", processos=3)
+    assert repetido.equals(sequencial)
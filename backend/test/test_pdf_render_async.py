@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from core import worker
+from core.worker import TaskWorker
+from models.background_task import BackgroundTaskModel
+from models.pedido_pdf import PedidoPdf
+from routers import pedidos
+from services import pdf_cache, pdf_service
+
+
+def _pedido(id_pedido):
+    return PedidoPdf(
+        id_pedido=id_pedido, codigo_cliente="100", cliente="Cliente", data_pedido=None,
+        data_entrega_ou_retirada=None, frete_total=0, total_peso_bruto=0,
+        total_peso_liquido=0, total_valor=100.0, itens=[],
+    )
+
+
+def _request():
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fila.db'}", connect_args={"check_same_thread": False})
+    BackgroundTaskModel.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    renders = []
+
+    def fake_render(pedido, sem_validade=False):
+        renders.append(pedido.id_pedido)
+        return f"%PDF pedido {pedido.id_pedido}".encode()
+
+    monkeypatch.setattr(pdf_cache, "cache", pdf_cache.PdfDiskCache(str(tmp_path / "pdf")))
+    monkeypatch.setattr(pdf_service, "gerar_pdf_pedido", fake_render)
+    monkeypatch.setattr(worker, "carregar_pedido_pdf", lambda db, id_pedido: _pedido(id_pedido))
+    monkeypatch.setattr(pedidos, "SessionLocal", Session)
+    return Session, renders
+
+
+def _baixar(id_pedido, ticket, aguardar=0):
+    return asyncio.run(pedidos.baixar_pdf_renderizado(id_pedido, ticket, _request(), aguardar=aguardar))
+
+
+def test_ticket_fica_pendente_ate_o_worker_renderizar(ambiente):
+    Session, renders = ambiente
+    with Session() as db:
+        ticket = pdf_cache.enfileirar_render_pdf(db, 42)
+        db.commit()
+
+    pendente = _baixar(42, ticket)
+    assert pendente.status_code == 202 and pendente.headers["retry-after"] == "1"
+    with pytest.raises(HTTPException) as exc:
+        _baixar(43, ticket)  # ticket de outro pedido
+    assert exc.value.status_code == 404
+
+    fila = TaskWorker(session_factory=Session)
+    ids = fila._reivindicar_lote(5)
+    fila.executar_tarefa(ids[0])
+    with Session() as db:
+        task = db.query(BackgroundTaskModel).one()
+        assert task.status == "CONCLUIDO" and task.resultado["chave"].startswith("42-vendedor-")
+
+    pronto = _baixar(42, ticket)
+    assert pronto.status_code == 200
+    assert pronto.media_type == "application/pdf" and pronto.body == b"%PDF pedido 42"
+    assert pronto.headers["etag"] == f'"{task.resultado["chave"]}"'
+    assert renders == [42]  # a rota serviu do cache, sem renderizar de novo
+
+
+def test_aguardar_espera_o_worker(ambiente):
+    Session, renders = ambiente
+    with Session() as db:
+        ticket = pdf_cache.enfileirar_render_pdf(db, 7)
+        db.commit()
+
+    async def _cenario():
+        fila = TaskWorker(session_factory=Session, poll_segundos=0.05, usar_listen=False)
+        rodando = asyncio.ensure_future(fila.run())
+        resposta = await pedidos.baixar_pdf_renderizado(7, ticket, _request(), aguardar=10)
+        fila.parar()
+        await rodando
+        return resposta
+
+    resposta = asyncio.run(_cenario())
+    assert resposta.status_code == 200 and resposta.body == b"%PDF pedido 7"
+    assert renders == [7]
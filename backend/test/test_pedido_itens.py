@@ -0,0 +1,105 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from core.exceptions import ValidationException
+from routers.pedidos import PedidoUpdateItem
+from schemas.pedido_confirmacao import ConfirmarItem
+from services.pedido_itens import (
+    COLUNAS_ITEM, frete_edicao, frete_link, inserir_itens, preparar_itens, sincronizar_itens,
+)
+
+
+def _sessao():
+    engine = create_engine("sqlite://")
+    comandos = []
+
+    @event.listens_for(engine, "connect")
+    def _schema_public(dbapi_conn, _):
+        dbapi_conn.execute("ATTACH DATABASE ':memory:' AS public")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _registra(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement.split()[0])
+
+    db = sessionmaker(bind=engine)()
+    db.execute(text(
+        f"CREATE TABLE public.tb_pedidos_itens (id_item INTEGER PRIMARY KEY, id_pedido, {', '.join(COLUNAS_ITEM)})"
+    ))
+    db.commit()
+    return db, comandos
+
+
+def _item(i, **kw):
+    dados = dict(codigo=f"P{i}", descricao=f"PRODUTO {i}", quantidade=i + 1, preco_unit=10.0 + i,
+                 preco_unit_com_frete=10.5 + i, peso_kg=25.0)
+    dados.update(kw)
+    return PedidoUpdateItem(**dados)
+
+
+def _itens(db, id_pedido):
+    return db.execute(text(
+        f"SELECT id_item, {', '.join(COLUNAS_ITEM)} FROM public.tb_pedidos_itens WHERE id_pedido = :p ORDER BY id_item"
+    ), {"p": id_pedido}).mappings().all()
+
+
+def test_preparar_calcula_totais_e_regras_de_frete():
+    itens = [_item(0), _item(1, manual_freight=True, frete_base_ton=120.0)]
+    linhas, totais = preparar_itens(itens, frete_edicao)
+
+    assert totais["peso_total_kg"] == pytest.approx(75.0)
+    assert totais["total_sem_frete"] == pytest.approx(10.0 + 2 * 11.0)
+    assert totais["frete_total"] == pytest.approx(1.5)
+    assert linhas[0]["valor_frete_unitario"] == 0.5 and linhas[0]["preco_unit_frt"] == 10.5
+    assert linhas[1]["valor_frete_unitario"] == 3.0 and linhas[1]["preco_unit_frt"] == 14.0  # 120/t x 25 kg
+    assert linhas[1]["subtotal_com_f"] == 23.0
+
+    # Confirmação via link: frete da tabela, sem frete_base_ton
+    link, _ = preparar_itens([ConfirmarItem(codigo="X", quantidade=2, preco_unit=5, preco_unit_com_frete=6,
+                                            valor_frete_unitario=0.8)], frete_link)
+    assert link[0]["valor_frete_unitario"] == 0.8 and link[0]["preco_unit_frt"] == 6.0
+    assert link[0]["frete_base_ton"] == 0.0  # mesmo valor do default da coluna no INSERT antigo
+
+    with pytest.raises(ValidationException) as exc:
+        preparar_itens([_item(0), _item(1, quantidade=-1), _item(2, preco_unit=float("nan"))], frete_edicao)
+    assert len(exc.value.details) == 2
+
+
+def test_insercao_em_um_comando_e_edicao_por_diferenca():
+    db, comandos = _sessao()
+    linhas, _ = preparar_itens([_item(i) for i in range(300)], frete_edicao)
+    comandos.clear()
+    inserir_itens(db, 7, linhas)
+    inserir_itens(db, 8, linhas[:2])
+    db.commit()
+    assert comandos.count("INSERT") == 2
+    antes = _itens(db, 7)
+    assert len(antes) == 300
+
+    # edição: muda a quantidade do item 1, remove os dois últimos
+    novos = [_item(i) for i in range(298)]
+    novos[1] = _item(1, quantidade=50)
+    linhas, _ = preparar_itens(novos, frete_edicao)
+    comandos.clear()
+    resumo = sincronizar_itens(db, 7, linhas)
+    db.commit()
+    assert resumo == {"atualizados": 1, "inseridos": 0, "removidos": 2}
+    assert comandos == ["SELECT", "UPDATE", "DELETE"]
+
+    depois = _itens(db, 7)
+    assert [r["id_item"] for r in depois] == [r["id_item"] for r in antes[:298]]
+    assert depois[1]["quantidade"] == 50 and depois[1]["subtotal_sem_f"] == 550.0
+    assert depois[0] == antes[0]
+
+    # acrescenta itens no fim: só INSERT, ordem preservada
+    linhas, _ = preparar_itens(novos + [_item(900), _item(901)], frete_edicao)
+    comandos.clear()
+    assert sincronizar_itens(db, 7, linhas) == {"atualizados": 0, "inseridos": 2, "removidos": 0}
+    assert comandos == ["SELECT", "INSERT"]
+    assert [r["codigo"] for r in _itens(db, 7)][-3:] == ["P297", "P900", "P901"]
+    assert len(_itens(db, 8)) == 2
@@ -0,0 +1,24 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+import pytest
+from services.pedidos import encode_cursor, decode_cursor
+
+
+def test_cursor_roundtrip():
+    dt = datetime(2026, 3, 14, 9, 26, 53, 589793)
+    cursor = encode_cursor(dt, 12345)
+    assert "=" not in cursor  # opaco e seguro para querystring
+    assert decode_cursor(cursor) == (dt, 12345)
+
+
+def test_cursor_sem_created_at():
+    cursor = encode_cursor(None, 7)
+    assert decode_cursor(cursor) == (None, 7)
+
+
+def test_cursor_invalido():
+    with pytest.raises(ValueError):
+        decode_cursor("nao-e-um-cursor")
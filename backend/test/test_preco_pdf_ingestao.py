@@ -0,0 +1,122 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from models.produto import ProdutoV2
+from services.produto_pdf import importar_lista_df, salvar_t_preco_produto_pdf
+
+COLUNAS = """
+    id INTEGER PRIMARY KEY, fornecedor TEXT, lista TEXT, familia TEXT, codigo TEXT, descricao TEXT,
+    preco_ton NUMERIC, preco_sc NUMERIC, page INTEGER, validade_tabela DATE, data_ingestao DATE,
+    nome_arquivo TEXT, ativo BOOLEAN, usuario TEXT, filhos INTEGER
+"""
+
+
+def _sessao():
+    engine = create_engine("sqlite://")
+    contador = {"n": 0}
+
+    @event.listens_for(engine, "connect")
+    def _schema_public(dbapi_conn, _):
+        dbapi_conn.execute("ATTACH DATABASE ':memory:' AS public")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contador["n"] += 1
+
+    db = sessionmaker(bind=engine)()
+    db.execute(text(f"CREATE TABLE public.t_preco_produto_pdf_v2 ({COLUNAS})"))
+    ProdutoV2.__table__.create(engine)
+    db.commit()
+    return db, contador
+
+
+def _lista(n):
+    linhas = []
+    for i in range(n):
+        linhas.append({
+            "fornecedor": "ALISUL", "lista": "PET", "familia": f"FAMILIA {i // 25}",
+            "codigo": str(7000 + i), "descricao": f"RACAO {i}",
+            "preco_ton": None if i % 3 == 0 else 1000.0 + i, "preco_sc": 50.0 + i / 100,
+            "page": i // 40, "filhos": i % 25 + 1,
+        })
+    df = pd.DataFrame(linhas)
+    df["data_ingestao"] = date(2026, 10, 1)
+    df["validade_tabela"] = None
+    return df
+
+
+def _salvar_legado(db, df, nome_arquivo, usuario):
+    """Implementação anterior: um INSERT por linha."""
+    sql = text("""
+        INSERT INTO public.t_preco_produto_pdf_v2 (
+            fornecedor, lista, familia, codigo, descricao, preco_ton, preco_sc, page,
+            validade_tabela, data_ingestao, nome_arquivo, ativo, usuario, filhos
+        ) VALUES (
+            :fornecedor, :lista, :familia, :codigo, :descricao, :preco_ton, :preco_sc, :page,
+            :validade_tabela, :data_ingestao, :nome_arquivo, :ativo, :usuario, :filhos
+        )
+    """)
+    for row in df.to_dict(orient="records"):
+        row.setdefault("nome_arquivo", nome_arquivo)
+        row["ativo"] = True
+        row.setdefault("usuario", usuario)
+        if pd.isna(row["preco_ton"]):
+            row["preco_ton"] = None
+        db.execute(sql, row)
+    db.commit()
+
+
+def _estado(db):
+    return db.execute(text("SELECT * FROM public.t_preco_produto_pdf_v2 ORDER BY id")).fetchall()
+
+
+def test_insert_em_lote_equivale_ao_laco_e_benchmark():
+    df = _lista(1500)
+    db_a, cont_a = _sessao()
+    db_b, cont_b = _sessao()
+    cont_a["n"] = cont_b["n"] = 0
+
+    t0 = time.perf_counter()
+    _salvar_legado(db_a, df, "lista.pdf", "u@x.com")
+    t_laco = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    gravadas = salvar_t_preco_produto_pdf(db_b, df, nome_arquivo="lista.pdf", usuario="u@x.com", page_size=500)
+    t_lote = time.perf_counter() - t0
+
+    print(
+        f"\n[benchmark] linhas=1500 | laço: {cont_a['n']} queries, {t_laco * 1000:.0f} ms"
+        f" | lote: {cont_b['n']} queries, {t_lote * 1000:.0f} ms"
+    )
+    assert gravadas == 1500
+    assert _estado(db_a) == _estado(db_b)
+    assert cont_b["n"] <= 3 < cont_a["n"]
+    assert "ativo" not in df.columns  # DataFrame do chamador não é alterado
+
+
+def test_importar_lista_df_consulta_produtos_uma_vez():
+    db, contador = _sessao()
+    db.execute(text(
+        "INSERT INTO t_cadastro_produto_v2 (codigo_supra, status_produto, nome_produto, preco) VALUES (:c, 'ATIVO', :c, 1)"
+    ), [{"c": str(7000 + i)} for i in range(0, 300, 2)])
+    db.commit()
+
+    df = _lista(300)
+    df = pd.concat([df, df.iloc[[1]].assign(preco_sc=99.0)], ignore_index=True)  # código novo repetido
+    contador["n"] = 0
+    resumo = importar_lista_df(db, df)
+
+    assert resumo == {"inseridos": 150, "atualizados": 151}
+    assert contador["n"] <= 4
+    precos = dict(db.execute(text("SELECT codigo_supra, preco FROM t_cadastro_produto_v2")).fetchall())
+    assert len(precos) == 300
+    assert precos["7000"] == 50.0 and precos["7001"] == 99.0 and precos["7002"] == 50.02
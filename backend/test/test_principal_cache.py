@@ -0,0 +1,87 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from core import deps
+from core.security import create_access_token, get_password_hash
+from models.usuario import UsuarioModel
+from routers.usuario import delete_user, update_user
+from schemas.usuario import UsuarioUpdate
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    contador = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        if "t_usuario" in statement:
+            contador["n"] += 1
+
+    Sessao = sessionmaker(bind=engine)
+    UsuarioModel.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO t_usuario (id, nome, email, senha_hash, funcao, ativo) VALUES (:id, :nome, :email, :h, :f, 1)"
+        ), [
+            {"id": 1, "nome": "Admin", "email": "admin@x.com", "h": get_password_hash("Senha#123"), "f": "admin"},
+            {"id": 2, "nome": "Vendedor", "email": "vend@x.com", "h": "-", "f": "vendedor"},
+        ])
+    monkeypatch.setattr(deps, "SessionLocal", Sessao)
+    deps._cache_principal.clear()
+    contador["n"] = 0
+    yield Sessao, contador
+    deps._cache_principal.clear()
+
+
+def _token(email, minutos=30):
+    return create_access_token({"sub": email, "role": "x"}, expires_delta=timedelta(minutes=minutos))
+
+
+def _usuario(token):
+    return asyncio.run(deps.get_current_user(token))
+
+
+def test_principal_em_cache_por_token_sem_sessao(banco):
+    _, contador = banco
+    token = _token("vend@x.com")
+
+    primeiro = _usuario(token)
+    for _ in range(5):
+        assert _usuario(token) is primeiro
+    assert contador["n"] == 1
+    assert (primeiro.id, primeiro.funcao, primeiro.nome) == (2, "vendedor", "Vendedor")
+    assert not hasattr(primeiro, "senha_hash")
+
+    assert asyncio.run(deps.get_current_user_optional(token)) is primeiro
+    assert asyncio.run(deps.get_current_user_optional("lixo")) is None
+    with pytest.raises(HTTPException) as exc:
+        _usuario(_token("naoexiste@x.com"))
+    assert exc.value.status_code == 401
+
+
+def test_update_e_delete_invalidam_o_principal(banco):
+    Sessao, _ = banco
+    admin = _usuario(_token("admin@x.com"))
+    token_vendedor = _token("vend@x.com")
+    assert _usuario(token_vendedor).funcao == "vendedor"
+
+    with Sessao() as db:
+        update_user(2, UsuarioUpdate(funcao="gerente"), db=db, current_user=admin)
+    assert _usuario(token_vendedor).funcao == "gerente"
+
+    with Sessao() as db:
+        delete_user(2, db=db, current_user=admin)
+    with pytest.raises(HTTPException):
+        _usuario(token_vendedor)
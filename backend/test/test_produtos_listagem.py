@@ -0,0 +1,112 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from models.produto import ImpostoV2
+from services.produto_pdf import COLUNAS_LISTAGEM, _row_to_out, campos_listagem, list_produtos
+
+HOJE = date.today()
+
+
+def _sessao(n):
+    engine = create_engine("sqlite://")
+    db = sessionmaker(bind=engine)()
+    colunas = ", ".join("id INTEGER PRIMARY KEY" if c == "id" else c for c in COLUNAS_LISTAGEM)
+    db.execute(text(f"CREATE TABLE v_produto_v2_preco ({colunas}, ipi, iva_st, icms, cbs, ibs)"))
+    ImpostoV2.__table__.create(engine)
+
+    casos = [
+        # (preco, peso, desconto_ton, inicio, fim)
+        (100.0, 25.0, 200.0, HOJE - timedelta(days=1), HOJE + timedelta(days=1)),  # vigente: 5%
+        (100.0, 25.0, 200.0, HOJE + timedelta(days=1), HOJE + timedelta(days=9)),  # futuro
+        (100.0, 25.0, 200.0, HOJE - timedelta(days=9), HOJE - timedelta(days=1)),  # vencido
+        (10.0, 40.0, 900.0, HOJE, HOJE),                                           # desconto > preço
+        (100.0, None, 200.0, HOJE, HOJE),                                          # sem peso
+        (None, 25.0, 200.0, HOJE, HOJE),                                           # sem preço
+        (100.0, 25.0, None, None, None),                                           # sem desconto
+        (33.3, 20.0, 150.0, HOJE, HOJE + timedelta(days=3)),
+    ]
+    linhas = []
+    for i in range(n):
+        preco, peso, desc, ini, fim = casos[i % len(casos)]
+        linhas.append({
+            "id": i + 1, "codigo_supra": f"{5000 + i}", "status_produto": "ATIVO",
+            "nome_produto": f"PRODUTO {i}", "fornecedor": "SUPRA", "unidade": "SC",
+            "preco": preco, "peso": peso, "desconto_valor_tonelada": desc,
+            "data_desconto_inicio": ini and ini.isoformat(), "data_desconto_fim": fim and fim.isoformat(),
+        })
+    nomes = list(linhas[0])
+    db.execute(text(
+        f"INSERT INTO v_produto_v2_preco ({', '.join(nomes)}) VALUES ({', '.join(':' + c for c in nomes)})"
+    ), linhas)
+    db.execute(text("INSERT INTO t_imposto_v2 (id, produto_id, ipi, icms) VALUES (:id, :id, 5, 18)"),
+               [{"id": i} for i in range(1, n + 1, 2)])
+    db.commit()
+    return engine, db
+
+
+def _listar(db, **kw):
+    args = dict(q=None, status="ATIVO", familia=None, fornecedor=None, vigencia_em=None, limit=500, offset=0)
+    args.update(kw)
+    return list_produtos(db, **args)
+
+
+def test_flags_calculados_no_banco_iguais_ao_row_to_out():
+    _, db = _sessao(16)
+    obtidos = {p.id: p for p in _listar(db)}
+    rows = db.execute(text("SELECT * FROM v_produto_v2_preco")).mappings().all()
+    assert len(obtidos) == len(rows) == 16
+    for r in rows:
+        esperado = _row_to_out(db, r, include_imposto=False)
+        p = obtidos[r["id"]]
+        assert p.vigencia_ativa is esperado.vigencia_ativa
+        assert p.reajuste_percentual == pytest.approx(esperado.reajuste_percentual)
+        assert p.model_dump(exclude={"imposto"}) == pytest.approx(esperado.model_dump(exclude={"imposto"}))
+    assert obtidos[1].reajuste_percentual == pytest.approx(5.0)
+    assert obtidos[4].reajuste_percentual == pytest.approx(100.0)
+
+
+def test_impostos_em_uma_consulta_e_quantidade_constante():
+    engine, db = _sessao(200)
+    contador = {"n": 0}
+
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contador["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", _conta)
+    consultas = []
+    for limite in (5, 200):
+        contador["n"] = 0
+        produtos = _listar(db, limit=limite, include_imposto=True)
+        consultas.append(contador["n"])
+        assert len(produtos) == limite
+    assert consultas[0] == consultas[1] <= 2
+
+    por_id = {p.id: p for p in produtos}
+    assert por_id[1].imposto.ipi == 5 and por_id[1].imposto.icms == 18
+    assert por_id[2].imposto is None
+
+
+def test_fields_projeta_apenas_campos_pedidos():
+    _, db = _sessao(8)
+    campos = campos_listagem("codigo_supra, preco,vigencia_ativa,preco")
+    assert campos == ["id", "codigo_supra", "preco", "vigencia_ativa"]
+
+    rows = _listar(db, campos=campos, limit=3)
+    assert rows == [
+        {"id": 8, "codigo_supra": "5007", "preco": 33.3, "vigencia_ativa": True},
+        {"id": 7, "codigo_supra": "5006", "preco": 100.0, "vigencia_ativa": False},
+        {"id": 6, "codigo_supra": "5005", "preco": None, "vigencia_ativa": True},
+    ]
+    assert campos_listagem(None) is None
+    with pytest.raises(HTTPException) as exc:
+        campos_listagem("id,senha")
+    assert exc.value.status_code == 400
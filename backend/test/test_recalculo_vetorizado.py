@@ -0,0 +1,130 @@
+import os
+import random
+import sys
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from services.fiscal import calcular_linha
+from services.recalculo_vetorizado import CHAVES_FISCAIS, calcular_linhas_fiscal, calcular_lote
+
+
+def _linha_legada(row, mapa_condicoes, mapa_descontos):
+    """Cálculo por linha do worker antigo (referência de paridade)."""
+    def resolver(valor, mapa):
+        s = str(valor or "").strip()
+        if not s:
+            return None
+        cod = s.split(" - ")[0].strip().upper()
+        if cod in mapa:
+            return mapa[cod]
+        return mapa.get(s.upper())
+
+    valor_antigo = float(row["valor_produto"])
+    comissao_antiga = float(row["comissao_aplicada"])
+    fator = resolver(row["descricao_fator_comissao"], mapa_descontos)
+    if fator is None:
+        fator = (comissao_antiga / valor_antigo) if valor_antigo > 0 else 0.0
+    taxa = resolver(row["codigo_plano_pagamento"], mapa_condicoes)
+    if taxa is None:
+        return None
+
+    novo_valor = float(row["preco"] or 0)
+    peso_bruto = float(row["peso_bruto"] or 0)
+    peso_liq = float(row["peso"] or 0)
+    peso_frete = peso_bruto if peso_bruto > 0 else peso_liq
+    if peso_frete <= 0:
+        peso_frete = float(row["peso_liquido"])
+
+    nova_comissao = novo_valor * fator
+    novo_liquido = max(0, novo_valor - nova_comissao)
+    novo_ajuste = novo_liquido * taxa
+    frete_total = (float(row["frete_kg"] or 0) / 1000.0) * peso_frete
+    res = calcular_linha(
+        preco_unit=novo_liquido + novo_ajuste, quantidade=1, desconto_linha=0, frete_linha=frete_total,
+        ipi=row["ipi"] or 0.0, icms=row["icms"] or 0.0, iva_st=row["iva_st"] or 0.0, aplica_st=row["calcula_st"],
+    )
+    factor = 1.0 + (float(row["markup"] or 0) / 100.0)
+    total = float(res["total_com_st"])
+    sem_frete = max(0, total - frete_total)
+    return {
+        "valor_produto": novo_valor,
+        "comissao_aplicada": nova_comissao,
+        "ajuste_pagamento": novo_ajuste,
+        "valor_frete_aplicado": round(frete_total, 4),
+        "valor_frete": round(total, 2),
+        "valor_s_frete": round(sem_frete, 2),
+        "ipi": float(res["ipi"]),
+        "icms_st": float(res["icms_proprio"]),
+        "iva_st": float(res["base_st"]),
+        "valor_final_markup": round(total * factor, 2),
+        "valor_s_frete_markup": round(sem_frete * factor, 2),
+    }
+
+
+def test_fiscal_vetorizado_igual_calcular_linha():
+    rng = random.Random(42)
+    precos, fretes, ipis, icmss, ivas, sts = [], [], [], [], [], []
+    # Empates de meio centavo e valores com representação decimal "suja"
+    especiais = [2.675, 1.005, 0.125, 0.005, 0.015, 10.0 / 3, 0.1 + 0.2, 0.0, 1234567.895]
+    for p in especiais:
+        for f in (0.0, 0.005, 2.345, 7.0 / 9):
+            precos.append(p); fretes.append(f)
+            ipis.append(Decimal("0.0650")); icmss.append(Decimal("0.18")); ivas.append(Decimal("0.5834")); sts.append(True)
+    for _ in range(5000):
+        precos.append(rng.uniform(0, 500) * rng.choice([1, 1.0 / 3, 0.97]))
+        fretes.append(rng.choice([0.0, rng.uniform(0, 30)]))
+        ipis.append(rng.choice([None, Decimal("0"), Decimal("0.05"), Decimal("0.065"), Decimal("0.1")]))
+        icmss.append(rng.choice([Decimal("0.07"), Decimal("0.12"), Decimal("0.18"), 0.04]))
+        ivas.append(rng.choice([Decimal("0"), Decimal("0.4"), Decimal("0.5834"), None]))
+        sts.append(rng.random() < 0.5)
+    # Fora das premissas (vai para o cálculo escalar)
+    precos.append(-3.215); fretes.append(1.0); ipis.append(0.1); icmss.append(0.18); ivas.append(0.3); sts.append(True)
+
+    res = calcular_linhas_fiscal(precos, fretes, ipis, icmss, ivas, sts)
+    for i in range(len(precos)):
+        esperado = calcular_linha(
+            preco_unit=precos[i], quantidade=1, desconto_linha=0, frete_linha=fretes[i],
+            ipi=ipis[i] or 0.0, icms=icmss[i], iva_st=ivas[i] or 0.0, aplica_st=sts[i],
+        )
+        for chave in CHAVES_FISCAIS:
+            assert int(res[chave][i]) == int(esperado[chave].scaleb(2)), (i, chave)
+
+
+def test_calcular_lote_igual_worker_legado():
+    rng = random.Random(7)
+    mapa_condicoes = {"28": 0.0, "28/35": 0.0125, "AV": -0.02}
+    mapa_descontos = {"D5": 0.05, "D12": 0.12}
+    rows = []
+    for i in range(3000):
+        valor_antigo = Decimal(str(round(rng.uniform(0, 300), 2)))
+        rows.append({
+            "id_linha": i + 1,
+            "id_tabela": rng.randint(1, 40),
+            "codigo_produto_supra": f"P{rng.randint(1, 200)}",
+            "codigo_plano_pagamento": rng.choice(["28", "28/35 - Boleto", "AV", "XX", ""]),
+            "descricao_fator_comissao": rng.choice(["D5", "D12 - Especial", "", "ZZ"]),
+            "valor_produto": valor_antigo,
+            "comissao_aplicada": Decimal(str(round(float(valor_antigo) * 0.07, 4))),
+            "peso_liquido": Decimal(str(round(rng.uniform(1, 30), 3))),
+            "frete_kg": Decimal(str(round(rng.choice([0, rng.uniform(50, 400)]), 4))),
+            "markup": Decimal(str(round(rng.choice([0, rng.uniform(0, 40)]), 4))),
+            "calcula_st": rng.random() < 0.4,
+            "preco": Decimal(str(round(rng.uniform(10, 400), 4))),
+            "peso": rng.choice([None, Decimal(str(round(rng.uniform(0, 25), 3)))]),
+            "peso_bruto": rng.choice([None, Decimal("0"), Decimal(str(round(rng.uniform(1, 26), 3)))]),
+            "ipi": rng.choice([None, Decimal("0.0000"), Decimal("0.0650")]),
+            "icms": rng.choice([None, Decimal("0.1200"), Decimal("0.1800")]),
+            "iva_st": rng.choice([None, Decimal("0.0000"), Decimal("0.5834")]),
+        })
+
+    resultado = calcular_lote(pd.DataFrame(rows), mapa_condicoes, mapa_descontos)
+    for row, out in zip(rows, resultado.to_dict("records")):
+        esperado = _linha_legada(row, mapa_condicoes, mapa_descontos)
+        assert out["ignorada"] == (esperado is None)
+        if esperado is None:
+            continue
+        for chave, valor in esperado.items():
+            assert out[chave] == valor, (row["id_linha"], chave, out[chave], valor)
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from services import referencias_cache
+
+
+def _sessao():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t_condicoes_pagamento (codigo_prazo TEXT, prazo TEXT, custo REAL, ativo BOOLEAN)"))
+        conn.execute(text("CREATE TABLE t_cadastro_cliente_v2 (cadastro_codigo_da_empresa TEXT, ultimas_compras_cliente_calcula_st TEXT, cadastro_tipo_cliente TEXT)"))
+        conn.execute(text("INSERT INTO t_condicoes_pagamento VALUES ('28', '28 dias', 0.01, 1)"))
+        conn.execute(text("INSERT INTO t_cadastro_cliente_v2 VALUES ('100', NULL, 'Revenda')"))
+    return sessionmaker(bind=engine)()
+
+
+def test_condicoes_em_cache_ate_invalidar():
+    referencias_cache.invalidar_referencias()
+    db = _sessao()
+    assert [c["codigo_prazo"] for c in referencias_cache.condicoes_pagamento_ativas(db)] == ["28"]
+
+    db.execute(text("INSERT INTO t_condicoes_pagamento VALUES ('AV', 'A vista', 0, 1)"))
+    db.commit()
+    assert len(referencias_cache.condicoes_pagamento_ativas(db)) == 1
+
+    referencias_cache.invalidar_referencias()
+    assert [c["codigo_prazo"] for c in referencias_cache.condicoes_pagamento_ativas(db)] == ["28", "AV"]
+
+
+def test_flag_st_cliente_em_cache_ate_invalidar():
+    referencias_cache.invalidar_st_clientes()
+    db = _sessao()
+    assert referencias_cache.cliente_calcula_st_flag(db, " 100 ") is True
+
+    db.execute(text("UPDATE t_cadastro_cliente_v2 SET ultimas_compras_cliente_calcula_st = 'NAO'"))
+    db.commit()
+    assert referencias_cache.cliente_calcula_st_flag(db, "100") is True
+
+    referencias_cache.invalidar_st_clientes()
+    assert referencias_cache.cliente_calcula_st_flag(db, "100") is False
@@ -0,0 +1,90 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+
+from openpyxl import load_workbook
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from routers import relatorios
+from services import relatorio_vendas_export as exp
+
+
+def _vendas_cliente():
+    return [
+        {"numero_pedido": 12, "pedido_supra": "S-9", "danfe": None, "data_faturamento": "2026-03-05",
+         "codigo_cliente": "100", "cliente": 'Agro "Boa; Safra"', "nome_fantasia": "Boa Safra",
+         "municipio": "Itu", "peso_liquido": 1250.6, "valor_sem_frete": 1999.999, "valor_com_frete": 0.0},
+        {"numero_pedido": 11, "pedido_supra": None, "danfe": "4411", "data_faturamento": None,
+         "codigo_cliente": "200", "cliente": "Pet Center", "nome_fantasia": "Sem Nome Fantasia",
+         "municipio": "Sem Município", "peso_liquido": 20.0, "valor_sem_frete": 0.0, "valor_com_frete": 350.5},
+    ]
+
+
+def test_csv_no_layout_do_navegador_em_blocos():
+    blocos = list(exp.gerar_csv(iter(_vendas_cliente()), exp.COLUNAS_VENDAS_CLIENTE, lote=1))
+    assert len(blocos) == 4  # cabeçalho, uma linha por bloco, total
+    conteudo = b"".join(blocos).decode("utf-8")
+    cab, l1, l2, total = conteudo.splitlines()
+
+    assert cab.startswith("\ufeff#;Nº Pedido Sistema;Pedido Supra;Danfe;Data Faturamento")
+    assert l1 == ('"1";"12";"S-9";"-";"05/03/2026";"100";"Agro ""Boa, Safra""";"Boa Safra";"Itu";'
+                  '"1251";"2000,00";"0,00"')
+    assert l2.startswith('"2";"11";"-";"4411";"-";"200"')
+    assert total == '"TOTAL ACUMULADO";"";"";"";"";"";"";"";"";"1271";"2000,00";"350,50"'
+
+    produto = [{"codigo_produto": "P1", "produto": "Ração", "embalagem": "SC", "peso_liquido_unitario": 25.0,
+                "quantidade": 2.5, "peso_liquido_acumulado": 62.5, "valor_sem_frete": 10, "valor_com_frete": 0}]
+    linhas = b"".join(exp.gerar_csv(produto, exp.COLUNAS_VENDAS_PRODUTOS)).decode("utf-8").splitlines()
+    assert linhas[1] == '"1";"P1";"Ração";"SC";"25";"2,5";"63";"10,00";"0,00"'
+
+
+def test_xlsx_write_only_com_totais():
+    conteudo = b"".join(exp.gerar_xlsx(iter(_vendas_cliente()), exp.COLUNAS_VENDAS_CLIENTE, "relatorio_vendas_por_cliente"))
+    ws = load_workbook(io.BytesIO(conteudo)).active
+    linhas = list(ws.iter_rows(values_only=True))
+
+    assert linhas[0][:3] == ("#", "Nº Pedido Sistema", "Pedido Supra")
+    assert linhas[1][:3] == (1, 12, "S-9") and linhas[1][9] == 1250.6
+    assert linhas[3][0] == "TOTAL ACUMULADO" and linhas[3][1] is None
+    assert linhas[3][9:] == (1270.6, 1999.999, 350.5)
+
+
+def test_linhas_lidas_em_lotes_so_durante_o_envio(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rel.db'}")
+    sessoes = []
+
+    class SessaoContada(Session):
+        def close(self):
+            sessoes.append("fechada")
+            super().close()
+
+    monkeypatch.setattr(exp, "SessionLocal", sessionmaker(bind=engine, class_=SessaoContada))
+    sql = """
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 5000)
+        SELECT i AS codigo_produto, 'x' AS produto, NULL AS embalagem, 1.0 AS peso_liquido_unitario,
+               i AS quantidade, 2.0 AS peso_liquido_acumulado, 0.5 AS valor_sem_frete, 0 AS valor_com_frete
+        FROM n
+    """
+    corpo = exp.exportar("csv", sql, {}, exp.COLUNAS_VENDAS_PRODUTOS, "vendas")
+    assert next(corpo).startswith(b"\xef\xbb\xbf#;")  # cabeçalho antes da consulta
+    assert sessoes == []
+
+    linhas = b"".join(corpo).decode("utf-8").splitlines()
+    assert len(linhas) == 5001 and sessoes == ["fechada"]
+    assert linhas[-1] == '"TOTAL ACUMULADO";"";"";"";"";"";"10000";"2500,00";"0,00"'
+
+
+def test_rota_de_exportacao_devolve_stream_com_nome_do_arquivo():
+    resp = relatorios.exportar_vendas_produtos(formato="xlsx", grupos=["PET"], categoria="pet")
+    assert resp.media_type == exp.MEDIA_TYPES["xlsx"]
+    assert 'filename="relatorio_vendas_por_produto_' in resp.headers["content-disposition"]
+
+    sql, params = relatorios._consulta_vendas(
+        relatorios._SQL_VENDAS_PRODUTOS, relatorios._AGRUPAMENTO_PRODUTOS, categoria="pet", grupos=["PET"],
+    )
+    assert params == {"categoria": "PET", "grupos": ["PET"]}
+    assert sql.endswith("AND UPPER(pr.tipo) = :categoria AND pr.marca = ANY(:grupos)" + relatorios._AGRUPAMENTO_PRODUTOS)
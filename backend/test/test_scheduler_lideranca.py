@@ -0,0 +1,118 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core import scheduler
+from core.lideranca import LiderancaArquivo
+from models.scheduler_execucao import SchedulerExecucaoModel
+
+
+def test_lock_de_arquivo_elege_um_lider(tmp_path):
+    caminho = str(tmp_path / "scheduler.lock")
+    a, b = LiderancaArquivo(caminho), LiderancaArquivo(caminho)
+
+    assert a.tentar() and a.tentar()
+    assert not b.tentar() and not b.lider
+    a.liberar()
+    assert b.tentar() and not a.tentar()
+    b.liberar()
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sched.db'}")
+    SchedulerExecucaoModel.__table__.create(engine)
+    Sessao = sessionmaker(bind=engine)
+    lider = LiderancaArquivo(str(tmp_path / "scheduler.lock"))
+    monkeypatch.setattr(scheduler, "SessionLocal", Sessao)
+    monkeypatch.setattr(scheduler, "lideranca", lider)
+    monkeypatch.setattr(scheduler, "_agora", lambda: datetime(2026, 3, 2, 0, 1, 7))
+    yield Sessao, lider
+    lider.liberar()
+
+
+def _execucoes(Sessao):
+    with Sessao() as db:
+        return db.query(SchedulerExecucaoModel).order_by(SchedulerExecucaoModel.id).all()
+
+
+def test_job_roda_uma_vez_por_disparo_e_registra_historico(ambiente):
+    Sessao, _ = ambiente
+    chamadas = []
+
+    def inativar():
+        chamadas.append(1)
+        return {"avaliados": 40, "inativados": 3}
+
+    scheduler._executar_job("inatividade_diaria", inativar)
+    scheduler._executar_job("inatividade_diaria", inativar)  # mesmo minuto: disparo já reivindicado
+    scheduler._executar_job("manutencao_diaria", lambda: 12)
+    assert len(chamadas) == 1
+
+    inat, manut = _execucoes(Sessao)
+    assert (inat.status, inat.linhas_afetadas, inat.resultado["avaliados"]) == ("CONCLUIDO", 3, 40)
+    assert inat.agendado_para == datetime(2026, 3, 2, 0, 1) and inat.instancia == scheduler.INSTANCIA
+    assert inat.fim is not None and inat.duracao_s >= 0
+    assert (manut.linhas_afetadas, manut.resultado) == (12, None)
+
+
+def test_erro_registrado_e_instancia_em_espera_nao_executa(ambiente):
+    Sessao, lider = ambiente
+
+    def falha():
+        raise RuntimeError("SMTP fora do ar")
+
+    scheduler._executar_job("resumo_matinal_calendario", falha)
+    (erro,) = _execucoes(Sessao)
+    assert erro.status == "ERRO" and "SMTP fora do ar" in erro.erro_msg
+
+    # outra instância segura o lock: este processo não executa nem registra nada
+    lider.liberar()
+    outra = LiderancaArquivo(lider.caminho)
+    assert outra.tentar()
+    chamadas = []
+    scheduler._executar_job("rollup_vendas_diario", lambda: chamadas.append(1))
+    assert chamadas == [] and len(_execucoes(Sessao)) == 1
+    outra.liberar()
+
+
+def test_chave_do_disparo_e_o_horario_agendado_nao_o_inicio(ambiente, monkeypatch):
+    Sessao, _ = ambiente
+    chamadas = []
+    agendado = datetime(2026, 3, 2, 10, 5, tzinfo=scheduler.TZ)
+
+    # duas instâncias durante a troca de liderança, uma de cada lado da virada do minuto
+    for inicio in (datetime(2026, 3, 2, 10, 4, 59, 900000), datetime(2026, 3, 2, 10, 5, 0, 100000)):
+        monkeypatch.setattr(scheduler, "_agora", lambda inicio=inicio: inicio)
+        scheduler._executar_job("prospeccao_dinamica", lambda: chamadas.append(1), agendado)
+    assert len(chamadas) == 1
+    (execucao,) = _execucoes(Sessao)
+    assert execucao.agendado_para == datetime(2026, 3, 2, 10, 5)
+
+
+def test_executor_entrega_o_horario_agendado_ao_job():
+    recebido = []
+    pronto = threading.Event()
+
+    def job(agendado_para=None):
+        recebido.append(agendado_para)
+        pronto.set()
+
+    sched = BackgroundScheduler(timezone=scheduler.TZ, executors={"default": scheduler.ExecutorComHorario()})
+    quando = (datetime.now(scheduler.TZ) + timedelta(milliseconds=300)).replace(microsecond=0) + timedelta(seconds=1)
+    sched.add_job(job, "date", run_date=quando)
+    sched.start()
+    try:
+        assert pronto.wait(5)
+    finally:
+        sched.shutdown()
+    assert recebido == [quando]
@@ -0,0 +1,136 @@
+import os
+import smtplib
+import socket
+import socketserver
+import sys
+import threading
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from services.smtp_pool import SMTPPool
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo (EHLO/MAIL/RCPT/DATA/NOOP/RSET/QUIT) para testes; recusa RCPT com "recusado"."""
+
+    def handle(self):
+        srv = self.server
+        with srv.lock:
+            srv.conexoes += 1
+            srv.abertas.append(self.connection)
+        self.wfile.write(b"220 teste\r\n")
+        em_dados = False
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            if em_dados:
+                if linha == b".\r\n":
+                    em_dados = False
+                    with srv.lock:
+                        srv.mensagens += 1
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            cmd = linha[:4].upper()
+            if cmd == b"EHLO":
+                self.wfile.write(b"250 teste\r\n")
+            elif cmd == b"DATA":
+                em_dados = True
+                self.wfile.write(b"354 fim com .\r\n")
+            elif cmd == b"NOOP":
+                with srv.lock:
+                    srv.noops += 1
+                self.wfile.write(b"250 OK\r\n")
+            elif cmd == b"RCPT" and b"recusado" in linha:
+                with srv.lock:
+                    srv.recusas += 1
+                self.wfile.write(b"550 destinatario inexistente\r\n")
+            elif cmd == b"RSET":
+                with srv.lock:
+                    srv.rsets += 1
+                self.wfile.write(b"250 OK\r\n")
+            elif cmd == b"QUIT":
+                self.wfile.write(b"221 tchau\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+def _servidor():
+    srv = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.conexoes = srv.mensagens = srv.noops = srv.recusas = srv.rsets = 0
+    srv.abertas = []
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def _pool(srv, **kw):
+    host, port = srv.server_address
+    cfg = SimpleNamespace(smtp_host=host, smtp_port=port, smtp_user="", smtp_senha="", usar_tls=False)
+    return SMTPPool(abrir=lambda c: smtplib.SMTP(c.smtp_host, c.smtp_port, timeout=5), **kw), cfg
+
+
+def test_rajada_reaproveita_uma_conexao():
+    srv = _servidor()
+    try:
+        pool, cfg = _pool(srv)
+        for i in range(10):
+            # interno + cliente, como em enviar_email_notificacao
+            pool.enviar(cfg, "a@x.com", ["interno@x.com"], f"Subject: {i}\r\n\r\ninterno")
+            pool.enviar(cfg, "a@x.com", ["cliente@x.com"], f"Subject: {i}\r\n\r\ncliente")
+        assert srv.mensagens == 20
+        assert srv.conexoes == 1
+        assert pool.conexoes_abertas == 1
+        pool.fechar_todas()
+    finally:
+        srv.shutdown()
+
+
+def test_reconecta_quando_servidor_derruba_a_sessao():
+    srv = _servidor()
+    try:
+        pool, cfg = _pool(srv, intervalo_noop=3600)
+        pool.enviar(cfg, "a@x.com", ["b@x.com"], "Subject: 1\r\n\r\nx")
+        srv.abertas[0].shutdown(socket.SHUT_RDWR)  # servidor derruba a sessão ociosa
+
+        pool.enviar(cfg, "a@x.com", ["b@x.com"], "Subject: 2\r\n\r\nx")
+        assert srv.mensagens == 2
+        assert srv.conexoes == 2
+        pool.fechar_todas()
+    finally:
+        srv.shutdown()
+
+
+def test_noop_antes_de_reusar_conexao_parada():
+    srv = _servidor()
+    try:
+        pool, cfg = _pool(srv, intervalo_noop=0)
+        pool.enviar(cfg, "a@x.com", ["b@x.com"], "Subject: 1\r\n\r\nx")
+        pool.enviar(cfg, "a@x.com", ["b@x.com"], "Subject: 2\r\n\r\nx")
+        assert srv.noops >= 1
+        assert srv.conexoes == 1
+        pool.fechar_todas()
+    finally:
+        srv.shutdown()
+
+
+def test_destinatario_recusado_nao_reconecta_nem_reenvia():
+    srv = _servidor()
+    try:
+        pool, cfg = _pool(srv)
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.enviar(cfg, "a@x.com", ["recusado@x.com"], "Subject: 1\r\n\r\nx")
+        assert srv.recusas == 1  # sem nova tentativa
+        assert srv.rsets >= 1 and len(pool) == 1  # RSET e conexão de volta ao pool
+
+        pool.enviar(cfg, "a@x.com", ["b@x.com"], "Subject: 2\r\n\r\nx")
+        assert srv.mensagens == 1
+        assert srv.conexoes == 1 and pool.conexoes_abertas == 1
+        pool.fechar_todas()
+    finally:
+        srv.shutdown()
@@ -0,0 +1,130 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models.cargas import CargaModel, CargaPedidoModel
+from models.pedido import PedidoModel
+from models.transporte import TransporteModel
+from models.usuario import UsuarioModel
+from models.cliente_v2 import ClienteModelV2
+from models.produto import ProdutoV2
+from routers import relatorios, tabela_preco
+from schemas.cargas import CargaPedidoCreate
+from services.vendas_rollup import ROLLUP_DDL, reconstruir_rollup
+
+# O SQL do rollup é específico do Postgres: a comparação com o agregado direto só roda com
+# TEST_DATABASE_URL apontando para um banco Postgres descartável (as tabelas são recriadas).
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+requer_postgres = pytest.mark.skipif(
+    not TEST_DATABASE_URL.startswith("postgresql"), reason="TEST_DATABASE_URL (Postgres) não configurado"
+)
+
+_TABELAS = [UsuarioModel.__table__, TransporteModel.__table__, CargaModel.__table__,
+            CargaPedidoModel.__table__, PedidoModel.__table__]
+
+
+def _banco(url):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        for tabela in ("tb_vendas_diario", "tb_vendas_produto_diario", "tb_pedidos_itens",
+                       "t_cadastro_cliente_v2", "t_cadastro_produto_v2"):
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabela}"))
+    Base.metadata.drop_all(engine, tables=_TABELAS)
+    Base.metadata.create_all(engine, tables=_TABELAS)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO tb_cargas (id, nome_carga) VALUES (1, 'Carga Norte')"))
+        conn.execute(text(
+            "INSERT INTO tb_pedidos (id_pedido, codigo_cliente, fornecedor, status, total_pedido, frete_total, "
+            "peso_total_kg, created_at, calcula_st) VALUES (:id, '100', 'SUPRA', 'Pedido', :total, 10, 50, :dt, false)"
+        ), [{"id": i, "total": 100.0 * i, "dt": datetime(2026, 3, i)} for i in (1, 2, 3)])
+    return engine, sessionmaker(bind=engine)
+
+
+def _por_status(db, sql):
+    return {r[0]: (int(r[1]), float(r[2])) for r in db.execute(text(sql)).fetchall()}
+
+
+def _comparar(db):
+    direto = _por_status(db, "SELECT status, COUNT(*), SUM(total_pedido) FROM public.tb_pedidos GROUP BY status")
+    rollup = _por_status(db, "SELECT status, SUM(qtd_pedidos), SUM(total_pedido) FROM public.tb_vendas_diario GROUP BY status")
+    assert rollup == direto
+    return direto
+
+
+@requer_postgres
+def test_rollup_acompanha_status_da_carga():
+    engine, Sessao = _banco(TEST_DATABASE_URL)
+    with engine.begin() as conn:
+        for ddl in ROLLUP_DDL:
+            conn.execute(text(ddl))
+        conn.execute(text("CREATE TABLE t_cadastro_cliente_v2 (id SERIAL PRIMARY KEY, cadastro_codigo_da_empresa "
+                          "VARCHAR, faturamento_municipio VARCHAR, entrega_municipio VARCHAR)"))
+        conn.execute(text("INSERT INTO t_cadastro_cliente_v2 (cadastro_codigo_da_empresa, entrega_municipio) "
+                          "VALUES ('100', 'Itu')"))
+        conn.execute(text("CREATE TABLE t_cadastro_produto_v2 (codigo_supra VARCHAR, familia VARCHAR)"))
+        conn.execute(text("CREATE TABLE tb_pedidos_itens (id_item SERIAL PRIMARY KEY, id_pedido BIGINT, codigo VARCHAR, "
+                          "nome VARCHAR, quantidade FLOAT, subtotal_sem_f FLOAT, subtotal_com_f FLOAT, peso_kg FLOAT)"))
+
+    with Sessao() as db:
+        reconstruir_rollup(db)
+        assert _comparar(db) == {"Pedido": (3, 600.0)}
+
+        resp = relatorios.add_pedido_to_carga(1, CargaPedidoCreate(numero_pedido="2"), db=db)
+        assert _comparar(db) == {"Pedido": (2, 400.0), "Carga em formação": (1, 200.0)}
+
+        relatorios.remove_pedido_from_carga(resp["id_carga_pedido"], db=db)
+        assert _comparar(db) == {"Pedido": (3, 600.0)}
+
+
+def test_vincular_e_remover_da_carga_atualizam_o_rollup(tmp_path, monkeypatch):
+    _, Sessao = _banco(f"sqlite:///{tmp_path / 'cargas.db'}")
+    chamadas = []
+
+    def _registra(db, ids):
+        # o status novo já está na sessão quando o rollup é recalculado (antes do commit)
+        chamadas.append((list(ids), db.get(PedidoModel, ids[0]).status))
+
+    monkeypatch.setattr(relatorios, "atualizar_rollup_pedidos", _registra)
+    with Sessao() as db:
+        resp = relatorios.add_pedido_to_carga(1, CargaPedidoCreate(numero_pedido="3"), db=db)
+        relatorios.remove_pedido_from_carga(resp["id_carga_pedido"], db=db)
+    assert chamadas == [([3], "Carga em formação"), ([3], "Pedido")]
+
+
+def test_pedido_confirmado_pela_tabela_entra_no_rollup(tmp_path, monkeypatch):
+    engine, Sessao = _banco(f"sqlite:///{tmp_path / 'tabela.db'}")
+    ClienteModelV2.__table__.create(engine)
+    ProdutoV2.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE tb_tabela_preco (id_tabela INTEGER, nome_tabela TEXT, fornecedor TEXT, codigo_cliente TEXT, "
+            "cliente TEXT, codigo_produto_supra TEXT, descricao_produto TEXT, embalagem TEXT, peso_liquido NUMERIC, "
+            "valor_s_frete NUMERIC, valor_frete NUMERIC, frete_kg NUMERIC, ativo BOOLEAN)"
+        ))
+        conn.execute(text(
+            "INSERT INTO tb_tabela_preco VALUES (7, 'Tabela Itu', 'SUPRA', '100', 'Agro Itu', '5001', 'RAÇÃO', 'SC', "
+            "25, 80, 5, 0.2, 1)"
+        ))
+    chamadas = []
+
+    def _registra(db, ids):
+        chamadas.append((list(ids), db.get(PedidoModel, ids[0]).status))
+
+    monkeypatch.setattr(tabela_preco, "SessionLocal", Sessao)
+    monkeypatch.setattr(tabela_preco, "atualizar_rollup_pedidos", _registra)
+    monkeypatch.setattr(tabela_preco, "gerar_pdf_pedido", lambda *a, **k: b"%PDF")
+    monkeypatch.setattr(tabela_preco, "enviar_email_notificacao", lambda *a, **k: None)
+
+    body = tabela_preco.ConfirmarPedidoReq(usar_valor_com_frete=True, produtos=[{"codigo": "5001", "quantidade": 2}])
+    resp = tabela_preco.confirmar_pedido(7, body)
+    assert chamadas == [([resp["pedido_id"]], "CONFIRMADO")]
+    with Sessao() as db:
+        assert float(db.get(PedidoModel, resp["pedido_id"]).total_pedido) == 170.0
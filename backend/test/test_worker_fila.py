@@ -0,0 +1,87 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.background_task import BackgroundTaskModel
+from core.worker import TaskWorker, calcular_backoff
+
+
+def _fila(tmp_path, tarefas):
+    # Arquivo (não :memory:) para cada thread do worker ter a sua conexão
+    engine = create_engine(f"sqlite:///{tmp_path / 'fila.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    BackgroundTaskModel.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        for i, tipo in enumerate(tarefas):
+            db.add(BackgroundTaskModel(task_id=f"t{i}", tipo_tarefa=tipo, status="PENDENTE", tentativas=0,
+                                       criado_em=datetime(2024, 1, 1, 0, 0, i)))
+        db.commit()
+    return Session
+
+
+async def _rodar_ate(worker, Session, condicao, timeout=10):
+    tarefa = asyncio.ensure_future(worker.run())
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < timeout:
+        with Session() as db:
+            if condicao(db.query(BackgroundTaskModel).all()):
+                break
+        await asyncio.sleep(0.05)
+    worker.parar()
+    await tarefa
+
+
+def test_executa_em_paralelo_e_ignora_tipos_sem_handler(tmp_path):
+    Session = _fila(tmp_path, ["EMAIL"] * 8 + ["RECALCULO_MASSIVO"])
+    lock = threading.Lock()
+    estado = {"ativas": 0, "pico": 0}
+
+    def handler(db, task):
+        with lock:
+            estado["ativas"] += 1
+            estado["pico"] = max(estado["pico"], estado["ativas"])
+        time.sleep(0.1)
+        with lock:
+            estado["ativas"] -= 1
+
+    worker = TaskWorker(session_factory=Session, handlers={"EMAIL": handler},
+                        concorrencia=4, lote=4, poll_segundos=0.05, usar_listen=False)
+    asyncio.run(_rodar_ate(worker, Session,
+                           lambda ts: all(t.status == "CONCLUIDO" for t in ts if t.tipo_tarefa == "EMAIL")))
+
+    with Session() as db:
+        tarefas = {t.task_id: t for t in db.query(BackgroundTaskModel).all()}
+    assert all(t.status == "CONCLUIDO" and t.tentativas == 1 for k, t in tarefas.items() if k != "t8")
+    # RECALCULO_MASSIVO roda via BackgroundTasks: o worker não pode tocar nele
+    assert tarefas["t8"].status == "PENDENTE" and tarefas["t8"].tentativas == 0
+    assert estado["pico"] > 1
+
+
+def test_falha_reagenda_com_backoff_ate_erro(tmp_path):
+    Session = _fila(tmp_path, ["EMAIL"])
+
+    def handler(db, task):
+        raise RuntimeError("smtp fora")
+
+    worker = TaskWorker(session_factory=Session, handlers={"EMAIL": handler}, concorrencia=2,
+                        max_tentativas=3, backoff_base=0, poll_segundos=0.05, usar_listen=False)
+    asyncio.run(_rodar_ate(worker, Session, lambda ts: ts[0].status == "ERRO"))
+
+    with Session() as db:
+        t = db.query(BackgroundTaskModel).one()
+    assert t.status == "ERRO"
+    assert t.tentativas == 3
+    assert t.erro_msg == "smtp fora"
+
+
+def test_calcular_backoff():
+    assert [calcular_backoff(n, 10, 900) for n in (1, 2, 3, 4)] == [10, 20, 40, 80]
+    assert calcular_backoff(20, 10, 900) == 900
@@ -11,5 +11,7 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 
 if __name__ == "__main__":
     print("Iniciando rotina oficial de inativação para teste manual...")
-    count = verificar_inatividade_clientes()
-    print(f"\\n>>> RESULTADO FINAL: {count} cliente(s) inativado(s) <<<")
+    resumo = verificar_inatividade_clientes()
+    if resumo.get("erro"):
+        print(f"\n>>> ERRO NA VERIFICAÇÃO: {resumo['erro']} <<<")
+    print(f"\n>>> RESULTADO FINAL: {resumo['inativados']} cliente(s) inativado(s) de {resumo['avaliados']} avaliado(s) <<<")
@@ -3304,7 +3304,8 @@ async function salvarPedido(payload) {
     throw new Error("ID do pedido não encontrado para atualização.");
   }
 
-  const url = `${API_BASE}/api/pedidos/${currentTabelaId}`;
+  // pdf_async: a tela não usa o PDF na resposta; ele é gerado em segundo plano (pdf_url)
+  const url = `${API_BASE}/api/pedidos/${currentTabelaId}?pdf_async=true`;
   const method = "PUT";
   
   let pedidoPayload = {
@@ -149,6 +149,9 @@ document.addEventListener("DOMContentLoaded", () => {
                 throw new Error(data.detail || "Erro ao processar planilha.");
             }
 
+            // A conciliação roda em segundo plano: acompanha o progresso até o resultado
+            data = await aguardarImportacao(API_BASE, token, data.task_id);
+
             // Salvar no cache do localStorage para persistir na tela
             localStorage.setItem("lastImportData", JSON.stringify(data));
 
@@ -164,6 +167,38 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    async function aguardarImportacao(apiBase, token, taskId) {
+        const statusEl = loadingOverlay.querySelector("p");
+        const textoOriginal = statusEl ? statusEl.innerText : "";
+        try {
+            return await acompanharTarefa(apiBase, token, taskId, statusEl);
+        } finally {
+            if (statusEl) statusEl.innerText = textoOriginal;
+        }
+    }
+
+    async function acompanharTarefa(apiBase, token, taskId, statusEl) {
+        while (true) {
+            await new Promise(r => setTimeout(r, 1000));
+            const res = await fetch(`${apiBase}/api/importacao/pedidos/status/${taskId}`, {
+                headers: { "Authorization": `Bearer ${token}` }
+            });
+            const task = await res.json();
+            if (!res.ok) {
+                throw new Error(task.detail || "Erro ao consultar andamento da importação.");
+            }
+            if (task.status === "CONCLUIDO") {
+                return task.resultado;
+            }
+            if (task.status === "ERRO") {
+                throw new Error(task.erro || task.mensagem_status || "Erro ao processar planilha.");
+            }
+            if (statusEl && task.mensagem_status) {
+                statusEl.innerText = `${task.mensagem_status} (${task.progresso || 0}%)`;
+            }
+        }
+    }
+
     function renderResults(data) {
         const { resumo, itens } = data;
         
@@ -508,6 +508,8 @@ const doSearch = debounce(async () => {
     params.append("status", "");
     params.append("limit", "50");
     params.append("offset", "0");
+    // Só as colunas exibidas na grade; o cadastro completo vem de GET /{id} ao clicar
+    params.append("fields", "id,codigo_supra,nome_produto,fornecedor,preco,unidade,status_produto");
 
     const url = `${base}?${params.toString()}`;
     const data = await fetchJSON(url);
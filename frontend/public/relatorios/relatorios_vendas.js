@@ -223,15 +223,9 @@ async function carregarFiltrosMetadata() {
 }
 
 /**
- * Realiza a requisição ao Backend e renderiza o relatório aplicando os parâmetros
+ * Monta a query string com os filtros preenchidos (usada na listagem e na exportação)
  */
-async function buscarDadosRelatorio() {
-    tbody.innerHTML = "";
-    tfoot.innerHTML = "";
-    emptyStateEl.style.display = "none";
-    loadingEl.style.display = "block";
-
-    // Constroi query string
+function montarParametrosFiltro() {
     const queryParams = new URLSearchParams();
     if (inDataInicio.value) queryParams.append("data_inicio", inDataInicio.value);
     if (inDataFim.value) queryParams.append("data_fim", inDataFim.value);
@@ -242,6 +236,19 @@ async function buscarDadosRelatorio() {
     if (selStatus.value) queryParams.append("status_list", selStatus.value);
     if (selMunicipio.value) queryParams.append("municipios", selMunicipio.value);
     if (activeReport === "produto" && selGrupo.value) queryParams.append("grupos", selGrupo.value);
+    return queryParams;
+}
+
+/**
+ * Realiza a requisição ao Backend e renderiza o relatório aplicando os parâmetros
+ */
+async function buscarDadosRelatorio() {
+    tbody.innerHTML = "";
+    tfoot.innerHTML = "";
+    emptyStateEl.style.display = "none";
+    loadingEl.style.display = "block";
+
+    const queryParams = montarParametrosFiltro();
 
     // Seleciona endpoint conforme relatório ativo
     const endpoint = activeReport === "cliente" ? "vendas_cliente" : "vendas_produtos";
@@ -449,69 +456,41 @@ async function limparTodosFiltros() {
 }
 
 /**
- * Exporta os dados exibidos atualmente na tabela em formato compatível com Excel (CSV formatado)
+ * Exporta o relatório com os filtros atuais em formato compatível com Excel (CSV formatado).
+ * O arquivo é gerado no servidor em streaming, sem depender do tamanho do período.
  */
-function exportarExcel() {
+async function exportarExcel() {
     if (listagemVendas.length === 0) {
         alert("Não há dados carregados para exportar.");
         return;
     }
 
-    let csv = "";
-    let filename = "";
-    
-    let totalPeso = 0;
-    let totalSemFrete = 0;
-    let totalComFrete = 0;
-
-    const clean = (txt) => txt ? String(txt).replace(/;/g, ",").replace(/"/g, '""').trim() : "-";
-
-    if (activeReport === "cliente") {
-        csv = "#;Nº Pedido Sistema;Pedido Supra;Danfe;Data Faturamento;Código Cliente;Cliente;Nome Fantasia;Município;Peso Líquido (kg);Valor Sem Frete;Valor Com Frete\n";
-        filename = "relatorio_vendas_por_cliente";
-
-        listagemVendas.forEach((item, index) => {
-            const p = parseFloat(item.peso_liquido || 0);
-            const vs = parseFloat(item.valor_sem_frete || 0);
-            const vc = parseFloat(item.valor_com_frete || 0);
-
-            totalPeso += p;
-            totalSemFrete += vs;
-            totalComFrete += vc;
-
-            csv += `"${index + 1}";"${clean(item.numero_pedido)}";"${clean(item.pedido_supra)}";"${clean(item.danfe)}";"${fmtData(item.data_faturamento)}";"${clean(item.codigo_cliente)}";"${clean(item.cliente)}";"${clean(item.nome_fantasia)}";"${clean(item.municipio)}";"${Math.round(p)}";"${vs.toFixed(2).replace('.', ',')}";"${vc.toFixed(2).replace('.', ',')}"\n`;
-        });
-
-        csv += `"TOTAL ACUMULADO";"";"";"";"";"";"";"";"";"${Math.round(totalPeso)}";"${totalSemFrete.toFixed(2).replace('.', ',')}";"${totalComFrete.toFixed(2).replace('.', ',')}"\n`;
-
-    } else {
-        // Vendas por Produto
-        csv = "#;Código Produto;Produto;Embalagem;Peso Líq. Unit. (kg);Quantidade;Peso Líq. Acumulado (kg);Valor Sem Frete;Valor Com Frete\n";
-        filename = "relatorio_vendas_por_produto";
-
-        listagemVendas.forEach((item, index) => {
-            const pu = parseFloat(item.peso_liquido_unitario || 0);
-            const q = parseFloat(item.quantidade || 0);
-            const pa = parseFloat(item.peso_liquido_acumulado || 0);
-            const vs = parseFloat(item.valor_sem_frete || 0);
-            const vc = parseFloat(item.valor_com_frete || 0);
-
-            totalPeso += pa;
-            totalSemFrete += vs;
-            totalComFrete += vc;
+    const endpoint = activeReport === "cliente" ? "vendas_cliente" : "vendas_produtos";
+    const queryParams = montarParametrosFiltro();
+    queryParams.append("formato", "csv");
 
-            csv += `"${index + 1}";"${clean(item.codigo_produto)}";"${clean(item.produto)}";"${clean(item.embalagem)}";"${Math.round(pu)}";"${q}";"${Math.round(pa)}";"${vs.toFixed(2).replace('.', ',')}";"${vc.toFixed(2).replace('.', ',')}"\n`;
+    btnExportar.disabled = true;
+    try {
+        const token = window.Auth ? window.Auth.getToken() : '';
+        const resp = await fetch(`${API_BASE}/api/relatorios/${endpoint}/exportar?${queryParams.toString()}`, {
+            headers: { "Authorization": `Bearer ${token}` }
         });
+        if (!resp.ok) throw new Error("Erro na requisição ao servidor");
 
-        csv += `"TOTAL ACUMULADO";"";"";"";"";"";"${Math.round(totalPeso)}";"${totalSemFrete.toFixed(2).replace('.', ',')}";"${totalComFrete.toFixed(2).replace('.', ',')}"\n`;
+        const disposition = resp.headers.get("Content-Disposition") || "";
+        const match = disposition.match(/filename="([^"]+)"/);
+        const blob = await resp.blob();
+        const link = document.createElement("a");
+        link.href = URL.createObjectURL(blob);
+        link.download = match ? match[1] : `relatorio_${endpoint}.csv`;
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        URL.revokeObjectURL(link.href);
+    } catch (err) {
+        console.error(`Falha ao exportar relatório de ${activeReport}:`, err);
+        alert("Falha ao exportar o relatório.");
+    } finally {
+        btnExportar.disabled = false;
     }
-
-    // Utiliza BOM (\ufeff) para forçar o Excel a interpretar os caracteres especiais em UTF-8 no Windows
-    const blob = new Blob(["\ufeff" + csv], { type: 'text/csv;charset=utf-8;' });
-    const link = document.createElement("a");
-    link.href = URL.createObjectURL(blob);
-    link.download = `${filename}_${new Date().toISOString().slice(0, 10)}.csv`;
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
 }